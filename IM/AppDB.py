@@ -15,7 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import requests
+from IM.HTTPClient import HTTPClient
 import xmltodict
 try:
     from urlparse import urlparse
@@ -34,7 +34,7 @@ class AppDB:
         """
         Basic AppDB REST API call
         """
-        resp = requests.request("GET", AppDB.APPDB_URL + path, verify=False)
+        resp = HTTPClient.request("GET", AppDB.APPDB_URL + path, verify=False)
         if resp.status_code == 200:
             resp.text.replace('\n', '')
             res = xmltodict.parse(resp.text)
@@ -18,7 +18,7 @@ try:
     from urlparse import urlparse
 except ImportError:
     from urllib.parse import urlparse
-import requests
+from IM.HTTPClient import HTTPClient
 import re
 import time
 
@@ -59,7 +59,7 @@ class AppDBIS:
 
         while skip < total_count:
             surl = url + sep_char + "limit=%s&skip=%s" % (limit, skip)
-            resp = requests.request("GET", surl, verify=self.verify)
+            resp = HTTPClient.request("GET", surl, verify=self.verify)
             if resp.status_code == 200:
                 data = resp.json()
                 if data["totalCount"] < total_count:
@@ -92,8 +92,8 @@ class AppDBIS:
         """
         Get the data of the specified image from the REST API
         """
-        resp = requests.request("GET", self.appdbis_url + self.REST_API_PATH + "/images/%s" % image_id,
-                                verify=self.verify)
+        resp = HTTPClient.request("GET", self.appdbis_url + self.REST_API_PATH + "/images/%s" % image_id,
+                                  verify=self.verify)
         if resp.status_code == 200:
             return 200, resp.json()["data"]
         else:
@@ -103,8 +103,8 @@ class AppDBIS:
         headers = {"Content-Type": "application/json", "Accept": "application/json"}
         graph_ql_q = '{"query": "%s"}' % graph_ql_req.replace(' ', '').replace('"', '\\"').replace('\n', '')
 
-        resp = requests.request("POST", self.appdbis_url + self.GRAPH_QL_PATH, headers=headers,
-                                data=graph_ql_q, verify=self.verify)
+        resp = HTTPClient.request("POST", self.appdbis_url + self.GRAPH_QL_PATH, headers=headers,
+                                  data=graph_ql_q, verify=self.verify)
 
         if resp.status_code == 200:
             try:
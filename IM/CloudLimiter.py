@@ -0,0 +1,268 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+from IM.config import Config
+
+
+class CloudLimit():
+    """
+    Concurrency limit of a cloud provider endpoint.
+    """
+
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        """Maximum number of concurrent operations."""
+        self.limit = float(max_limit)
+        """Current number of concurrent operations allowed."""
+        self.active = 0
+        """Number of operations in progress."""
+        self.throttled = 0
+        """Number of rate limit or quota errors received."""
+        self.cond = threading.Condition()
+        """Condition to wait for a free slot."""
+
+    def set_max_limit(self, max_limit):
+        with self.cond:
+            self.max_limit = max_limit
+            self.limit = float(max_limit)
+            self.cond.notify_all()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= max(1, int(self.limit)):
+                self.cond.wait()
+            self.active += 1
+
+    def release(self, throttled=False):
+        with self.cond:
+            self.active -= 1
+            if throttled:
+                # Multiplicative decrease
+                self.throttled += 1
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                # Additive increase (one slot per window of successful operations)
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
+
+
+class CloudLimiter():
+    """
+    Long-lived manager shared by all the operations (launch, start, stop, destroy) to limit
+    the number of concurrent operations per cloud provider endpoint. The limit of each endpoint
+    is adapted with an AIMD algorithm: it is halved when a rate limit or quota error is
+    detected and increased while the operations succeed up to the configured maximum
+    (MAX_SIMULTANEOUS_LAUNCHES or MAX_SIMULTANEOUS_LAUNCHES_BY_TYPE).
+    """
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    THROTTLE_ERRORS = re.compile(r"\b(429|413)\b|RequestLimitExceeded|Throttl|Too ?Many ?Requests|"
+                                 r"Rate ?limit|Rate exceeded|QuotaExceeded|Quota exceeded|LimitExceeded",
+                                 re.IGNORECASE)
+    """Regular expression to detect rate limit or quota errors."""
+
+    _limits = {}
+    """Map from the cloud endpoint to its CloudLimit."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    _pool = None
+    """Shared ThreadPool used to run the operations."""
+
+    _local = threading.local()
+    """Thread local data to detect the calls made from a cloud operation."""
+
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        with CloudLimiter._lock:
+            CloudLimiter._limits = {}
+
+    @staticmethod
+    def get_key(cloud, auth=None, system=None):
+        """
+        Get the key of the endpoint of a cloud provider (CloudInfo).
+        As the limits are applied per region and account, it includes the region
+        (host of the image URL of the system, e.g. aws://us-east-1/ami-...) and a hash
+        of the credentials (like the keys of the ImageCache).
+        """
+        key = "%s://%s" % (cloud.type, cloud.server)
+        if cloud.port != -1:
+            key += ":%s" % cloud.port
+        url = system.getValue("disk.0.image.url") if system else None
+        if url and isinstance(url, str):
+            region = urlparse(url).hostname
+            if region and region != cloud.server:
+                key += "/%s" % region
+        auth_data = auth.getAuthInfoByID(cloud.id) if auth else None
+        if auth_data:
+            data = json.dumps(auth_data, sort_keys=True, default=str)
+            key += "#%s" % hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+        return key
+
+    @staticmethod
+    def get_limit(cloud, auth=None, system=None):
+        """
+        Get the CloudLimit of a cloud provider (CloudInfo) creating it if needed.
+        """
+        key = CloudLimiter.get_key(cloud, auth, system)
+        max_limit = max(1, int(Config.MAX_SIMULTANEOUS_LAUNCHES_BY_TYPE.get(cloud.type,
+                                                                            Config.MAX_SIMULTANEOUS_LAUNCHES)))
+        with CloudLimiter._lock:
+            limit = CloudLimiter._limits.get(key)
+            if limit is None:
+                limit = CloudLimit(max_limit)
+                CloudLimiter._limits[key] = limit
+        # The configured value has changed
+        if limit.max_limit != max_limit:
+            limit.set_max_limit(max_limit)
+        return limit
+
+    @staticmethod
+    def is_throttle_error(error):
+        """
+        Check if an error (exception or message) is a rate limit or quota error.
+        """
+        return bool(error) and CloudLimiter.THROTTLE_ERRORS.search(str(error)) is not None
+
+    @staticmethod
+    def _get_pool():
+        with CloudLimiter._lock:
+            if CloudLimiter._pool is None:
+                CloudLimiter._pool = ThreadPool(processes=Config.CLOUD_OPERATIONS_POOL_SIZE)
+            return CloudLimiter._pool
+
+    @staticmethod
+    def _run_item(func, item, limit):
+        error = None
+        CloudLimiter._local.nested = True
+        try:
+            error = func(item)
+        except Exception as ex:
+            error = ex
+            CloudLimiter.logger.exception("Error in a cloud operation.")
+        finally:
+            CloudLimiter._local.nested = False
+            throttled = CloudLimiter.is_throttle_error(error)
+            limit.release(throttled)
+            if throttled:
+                CloudLimiter.logger.warning("Rate limit or quota error received. Reducing concurrency to %d." %
+                                            int(limit.limit))
+        return error
+
+    @staticmethod
+    def _run_group(func, group, limit, res, nested):
+        """
+        Run the items of one cloud provider endpoint, acquiring its slots in order.
+        The results are stored in the res list (in the position of each item).
+        """
+        # Imported here to avoid a circular import
+        from IM.InfrastructureList import InfrastructureList
+        task = InfrastructureList.released(CloudLimiter._run_item)
+        pending = []
+        for pos, item in group:
+            limit.acquire()
+            try:
+                if nested:
+                    # The threads of the shared pool may be all waiting for this call,
+                    # so the nested calls use their own threads
+                    thread = threading.Thread(target=lambda p=pos, i=item: res.__setitem__(p, task(func, i, limit)))
+                    thread.daemon = True
+                    thread.start()
+                    pending.append((pos, thread))
+                else:
+                    pending.append((pos, CloudLimiter._get_pool().apply_async(task, (func, item, limit))))
+            except Exception as ex:
+                limit.release()
+                CloudLimiter.logger.exception("Error running a cloud operation.")
+                res[pos] = ex
+        for pos, op in pending:
+            if nested:
+                op.join()
+            else:
+                res[pos] = op.get()
+
+    @staticmethod
+    def run(func, items, get_cloud, auth=None, get_system=None):
+        """
+        Run a function over a list of items concurrently, limiting the concurrency
+        per cloud provider endpoint. The items are grouped by endpoint and each group
+        acquires its slots independently, so a busy endpoint does not delay the others.
+        The slots are never acquired by the threads of the shared pool, and the calls
+        made from a cloud operation do not use the pool, to avoid deadlocks.
+
+        Args:
+
+        - func(function): function to call with each item. It must return None or the
+          error (exception or message) of the operation, used to detect rate limit errors.
+        - items(list): list of items.
+        - get_cloud(function): function that returns the cloud provider (CloudInfo) of an item.
+        - auth(Authentication): parsed authentication tokens, to limit the operations per account.
+        - get_system(function): function that returns the RADL system of an item, to limit
+          the operations per region.
+
+        Return: a list with the values returned by the function for each item.
+        """
+        if not items:
+            return []
+
+        groups = {}
+        for pos, item in enumerate(items):
+            limit = CloudLimiter.get_limit(get_cloud(item), auth, get_system(item) if get_system else None)
+            groups.setdefault(id(limit), (limit, []))[1].append((pos, item))
+
+        nested = getattr(CloudLimiter._local, "nested", False)
+        res = [None] * len(items)
+        groups = list(groups.values())
+        threads = []
+        for limit, group in groups[1:]:
+            thread = threading.Thread(target=CloudLimiter._run_group, args=(func, group, limit, res, nested))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        # The first group is run by the calling thread
+        limit, group = groups[0]
+        CloudLimiter._run_group(func, group, limit, res, nested)
+        for thread in threads:
+            thread.join()
+        return res
+
+    @staticmethod
+    def get_stats():
+        """
+        Return a dict with the current and max limit, the operations in progress and
+        the rate limit errors per cloud provider endpoint.
+        """
+        with CloudLimiter._lock:
+            limits = list(CloudLimiter._limits.items())
+        return dict((key, {"limit": int(limit.limit), "max_limit": limit.max_limit,
+                           "active": limit.active, "throttled": limit.throttled})
+                    for key, limit in limits)
@@ -49,6 +49,7 @@ from IM.ansible_utils import merge_recipes
 from IM.ansible_utils.ansible_launcher import AnsibleThread
 
 import IM.InfrastructureList
+from IM.EventBus import EventBus
 from IM.LoggerMixin import LoggerMixin
 from IM.VirtualMachine import VirtualMachine
 from IM.SSH import AuthenticationException
@@ -101,7 +102,7 @@ class ConfManager(LoggerMixin, threading.Thread):
                         else:
                             self.log_warn("Configuration process of VM %s in unfinished state." % vm.im_id)
                         # Force to save the data to store the log data ()
-                        IM.InfrastructureList.InfrastructureList.save_data(self.inf.id)
+                        IM.InfrastructureList.InfrastructureList.save_data(self.inf)
                 else:
                     # General Infrastructure tasks
                     if vm.is_ctxt_process_running():
@@ -118,7 +119,7 @@ class ConfManager(LoggerMixin, threading.Thread):
                         else:
                             self.log_warn("Configuration process of master node in unfinished state.")
                         # Force to save the data to store the log data
-                        IM.InfrastructureList.InfrastructureList.save_data(self.inf.id)
+                        IM.InfrastructureList.InfrastructureList.save_data(self.inf)
 
         return res
 
@@ -243,6 +244,13 @@ class ConfManager(LoggerMixin, threading.Thread):
                 self.log_exception("Error killing ctxt processes in VM: %s" % vm.id)
 
     def run(self):
+        try:
+            self._run()
+        finally:
+            # Release the infrastructures got by this thread
+            IM.InfrastructureList.InfrastructureList.release()
+
+    def _run(self):
         self.log_info("Starting the ConfManager Thread")
 
         last_step = None
@@ -298,6 +306,7 @@ class ConfManager(LoggerMixin, threading.Thread):
                     else:
                         # if not, update the step, to go ahead with the new step
                         self.log_info("Step " + str(last_step) + " finished. Go to step: " + str(step))
+                        EventBus.publish(self.inf.id, "ctxt_step", {"finished_step": last_step, "step": step})
                         last_step = step
             else:
                 if isinstance(vm, VirtualMachine):
@@ -325,9 +334,12 @@ class ConfManager(LoggerMixin, threading.Thread):
                             # If not, launch it
                             # Mark this VM as configuring
                             vm.configured = None
+                            EventBus.publish(self.inf.id, "ctxt_tasks", {"step": step, "vm_id": str(vm.im_id),
+                                                                         "tasks": tasks})
                             # Launch the ctxt_agent using a thread
-                            t = threading.Thread(name="launch_ctxt_agent_" + str(
-                                vm.id), target=self.launch_ctxt_agent, args=(vm, tasks))
+                            t = threading.Thread(name="launch_ctxt_agent_" + str(vm.id),
+                                                 target=IM.InfrastructureList.InfrastructureList.released(
+                                                     self.launch_ctxt_agent), args=(vm, tasks))
                             t.daemon = True
                             t.start()
                             vm.inf.conf_threads.append(t)
@@ -340,12 +352,14 @@ class ConfManager(LoggerMixin, threading.Thread):
                             # assigned
                             vm.ctxt_pid = VirtualMachine.WAIT_TO_PID
                         # Force to save the data to store the log data
-                        IM.InfrastructureList.InfrastructureList.save_data(self.inf.id)
+                        IM.InfrastructureList.InfrastructureList.save_data(self.inf)
                 else:
                     # Launch the Infrastructure tasks
+                    EventBus.publish(self.inf.id, "ctxt_tasks", {"step": step, "vm_id": None, "tasks": tasks})
                     vm.configured = None
                     for task in tasks:
-                        t = threading.Thread(name=task, target=getattr(self, task))
+                        t = threading.Thread(name=task, target=IM.InfrastructureList.InfrastructureList.released(
+                            getattr(self, task)))
                         t.daemon = True
                         t.start()
                         vm.conf_threads.append(t)
@@ -353,7 +367,7 @@ class ConfManager(LoggerMixin, threading.Thread):
                         vms_configuring[step] = []
                     vms_configuring[step].append(vm)
                     # Force to save the data to store the log data
-                    IM.InfrastructureList.InfrastructureList.save_data(self.inf.id)
+                    IM.InfrastructureList.InfrastructureList.save_data(self.inf)
 
                 last_step = step
 
@@ -937,7 +951,7 @@ class ConfManager(LoggerMixin, threading.Thread):
                 self.inf.ansible_configured = True
                 self.inf.set_configured(True)
                 # Force to save the data to store the log data
-                IM.InfrastructureList.InfrastructureList.save_data(self.inf.id)
+                IM.InfrastructureList.InfrastructureList.save_data(self.inf)
             else:
                 self.inf.ansible_configured = False
                 self.inf.set_configured(False)
@@ -1006,7 +1020,7 @@ class ConfManager(LoggerMixin, threading.Thread):
                 self.change_master_credentials(ssh)
 
                 # Force to save the data to store the log data
-                IM.InfrastructureList.InfrastructureList.save_data(self.inf.id)
+                IM.InfrastructureList.InfrastructureList.save_data(self.inf)
 
                 self.inf.set_configured(True)
             except Exception:
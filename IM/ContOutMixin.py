@@ -0,0 +1,120 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import zlib
+
+from IM.config import Config
+
+
+class CompressedText(object):
+    """
+    Text stored compressed in memory.
+    The text is stored as a list of compressed chunks and an uncompressed tail,
+    so appending text does not require to decompress and compress it again.
+    """
+
+    __slots__ = ["chunks", "tail", "size"]
+
+    def __init__(self, text=""):
+        self.chunks = []
+        """List of compressed chunks of the text."""
+        self.tail = ""
+        """Last part of the text not compressed yet."""
+        self.size = 0
+        """Length of the original text."""
+        self.append(text)
+
+    def __str__(self):
+        return "".join(zlib.decompress(chunk).decode("utf-8") for chunk in self.chunks) + self.tail
+
+    def append(self, text):
+        """
+        Append a text. The tail is compressed as a new chunk when it is larger
+        than CONT_OUT_COMPRESS_SIZE chars.
+        """
+        self.tail += text
+        self.size += len(text)
+        if Config.CONT_OUT_COMPRESS_SIZE and len(self.tail) > Config.CONT_OUT_COMPRESS_SIZE:
+            self.chunks.append(zlib.compress(self.tail.encode("utf-8"), 1))
+            self.tail = ""
+
+    @staticmethod
+    def compress(text):
+        """
+        Return the text compressed if it is larger than CONT_OUT_COMPRESS_SIZE chars
+        or the same text otherwise.
+        """
+        if Config.CONT_OUT_COMPRESS_SIZE and isinstance(text, str) and len(text) > Config.CONT_OUT_COMPRESS_SIZE:
+            return CompressedText(text)
+        return text
+
+    @staticmethod
+    def get_text(value):
+        """
+        Return the original text of a value returned by :py:meth:`compress`.
+        """
+        if isinstance(value, CompressedText):
+            return str(value)
+        return value
+
+    @staticmethod
+    def get_sizes(value):
+        """
+        Return a tuple with the length of the original text and the memory used
+        to store it of a value returned by :py:meth:`compress`.
+        """
+        if isinstance(value, CompressedText):
+            return value.size, sum(len(chunk) for chunk in value.chunks) + len(value.tail)
+        if value:
+            return len(value), len(value)
+        return 0, 0
+
+
+class ContOutMixin(object):
+    """
+    Class to store the contextualization output message (cont_out attribute)
+    compressed in memory when it is larger than CONT_OUT_COMPRESS_SIZE chars.
+    The compressed value is stored in the instance __dict__ with the same name.
+    """
+
+    @property
+    def cont_out(self):
+        return CompressedText.get_text(self.__dict__.get("cont_out"))
+
+    @cont_out.setter
+    def cont_out(self, value):
+        self.__dict__["cont_out"] = CompressedText.compress(value)
+
+    def append_cont_out(self, text):
+        """
+        Append a text to the contextualization output message.
+        If it is compressed the text is appended without decompressing it,
+        so the cost does not depend on the length of the message.
+        """
+        value = self.__dict__.get("cont_out")
+        if isinstance(value, CompressedText):
+            value.append(text)
+        else:
+            self.__dict__["cont_out"] = CompressedText.compress((value or "") + text)
+        # Only the appended text is notified, as an append to an empty message
+        self.attr_changed("cont_out", "", text)
+
+    def get_cont_out_sizes(self):
+        """
+        Return a tuple with the length of the contextualization output message
+        and the memory used to store it.
+        """
+        return CompressedText.get_sizes(self.__dict__.get("cont_out"))
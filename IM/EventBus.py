@@ -0,0 +1,216 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from IM.config import Config
+
+
+class EventChannel():
+    """
+    Stores the recent events of an infrastructure and the clients watching them.
+    """
+
+    def __init__(self):
+        self.events = deque(maxlen=Config.EVENTS_HISTORY_SIZE)
+        """Last events published in the infrastructure."""
+        self.cond = threading.Condition()
+        """Condition to wake up the clients waiting for events."""
+        self.watchers = 0
+        """Number of clients watching the infrastructure."""
+        self.last_watch = time.time()
+        """Last time that a client watched the infrastructure."""
+        self.auth = None
+        """Authentication data used to refresh the VMs of the infrastructure."""
+        self.refresher = None
+        """Thread that refreshes the state of the VMs of the infrastructure."""
+
+
+class EventBus():
+    """
+    Internal bus to notify the changes in the infrastructures (VM state transitions,
+    contextualization steps and new contextualization messages) to the clients
+    watching them. The VMs of the watched infrastructures are refreshed by a single
+    thread per infrastructure independently of the number of watchers.
+    """
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    _channels = {}
+    """Map from the infrastructure ID to the :py:class:`EventChannel` of the watched infrastructures."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    # Start the counter with the current time to get increasing ids across restarts
+    _counter = itertools.count(int(time.time() * 1000))
+
+    @staticmethod
+    def is_watched(inf_id):
+        """
+        Return True if some client is watching the events of the infrastructure.
+        """
+        return inf_id in EventBus._channels
+
+    @staticmethod
+    def get_msg_data(old_msg, new_msg):
+        """
+        Get the data of a contextualization message event.
+        If the new message is an append of the old one only the new part is returned.
+        """
+        old_msg = old_msg or ""
+        new_msg = new_msg or ""
+        if new_msg.startswith(old_msg):
+            return {"msg": new_msg[len(old_msg):], "append": True}
+        else:
+            return {"msg": new_msg, "append": False}
+
+    @staticmethod
+    def publish(inf_id, event_type, data):
+        """
+        Publish an event of an infrastructure.
+        Events are only stored if some client is watching the infrastructure.
+
+        Args:
+
+        - inf_id(str): infrastructure id.
+        - event_type(str): type of the event.
+        - data(dict): data of the event.
+        """
+        channel = EventBus._channels.get(inf_id)
+        if channel:
+            with channel.cond:
+                channel.events.append({"id": next(EventBus._counter), "type": event_type,
+                                       "date": time.time(), "data": data})
+                channel.cond.notify_all()
+
+    @staticmethod
+    def get_events(inf_id, last_id=None, timeout=0):
+        """
+        Get the events of an infrastructure published after the specified one.
+        If there are no events, wait for them the specified time.
+
+        Args:
+
+        - inf_id(str): infrastructure id.
+        - last_id(int): ID of the last event received by the client.
+        - timeout(int): max time to wait for new events.
+
+        Return: a list of dicts with the events or None if the infrastructure is not watched.
+        """
+        channel = EventBus._channels.get(inf_id)
+        if not channel:
+            return None
+
+        deadline = time.time() + timeout
+        with channel.cond:
+            while True:
+                res = [event for event in channel.events if last_id is None or event["id"] > last_id]
+                remaining = deadline - time.time()
+                if res or remaining <= 0:
+                    return res
+                channel.cond.wait(remaining)
+
+    @staticmethod
+    def add_watcher(inf, auth):
+        """
+        Register a client watching the events of an infrastructure and
+        launch the thread to refresh the state of its VMs if needed.
+
+        Args:
+
+        - inf(InfrastructureInfo): infrastructure to watch.
+        - auth(Authentication): parsed authentication tokens.
+        """
+        with EventBus._lock:
+            channel = EventBus._channels.get(inf.id)
+            if not channel:
+                channel = EventChannel()
+                EventBus._channels[inf.id] = channel
+            channel.watchers += 1
+            channel.last_watch = time.time()
+            channel.auth = auth
+            if not channel.refresher:
+                channel.refresher = threading.Thread(name="EventBus-%s" % inf.id,
+                                                     target=EventBus._refresh_inf, args=(inf.id, channel))
+                channel.refresher.daemon = True
+                channel.refresher.start()
+
+    @staticmethod
+    def remove_watcher(inf_id):
+        """
+        Unregister a client watching the events of an infrastructure.
+        """
+        with EventBus._lock:
+            channel = EventBus._channels.get(inf_id)
+            if channel:
+                channel.watchers -= 1
+                channel.last_watch = time.time()
+
+    @staticmethod
+    def _refresh_inf(inf_id, channel):
+        """
+        Refresh the state of the VMs of an infrastructure while it is watched.
+        The channel is removed when there are no watchers during EVENTS_MAX_WAIT secs
+        to enable the long-poll clients to get the events published between calls.
+        If the VMReconciler is enabled the VMs are already refreshed by it.
+        """
+        # Imported here to avoid a circular import (VirtualMachine uses the EventBus)
+        from IM.InfrastructureList import InfrastructureList
+        while True:
+            deleted = False
+            if not Config.VM_RECONCILER:
+                # Get the infrastructure in each loop as it may have been evicted or reloaded from the DB
+                try:
+                    inf = InfrastructureList.get_infrastructure(inf_id)
+                    deleted = inf is None or inf.deleted
+                    if not deleted:
+                        for vm in inf.get_vm_list():
+                            try:
+                                vm.update_status(channel.auth, force=True)
+                            except Exception:
+                                EventBus.logger.exception("Inf ID: %s: Error updating VM status." % inf_id)
+                        InfrastructureList.save_data(inf)
+                except Exception:
+                    EventBus.logger.exception("Inf ID: %s: Error refreshing the VMs." % inf_id)
+                finally:
+                    InfrastructureList.release()
+
+            with EventBus._lock:
+                idle = channel.watchers <= 0 and time.time() - channel.last_watch > Config.EVENTS_MAX_WAIT
+                if idle or deleted or EventBus._channels.get(inf_id) is not channel:
+                    if EventBus._channels.get(inf_id) is channel:
+                        del EventBus._channels[inf_id]
+                    channel.refresher = None
+                    EventBus.logger.debug("Inf ID: %s: Stop watching events." % inf_id)
+                    break
+
+            time.sleep(Config.VM_INFO_UPDATE_FREQUENCY)
+
+        # Wake up the clients still waiting
+        with channel.cond:
+            channel.cond.notify_all()
+
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        with EventBus._lock:
+            EventBus._channels = {}
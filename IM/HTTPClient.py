@@ -0,0 +1,150 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+
+from IM.config import Config
+
+
+class HTTPClient():
+    """
+    Long-lived manager of the HTTP sessions used by the REST based clients (connectors,
+    AppDB, TTS, OpenID, Vault). It keeps a pooled Session per host to reuse the
+    connections (keep-alive) among requests and records the latency of each endpoint.
+    """
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    RETRY_STATUS = [502, 503, 504]
+    """HTTP status codes of the idempotent requests to retry."""
+
+    _sessions = {}
+    """Map from the host to its Session."""
+
+    _stats = {}
+    """Map from the host to its request metrics."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        with HTTPClient._lock:
+            sessions = list(HTTPClient._sessions.values())
+            HTTPClient._sessions = {}
+            HTTPClient._stats = {}
+        for session in sessions:
+            session.close()
+
+    @staticmethod
+    def get_key(url):
+        """
+        Get the key of the host of an URL.
+        """
+        parsed = urlparse(url)
+        return "%s://%s" % (parsed.scheme, parsed.netloc)
+
+    @staticmethod
+    def create_session(pool_size=None):
+        """
+        Create a new Session with the configured pool size and retries.
+        The cookies are not stored to avoid sharing them among different users.
+        """
+        if pool_size is None:
+            pool_size = Config.HTTP_POOL_SIZE
+        retries = Retry(total=Config.HTTP_MAX_RETRIES, backoff_factor=float(Config.HTTP_RETRY_BACKOFF),
+                        status_forcelist=HTTPClient.RETRY_STATUS, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @staticmethod
+    def get_session(url):
+        """
+        Get the Session of the host of an URL creating it if needed.
+        """
+        key = HTTPClient.get_key(url)
+        with HTTPClient._lock:
+            session = HTTPClient._sessions.get(key)
+            if session is None:
+                session = HTTPClient.create_session()
+                HTTPClient._sessions[key] = session
+        return session
+
+    @staticmethod
+    def _add_stats(key, elapsed, error):
+        with HTTPClient._lock:
+            stats = HTTPClient._stats.setdefault(key, {"requests": 0, "errors": 0, "total_time": 0.0,
+                                                       "max_time": 0.0})
+            stats["requests"] += 1
+            if error:
+                stats["errors"] += 1
+            stats["total_time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+
+    @staticmethod
+    def request(method, url, **kwargs):
+        """
+        Send an HTTP request using the Session of the host of the URL.
+        It accepts the same arguments of the requests.request function.
+
+        The requests with a client certificate use a one-off Session to avoid
+        reusing the connections authenticated with it.
+        """
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = Config.HTTP_TIMEOUT
+        key = HTTPClient.get_key(url)
+        error = False
+        init = time.time()
+        try:
+            if kwargs.get("cert"):
+                with HTTPClient.create_session(1) as session:
+                    return session.request(method, url, **kwargs)
+            else:
+                return HTTPClient.get_session(url).request(method, url, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            HTTPClient._add_stats(key, time.time() - init, error)
+
+    @staticmethod
+    def get_stats():
+        """
+        Return a dict with the number of requests, the errors and the average and
+        max time of the requests per host.
+        """
+        with HTTPClient._lock:
+            stats = [(key, dict(value)) for key, value in HTTPClient._stats.items()]
+        res = {}
+        for key, value in stats:
+            res[key] = {"requests": value["requests"], "errors": value["errors"],
+                        "avg_time": round(value["total_time"] / value["requests"], 3),
+                        "max_time": round(value["max_time"], 3)}
+        return res
@@ -0,0 +1,111 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import threading
+import time
+
+from IM.config import Config
+
+
+class ImageCache():
+    """
+    TTL cache of the results of the image searches (list_images of the cloud providers,
+    VMRC and AppDBIS queries) indexed by the hash of the query data (including the credentials).
+    Concurrent identical lookups are deduplicated: only one of them performs the query
+    and the rest wait for its result.
+    """
+
+    _cache = {}
+    """Map from the hash of the query to a tuple (expiration time, result)."""
+
+    _pending = {}
+    """Map from the hash of the queries in progress to a threading Event."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    hits = 0
+    """Number of lookups served from the cache or from a concurrent identical lookup."""
+
+    misses = 0
+    """Number of lookups that required to perform the query."""
+
+    @staticmethod
+    def get_key(*args):
+        """
+        Get the cache key of a query from its data.
+        """
+        data = json.dumps(args, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _purge(now):
+        for key in [k for k, (expire, _) in ImageCache._cache.items() if expire <= now]:
+            del ImageCache._cache[key]
+
+    @staticmethod
+    def get(key, func, *args):
+        """
+        Get the result of a query using the cache.
+
+        Args:
+
+        - key(str): key of the query (see :py:meth:`get_key`).
+        - func(function): function that performs the query.
+        - args: arguments of the function.
+
+        Return: a copy of the list returned by the function. Errors are not cached.
+        """
+        if not Config.IMAGE_CACHE_TIME:
+            return func(*args)
+
+        while True:
+            with ImageCache._lock:
+                entry = ImageCache._cache.get(key)
+                if entry and entry[0] > time.time():
+                    ImageCache.hits += 1
+                    return list(entry[1])
+                event = ImageCache._pending.get(key)
+                if event is None:
+                    event = threading.Event()
+                    ImageCache._pending[key] = event
+                    break
+            # The same query is in progress, wait its result
+            event.wait()
+
+        try:
+            res = func(*args)
+            with ImageCache._lock:
+                now = time.time()
+                ImageCache.misses += 1
+                ImageCache._purge(now)
+                ImageCache._cache[key] = (now + Config.IMAGE_CACHE_TIME, res)
+        finally:
+            with ImageCache._lock:
+                del ImageCache._pending[key]
+            event.set()
+
+        return list(res)
+
+    @staticmethod
+    def clear():
+        """Remove all the elements of the cache."""
+        with ImageCache._lock:
+            ImageCache._cache = {}
+            ImageCache.hits = 0
+            ImageCache.misses = 0
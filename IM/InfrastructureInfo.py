@@ -23,7 +23,6 @@ import json
 import IM.ConfManager
 from datetime import datetime, timedelta
 from radl.radl import RADL, Feature, deploy, system, contextualize_item
-from radl.radl_parse import parse_radl
 from radl.radl_json import radlToSimple
 from IM.config import Config
 try:
@@ -31,11 +30,13 @@ try:
 except ImportError:
     from queue import PriorityQueue
 from IM.VirtualMachine import VirtualMachine
+from IM.VersionMixin import VersionMixin
+from IM.ContOutMixin import ContOutMixin, CompressedText
+from IM.EventBus import EventBus
+from IM.RADLCache import RADLCache
 from IM.auth import Authentication
 from IM.tosca.Tosca import Tosca
-
-if Config.MAX_SIMULTANEOUS_LAUNCHES > 1:
-    from multiprocessing.pool import ThreadPool
+from IM.CloudLimiter import CloudLimiter
 
 
 class IncorrectVMException(Exception):
@@ -62,7 +63,7 @@ class IncorrectStateException(Exception):
         self.message = msg
 
 
-class InfrastructureInfo:
+class InfrastructureInfo(VersionMixin, ContOutMixin):
     """
     Stores all the information about a registered infrastructure.
     """
@@ -73,6 +74,9 @@ class InfrastructureInfo:
     FAKE_SYSTEM = "F0000__FAKE_SYSTEM__"
     OPENID_USER_PREFIX = "__OPENID__"
 
+    VERSIONED_ATTRS = frozenset(["radl", "cont_out", "deleted", "deleting", "configured", "auth",
+                                 "vm_list", "vm_master", "extra_info"])
+
     def __init__(self):
         self._lock = threading.Lock()
         """Threading Lock to avoid concurrency problems."""
@@ -122,6 +126,7 @@ class InfrastructureInfo:
     def serialize(self):
         with self._lock:
             odict = self.__dict__.copy()
+        odict['cont_out'] = CompressedText.get_text(odict.get('cont_out'))
         # Quit the ConfManager object and the lock to the data to be stored
         del odict['cm']
         del odict['_lock']
@@ -157,7 +162,7 @@ class InfrastructureInfo:
         if dic['auth']:
             dic['auth'] = Authentication.deserialize(dic['auth'])
         if dic['radl']:
-            dic['radl'] = parse_radl(dic['radl'])
+            dic['radl'] = RADLCache.parse(dic['radl'])
         else:
             dic['radl'] = RADL()
         if 'extra_info' in dic and dic['extra_info'] and "TOSCA" in dic['extra_info']:
@@ -166,14 +171,17 @@ class InfrastructureInfo:
             except Exception:
                 del dic['extra_info']['TOSCA']
                 InfrastructureInfo.logger.exception("Error deserializing TOSCA document")
+        if 'cont_out' in dic:
+            dic['cont_out'] = CompressedText.compress(dic['cont_out'])
         newinf.__dict__.update(dic)
         newinf.cloud_connector = None
         # Set the ConfManager object and the lock to the data loaded
         newinf.cm = None
         newinf.ctxt_tasks = PriorityQueue()
         newinf.conf_threads = []
+        requested_radls = {}
         for vm_data in vm_list:
-            vm = VirtualMachine.deserialize(vm_data)
+            vm = VirtualMachine.deserialize(vm_data, requested_radls)
             vm.inf = newinf
             if vm.im_id == vm_master_id:
                 newinf.vm_master = vm
@@ -193,24 +201,127 @@ class InfrastructureInfo:
         newinf.auth = Authentication.deserialize(str_data)
         return newinf
 
+    @staticmethod
+    def _delete_vm(vm, delete_list, auth, exceptions, last=None):
+        """
+        Delete a VM. Return the error message or None.
+        """
+        errors = []
+        vm.delete(delete_list, auth, errors, last)
+        exceptions.extend(errors)
+        return errors[0] if errors else None
+
+    @staticmethod
+    def _wait_vms_terminated(vms, auth):
+        """
+        Wait the finalized VMs of a cloud provider to be terminated.
+        """
+        finalized = [vm for vm in vms if vm.destroy]
+        try:
+            if finalized and not vms[0].getCloudConnector().wait_vms_terminated(finalized, auth):
+                InfrastructureInfo.logger.warning("Inf ID: %s: Some VMs are not terminated." % vms[0].inf.id)
+        except Exception:
+            InfrastructureInfo.logger.exception("Inf ID: %s: Error waiting the VMs to be terminated." %
+                                                vms[0].inf.id)
+        return None
+
+    @staticmethod
+    def _delete_shared_resources(vms, auth, exceptions):
+        """
+        Delete the resources shared by the VMs of a cloud provider. Return the error message or None.
+        """
+        try:
+            success, msg = vms[0].getCloudConnector().delete_shared_resources(vms, auth)
+        except Exception as ex:
+            success, msg = False, str(ex)
+        if success:
+            return None
+        InfrastructureInfo.logger.info("Inf ID: %s: The shared resources cannot be deleted: %s" %
+                                       (vms[0].inf.id, msg))
+        exceptions.append(msg)
+        return msg
+
+    def delete_vms(self, delete_list, auth, exceptions):
+        """
+        Delete a list of VMs of the infrastructure in three phases:
+
+        - Delete the snapshots created with the auto_delete option in the cloud providers
+          that delete the shared resources in the last phase.
+        - Terminate all the VMs concurrently.
+        - Wait the VMs to be terminated, checking all the VMs of each cloud provider together.
+        - Delete the resources shared by the VMs (networks, SGs, ...) once per cloud provider,
+          if no other VM of the infrastructure remains in it.
+
+        In the cloud providers that do not support the last two phases (SHARED_RESOURCES_CLEANUP)
+        the last VM is finalized in the last phase, also deleting the shared resources.
+
+        Args:
+
+        - delete_list(list of VirtualMachine): list of VMs to delete.
+        - auth(Authentication): parsed authentication tokens.
+        - exceptions(list): list to append the error messages.
+
+        Return(int): number of VMs deleted.
+        """
+        remain_vms = [v for v in self.get_vm_list() if v not in delete_list]
+        cloud_vms = {}
+        for vm in delete_list:
+            cloud_vms.setdefault((vm.cloud.type, vm.cloud.server), []).append(vm)
+
+        terminate = []
+        cleanup = []
+        for vms in cloud_vms.values():
+            if not vms[-1].is_last_in_cloud(delete_list, remain_vms):
+                terminate.extend(vms)
+            elif vms[-1].getCloudConnector().SHARED_RESOURCES_CLEANUP:
+                terminate.extend(vms)
+                cleanup.append((vms, True))
+            else:
+                terminate.extend(vms[:-1])
+                cleanup.append(([vms[-1]], False))
+
+        # Get the data needed to finalize the VMs in batches per cloud provider
+        VirtualMachine.prefetch_status(delete_list, auth, force=True, finalize=True)
+
+        # Delete the snapshots before terminating the VMs, as in EC3 the IM may run in the front-end VM
+        for vms, shared in cleanup:
+            if shared:
+                try:
+                    vms[-1].getCloudConnector().delete_snapshots(vms[-1], auth)
+                except Exception:
+                    InfrastructureInfo.logger.exception("Inf ID: %s: Error deleting snapshots." % self.id)
+
+        times = []
+        now = time.time()
+        CloudLimiter.run(lambda vm: self._delete_vm(vm, delete_list, auth, exceptions, False),
+                         terminate, lambda vm: vm.cloud, auth, lambda vm: vm.info.systems[0])
+        times.append(time.time() - now)
+
+        now = time.time()
+        CloudLimiter.run(lambda item: self._wait_vms_terminated(item[0], auth),
+                         [item for item in cleanup if item[1]], lambda item: item[0][0].cloud, auth,
+                         lambda item: item[0][0].info.systems[0])
+        times.append(time.time() - now)
+
+        now = time.time()
+        CloudLimiter.run(lambda item: (self._delete_shared_resources(item[0], auth, exceptions) if item[1] else
+                                       self._delete_vm(item[0][0], delete_list, auth, exceptions)),
+                         cleanup, lambda item: item[0][0].cloud, auth, lambda item: item[0][0].info.systems[0])
+        times.append(time.time() - now)
+
+        deleted = len([vm for vm in delete_list if vm.destroy])
+        msg = "%d VMs deleted in %.2f seconds (terminate: %.2f, wait: %.2f, cleanup: %.2f)." % (
+            (deleted, sum(times)) + tuple(times))
+        InfrastructureInfo.logger.info("Inf ID: %s: %s" % (self.id, msg))
+        self.add_cont_msg(msg)
+        return deleted
+
     def destroy_vms(self, auth):
         """
         Destroy all the VMs
         """
-        delete_list = list(reversed(self.get_vm_list()))
-
         exceptions = []
-        if Config.MAX_SIMULTANEOUS_LAUNCHES > 1:
-            pool = ThreadPool(processes=Config.MAX_SIMULTANEOUS_LAUNCHES)
-            pool.map(
-                lambda vm: vm.delete(delete_list, auth, exceptions),
-                delete_list
-            )
-            pool.close()
-        else:
-            # If IM server is the first VM, then it will be the last destroyed
-            for vm in delete_list:
-                vm.delete(delete_list, auth, exceptions)
+        self.delete_vms(list(reversed(self.get_vm_list())), auth, exceptions)
 
         if exceptions:
             msg = ""
@@ -260,15 +371,56 @@ class InfrastructureInfo:
         # Set the Infrastructure as deleted
         self.delete()
         InfrastructureInfo.logger.info("Inf ID: %s: Successfully destroyed" % self.id)
-        IM.InfrastructureList.InfrastructureList.save_data(self.id)
+        IM.InfrastructureList.InfrastructureList.save_data(self)
         IM.InfrastructureList.InfrastructureList.remove_inf(self)
 
+    def attr_changed(self, name, old, value):
+        """
+        Increase the version and publish the changes in the contextualization process.
+        """
+        VersionMixin.attr_changed(self, name, old, value)
+        if EventBus.is_watched(self.id):
+            if name == "cont_out":
+                EventBus.publish(self.id, "cont_msg", EventBus.get_msg_data(old, value))
+            elif name == "configured":
+                EventBus.publish(self.id, "configured", {"configured": value})
+            elif name == "deleted" and value:
+                EventBus.publish(self.id, "deleted", {})
+
+    def get_version(self):
+        """
+        Return a tuple with the version and the last modification time of the Inf.
+        taking into account also the changes in the VMs.
+        """
+        version, last_modified = self.version, self.last_modified
+        for vm in self.vm_list:
+            version = max(version, vm.version)
+            last_modified = max(last_modified, vm.last_modified)
+        return version, last_modified
+
     def get_cont_out(self):
         """
         Returns the contextualization message
         """
         return self.cont_out
 
+    def get_memory_usage(self):
+        """
+        Returns an estimation of the memory used by this Inf: the size of its serialized data
+        and the length of the contextualization messages of the Inf and its VMs and the memory
+        used to store them (they may be compressed).
+        """
+        cont_out_len, cont_out_mem = self.get_cont_out_sizes()
+        for vm in self.vm_list:
+            vm_len, vm_mem = vm.get_cont_out_sizes()
+            cont_out_len += vm_len
+            cont_out_mem += vm_mem
+        return {"id": self.id,
+                "vms": len(self.vm_list),
+                "data_size": IM.InfrastructureList.InfrastructureList.get_inf_size(self.id),
+                "cont_out_size": cont_out_len,
+                "cont_out_memory": cont_out_mem}
+
     def add_vm(self, vm):
         """
         Add, and assigns a new VM ID to the infrastructure
@@ -282,7 +434,8 @@ class InfrastructureInfo:
             if vm.creation_im_id is None:
                 vm.creation_im_id = vm.im_id
             self.vm_list.append(vm)
-        IM.InfrastructureList.InfrastructureList.save_data(self.id)
+        self.update_version()
+        IM.InfrastructureList.InfrastructureList.save_data(self)
 
     def add_cont_msg(self, msg):
         """
@@ -292,7 +445,7 @@ class InfrastructureInfo:
             str_msg = str(msg.decode('utf8', 'ignore'))
         except Exception:
             str_msg = msg
-        self.cont_out += str(datetime.now()) + ": " + str_msg + "\n"
+        self.append_cont_out(str(datetime.now()) + ": " + str_msg + "\n")
 
     def remove_creating_vms(self):
         """
@@ -384,6 +537,8 @@ class InfrastructureInfo:
                     else:
                         self.private_networks[private_net] = d.cloud_id
 
+        self.update_version()
+
         # Check the RADL
         try:
             self.radl.check()
@@ -680,9 +835,10 @@ class InfrastructureInfo:
             # restart the failed step
             self.cm.failed_step = []
 
-    def _is_authorized(self, self_im_auth, auth):
+    @staticmethod
+    def _is_authorized(self_im_auth, auth):
         """
-        Checks if the auth data provided is authorized to access this infrastructure
+        Checks if the auth data provided is authorized to access the object owned by self_im_auth
         """
         for other_im_auth in auth.getAuthInfo("InfrastructureManager"):
             if other_im_auth.get("admin"):
@@ -729,7 +885,7 @@ class InfrastructureInfo:
             if self.adding:
                 raise IncorrectStateException()
             self.deleting = value
-        IM.InfrastructureList.InfrastructureList.save_data(self.id)
+        IM.InfrastructureList.InfrastructureList.save_data(self)
 
     def set_adding(self, value=True):
         """
@@ -740,7 +896,7 @@ class InfrastructureInfo:
                 self.add_cont_msg("Infrastructure deleted. Do not add resources.")
                 raise Exception("Infrastructure deleted. Do not add resources.")
             self.adding = value
-        IM.InfrastructureList.InfrastructureList.save_data(self.id)
+        IM.InfrastructureList.InfrastructureList.save_data(self)
 
     def get_auth(self, only_user_pass=False):
         """
@@ -769,3 +925,4 @@ class InfrastructureInfo:
                     self.auth = Authentication(im_auth)
                 else:
                     self.auth.auth_list.extend(im_auth)
+                    self.update_version()
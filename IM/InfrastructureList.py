@@ -17,13 +17,16 @@
 
 import sys
 import time
+import functools
 import logging
 import threading
 import json
+from datetime import datetime
 
 from IM.db import DataBase
 from IM.config import Config
 import IM.InfrastructureInfo
+import IM.Stats
 
 
 class InfrastructureList():
@@ -40,6 +43,36 @@ class InfrastructureList():
     _lock = threading.Lock()
     """Threading Lock to avoid concurrency problems."""
 
+    _startup_thread = None
+    """Thread that performs the startup process."""
+
+    startup_info = {}
+    """Number of infrastructures found in the startup process and the IDs of the interrupted ones."""
+
+    MIN_RESIDENCE_TIME = 60
+    """Minimum time (in secs) since the last access of an infrastructure to evict it from memory."""
+
+    _sizes = {}
+    """Estimated size (length of the serialized data) of the infrastructures in memory."""
+
+    _evict_lock = threading.Lock()
+    """Threading Lock to avoid concurrent evictions."""
+
+    _in_use = {}
+    """Map from the infrastructure ID to the number of operations (requests or jobs) using it."""
+
+    _current = threading.local()
+    """Thread local data with the IDs of the infrastructures got by the current operation."""
+
+    cache_hits = 0
+    """Number of times an infrastructure has been got from memory."""
+
+    cache_misses = 0
+    """Number of times an infrastructure has been loaded from the DB."""
+
+    cache_evictions = 0
+    """Number of infrastructures evicted from memory."""
+
     @staticmethod
     def add_infrastructure(inf):
         """Add a new Infrastructure."""
@@ -49,6 +82,7 @@ class InfrastructureList():
                 raise Exception("Trying to add an existing infrastructure ID.")
             else:
                 InfrastructureList.infrastructure_list[inf.id] = inf
+        InfrastructureList._evict()
 
     @staticmethod
     def remove_inf(del_inf):
@@ -57,39 +91,169 @@ class InfrastructureList():
         with InfrastructureList._lock:
             if del_inf.id in InfrastructureList.infrastructure_list:
                 del InfrastructureList.infrastructure_list[del_inf.id]
+            InfrastructureList._sizes.pop(del_inf.id, None)
+
+    @staticmethod
+    def _is_evictable(inf, now):
+        """
+        Check if an infrastructure can be evicted from memory: it has not been accessed in the last
+        MIN_RESIDENCE_TIME secs, it is not used by any request or job and it has no contextualization
+        process or operation in progress.
+        """
+        if InfrastructureList._in_use.get(inf.id):
+            return False
+        if inf.adding or inf.deleting or inf.is_ctxt_process_running() or (inf.cm and inf.cm.is_alive()):
+            return False
+        return (now - inf.last_access).total_seconds() > InfrastructureList.MIN_RESIDENCE_TIME
+
+    @staticmethod
+    def _evict():
+        """
+        Evict the least recently used infrastructures from memory while the INF_CACHE_MAX_ENTRIES
+        or INF_CACHE_MAX_SIZE limits are exceeded. They will be loaded again from the DB on next access.
+        """
+        max_entries = Config.INF_CACHE_MAX_ENTRIES
+        max_size = Config.INF_CACHE_MAX_SIZE
+        if not max_entries and not max_size:
+            return
+
+        with InfrastructureList._evict_lock:
+            infs = InfrastructureList.infrastructure_list
+            sizes = InfrastructureList._sizes
+            for inf_id in [i for i in sizes if i not in infs]:
+                sizes.pop(inf_id, None)
+            num = len(infs)
+            size = sum(sizes.values())
+            if (not max_entries or num <= max_entries) and (not max_size or size <= max_size):
+                return
+
+            now = datetime.now()
+            for inf in sorted(list(infs.values()), key=lambda x: x.last_access):
+                if (not max_entries or num <= max_entries) and (not max_size or size <= max_size):
+                    break
+                if InfrastructureList._is_evictable(inf, now):
+                    with InfrastructureList._lock:
+                        if infs.get(inf.id) is inf:
+                            del infs[inf.id]
+                    num -= 1
+                    size -= sizes.pop(inf.id, 0)
+                    InfrastructureList.cache_evictions += 1
+                    InfrastructureList.logger.debug("Inf ID: %s: Evicted from memory." % inf.id)
+
+    @staticmethod
+    def _acquire(inf_id):
+        """
+        Mark an infrastructure as used by the current operation to avoid evicting it
+        until the operation calls release().
+        """
+        # Use the evict lock to avoid evicting it between the check and the acquisition
+        with InfrastructureList._evict_lock:
+            InfrastructureList._in_use[inf_id] = InfrastructureList._in_use.get(inf_id, 0) + 1
+        if not hasattr(InfrastructureList._current, "inf_ids"):
+            InfrastructureList._current.inf_ids = []
+        InfrastructureList._current.inf_ids.append(inf_id)
+
+    @staticmethod
+    def release():
+        """
+        Release the infrastructures got by the current operation (request or job),
+        so that they can be evicted from memory.
+        """
+        inf_ids = getattr(InfrastructureList._current, "inf_ids", None)
+        if not inf_ids:
+            return
+        InfrastructureList._current.inf_ids = []
+        with InfrastructureList._evict_lock:
+            for inf_id in inf_ids:
+                count = InfrastructureList._in_use.get(inf_id, 0) - 1
+                if count > 0:
+                    InfrastructureList._in_use[inf_id] = count
+                else:
+                    InfrastructureList._in_use.pop(inf_id, None)
+
+    @staticmethod
+    def released(func):
+        """
+        Wrap a function run in other thread (a thread target or a pool task) to release the
+        infrastructures got by it when it finishes, as the thread may never call release().
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                InfrastructureList.release()
+        return wrapper
+
+    @staticmethod
+    def get_inf_size(inf_id):
+        """ Get the estimated size of an infrastructure in memory (0 if unknown) """
+        return InfrastructureList._sizes.get(inf_id, 0)
+
+    @staticmethod
+    def get_cache_stats():
+        """ Get the statistics of the infrastructures in memory """
+        return {"entries": len(InfrastructureList.infrastructure_list),
+                "size": sum(InfrastructureList._sizes.values()),
+                "hits": InfrastructureList.cache_hits,
+                "misses": InfrastructureList.cache_misses,
+                "evictions": InfrastructureList.cache_evictions}
 
     @staticmethod
     def get_inf_ids(auth=None):
         """ Get the IDs of the Infrastructures """
         if auth:
-            # In this case only loads the auth data to improve performance
-            inf_ids = []
-            for inf_id in InfrastructureList._get_inf_ids_from_db(auth):
-                inf = None
-                res = InfrastructureList._get_data_from_db(Config.DATA_DB, inf_id, auth)
-                if res:
-                    inf = res[inf_id]
-                if inf and inf.is_authorized(auth):
-                    inf_ids.append(inf.id)
-            return inf_ids
+            return list(InfrastructureList.iter_inf_ids(auth))
         else:
             return InfrastructureList._get_inf_ids_from_db()
 
     @staticmethod
-    def get_infrastructure(inf_id):
-        """ Get the infrastructure object """
-        if inf_id in InfrastructureList.infrastructure_list:
-            inf = InfrastructureList.infrastructure_list[inf_id]
-            if not inf.has_expired():
-                inf.touch()
-                return inf
+    def iter_inf_ids(auth):
+        """
+        Get the IDs of the Infrastructures authorized to the user as a generator,
+        checking the auth data of each of them only when it is consumed.
+        """
+        for inf_id in InfrastructureList._get_inf_ids_from_db(auth):
+            inf = None
+            # In this case only loads the auth data to improve performance
+            res = InfrastructureList._get_data_from_db(Config.DATA_DB, inf_id, auth)
+            if res:
+                inf = res[inf_id]
+            if inf and inf.is_authorized(auth):
+                yield inf.id
 
-        if inf_id in InfrastructureList.get_inf_ids():
+    @staticmethod
+    def inf_exists(inf_id):
+        """
+        Check if an infrastructure exists and it is not deleted, without getting
+        the IDs of all the infrastructures from the DB.
+        """
+        inf = InfrastructureList.infrastructure_list.get(inf_id)
+        if inf and not inf.has_expired():
+            return not inf.deleted
+        return InfrastructureList._inf_exists_in_db(inf_id)
+
+    @staticmethod
+    def get_infrastructure(inf_id):
+        """
+        Get the infrastructure object.
+        It is not evicted from memory until the current operation calls release().
+        """
+        InfrastructureList._acquire(inf_id)
+        inf = InfrastructureList.infrastructure_list.get(inf_id)
+        if inf and not inf.has_expired():
+            inf.touch()
+            InfrastructureList.cache_hits += 1
+            return inf
+
+        if InfrastructureList._inf_exists_in_db(inf_id):
             # Load the data from DB:
             res = InfrastructureList._get_data_from_db(Config.DATA_DB, inf_id)
             if res:
                 inf = res[inf_id]
                 InfrastructureList.infrastructure_list[inf_id] = inf
+                InfrastructureList.cache_misses += 1
+                InfrastructureList._evict()
                 return inf
             else:
                 return None
@@ -97,6 +261,36 @@ class InfrastructureList():
             InfrastructureList.logger.warning("%s not in list of Inf IDs." % inf_id)
             return None
 
+    @staticmethod
+    def get_infrastructures(inf_ids):
+        """
+        Get the infrastructure objects of a list of IDs.
+        The infrastructures not in memory are loaded from the DB in a single query.
+        Returns a dict indexed by the infrastructure ID (not found IDs are not included).
+        They are not evicted from memory until the current operation calls release().
+        """
+        res = {}
+        to_load = []
+        for inf_id in inf_ids:
+            InfrastructureList._acquire(inf_id)
+            inf = InfrastructureList.infrastructure_list.get(inf_id)
+            if inf and not inf.has_expired():
+                inf.touch()
+                InfrastructureList.cache_hits += 1
+                res[inf_id] = inf
+            else:
+                to_load.append(inf_id)
+
+        if to_load:
+            for inf_id, inf in InfrastructureList._get_data_from_db(Config.DATA_DB, to_load).items():
+                if not inf.deleted:
+                    InfrastructureList.infrastructure_list[inf_id] = inf
+                    InfrastructureList.cache_misses += 1
+                res[inf_id] = inf
+            InfrastructureList._evict()
+
+        return res
+
     @staticmethod
     def stop():
         """ Stop securely the IM service """
@@ -106,6 +300,84 @@ class InfrastructureList():
             for inf in InfrastructureList.infrastructure_list.values():
                 inf.stop()
 
+    @staticmethod
+    def _get_startup_data():
+        """
+        Get the number of non deleted infrastructures and the IDs of the ones that were
+        being contextualized when the IM was stopped, parsing only the JSON data
+        (not the RADL or TOSCA documents).
+        """
+        count = 0
+        inf_ids = []
+        db = DataBase(Config.DATA_DB)
+        if db.connect():
+            if db.db_type == DataBase.MONGO:
+                res = db.find_iter("inf_list", {"deleted": 0}, {"id": True, "data": True})
+            else:
+                res = db.select_iter("select id, data from inf_list where deleted = 0")
+            for elem in res:
+                if db.db_type == DataBase.MONGO:
+                    inf_id, data = elem["id"], elem["data"]
+                else:
+                    inf_id, data = elem
+                count += 1
+                try:
+                    dic = data if isinstance(data, dict) else json.loads(data)
+                    if dic.get("vm_list") and dic.get("configured", False) is None:
+                        inf_ids.append(inf_id)
+                except Exception:
+                    InfrastructureList.logger.exception("ERROR reading infrastructure %s data." % inf_id)
+            db.close()
+        else:
+            InfrastructureList.logger.error("ERROR connecting with the database!.")
+        return count, inf_ids
+
+    @staticmethod
+    def startup():
+        """
+        Startup process of the IM service. The infrastructures are not loaded at startup
+        (they are loaded on first access), only the ones that were being contextualized
+        when the IM was stopped. Their contextualization is relaunched if RESUME_CTXT is set
+        or they are marked as not configured otherwise.
+        """
+        count, inf_ids = InfrastructureList._get_startup_data()
+        InfrastructureList.startup_info = {"infrastructures": count, "interrupted": inf_ids}
+        InfrastructureList.logger.info("%d infrastructures in the DB, %d with an interrupted "
+                                       "contextualization process." % (count, len(inf_ids)))
+        if Config.INF_CACHE_TIME:
+            # In HA mode other IM instance may be contextualizing them
+            return
+
+        for inf_id in inf_ids:
+            try:
+                inf = InfrastructureList.get_infrastructure(inf_id)
+                if not inf:
+                    continue
+                if Config.RESUME_CTXT:
+                    InfrastructureList.logger.info("Inf ID: %s: Resuming contextualization process." % inf_id)
+                    inf.Contextualize(inf.auth)
+                else:
+                    InfrastructureList.logger.info("Inf ID: %s: Contextualization process interrupted." % inf_id)
+                    inf.add_cont_msg("Contextualization process interrupted by an IM restart.")
+                    inf.set_configured(False)
+                    InfrastructureList.save_data(inf)
+            except Exception:
+                InfrastructureList.logger.exception("Inf ID: %s: Error in the startup process." % inf_id)
+            finally:
+                InfrastructureList.release()
+
+    @staticmethod
+    def launch_startup():
+        """ Launch the startup process in background """
+        InfrastructureList._startup_thread = threading.Thread(name="startup", target=InfrastructureList.startup)
+        InfrastructureList._startup_thread.daemon = True
+        InfrastructureList._startup_thread.start()
+
+    @staticmethod
+    def is_ready():
+        """ Check if the startup process has finished """
+        return not InfrastructureList._startup_thread or not InfrastructureList._startup_thread.is_alive()
+
     @staticmethod
     def load_data():
         """ Load Data from DB """
@@ -125,7 +397,9 @@ class InfrastructureList():
 
         Args:
 
-        - inf_id(str): ID of the infrastructure to save. If None all will be saved.
+        - inf_id(str, InfrastructureInfo or list): ID or object (or list of them) of the infrastructure
+          to save. If None all will be saved. Use the object if available, as an infrastructure
+          evicted from memory is only saved if the object is specified.
         """
         with InfrastructureList._lock:
             try:
@@ -170,6 +444,7 @@ class InfrastructureList():
         """
         Get data from DB.
         If no inf_id specified all Infrastructures are loaded.
+        If inf_id is a list, all the Infrastructures in the list are loaded.
         If auth is specified only auth data will be loaded.
         """
         if InfrastructureList.init_table():
@@ -179,36 +454,46 @@ class InfrastructureList():
                 data_field = "data"
                 if auth:
                     data_field = "auth"
-                if inf_id:
+                if isinstance(inf_id, list):
+                    if db.db_type == DataBase.MONGO:
+                        res = db.find_iter("inf_list", {"id": {"$in": inf_id}}, {data_field: True, "deleted": True})
+                    else:
+                        res = db.select_iter("select " + data_field + ",deleted from inf_list where id in (" +  # nosec
+                                             ",".join(["%s"] * len(inf_id)) + ")", tuple(inf_id))
+                elif inf_id:
                     if db.db_type == DataBase.MONGO:
                         res = db.find("inf_list", {"id": inf_id}, {data_field: True, "deleted": True})
                     else:
                         res = db.select("select " + data_field + ",deleted from inf_list where id = %s",  # nosec
                                         (inf_id,))
                 else:
+                    # Read the rows in batches to avoid having all the serialized data in memory
+                    if db.db_type == DataBase.MONGO:
+                        res = db.find_iter("inf_list", {"deleted": 0}, {data_field: True, "deleted": True},
+                                           [('_id', -1)])
+                    else:
+                        res = db.select_iter("select " + data_field + ",deleted from inf_list"  # nosec
+                                             " where deleted = 0 order by rowid desc")
+                count = 0
+                for elem in res:
+                    count += 1
                     if db.db_type == DataBase.MONGO:
-                        res = db.find("inf_list", {"deleted": 0}, {data_field: True, "deleted": True}, [('_id', -1)])
+                        data = elem[data_field]
+                        deleted = elem["deleted"]
                     else:
-                        res = db.select("select " + data_field + ",deleted from inf_list where deleted = 0"  # nosec
-                                        " order by rowid desc")
-                if len(res) > 0:
-                    for elem in res:
-                        if db.db_type == DataBase.MONGO:
-                            data = elem[data_field]
-                            deleted = elem["deleted"]
+                        data = elem[0]
+                        deleted = elem[1]
+                    try:
+                        if auth:
+                            inf = IM.InfrastructureInfo.InfrastructureInfo.deserialize_auth(inf_id, deleted, data)
                         else:
-                            data = elem[0]
-                            deleted = elem[1]
-                        try:
-                            if auth:
-                                inf = IM.InfrastructureInfo.InfrastructureInfo.deserialize_auth(inf_id, deleted, data)
-                            else:
-                                inf = IM.InfrastructureInfo.InfrastructureInfo.deserialize(data)
-                            inf_list[inf.id] = inf
-                        except Exception:
-                            InfrastructureList.logger.exception(
-                                "ERROR reading infrastructure from database, ignoring it!.")
-                else:
+                            inf = IM.InfrastructureInfo.InfrastructureInfo.deserialize(data)
+                            InfrastructureList._set_size(inf.id, data)
+                        inf_list[inf.id] = inf
+                    except Exception:
+                        InfrastructureList.logger.exception(
+                            "ERROR reading infrastructure from database, ignoring it!.")
+                if count == 0:
                     msg = ""
                     if inf_id:
                         msg = " for inf ID: %s" % inf_id
@@ -225,15 +510,22 @@ class InfrastructureList():
 
     @staticmethod
     def _save_data_to_db(db_url, inf_list, inf_id=None):
-        if not inf_list:
+        infs_to_save = inf_list
+        if inf_id:
+            infs_to_save = {}
+            for elem in (inf_id if isinstance(inf_id, list) else [inf_id]):
+                if isinstance(elem, IM.InfrastructureInfo.InfrastructureInfo):
+                    # Save the caller object, as it may have been evicted from memory
+                    infs_to_save[elem.id] = elem
+                elif elem in inf_list:
+                    infs_to_save[elem] = inf_list[elem]
+        if not infs_to_save:
             InfrastructureList.logger.info("No data to save to the database!.")
             return True
         db = DataBase(db_url)
         if db.connect():
-            infs_to_save = inf_list
-            if inf_id:
-                infs_to_save = {inf_id: inf_list[inf_id]}
 
+            res = True
             for inf in infs_to_save.values():
                 data = inf.serialize()
                 if db.db_type == DataBase.MONGO:
@@ -241,10 +533,13 @@ class InfrastructureList():
                                                                   "data": data, "date": time.time(),
                                                                   "auth": inf.auth.serialize()})
                 else:
+                    data = json.dumps(data)
                     res = db.execute("replace into inf_list (id, deleted, data, date, auth)"
                                      " values (%s, %s, %s, now(), %s)",
-                                     (inf.id, int(inf.deleted), json.dumps(data),
+                                     (inf.id, int(inf.deleted), data,
                                       json.dumps(inf.auth.serialize())))
+                InfrastructureList._set_size(inf.id, data)
+                IM.Stats.Stats.save_inf_stats(db, inf)
 
             db.close()
             return res
@@ -290,14 +585,14 @@ class InfrastructureList():
                 if db.db_type == DataBase.MONGO:
                     filt = InfrastructureList._gen_filter_from_auth(auth)
                     filt["deleted"] = 0
-                    res = db.find("inf_list", filt, {"id": True}, [('id', -1)])
+                    res = db.find_iter("inf_list", filt, {"id": True}, [('id', -1)])
                 else:
                     like = InfrastructureList._gen_where_from_auth(auth)
                     if like:
                         where = "where deleted = 0 and (%s)" % like
                     else:
                         where = "where deleted = 0"
-                    res = db.select("select id from inf_list %s order by rowid desc" % where)  # nosec
+                    res = db.select_iter("select id from inf_list %s order by rowid desc" % where)  # nosec
                 for elem in res:
                     if db.db_type == DataBase.MONGO:
                         inf_list.append(elem['id'])
@@ -313,11 +608,45 @@ class InfrastructureList():
             InfrastructureList.logger.exception("ERROR loading data. Correct or delete it!!")
             return []
 
+    @staticmethod
+    def _set_size(inf_id, data):
+        """ Store the estimated size of an infrastructure from its serialized data """
+        if isinstance(data, str):
+            InfrastructureList._sizes[inf_id] = len(data)
+        elif Config.INF_CACHE_MAX_SIZE:
+            InfrastructureList._sizes[inf_id] = len(json.dumps(data))
+
+    @staticmethod
+    def _inf_exists_in_db(inf_id):
+        try:
+            db = DataBase(Config.DATA_DB)
+            if db.connect():
+                if db.db_type == DataBase.MONGO:
+                    res = db.find("inf_list", {"id": inf_id, "deleted": 0}, {"id": True})
+                else:
+                    res = db.select("select id from inf_list where id = %s and deleted = 0", (inf_id,))
+                db.close()
+                return len(res) > 0
+            else:
+                InfrastructureList.logger.error("ERROR connecting with the database!.")
+                return False
+        except Exception:
+            InfrastructureList.logger.exception("ERROR loading data. Correct or delete it!!")
+            return False
+
     @staticmethod
     def _reinit():
         """Restart the class attributes to initial values."""
         InfrastructureList.infrastructure_list = {}
         InfrastructureList._lock = threading.Lock()
+        InfrastructureList._startup_thread = None
+        InfrastructureList.startup_info = {}
+        InfrastructureList._sizes = {}
+        InfrastructureList._in_use = {}
+        InfrastructureList._current = threading.local()
+        InfrastructureList.cache_hits = 0
+        InfrastructureList.cache_misses = 0
+        InfrastructureList.cache_evictions = 0
         db = DataBase(Config.DATA_DB)
         if db.connect():
             if db.db_type == DataBase.MONGO:
@@ -22,6 +22,7 @@ import string
 import random
 import logging
 import threading
+import time
 
 import IM.InfrastructureInfo
 import IM.InfrastructureList
@@ -43,10 +44,16 @@ from IM.openid.JWT import JWT
 from IM.openid.OpenIDClient import OpenIDClient
 from IM.vault import VaultCredentials
 from IM.Stats import Stats
-
-
-if Config.MAX_SIMULTANEOUS_LAUNCHES > 1:
-    from multiprocessing.pool import ThreadPool
+from IM import get_ex_error
+from IM.JobManager import JobManager
+from IM.EventBus import EventBus
+from IM.VMReconciler import VMReconciler
+from IM.RADLCache import RADLCache
+from IM.ImageCache import ImageCache
+from IM.CloudLimiter import CloudLimiter
+from IM.HTTPClient import HTTPClient
+from IM.tosca.ArtifactCache import ArtifactCache
+from IM.tosca.ToscaCache import ToscaCache
 
 try:
     unicode("hola")
@@ -102,10 +109,33 @@ class InfrastructureManager:
     logger = logging.getLogger('InfrastructureManager')
     """Logger object."""
 
+    ASYNC_OPERATIONS = ["AddResource", "RemoveResource", "Reconfigure", "StartInfrastructure",
+                        "StopInfrastructure", "AlterVM"]
+    """Operations that can be launched as asynchronous jobs."""
+
+    scheduling_stats = {}
+    """Time spent concreting the systems (scheduling phase) in each cloud provider type."""
+
+    _scheduling_lock = threading.Lock()
+    """Threading Lock to update the scheduling stats."""
+
+    _concrete_pool = None
+    """Thread pool shared by all the requests to concrete the systems with the cloud providers."""
+
     @staticmethod
     def _reinit():
         """Restart the class attributes to initial values."""
         IM.InfrastructureList.InfrastructureList._reinit()
+        JobManager._reinit()
+        EventBus._reinit()
+        VMReconciler._reinit()
+        Stats._reinit()
+        ImageCache.clear()
+        InfrastructureManager.scheduling_stats = {}
+        CloudLimiter._reinit()
+        HTTPClient._reinit()
+        ArtifactCache._reinit()
+        ToscaCache.clear()
 
     @staticmethod
     def _compute_deploy_groups(radl):
@@ -162,14 +192,16 @@ class InfrastructureManager:
 
     @staticmethod
     def _launch_deploy(sel_inf, dep, cloud_id, cloud, concrete_systems, radl, auth, deployed_vm):
-        """Launch a deploy."""
+        """Launch a deploy. Return the error messages of the VMs not launched or None."""
 
         # Clone the deploy to avoid changes in the original inf deploys
         deploy = dep.clone()
         if deploy.vm_number <= 0:
             InfrastructureManager.logger.warning(
                 "Inf ID: %s: deploy %s with 0 num: Ignoring." % (sel_inf.id, deploy.id))
-            return
+            return None
+
+        errors = []
 
         if not deploy.id.startswith(IM.InfrastructureInfo.InfrastructureInfo.FAKE_SYSTEM):
             concrete_system = concrete_systems[cloud_id][deploy.id][0]
@@ -216,6 +248,7 @@ class InfrastructureManager:
                 else:
                     InfrastructureManager.logger.error("Inf ID: %s. Error launching some of the "
                                                        "VMs: %s" % (sel_inf.id, launched_vm))
+                    errors.append(str(launched_vm))
                     vm = VirtualMachine(sel_inf, None, cloud.cloud, launch_radl, requested_radl)
                     vm.state = VirtualMachine.FAILED
                     vm.info.systems[0].setValue('state', VirtualMachine.FAILED)
@@ -225,11 +258,13 @@ class InfrastructureManager:
                     deployed_vm.setdefault(deploy, []).append(vm)
                     deploy.cloud_id = cloud_id
 
+        return "\n".join(errors) if errors else None
+
     @staticmethod
     def get_infrastructure(inf_id, auth):
         """Return infrastructure info with some id if valid authorization provided."""
 
-        if inf_id not in IM.InfrastructureList.InfrastructureList.get_inf_ids():
+        if not IM.InfrastructureList.InfrastructureList.inf_exists(inf_id):
             InfrastructureManager.logger.error("Error, incorrect Inf ID: %s" % inf_id)
             raise IncorrectInfrastructureException()
         sel_inf = IM.InfrastructureList.InfrastructureList.get_infrastructure(inf_id)
@@ -243,6 +278,7 @@ class InfrastructureManager:
             InfrastructureManager.logger.error("Inf ID: %s is deleted." % inf_id)
             raise DeletedInfrastructureException()
 
+        VMReconciler.register(sel_inf, auth)
         return sel_inf
 
     @staticmethod
@@ -342,7 +378,7 @@ class InfrastructureManager:
         sel_inf.ansible_configured = None
         sel_inf.Contextualize(auth, vm_list)
 
-        IM.InfrastructureList.InfrastructureList.save_data(inf_id)
+        IM.InfrastructureList.InfrastructureList.save_data(sel_inf)
 
         return ""
 
@@ -391,30 +427,82 @@ class InfrastructureManager:
         return concrete_system, score
 
     @staticmethod
-    def search_vm(inf, radl_sys, auth):
+    def _list_images(inf, cloud, auth, filters):
+        """ Get the list of images of a cloud provider. """
+        return cloud.getCloudConnector(inf).list_images(auth, filters=filters)
+
+    @staticmethod
+    def _search_iis_vm(iis_class, iis_args, radl_sys):
+        """ Search the images of a system in an Image Information System (VMRC or AppDBIS). """
+        return iis_class(*iis_args).search_vm(radl_sys)
+
+    @staticmethod
+    def _run_image_query(query):
+        """
+        Run an image query using the ImageCache.
+        Return the list of results or the exception raised.
+        """
+        key, func, args = query
+        try:
+            return ImageCache.get(key, func, *args)
+        except Exception as ex:
+            return ex
+
+    @staticmethod
+    def _run_image_queries(queries):
+        """
+        Run a list of image queries (tuples with the cache key, the function and its arguments)
+        concurrently. Return a list with the results (or the exceptions) in the same order.
+        """
+        if len(queries) > 1 and Config.MAX_SIMULTANEOUS_IMAGE_QUERIES > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(processes=min(len(queries), Config.MAX_SIMULTANEOUS_IMAGE_QUERIES))
+            res = pool.map(IM.InfrastructureList.InfrastructureList.released(InfrastructureManager._run_image_query),
+                           queries)
+            pool.close()
+            return res
+        return [InfrastructureManager._run_image_query(query) for query in queries]
+
+    @staticmethod
+    def _get_search_vm_queries(inf, radl_sys, auth):
+        """
+        Get the image queries to the cloud providers needed to search the image of a system.
+        Return a list of tuples (cloud, query).
+        """
         # If an images is already set do not search
         if radl_sys.getValue("disk.0.image.url"):
             return []
 
-        dist = radl_sys.getValue('disk.0.os.flavour')
-        version = radl_sys.getValue('disk.0.os.version')
+        filters = {"distribution": radl_sys.getValue('disk.0.os.flavour'),
+                   "version": radl_sys.getValue('disk.0.os.version')}
         res = []
         for c in CloudInfo.get_cloud_list(auth):
-            cloud_site = c.getCloudConnector(inf)
-            try:
-                images = cloud_site.list_images(auth, filters={"distribution": dist, "version": version})
-            except Exception as ex:
-                images = []
-                InfrastructureManager.logger.warning("Inf ID: %s: Error getting images " % inf.id +
-                                                     "from cloud: %s (%s)" % (c.id, ex))
+            key = ImageCache.get_key("list_images", c.type, auth.getAuthInfoByID(c.id), filters)
+            res.append((c, (key, InfrastructureManager._list_images, (inf, c, auth, filters))))
+        return res
 
-            if images:
+    @staticmethod
+    def _get_search_vm_results(inf, radl_sys, clouds, results):
+        """
+        Get the systems with the images found in the cloud providers.
+        """
+        res = []
+        for c, images in zip(clouds, results):
+            if isinstance(images, Exception):
+                InfrastructureManager.logger.warning("Inf ID: %s: Error getting images " % inf.id +
+                                                     "from cloud: %s (%s)" % (c.id, images))
+            elif images:
                 new_sys = system(radl_sys.name)
                 new_sys.setValue("disk.0.image.url", images[0]["uri"])
                 res.append(new_sys)
-
         return res
 
+    @staticmethod
+    def search_vm(inf, radl_sys, auth):
+        queries = InfrastructureManager._get_search_vm_queries(inf, radl_sys, auth)
+        results = InfrastructureManager._run_image_queries([query for _, query in queries])
+        return InfrastructureManager._get_search_vm_results(inf, radl_sys, [c for c, _ in queries], results)
+
     @staticmethod
     def systems_with_iis(sel_inf, radl, auth):
         """
@@ -426,7 +514,7 @@ class InfrastructureManager:
         vmrc_list = []
         for vmrc_elem in auth.getAuthInfo('VMRC'):
             if 'host' in vmrc_elem and 'username' in vmrc_elem and 'password' in vmrc_elem:
-                vmrc_list.append(VMRC(vmrc_elem['host'], vmrc_elem['username'], vmrc_elem['password']))
+                vmrc_list.append(("VMRC", VMRC, (vmrc_elem['host'], vmrc_elem['username'], vmrc_elem['password'])))
 
         # Get AppDBIS credentials
         appdbis_list = []
@@ -434,9 +522,10 @@ class InfrastructureManager:
             host = None
             if 'host' in appdbis_elem:
                 host = appdbis_elem['host']
-            appdbis_list.append(AppDBIS(host))
+            appdbis_list.append(("AppDBIS", AppDBIS, (host,)))
 
-        systems_with_vmrc = {}
+        systems = {}
+        queries = []
         for system_id in set([d.id for d in radl.deploys if d.vm_number > 0]):
             s = radl.get_system_by_name(system_id)
 
@@ -447,8 +536,32 @@ class InfrastructureManager:
                     url_prefix = url_prefix + "/"
                 s.setValue("disk.0.image.url", url_prefix + image_id)
 
+            iis_queries = []
+            for iis_name, iis_class, iis_args in vmrc_list + appdbis_list:
+                key = ImageCache.get_key(iis_name, iis_args, str(s))
+                iis_queries.append((key, InfrastructureManager._search_iis_vm, (iis_class, iis_args, s)))
+            local_queries = InfrastructureManager._get_search_vm_queries(sel_inf, s, auth)
+            systems[system_id] = (s, len(vmrc_list), len(iis_queries), [c for c, _ in local_queries])
+            queries.extend(iis_queries + [query for _, query in local_queries])
+
+        # Query all the image sources concurrently
+        results = InfrastructureManager._run_image_queries(queries)
+
+        systems_with_vmrc = {}
+        for system_id, (s, num_vmrc, num_iis, clouds) in systems.items():
+            iis_results = results[:num_iis]
+            local_results = results[num_iis:num_iis + len(clouds)]
+            results = results[num_iis + len(clouds):]
+
+            for iis_res in iis_results:
+                if isinstance(iis_res, Exception):
+                    raise iis_res
+            vmrc_res = [s0 for iis_res in iis_results[:num_vmrc] for s0 in iis_res]
+            appdbis_res = [s0 for iis_res in iis_results[num_vmrc:] for s0 in iis_res]
+            local_res = InfrastructureManager._get_search_vm_results(sel_inf, s, clouds, local_results)
+
             # Remove the requested apps from the system
-            s_without_apps = radl.get_system_by_name(system_id).clone()
+            s_without_apps = s.clone()
             s_without_apps.delValue("disk.0.applications")
 
             # Set the default values for cpu, memory
@@ -459,9 +572,6 @@ class InfrastructureManager:
                 if not s_without_apps.hasFeature(f.prop, check_softs=True):
                     s_without_apps.addFeature(f)
 
-            vmrc_res = [s0 for vmrc in vmrc_list for s0 in vmrc.search_vm(s)]
-            appdbis_res = [s0 for appdbis in appdbis_list for s0 in appdbis.search_vm(s)]
-            local_res = InfrastructureManager.search_vm(sel_inf, s, auth)
             # Check that now the image URL is in the RADL
             if not s.getValue("disk.0.image.url") and not vmrc_res and not appdbis_res and not local_res:
                 sel_inf.add_cont_msg("No VMI obtained from VMRC nor AppDBIS nor Sites to system: " + system_id)
@@ -545,11 +655,40 @@ class InfrastructureManager:
                         break
 
     @staticmethod
-    def get_deploy_groups(cloud_list, radl, systems_with_iis, sel_inf, auth):
-        # Concrete systems with cloud providers and select systems with the greatest score
-        # in every cloud
-        concrete_systems = {}
-        for cloud_id, cloud in cloud_list.items():
+    def _add_scheduling_stats(cloud_type, elapsed=None, status="ok"):
+        """
+        Add the time spent concreting the systems in a cloud provider to the scheduling stats.
+        """
+        with InfrastructureManager._scheduling_lock:
+            stats = InfrastructureManager.scheduling_stats.setdefault(cloud_type, {"count": 0, "time": 0.0,
+                                                                                   "max_time": 0.0, "errors": 0,
+                                                                                   "timeouts": 0})
+            if elapsed is not None:
+                stats["count"] += 1
+                stats["time"] += elapsed
+                stats["max_time"] = max(stats["max_time"], elapsed)
+            if status != "ok":
+                stats[status] += 1
+
+    @staticmethod
+    def get_scheduling_stats():
+        """
+        Return a dict with the number of scheduling phases, the total and max time spent and
+        the number of errors and timeouts per cloud provider type.
+        """
+        with InfrastructureManager._scheduling_lock:
+            return dict((k, dict(v)) for k, v in InfrastructureManager.scheduling_stats.items())
+
+    @staticmethod
+    def _concrete_cloud_systems(cloud, radl, systems_with_iis, auth):
+        """
+        Concrete the systems with a cloud provider and select the systems with the greatest score.
+        Return a dict with the system id as key and a tuple (concrete system, score) as value.
+        """
+        init = time.time()
+        status = "errors"
+        try:
+            res = {}
             for system_id, systems in systems_with_iis.items():
                 s1 = [InfrastructureManager._compute_score(s.clone().applyFeatures(s0,
                                                                                    conflict="other",
@@ -557,8 +696,54 @@ class InfrastructureManager:
                                                            radl.get_system_by_name(system_id))
                       for s in systems for s0 in cloud.concreteSystem(s, auth)]
                 # Store the concrete system with largest score
-                concrete_systems.setdefault(cloud_id, {})[system_id] = max(s1, key=lambda x: x[1]) if s1 else (None,
-                                                                                                               -1e9)
+                res[system_id] = max(s1, key=lambda x: x[1]) if s1 else (None, -1e9)
+            status = "ok"
+            return res
+        finally:
+            elapsed = time.time() - init
+            InfrastructureManager.logger.debug("Systems concreted with cloud %s in %.2f secs." %
+                                               (cloud.cloud.id, elapsed))
+            InfrastructureManager._add_scheduling_stats(cloud.cloud.type, elapsed, status)
+
+    @staticmethod
+    def _get_concrete_pool():
+        with InfrastructureManager._scheduling_lock:
+            if InfrastructureManager._concrete_pool is None:
+                from multiprocessing.pool import ThreadPool
+                InfrastructureManager._concrete_pool = ThreadPool(processes=Config.CONCRETE_SYSTEM_POOL_SIZE)
+            return InfrastructureManager._concrete_pool
+
+    @staticmethod
+    def get_deploy_groups(cloud_list, radl, systems_with_iis, sel_inf, auth):
+        # Concrete systems with cloud providers and select systems with the greatest score
+        # in every cloud. Each cloud is evaluated concurrently with a timeout, using a shared
+        # bounded pool. The evaluations that time out are not cancelled: they keep running
+        # (using a thread of the pool) until the cloud provider answers, but they are ignored.
+        concrete_systems = {}
+        if cloud_list:
+            pool = InfrastructureManager._get_concrete_pool()
+            init = time.time()
+            async_res = {}
+            for cloud_id, cloud in cloud_list.items():
+                async_res[cloud_id] = pool.apply_async(
+                    IM.InfrastructureList.InfrastructureList.released(InfrastructureManager._concrete_cloud_systems),
+                    (cloud, radl, systems_with_iis, auth))
+
+            for cloud_id, cloud in cloud_list.items():
+                try:
+                    timeout = None
+                    if Config.CONCRETE_SYSTEM_TIMEOUT:
+                        timeout = max(0, init + Config.CONCRETE_SYSTEM_TIMEOUT - time.time())
+                    concrete_systems[cloud_id] = async_res[cloud_id].get(timeout)
+                except Exception as ex:
+                    if async_res[cloud_id].ready():
+                        msg = "Error concreting the systems with cloud %s: %s" % (cloud_id, get_ex_error(ex))
+                    else:
+                        msg = "Timeout concreting the systems with cloud %s." % cloud_id
+                        InfrastructureManager._add_scheduling_stats(cloud.cloud.type, status="timeouts")
+                    InfrastructureManager.logger.warning("Inf ID: %s: %s Ignoring it." % (sel_inf.id, msg))
+                    sel_inf.add_cont_msg(msg + " Ignoring it.")
+                    concrete_systems[cloud_id] = dict((system_id, (None, -1e9)) for system_id in systems_with_iis)
 
         # Group virtual machines to deploy by network dependencies
         deploy_groups = InfrastructureManager._compute_deploy_groups(radl)
@@ -602,7 +787,7 @@ class InfrastructureManager:
             if isinstance(radl_data, RADL):
                 radl = radl_data
             else:
-                radl = radl_parse.parse_radl(radl_data)
+                radl = RADLCache.parse(radl_data)
 
             InfrastructureManager.logger.debug("Inf ID: " + str(inf_id) + ": \n" + str(radl))
             radl.check()
@@ -634,6 +819,7 @@ class InfrastructureManager:
             sel_inf.add_cont_msg("Error getting VM images: %s" % str(ex))
             InfrastructureManager.logger.exception("Inf ID: " + sel_inf.id + " error getting VM images")
             raise ex
+        JobManager.set_progress(10)
 
         # Concrete systems with cloud providers and select systems with the greatest score
         # in every cloud
@@ -650,6 +836,7 @@ class InfrastructureManager:
         # Launch every group in the same cloud provider
         deployed_vm = {}
         deploy_items = []
+        bulk_deploys = {}
         for deploy_group in deploy_groups:
             if not deploy_group:
                 InfrastructureManager.logger.warning("Inf ID: %s: No VMs to deploy!" % sel_inf.id)
@@ -662,22 +849,32 @@ class InfrastructureManager:
             cloud = cloud_list[cloud_id]
 
             for d in deploy_group:
-                deploy_items.append((d, cloud_id, cloud))
+                if cloud.MAX_LAUNCH_BATCH > 1:
+                    # Merge the deploys of the same system in the same cloud to launch them in bulk
+                    key = (d.id, cloud_id)
+                    if key in bulk_deploys:
+                        bulk_deploys[key][0].vm_number += d.vm_number
+                    else:
+                        bulk_deploys[key] = (d.clone(), cloud_id, cloud)
+                else:
+                    deploy_items.append((d, cloud_id, cloud))
+
+        # Split the merged deploys in the batches of VMs launched with a single request
+        for d, cloud_id, cloud in bulk_deploys.values():
+            for vm_number in cloud.get_launch_batches(d.vm_number):
+                batch = d.clone()
+                batch.vm_number = vm_number
+                deploy_items.append((batch, cloud_id, cloud))
 
         # Now launch all the deployments
-        if Config.MAX_SIMULTANEOUS_LAUNCHES > 1:
-            pool = ThreadPool(processes=Config.MAX_SIMULTANEOUS_LAUNCHES)
-            pool.map(
-                lambda depitem: InfrastructureManager._launch_deploy(sel_inf, depitem[0], depitem[1],
-                                                                     depitem[2], concrete_systems, radl, auth,
-                                                                     deployed_vm),
-                deploy_items)
-            pool.close()
-        else:
-            for deploy, cloud_id, cloud in deploy_items:
-                InfrastructureManager._launch_deploy(sel_inf, deploy, cloud_id,
-                                                     cloud, concrete_systems, radl,
-                                                     auth, deployed_vm)
+        CloudLimiter.run(
+            lambda depitem: InfrastructureManager._launch_deploy(sel_inf, depitem[0], depitem[1],
+                                                                 depitem[2], concrete_systems, radl, auth,
+                                                                 deployed_vm),
+            deploy_items, lambda depitem: depitem[2].cloud, auth,
+            lambda depitem: concrete_systems.get(depitem[1], {}).get(depitem[0].id, (None,))[0])
+
+        JobManager.set_progress(80)
 
         # We make this to maintain the order of the VMs in the sel_inf.vm_list
         # according to the deploys shown in the RADL
@@ -739,7 +936,7 @@ class InfrastructureManager:
                 sel_inf.configured = False
             raise Exception("Error adding VMs: %s" % error_msg)
 
-        IM.InfrastructureList.InfrastructureList.save_data(inf_id)
+        IM.InfrastructureList.InfrastructureList.save_data(sel_inf)
 
         return [vm.im_id for vm in new_vms]
 
@@ -776,12 +973,9 @@ class InfrastructureManager:
             raise Exception(
                 'Incorrect parameter type to RemoveResource function: expected: str, int or list of str.')
 
-        cont = 0
         exceptions = []
         delete_list = [sel_inf.get_vm(vmid) for vmid in vm_ids]
-        for vm in delete_list:
-            if vm.delete(delete_list, auth, exceptions):
-                cont += 1
+        cont = sel_inf.delete_vms(delete_list, auth, exceptions)
 
         InfrastructureManager.logger.info("Inf ID: " + sel_inf.id + ": %d VMs successfully removed" % cont)
 
@@ -789,7 +983,7 @@ class InfrastructureManager:
             # Now test again if the infrastructure is contextualizing
             sel_inf.Contextualize(auth)
 
-        IM.InfrastructureList.InfrastructureList.save_data(inf_id)
+        IM.InfrastructureList.InfrastructureList.save_data(sel_inf)
 
         if exceptions:
             InfrastructureManager.logger.exception("Inf ID: " + sel_inf.id + ": Error removing resources")
@@ -821,7 +1015,7 @@ class InfrastructureManager:
         return res
 
     @staticmethod
-    def GetVMInfo(inf_id, vm_id, auth, json_res=False):
+    def GetVMInfo(inf_id, vm_id, auth, json_res=False, force=False):
         """
         Get information about a virtual machine in an infrastructure.
 
@@ -831,6 +1025,7 @@ class InfrastructureManager:
         - vm_id(str): virtual machine id.
         - auth(Authentication): parsed authentication tokens.
         - json_res(bool): Flag to return the info in RADL JSON format
+        - force(bool): Flag to force the update of the VM info from the cloud provider.
 
         Return: the RADL with the information about the VM or a str with the JSON data if json_res flag.
         """
@@ -841,13 +1036,17 @@ class InfrastructureManager:
 
         vm = InfrastructureManager.get_vm_from_inf(inf_id, vm_id, auth)
 
-        success = vm.update_status(auth)
+        if not force and VMReconciler.is_reconciled(vm.inf):
+            # The VM info is updated in background
+            success = False
+        else:
+            success = vm.update_status(auth, force)
         if not success:
             InfrastructureManager.logger.debug(
                 "Inf ID: " + str(inf_id) + ": " +
                 "Information not updated. Using last information retrieved")
         else:
-            IM.InfrastructureList.InfrastructureList.save_data(inf_id)
+            IM.InfrastructureList.InfrastructureList.save_data(vm.inf)
 
         if json_res:
             return dump_radl_json(vm.get_vm_info())
@@ -918,7 +1117,7 @@ class InfrastructureManager:
             raise Exception("Error modifying the information about the VM %s: %s" % (vm_id, alter_res))
 
         vm.update_status(auth)
-        IM.InfrastructureList.InfrastructureList.save_data(inf_id)
+        IM.InfrastructureList.InfrastructureList.save_data(vm.inf)
 
         return vm.info
 
@@ -997,7 +1196,7 @@ class InfrastructureManager:
         return res
 
     @staticmethod
-    def GetInfrastructureState(inf_id, auth):
+    def GetInfrastructureState(inf_id, auth, force=False):
         """
         Get the aggregated state of an infrastructure.
 
@@ -1005,10 +1204,12 @@ class InfrastructureManager:
 
         - inf_id(str): infrastructure id.
         - auth(Authentication): parsed authentication tokens.
+        - force(bool): Flag to force the update of the VMs state from the cloud providers.
 
-        Return: a dict with two elements:
+        Return: a dict with three elements:
             - 'state': str with the aggregated state of the infrastructure
             - 'vm_states': a dict indexed with the id of the VM and its state as value
+            - 'last_update': time of the oldest update of the VMs state (None if there are no VMs)
         """
         auth = InfrastructureManager.check_auth_data(auth)
 
@@ -1016,12 +1217,30 @@ class InfrastructureManager:
 
         sel_inf = InfrastructureManager.get_infrastructure(inf_id, auth)
 
+        if force or not VMReconciler.is_reconciled(sel_inf):
+            vm_list = sel_inf.get_vm_list()
+            VirtualMachine.prefetch_status(vm_list, auth, force)
+            for vm in vm_list:
+                # First try to update the status of the VM
+                vm.update_status(auth, force)
+
+        res = InfrastructureManager._get_inf_state(sel_inf)
+        IM.InfrastructureList.InfrastructureList.save_data(sel_inf)
+        InfrastructureManager.logger.info("Inf ID: " + str(inf_id) + " is in state: " + res['state'])
+        return res
+
+    @staticmethod
+    def _get_inf_state(sel_inf):
+        """
+        Get the aggregated state of an infrastructure using the current state of the VMs.
+        """
         vm_list = sel_inf.get_vm_list()
         vm_states = {}
+        last_update = None
         for vm in vm_list:
-            # First try to update the status of the VM
-            vm.update_status(auth)
             vm_states[str(vm.im_id)] = vm.state
+            if last_update is None or vm.last_update < last_update:
+                last_update = vm.last_update
 
         state = None
         for vm in vm_list:
@@ -1062,9 +1281,130 @@ class InfrastructureManager:
         if sel_inf.deleting:
             state = VirtualMachine.DELETING
 
-        IM.InfrastructureList.InfrastructureList.save_data(inf_id)
-        InfrastructureManager.logger.info("Inf ID: " + str(inf_id) + " is in state: " + state)
-        return {'state': state, 'vm_states': vm_states}
+        return {'state': state, 'vm_states': vm_states, 'last_update': last_update}
+
+    @staticmethod
+    def GetInfrastructureEvents(inf_id, auth, last_id=None, timeout=0):
+        """
+        Get the events (VM state transitions, contextualization steps and messages)
+        of an infrastructure. If there are no new events it waits for them.
+
+        Args:
+
+        - inf_id(str): infrastructure id.
+        - auth(Authentication): parsed authentication tokens.
+        - last_id(int): ID of the last event received. If None all stored events are returned.
+        - timeout(int): max time to wait for new events (limited to EVENTS_MAX_WAIT).
+
+        Return: a dict with the current aggregated 'state' of the infrastructure,
+                the list of 'events' and the 'last_id' of the events (0 if there are no events,
+                to be used as cursor in the next call).
+        """
+        auth = InfrastructureManager.check_auth_data(auth)
+        sel_inf = InfrastructureManager.get_infrastructure(inf_id, auth)
+
+        EventBus.add_watcher(sel_inf, auth)
+        try:
+            events = EventBus.get_events(inf_id, last_id, min(timeout, Config.EVENTS_MAX_WAIT)) or []
+        finally:
+            EventBus.remove_watcher(inf_id)
+
+        if events:
+            last_id = events[-1]["id"]
+        res = InfrastructureManager._get_inf_state(sel_inf)
+        res["events"] = events
+        res["last_id"] = last_id or 0
+        return res
+
+    @staticmethod
+    def get_infrastructures(inf_ids, auth):
+        """
+        Return a dict with the infrastructure info of a list of IDs if valid authorization provided.
+        In case of error getting an infrastructure the value is the exception raised.
+        """
+        res = {}
+        infs = IM.InfrastructureList.InfrastructureList.get_infrastructures(inf_ids)
+        for inf_id in inf_ids:
+            sel_inf = infs.get(inf_id)
+            if not sel_inf:
+                res[inf_id] = IncorrectInfrastructureException()
+            elif not sel_inf.is_authorized(auth):
+                res[inf_id] = UnauthorizedUserException()
+            elif sel_inf.deleted:
+                res[inf_id] = DeletedInfrastructureException()
+            else:
+                VMReconciler.register(sel_inf, auth)
+                res[inf_id] = sel_inf
+        return res
+
+    @staticmethod
+    def GetInfrastructuresState(inf_ids, auth, force=False):
+        """
+        Get the aggregated state of a list of infrastructures.
+
+        Args:
+
+        - inf_ids(list of str): list of infrastructure ids.
+        - auth(Authentication): parsed authentication tokens.
+        - force(bool): Flag to force the update of the VMs state from the cloud providers.
+
+        Return: a dict indexed by the infrastructure id with the same value returned
+                by GetInfrastructureState or a dict with an 'error' element in case of failure.
+        """
+        auth = InfrastructureManager.check_auth_data(auth)
+
+        InfrastructureManager.logger.info("Getting state of the Inf IDs: %s" % inf_ids)
+
+        infs = InfrastructureManager.get_infrastructures(inf_ids, auth)
+        sel_infs = [inf for inf in infs.values() if not isinstance(inf, Exception)]
+
+        # Update the status of all the VMs concurrently
+        vm_list = [vm for inf in sel_infs for vm in inf.get_vm_list()
+                   if force or not VMReconciler.is_reconciled(inf)]
+        if vm_list:
+            VirtualMachine.prefetch_status(vm_list, auth, force)
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(processes=min(len(vm_list), Config.MAX_SIMULTANEOUS_UPDATES))
+            pool.map(IM.InfrastructureList.InfrastructureList.released(lambda vm: vm.update_status(auth, force)),
+                     vm_list)
+            pool.close()
+
+        res = {}
+        for inf_id, sel_inf in infs.items():
+            if isinstance(sel_inf, Exception):
+                res[inf_id] = {'error': get_ex_error(sel_inf)}
+            else:
+                res[inf_id] = InfrastructureManager._get_inf_state(sel_inf)
+
+        if sel_infs:
+            IM.InfrastructureList.InfrastructureList.save_data(sel_infs)
+        return res
+
+    @staticmethod
+    def GetInfrastructuresInfo(inf_ids, auth):
+        """
+        Get information about a list of infrastructures.
+
+        Args:
+
+        - inf_ids(list of str): list of infrastructure ids.
+        - auth(Authentication): parsed authentication tokens.
+
+        Return: a dict indexed by the infrastructure id with a dict with a 'vm_list'
+                element with the list of virtual machine ids, or a dict with an 'error'
+                element in case of failure.
+        """
+        auth = InfrastructureManager.check_auth_data(auth)
+
+        InfrastructureManager.logger.info("Getting information about the Inf IDs: %s" % inf_ids)
+
+        res = {}
+        for inf_id, sel_inf in InfrastructureManager.get_infrastructures(inf_ids, auth).items():
+            if isinstance(sel_inf, Exception):
+                res[inf_id] = {'error': get_ex_error(sel_inf)}
+            else:
+                res[inf_id] = {'vm_list': [str(vm.im_id) for vm in sel_inf.get_vm_list()]}
+        return res
 
     @staticmethod
     def _stop_vm(vm, auth, exceptions):
@@ -1077,6 +1417,8 @@ class InfrastructureManager:
         if not success:
             InfrastructureManager.logger.info("Inf ID: " + vm.inf.id + ": The VM cannot be stopped")
             exceptions.append(msg)
+            return msg
+        return None
 
     @staticmethod
     def StopInfrastructure(inf_id, auth):
@@ -1099,17 +1441,9 @@ class InfrastructureManager:
 
         sel_inf = InfrastructureManager.get_infrastructure(inf_id, auth)
         exceptions = []
-        if Config.MAX_SIMULTANEOUS_LAUNCHES > 1:
-            pool = ThreadPool(processes=Config.MAX_SIMULTANEOUS_LAUNCHES)
-            pool.map(
-                lambda vm: InfrastructureManager._stop_vm(
-                    vm, auth, exceptions),
-                reversed(sel_inf.get_vm_list())
-            )
-            pool.close()
-        else:
-            for vm in sel_inf.get_vm_list():
-                InfrastructureManager._stop_vm(vm, auth, exceptions)
+        CloudLimiter.run(lambda vm: InfrastructureManager._stop_vm(vm, auth, exceptions),
+                         list(reversed(sel_inf.get_vm_list())), lambda vm: vm.cloud, auth,
+                         lambda vm: vm.info.systems[0])
 
         if exceptions:
             msg = ""
@@ -1131,6 +1465,8 @@ class InfrastructureManager:
         if not success:
             InfrastructureManager.logger.info("Inf ID: " + vm.inf.id + ": The VM cannot be restarted")
             exceptions.append(msg)
+            return msg
+        return None
 
     @staticmethod
     def StartInfrastructure(inf_id, auth):
@@ -1153,17 +1489,9 @@ class InfrastructureManager:
 
         sel_inf = InfrastructureManager.get_infrastructure(inf_id, auth)
         exceptions = []
-        if Config.MAX_SIMULTANEOUS_LAUNCHES > 1:
-            pool = ThreadPool(processes=Config.MAX_SIMULTANEOUS_LAUNCHES)
-            pool.map(
-                lambda vm: InfrastructureManager._start_vm(
-                    vm, auth, exceptions),
-                reversed(sel_inf.get_vm_list())
-            )
-            pool.close()
-        else:
-            for vm in sel_inf.get_vm_list():
-                InfrastructureManager._start_vm(vm, auth, exceptions)
+        CloudLimiter.run(lambda vm: InfrastructureManager._start_vm(vm, auth, exceptions),
+                         list(reversed(sel_inf.get_vm_list())), lambda vm: vm.cloud, auth,
+                         lambda vm: vm.info.systems[0])
 
         if exceptions:
             msg = ""
@@ -1317,11 +1645,7 @@ class InfrastructureManager:
         sel_inf.set_deleting()
 
         if async_call:
-            t = threading.Thread(name="DestroyResource-%s" % sel_inf.id,
-                                 target=sel_inf.destroy,
-                                 args=(auth, force))
-            t.daemon = True
-            t.start()
+            JobManager.submit("DestroyInfrastructure", sel_inf.id, sel_inf.destroy, (auth, force), auth)
         else:
             sel_inf.destroy(auth, force)
         return ""
@@ -1540,6 +1864,10 @@ class InfrastructureManager:
 
     @staticmethod
     def check_auth_data(auth):
+        # Do not validate again the credentials (e.g. OIDC tokens) already checked in this request
+        if isinstance(auth, Authentication) and auth.checked:
+            return auth
+
         # First check if it is configured to check the users from a list
         im_auth = auth.getAuthInfo("InfrastructureManager")
 
@@ -1592,6 +1920,7 @@ class InfrastructureManager:
         auth = InfrastructureManager.get_auth_from_vault(auth)
         auth = InfrastructureManager.gen_auth_from_appdb(auth)
         auth = InfrastructureManager.translate_egi_to_ost(auth)
+        auth.checked = True
         return auth
 
     @staticmethod
@@ -1628,7 +1957,7 @@ class InfrastructureManager:
         inf = IM.InfrastructureInfo.InfrastructureInfo()
         inf.auth = Authentication(auth.getAuthInfo("InfrastructureManager"))
         IM.InfrastructureList.InfrastructureList.add_infrastructure(inf)
-        IM.InfrastructureList.InfrastructureList.save_data(inf.id)
+        IM.InfrastructureList.InfrastructureList.save_data(inf)
         im_user = auth.getAuthInfo("InfrastructureManager")[0]['username']
         InfrastructureManager.logger.info("Creating new Inf ID: %s by %s." % (inf.id, im_user))
 
@@ -1636,11 +1965,8 @@ class InfrastructureManager:
         try:
             if async_call:
                 InfrastructureManager.logger.debug("Inf ID: " + str(inf.id) + " created Async.")
-                t = threading.Thread(name="AddResource-%s" % inf.id,
-                                     target=InfrastructureManager.AddResource,
-                                     args=(inf.id, radl, auth))
-                t.daemon = True
-                t.start()
+                JobManager.submit("CreateInfrastructure", inf.id, InfrastructureManager.AddResource,
+                                  (inf.id, radl, auth), auth)
             else:
                 # In case of sync call
                 vms = InfrastructureManager.AddResource(inf.id, radl, auth)
@@ -1666,7 +1992,7 @@ class InfrastructureManager:
         except Exception as e:
             InfrastructureManager.logger.exception("Error Creating Inf ID " + str(inf.id))
             inf.delete()
-            IM.InfrastructureList.InfrastructureList.save_data(inf.id)
+            IM.InfrastructureList.InfrastructureList.save_data(inf)
             IM.InfrastructureList.InfrastructureList.remove_inf(inf)
             raise e
 
@@ -1675,7 +2001,7 @@ class InfrastructureManager:
         return inf.id
 
     @staticmethod
-    def GetInfrastructureList(auth, flt=None):
+    def GetInfrastructureList(auth, flt=None, stream=False):
         """
         Return the infrastructure ids associated to IM tokens.
 
@@ -1684,6 +2010,8 @@ class InfrastructureManager:
         - auth(Authentication): parsed authentication tokens.
         - flt(string): string to filter the list of returned infrastructures.
                           A regex to be applied in the RADL or TOSCA of the infra.
+        - stream(bool): return a generator instead of a list, to avoid loading all the
+                        infrastructures at once.
 
         Return(list of int): list of infrastructure ids.
         """
@@ -1696,21 +2024,28 @@ class InfrastructureManager:
             InfrastructureManager.logger.error("No correct auth data has been specified.")
             raise InvaliddUserException()
 
-        inf_ids = IM.InfrastructureList.InfrastructureList.get_inf_ids(auth)
+        res = IM.InfrastructureList.InfrastructureList.iter_inf_ids(auth)
         if flt:
-            res = []
-            for infid in inf_ids:
-                inf = InfrastructureManager.get_infrastructure(infid, auth)
-                radl = str(inf.get_radl())
-                tosca = ""
-                if "TOSCA" in inf.extra_info:
-                    tosca = inf.extra_info["TOSCA"].serialize()
-
-                if re.search(flt, radl) or re.search(flt, tosca):
-                    res.append(infid)
-        else:
-            res = inf_ids
-        return res
+            res = InfrastructureManager._filter_inf_ids(res, flt, auth)
+        if stream:
+            return res
+        return list(res)
+
+    @staticmethod
+    def _filter_inf_ids(inf_ids, flt, auth):
+        """
+        Generator that filters the infrastructure ids applying the flt regex
+        in the RADL or TOSCA of the infrastructures.
+        """
+        for infid in inf_ids:
+            inf = InfrastructureManager.get_infrastructure(infid, auth)
+            radl = str(inf.get_radl())
+            tosca = ""
+            if "TOSCA" in inf.extra_info:
+                tosca = inf.extra_info["TOSCA"].serialize()
+
+            if re.search(flt, radl) or re.search(flt, tosca):
+                yield infid
 
     @staticmethod
     def ExportInfrastructure(inf_id, delete, auth_data):
@@ -1725,7 +2060,7 @@ class InfrastructureManager:
         InfrastructureManager.logger.info("Exporting Inf ID: " + str(sel_inf.id))
         if delete:
             sel_inf.delete()
-            IM.InfrastructureList.InfrastructureList.save_data(sel_inf.id)
+            IM.InfrastructureList.InfrastructureList.save_data(sel_inf)
             IM.InfrastructureList.InfrastructureList.remove_inf(sel_inf)
         return str_inf
 
@@ -1748,7 +2083,7 @@ class InfrastructureManager:
         IM.InfrastructureList.InfrastructureList.add_infrastructure(new_inf)
         InfrastructureManager.logger.info("Importing new infrastructure with Inf ID: " + str(new_inf.id))
         # Save the state
-        IM.InfrastructureList.InfrastructureList.save_data(new_inf.id)
+        IM.InfrastructureList.InfrastructureList.save_data(new_inf)
         return new_inf.id
 
     @staticmethod
@@ -1785,8 +2120,57 @@ class InfrastructureManager:
         else:
             return image_url
 
+    @staticmethod
+    def CreateJob(op, inf_id, args, auth, function=None):
+        """
+        Launch an operation over an infrastructure as an asynchronous job.
+
+        Args:
+
+        - op(str): name of the operation (one of ASYNC_OPERATIONS).
+        - inf_id(str): infrastructure id.
+        - args(tuple): arguments of the operation.
+        - auth(Authentication): parsed authentication tokens.
+        - function(callable): function to call. If not set the InfrastructureManager
+          function with the name of the operation is used.
+
+        Return(str): the ID of the new job.
+        """
+        if Config.BOOT_MODE in [1, 2]:
+            raise DisabledFunctionException()
+
+        if op not in InfrastructureManager.ASYNC_OPERATIONS:
+            raise Exception("Operation %s cannot be launched asynchronously." % op)
+
+        checked_auth = InfrastructureManager.check_auth_data(auth)
+        # Check that the inf exists and the user has access to it
+        InfrastructureManager.get_infrastructure(inf_id, checked_auth)
+
+        if function is None:
+            function = getattr(InfrastructureManager, op)
+        job = JobManager.submit(op, inf_id, function, args, checked_auth)
+        return job.id
+
+    @staticmethod
+    def GetJobInfo(job_id, auth):
+        """
+        Get the information about an asynchronous job.
+
+        Args:
+
+        - job_id(str): job id.
+        - auth(Authentication): parsed authentication tokens.
+
+        Return: a dict with keys "id", "op", "inf_id", "state", "progress",
+                "result", "error_msg", "creation_date" and "update_date".
+        """
+        auth = InfrastructureManager.check_auth_data(auth)
+        return JobManager.get_job(job_id, auth).get_info()
+
     @staticmethod
     def stop():
+        JobManager.stop()
+        VMReconciler.stop()
         IM.InfrastructureList.InfrastructureList.stop()
         # Flush data to DB
         InfrastructureManager.logger.info('Flushing data to DB...')
@@ -1886,7 +2270,7 @@ class InfrastructureManager:
         # Only add new user if it is not already authorized or we are overwriting
         if not sel_inf.is_authorized(new_auth) or overwrite:
             sel_inf.change_auth(new_auth, overwrite)
-        IM.InfrastructureList.InfrastructureList.save_data(inf_id)
+        IM.InfrastructureList.InfrastructureList.save_data(sel_inf)
         return ""
 
     @staticmethod
@@ -2049,20 +2433,64 @@ class InfrastructureManager:
         return res
 
     @staticmethod
-    def GetStats(init_date, end_date, auth):
+    def GetMemoryReport(auth):
+        """
+        Get a report of the memory used by the infrastructures of the user loaded in memory.
+        Args:
+        - auth(Authentication): parsed authentication tokens.
+        Return: a dict with the stats of the infrastructures cache ("cache") and the list of
+                infrastructures ("infrastructures") with their estimated memory usage
+                (see :py:meth:`InfrastructureInfo.get_memory_usage`) sorted by size.
+        """
+        # First check the auth data
+        auth = InfrastructureManager.check_auth_data(auth)
+        infs = []
+        for inf in list(IM.InfrastructureList.InfrastructureList.infrastructure_list.values()):
+            if inf.is_authorized(auth):
+                infs.append(inf.get_memory_usage())
+        infs.sort(key=lambda x: x["data_size"] + x["cont_out_memory"], reverse=True)
+        return {"cache": IM.InfrastructureList.InfrastructureList.get_cache_stats(), "infrastructures": infs}
+
+    @staticmethod
+    def GetServiceStats(auth):
+        """
+        Get the internal stats of the IM service. Only the admin users can get them,
+        as they include data of all the users.
+        Args:
+        - auth(Authentication): parsed authentication tokens.
+        Return: a dict with the stats of the infrastructures cache ("cache"), of the
+                scheduling of the systems in the cloud providers ("scheduling"), of the
+                operations per cloud provider endpoint ("clouds") and of the HTTP requests
+                per host ("http").
+        """
+        # First check the auth data
+        auth = InfrastructureManager.check_auth_data(auth)
+        if not any(im_auth.get("admin") for im_auth in auth.getAuthInfo("InfrastructureManager")):
+            raise UnauthorizedUserException("Access to the service stats not granted.")
+        return {"cache": IM.InfrastructureList.InfrastructureList.get_cache_stats(),
+                "scheduling": InfrastructureManager.get_scheduling_stats(),
+                "clouds": CloudLimiter.get_stats(),
+                "http": HTTPClient.get_stats()}
+
+    @staticmethod
+    def GetStats(init_date, end_date, auth, stream=False):
         """
         Get the statistics from the IM DB.
         Args:
         - init_date(str): Only will be returned infrastructure created afther this date.
         - end_date(str): Only will be returned infrastructure created before this date.
         - auth(Authentication): parsed authentication tokens.
-        Return: a list of dict with the stats.
+        - stream(bool): return a generator instead of a list.
+        Return: a list (or a generator) of dict with the stats.
         """
         # First check the auth data
         auth = InfrastructureManager.check_auth_data(auth)
         if not init_date:
             init_date = "1970-01-01"
-        stats = Stats.get_stats(init_date, end_date, auth)
+        if stream:
+            stats = Stats.iter_stats(init_date, end_date, auth)
+        else:
+            stats = Stats.get_stats(init_date, end_date, auth)
         if stats is None:
             raise Exception("ERROR connecting with the database!.")
         else:
@@ -0,0 +1,476 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import logging
+import socket
+import threading
+import time
+from uuid import uuid1
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+from IM.db import DataBase
+from IM.config import Config
+import IM.InfrastructureList
+from IM import get_ex_error
+
+
+class IncorrectJobException(Exception):
+    """ Invalid job ID or access not granted. """
+
+    def __init__(self, msg="Invalid job ID or access not granted."):
+        Exception.__init__(self, msg)
+        self.message = msg
+
+
+class Job:
+    """
+    Stores the information about an asynchronous operation.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+    def __init__(self, op=None, inf_id=None, auth=None):
+        self.id = str(uuid1())
+        """Job unique ID."""
+        self.op = op
+        """Name of the operation performed by the job."""
+        self.inf_id = inf_id
+        """ID of the infrastructure affected by the job."""
+        self.owners = []
+        """Identities (user name and hashed password) of the job owner."""
+        if auth:
+            self.owners = [Job._get_identity(im_auth) for im_auth in auth.getAuthInfo("InfrastructureManager")]
+        self.instance = None
+        """ID of the IM instance that processes the job."""
+        self.state = Job.PENDING
+        """State of the job."""
+        self.progress = 0
+        """Percentage of the operation completed."""
+        self.result = None
+        """Value returned by the operation."""
+        self.error_msg = None
+        """Error message in case of failure."""
+        self.creation_date = int(time.time())
+        """Creation time of the job."""
+        self.update_date = self.creation_date
+        """Time of the last change in the job."""
+        self.function = None
+        """Function to call to perform the operation."""
+        self.args = ()
+        """Arguments of the function."""
+
+    def serialize(self):
+        odict = self.__dict__.copy()
+        del odict['function']
+        del odict['args']
+        return json.dumps(odict)
+
+    @staticmethod
+    def deserialize(str_data):
+        newjob = Job()
+        dic = str_data if isinstance(str_data, dict) else json.loads(str_data)
+        newjob.__dict__.update(dic)
+        return newjob
+
+    @staticmethod
+    def _get_identity(im_auth):
+        """
+        Get the data needed to check the ownership of a job from an InfrastructureManager
+        auth item, without storing the password or the token.
+        """
+        password = im_auth.get('password') or ''
+        return {'username': im_auth.get('username'),
+                'password': hashlib.sha256(password.encode('utf-8')).hexdigest(),
+                'token': im_auth.get('token') is not None}
+
+    def get_info(self):
+        """
+        Get a dict with the public information of the job
+        """
+        return {"id": self.id,
+                "op": self.op,
+                "inf_id": self.inf_id,
+                "state": self.state,
+                "progress": self.progress,
+                "result": self.result,
+                "error_msg": self.error_msg,
+                "creation_date": self.creation_date,
+                "update_date": self.update_date}
+
+    def is_authorized(self, auth):
+        """
+        Checks if the auth data provided is authorized to access this job
+        """
+        for other_im_auth in auth.getAuthInfo("InfrastructureManager"):
+            if other_im_auth.get('admin'):
+                return True
+            other = Job._get_identity(other_im_auth)
+            for owner in self.owners:
+                # Same rules as InfrastructureInfo._is_authorized
+                if ((not owner['token'] or other['token']) and owner['username'] == other['username'] and
+                        owner['password'] == other['password']):
+                    return True
+        return False
+
+    def set_result(self, res):
+        """
+        Set the value returned by the operation, assuring that it can be serialized
+        """
+        try:
+            json.dumps(res)
+            self.result = res
+        except (TypeError, ValueError):
+            self.result = str(res)
+
+
+class JobManager():
+    """
+    Class to manage the asynchronous operations (jobs) of the IM service.
+    """
+
+    jobs = {}
+    """Map from string to :py:class:`Job` with the active (pending or running) jobs."""
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    _queue = Queue()
+    """Queue of jobs pending to be processed."""
+
+    _workers = []
+    """List of worker threads."""
+
+    _current = threading.local()
+    """Thread local data to store the job processed by each worker."""
+
+    _table_created = set()
+    """Set of the DB URLs where the jobs table has been already created."""
+
+    _last_purge = 0
+    """Time of the last purge of the old jobs."""
+
+    PURGE_INTERVAL = 3600
+    """Time (in secs) between the purges of the old jobs."""
+
+    INSTANCE = socket.gethostname()
+    """ID of this IM instance, to only fail its own jobs when it is restarted."""
+
+    DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+    """Format of the date column of the jobs table."""
+
+    @staticmethod
+    def submit(op, inf_id, function, args, auth):
+        """
+        Create a new job and queue it to be processed by the workers.
+
+        Args:
+
+        - op(str): name of the operation.
+        - inf_id(str): infrastructure id.
+        - function(callable): function that performs the operation.
+        - args(tuple): arguments of the function.
+        - auth(Authentication): parsed authentication tokens.
+
+        Return(Job): the new job.
+        """
+        job = Job(op, inf_id, auth)
+        job.instance = JobManager.INSTANCE
+        job.function = function
+        job.args = args
+
+        with JobManager._lock:
+            JobManager.jobs[job.id] = job
+        JobManager.save_job(job)
+
+        JobManager._start_workers()
+        JobManager._queue.put(job)
+        JobManager.logger.info("Job %s (%s) queued for Inf ID: %s." % (job.id, op, inf_id))
+        return job
+
+    @staticmethod
+    def get_job(job_id, auth):
+        """
+        Get the job with the specified ID.
+
+        Args:
+
+        - job_id(str): job id.
+        - auth(Authentication): parsed authentication tokens.
+
+        Return(Job): the job.
+        """
+        job = JobManager.jobs.get(job_id)
+        if not job:
+            job = JobManager._get_job_from_db(job_id)
+        if not job or not job.is_authorized(auth):
+            raise IncorrectJobException()
+        return job
+
+    @staticmethod
+    def set_progress(progress):
+        """
+        Set the progress of the job processed by the current thread (if any).
+
+        Args:
+
+        - progress(int): percentage of the operation completed.
+        """
+        job = getattr(JobManager._current, "job", None)
+        if job:
+            job.progress = progress
+            job.update_date = int(time.time())
+            JobManager.save_job(job)
+
+    @staticmethod
+    def _start_workers():
+        """Launch the worker threads if not already running."""
+        with JobManager._lock:
+            JobManager._workers = [t for t in JobManager._workers if t.is_alive()]
+            while len(JobManager._workers) < Config.MAX_SIMULTANEOUS_JOBS:
+                t = threading.Thread(name="JobWorker-%d" % len(JobManager._workers),
+                                     target=JobManager._process_jobs)
+                t.daemon = True
+                t.start()
+                JobManager._workers.append(t)
+
+    @staticmethod
+    def _process_jobs():
+        """Worker loop: process jobs until a None is received."""
+        queue = JobManager._queue
+        while True:
+            job = queue.get()
+            if job is None:
+                break
+            JobManager._run_job(job)
+
+    @staticmethod
+    def _run_job(job):
+        """Execute the operation of a job and store the results."""
+        job.state = Job.RUNNING
+        job.update_date = int(time.time())
+        JobManager.save_job(job)
+        JobManager._current.job = job
+        try:
+            job.set_result(job.function(*job.args))
+            job.progress = 100
+            job.state = Job.FINISHED
+            JobManager.logger.info("Job %s (%s) successfully finished." % (job.id, job.op))
+        except Exception as ex:
+            JobManager.logger.exception("Job %s (%s) failed." % (job.id, job.op))
+            job.error_msg = get_ex_error(ex)
+            job.state = Job.FAILED
+        finally:
+            JobManager._current.job = None
+            IM.InfrastructureList.InfrastructureList.release()
+
+        job.update_date = int(time.time())
+        JobManager.save_job(job)
+        with JobManager._lock:
+            if job.id in JobManager.jobs:
+                del JobManager.jobs[job.id]
+            purge = time.time() - JobManager._last_purge > JobManager.PURGE_INTERVAL
+            if purge:
+                JobManager._last_purge = time.time()
+        if purge:
+            JobManager.check_jobs()
+
+    @staticmethod
+    def stop():
+        """ Stop the worker threads """
+        with JobManager._lock:
+            for _ in JobManager._workers:
+                JobManager._queue.put(None)
+            JobManager._workers = []
+
+    @staticmethod
+    def save_job(job):
+        """
+        Save the job data to DB
+        """
+        try:
+            if not JobManager._save_job_to_db(Config.DATA_DB, job):
+                JobManager.logger.error("ERROR saving data of job %s." % job.id)
+        except Exception:
+            JobManager.logger.exception("ERROR saving data of job %s." % job.id)
+
+    @staticmethod
+    def init_table():
+        """ Creates the jobs table """
+        if Config.DATA_DB in JobManager._table_created:
+            return True
+        db = DataBase(Config.DATA_DB)
+        if db.connect():
+            if not db.table_exists("jobs"):
+                JobManager.logger.debug("Creating the jobs table!.")
+                if db.db_type == DataBase.MYSQL:
+                    db.execute("CREATE TABLE jobs(id VARCHAR(255) PRIMARY KEY, inf_id VARCHAR(255),"
+                               " date TIMESTAMP, data TEXT, INDEX(inf_id), INDEX(date))")
+                elif db.db_type == DataBase.SQLITE:
+                    db.execute("CREATE TABLE jobs(id VARCHAR(255) PRIMARY KEY, inf_id VARCHAR(255),"
+                               " date TIMESTAMP, data TEXT)")
+                    db.execute("CREATE INDEX jobs_date ON jobs(date)")
+                elif db.db_type == DataBase.MONGO:
+                    db.connection.create_collection("jobs")
+                    db.connection["jobs"].create_index([("id", 1)], unique=True)
+                    db.connection["jobs"].create_index([("inf_id", 1)])
+                    db.connection["jobs"].create_index([("date", 1)])
+            db.close()
+            JobManager._table_created.add(Config.DATA_DB)
+            return True
+        else:
+            JobManager.logger.error("ERROR connecting with the database!.")
+
+        return False
+
+    @staticmethod
+    def _save_job_to_db(db_url, job):
+        if not JobManager.init_table():
+            return False
+        db = DataBase(db_url)
+        if db.connect():
+            data = job.serialize()
+            if db.db_type == DataBase.MONGO:
+                res = db.replace("jobs", {"id": job.id}, {"id": job.id, "inf_id": job.inf_id,
+                                                          "data": data, "date": job.update_date})
+            else:
+                # Set the date explicitly, as now() only has day resolution in SQLite
+                date = time.strftime(JobManager.DATE_FORMAT, time.localtime(job.update_date))
+                res = db.execute("replace into jobs (id, inf_id, data, date) values (%s, %s, %s, %s)",
+                                 (job.id, job.inf_id, data, date))
+            db.close()
+            return res
+        else:
+            JobManager.logger.error("ERROR connecting with the database!.")
+            return False
+
+    @staticmethod
+    def check_jobs(interrupted=False):
+        """
+        Purge the finished jobs not updated in the last JOB_HISTORY_TIME secs.
+
+        Args:
+
+        - interrupted(bool): also set as failed the pending or running jobs processed by this
+          IM instance (or by a previous version without instance ID). To be used at IM startup,
+          as the jobs of a previous execution will never be finished. It reads the whole table.
+        """
+        try:
+            if not JobManager.init_table():
+                return False
+            now = time.time()
+            purge = []
+            failed = []
+            db = DataBase(Config.DATA_DB)
+            if db.connect():
+                if interrupted:
+                    if db.db_type == DataBase.MONGO:
+                        res = db.find_iter("jobs", {}, {"id": True, "data": True})
+                        res = ((elem["id"], elem["data"]) for elem in res)
+                    else:
+                        res = db.select_iter("select id, data from jobs")
+                elif Config.JOB_HISTORY_TIME:
+                    # Only the jobs not updated in the last JOB_HISTORY_TIME secs can be purged
+                    cutoff = int(now - Config.JOB_HISTORY_TIME)
+                    if db.db_type == DataBase.MONGO:
+                        res = db.find("jobs", {"date": {"$lt": cutoff}}, {"id": True, "data": True})
+                        res = [(elem["id"], elem["data"]) for elem in res]
+                    else:
+                        res = db.select("select id, data from jobs where date < %s",
+                                        (time.strftime(JobManager.DATE_FORMAT, time.localtime(cutoff)),))
+                else:
+                    res = []
+                for job_id, data in res:
+                    job_data = json.loads(data)
+                    if job_data["state"] in [Job.FINISHED, Job.FAILED]:
+                        if Config.JOB_HISTORY_TIME and now - job_data["update_date"] > Config.JOB_HISTORY_TIME:
+                            purge.append(job_id)
+                    elif (interrupted and job_id not in JobManager.jobs and
+                            job_data.get("instance") in [None, JobManager.INSTANCE]):
+                        failed.append(Job.deserialize(job_data))
+
+                for job_id in purge:
+                    if db.db_type == DataBase.MONGO:
+                        db.delete("jobs", {"id": job_id})
+                    else:
+                        db.execute("delete from jobs where id = %s", (job_id,))
+                db.close()
+            else:
+                JobManager.logger.error("ERROR connecting with the database!.")
+                return False
+
+            if purge:
+                JobManager.logger.info("%d old jobs purged." % len(purge))
+            for job in failed:
+                JobManager.logger.warning("Job %s (%s) was %s when the IM was stopped. Setting it as failed." %
+                                          (job.id, job.op, job.state))
+                job.error_msg = "The IM service was stopped while the job was %s." % job.state
+                job.state = Job.FAILED
+                job.update_date = int(now)
+                JobManager.save_job(job)
+            return True
+        except Exception:
+            JobManager.logger.exception("ERROR checking the jobs in the database.")
+            return False
+
+    @staticmethod
+    def _get_job_from_db(job_id):
+        try:
+            if not JobManager.init_table():
+                return None
+            db = DataBase(Config.DATA_DB)
+            if db.connect():
+                if db.db_type == DataBase.MONGO:
+                    res = db.find("jobs", {"id": job_id}, {"data": True})
+                    res = [(elem["data"],) for elem in res]
+                else:
+                    res = db.select("select data from jobs where id = %s", (job_id,))
+                db.close()
+                if res:
+                    return Job.deserialize(res[0][0])
+            else:
+                JobManager.logger.error("ERROR connecting with the database!.")
+        except Exception:
+            JobManager.logger.exception("ERROR reading job %s from database." % job_id)
+        return None
+
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        JobManager.stop()
+        JobManager.jobs = {}
+        JobManager._queue = Queue()
+        JobManager._table_created = set()
+        JobManager._last_purge = 0
+        db = DataBase(Config.DATA_DB)
+        if db.connect():
+            if db.table_exists("jobs"):
+                if db.db_type == DataBase.MONGO:
+                    db.delete("jobs", {})
+                else:
+                    db.execute("delete from jobs")
+            db.close()
@@ -0,0 +1,90 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from radl.radl_parse import parse_radl
+from IM.config import Config
+
+
+class RADLCache():
+    """
+    LRU cache of parsed RADL documents indexed by the hash of their content.
+    The same RADL texts are parsed many times (the info and requested RADL of the VMs
+    each time an infrastructure is loaded, the stats, etc.) and many VMs of an
+    infrastructure share the same requested RADL.
+    """
+
+    _cache = OrderedDict()
+    """Map from the hash of the RADL text to the parsed RADL object."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    hits = 0
+    """Number of parse requests served from the cache."""
+
+    misses = 0
+    """Number of parse requests that required to parse the RADL text."""
+
+    @staticmethod
+    def _get_key(radl_data):
+        if not isinstance(radl_data, bytes):
+            radl_data = radl_data.encode("utf-8")
+        return hashlib.sha256(radl_data).hexdigest()
+
+    @staticmethod
+    def parse(radl_data, clone=True):
+        """
+        Parse a RADL document using the cache.
+
+        Args:
+
+        - radl_data(str): RADL document to parse.
+        - clone(bool): return a copy of the cached RADL object. Set it to False only
+          if the returned object is not going to be modified.
+
+        Return(RADL): RADL object.
+        """
+        if not Config.RADL_CACHE_SIZE or not isinstance(radl_data, str) or not radl_data.strip():
+            return parse_radl(radl_data)
+
+        key = RADLCache._get_key(radl_data)
+        with RADLCache._lock:
+            radl = RADLCache._cache.get(key)
+            if radl is not None:
+                RADLCache._cache.move_to_end(key)
+                RADLCache.hits += 1
+
+        if radl is None:
+            radl = parse_radl(radl_data)
+            with RADLCache._lock:
+                RADLCache.misses += 1
+                RADLCache._cache[key] = radl
+                while len(RADLCache._cache) > Config.RADL_CACHE_SIZE:
+                    RADLCache._cache.popitem(last=False)
+
+        return radl.clone() if clone else radl
+
+    @staticmethod
+    def clear():
+        """Remove all the elements of the cache."""
+        with RADLCache._lock:
+            RADLCache._cache = OrderedDict()
+            RADLCache.hits = 0
+            RADLCache.misses = 0
@@ -17,19 +17,30 @@
 import logging
 import threading
 import json
+import csv
+import io
 import base64
 import flask
 import os
+import signal
+import time
 import yaml
 import datetime
+import calendar
+import zlib
+import requests
 
 from cheroot.wsgi import Server as WSGIServer, PathInfoDispatcher
 from cheroot.ssl.builtin import BuiltinSSLAdapter
 from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.http import http_date
 from IM.InfrastructureInfo import IncorrectVMException, DeletedVMException, IncorrectStateException
+from IM.InfrastructureList import InfrastructureList
 from IM.InfrastructureManager import (InfrastructureManager, DeletedInfrastructureException,
                                       IncorrectInfrastructureException, UnauthorizedUserException,
                                       InvaliddUserException, DisabledFunctionException)
+from IM.JobManager import IncorrectJobException
+from IM.EventBus import EventBus
 from IM.auth import Authentication
 from IM.config import Config
 from IM import get_ex_error
@@ -45,6 +56,8 @@ AUTH_LINE_SEPARATOR = '\\n'
 # Combination of chars used to separate the lines inside the auth data
 # (i.e. in a certificate)
 AUTH_NEW_LINE_SEPARATOR = '\\\\n'
+# Interval (in secs) to send keepalive comments in the event streams
+EVENTS_KEEPALIVE_INTERVAL = 15
 
 HTML_ERROR_TEMPLATE = """<!DOCTYPE HTML PUBLIC "-//IETF//DTD HTML 2.0//EN">
 <html>
@@ -72,7 +85,13 @@ def run_in_thread(host, port):
 
 def run(host, port):
     global flask_server
-    flask_server = WSGIServer((host, port), PathInfoDispatcher({'/': app}))
+    flask_server = WSGIServer((host, port), PathInfoDispatcher({'/': app}),
+                              numthreads=Config.REST_THREADS,
+                              max=Config.REST_MAX_THREADS,
+                              request_queue_size=Config.REST_REQUEST_QUEUE_SIZE,
+                              timeout=Config.REST_KEEPALIVE_TIMEOUT,
+                              reuse_port=Config.REST_WORKERS > 1)
+    flask_server.max_request_body_size = Config.REST_MAX_BODY_SIZE
     if Config.REST_SSL:
         flask_server.ssl_adapter = BuiltinSSLAdapter(Config.REST_SSL_CERTFILE,
                                                      Config.REST_SSL_KEYFILE,
@@ -80,6 +99,111 @@ def run(host, port):
     flask_server.start()
 
 
+def _stop_worker(signum, frame):
+    """
+    Signal handler of the REST worker processes: stop them as the main one,
+    assuring that the data of the infrastructures are saved.
+    """
+    try:
+        stop()
+        InfrastructureManager.stop()
+    except Exception:
+        logger.exception("Error stopping REST API worker process.")
+    os._exit(0)
+
+
+def stop_workers(pids, timeout=30):
+    """
+    Send a SIGTERM to the REST worker processes and wait them to finish
+    (up to timeout secs) to let them save the infrastructures data.
+    """
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    pending = list(pids)
+    wait = 0
+    while pending and wait < timeout:
+        for pid in list(pending):
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                    pending.remove(pid)
+            except OSError:
+                pending.remove(pid)
+        if pending:
+            time.sleep(0.5)
+            wait += 0.5
+    if pending:
+        logger.warning("REST API worker processes %s not finished in %d secs." % (pending, timeout))
+
+
+def run_workers(host, port):
+    """
+    Launch REST_WORKERS - 1 additional processes serving the REST API in the same port.
+    It must be called before starting any other thread.
+    Returns the list of PIDs of the new processes, to stop them with :py:func:`stop_workers`.
+    """
+    pids = []
+    for _ in range(Config.REST_WORKERS - 1):
+        pid = os.fork()
+        if pid == 0:
+            for sig in [signal.SIGINT, signal.SIGTERM, signal.SIGHUP]:
+                signal.signal(sig, _stop_worker)
+            try:
+                run(host, port)
+            except Exception:
+                logger.exception("Error in REST API worker process.")
+            os._exit(0)
+        pids.append(pid)
+    logger.info("Launched %d REST API worker processes: %s" % (len(pids), pids))
+    return pids
+
+
+def benchmark(host, port, num_requests, concurrency=None):
+    """
+    Measure the number of requests per second that the REST API is able to serve
+    calling the /version path.
+    Returns the number of requests per second.
+    """
+    from multiprocessing.pool import ThreadPool
+
+    if not concurrency:
+        concurrency = Config.REST_THREADS
+    if host in ["0.0.0.0", ""]:  # nosec
+        host = "127.0.0.1"
+    protocol = "https" if Config.REST_SSL else "http"
+    url = "%s://%s:%d/version" % (protocol, host, port)
+
+    # Wait the server to be ready
+    wait = 0
+    while (flask_server is None or not flask_server.ready) and wait < 30:
+        time.sleep(1)
+        wait += 1
+
+    session = requests.Session()
+    errors = []
+
+    def _get(_):
+        try:
+            resp = session.get(url, verify=Config.VERIFI_SSL, timeout=Config.REST_KEEPALIVE_TIMEOUT)
+            if resp.status_code != 200:
+                errors.append(resp.status_code)
+        except Exception as ex:
+            errors.append(ex)
+
+    pool = ThreadPool(processes=concurrency)
+    init = time.time()
+    pool.map(_get, range(num_requests))
+    pool.close()
+    total_time = time.time() - init
+
+    rps = num_requests / total_time if total_time > 0 else 0
+    logger.info("REST API benchmark: %d requests (%d errors) with concurrency %d in %.2f secs: %.2f req/s." %
+                (num_requests, len(errors), concurrency, total_time, rps))
+    return rps
+
+
 def return_error(code, msg):
     content_type = get_media_type('Accept')
 
@@ -191,6 +315,98 @@ def format_output_json(res, field_name=None, list_field_name=None):
     return json.dumps(res_dict)
 
 
+def stream_output_json(elems, field_name):
+    """
+    Generator to stream a list of elements as a JSON object with the list in the
+    field_name field, without building the whole document in memory.
+    """
+    yield '{"%s": [' % field_name
+    sep = ''
+    for elem in elems:
+        yield sep + json.dumps(elem)
+        sep = ', '
+    yield ']}'
+
+
+def stream_output_ndjson(elems):
+    """
+    Generator to stream a list of elements as newline delimited JSON.
+    """
+    for elem in elems:
+        yield json.dumps(elem) + "\n"
+
+
+def stream_output_csv(elems):
+    """
+    Generator to stream a list of dicts as CSV, using the keys
+    of the first element as header.
+    """
+    buf = io.StringIO()
+    writer = None
+    for elem in elems:
+        if writer is None:
+            writer = csv.DictWriter(buf, fieldnames=list(elem.keys()), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow(elem)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+
+
+def stream_output_text(elems):
+    """
+    Generator to stream a list of strings, one per line.
+    """
+    sep = ''
+    for elem in elems:
+        yield sep + elem
+        sep = '\n'
+
+
+def get_stream_media_type(default_type="application/json"):
+    """
+    Get the media type to stream a list of elements from the Accept header.
+    Returns None if none of the accepted media types is supported.
+    """
+    accept = get_media_type('Accept')
+    if not accept:
+        accept = [default_type]
+
+    for accept_item in accept:
+        if accept_item in ["application/json", "application/*"]:
+            return "application/json"
+        elif accept_item in [default_type, "application/x-ndjson", "text/csv"]:
+            return accept_item
+        elif accept_item in ["*/*", "text/*"]:
+            return default_type
+    return None
+
+
+def stream_output(elems, default_type="application/json", field_name=None, list_field_name=None):
+    """
+    Stream a list of elements in the media type requested in the Accept header
+    (JSON, newline delimited JSON, CSV or the default type), without building the
+    whole document in memory.
+    """
+    media_type = get_stream_media_type(default_type)
+    if not media_type:
+        return return_error(415, "Unsupported Accept Media Types: %s" % ",".join(get_media_type('Accept')))
+
+    if media_type not in ["application/json", "application/x-ndjson", "text/csv"]:
+        output = stream_output_text(elems)
+    else:
+        if list_field_name:
+            elems = ({list_field_name: elem} for elem in elems)
+        if media_type == "application/json":
+            output = stream_output_json(elems, field_name)
+        elif media_type == "application/x-ndjson":
+            output = stream_output_ndjson(elems)
+        else:
+            output = stream_output_csv(elems)
+
+    return flask.Response(flask.stream_with_context(output), 200, {'Content-Type': media_type})
+
+
 def format_output(res, default_type="text/plain", field_name=None, list_field_name=None, extra_headers=None):
     """
     Format the output of the API responses
@@ -243,6 +459,90 @@ def format_output(res, default_type="text/plain", field_name=None, list_field_na
         return return_error(415, "Unsupported Accept Media Types: %s" % ",".join(accept))
 
 
+def get_async_param():
+    """
+    Get the value of the async query parameter.
+    Returns True, False or None if the value is not valid.
+    """
+    if "async" in flask.request.args.keys():
+        str_async = flask.request.args.get("async").lower()
+        if str_async in ['yes', 'true', '1']:
+            return True
+        elif str_async in ['no', 'false', '0']:
+            return False
+        else:
+            return None
+    return False
+
+
+def get_force_param():
+    """
+    Get the value of the force query parameter.
+    Returns True, False or None if the value is not valid.
+    """
+    if "force" in flask.request.args.keys():
+        str_force = flask.request.args.get("force").lower()
+        if str_force in ['yes', 'true', '1']:
+            return True
+        elif str_force in ['no', 'false', '0']:
+            return False
+        else:
+            return None
+    return False
+
+
+def format_job_output(job_id):
+    """
+    Format the output of an operation launched as an asynchronous job
+    """
+    res = "%sjobs/%s" % (flask.request.url_root, job_id)
+    response = format_output(res, "text/uri-list", "uri", extra_headers={'JobID': job_id, 'Location': res})
+    if response.status_code == 200:
+        response.status_code = 202
+    return response
+
+
+def check_not_modified(obj):
+    """
+    Get the ETag and Last-Modified headers of an infrastructure or VM using
+    its version counter and check them with the conditional headers of the request.
+    Return a tuple with a flag set to True if the client has the current data and
+    the dict of headers to add to the response.
+    """
+    if obj is None:
+        return False, {}
+
+    # The representation also depends on the Accept header and the query parameters
+    variant = "%s?%s" % (flask.request.headers.get('Accept', ''), flask.request.query_string.decode())
+    version, last_modified = obj.get_version()
+    etag = "%d-%08x" % (version, zlib.crc32(variant.encode()) & 0xffffffff)
+    headers = {'ETag': '"%s"' % etag, 'Last-Modified': http_date(last_modified)}
+
+    not_modified = False
+    if flask.request.if_none_match:
+        not_modified = flask.request.if_none_match.contains_weak(etag)
+    elif flask.request.if_modified_since:
+        not_modified = int(last_modified) <= calendar.timegm(flask.request.if_modified_since.utctimetuple())
+    return not_modified, headers
+
+
+@app.before_request
+def check_body_size():
+    """
+    Reject the requests with bodies greater than REST_MAX_BODY_SIZE
+    """
+    if Config.REST_MAX_BODY_SIZE and (flask.request.content_length or 0) > Config.REST_MAX_BODY_SIZE:
+        return return_error(413, "Request body too large. Max size: %d bytes." % Config.REST_MAX_BODY_SIZE)
+
+
+@app.teardown_request
+def release_infrastructures(exception=None):
+    """
+    Release the infrastructures used in the request so they can be evicted from memory
+    """
+    InfrastructureList.release()
+
+
 @app.after_request
 def enable_cors(response):
     """
@@ -251,7 +551,9 @@ def enable_cors(response):
     if Config.ENABLE_CORS:
         response.headers['Access-Control-Allow-Origin'] = Config.CORS_ORIGIN
         response.headers['Access-Control-Allow-Methods'] = 'PUT, GET, POST, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Origin, Accept, Content-Type, Authorization'
+        response.headers['Access-Control-Allow-Headers'] = ('Origin, Accept, Content-Type, Authorization, '
+                                                            'If-None-Match, If-Modified-Since')
+        response.headers['Access-Control-Expose-Headers'] = 'ETag, Last-Modified'
     return response
 
 
@@ -263,15 +565,9 @@ def RESTDestroyInfrastructure(infid=None):
         return return_error(401, "No authentication data provided")
 
     try:
-        force = False
-        if "force" in flask.request.args.keys():
-            str_force = flask.request.args.get("force").lower()
-            if str_force in ['yes', 'true', '1']:
-                force = True
-            elif str_force in ['no', 'false', '0']:
-                force = False
-            else:
-                return return_error(400, "Incorrect value in force parameter")
+        force = get_force_param()
+        if force is None:
+            return return_error(400, "Incorrect value in force parameter")
 
         async_call = False
         if "async" in flask.request.args.keys():
@@ -326,6 +622,81 @@ def RESTGetInfrastructureInfo(infid=None):
         return return_error(400, "Error Getting Inf. info: %s" % get_ex_error(ex))
 
 
+def format_event(event):
+    """
+    Format an event using the Server-sent events format
+    """
+    return "id: %d\nevent: %s\ndata: %s\n\n" % (event["id"], event["type"], json.dumps(event["data"]))
+
+
+def stream_events(sel_inf, auth, first_events, last_id, timeout):
+    """
+    Generator that returns the events of an infrastructure as Server-sent events
+    """
+    EventBus.add_watcher(sel_inf, auth)
+    try:
+        end = time.time() + timeout
+        events = first_events
+        while events is not None:
+            for event in events:
+                last_id = event["id"]
+                yield format_event(event)
+                if event["type"] == "deleted":
+                    return
+            remaining = end - time.time()
+            if remaining <= 0:
+                return
+            if not events:
+                yield ": keepalive\n\n"
+            events = EventBus.get_events(sel_inf.id, last_id, min(remaining, EVENTS_KEEPALIVE_INTERVAL))
+    finally:
+        EventBus.remove_watcher(sel_inf.id)
+
+
+@app.route('/infrastructures/<infid>/events', methods=['GET'])
+def RESTGetInfrastructureEvents(infid=None):
+    try:
+        auth = get_auth_header()
+    except Exception:
+        return return_error(401, "No authentication data provided")
+
+    try:
+        last_id = flask.request.args.get("wait", flask.request.headers.get("Last-Event-ID"))
+        timeout = Config.EVENTS_MAX_WAIT
+        try:
+            if last_id is not None:
+                last_id = int(last_id)
+            if "timeout" in flask.request.args.keys():
+                timeout = min(int(flask.request.args.get("timeout")), Config.EVENTS_MAX_WAIT)
+        except ValueError:
+            return return_error(400, "Incorrect value in wait or timeout parameters")
+
+        accept = get_media_type('Accept') or []
+        if "text/event-stream" in accept:
+            res = InfrastructureManager.GetInfrastructureEvents(infid, auth, last_id)
+            # The auth data has been checked in the previous call
+            sel_inf = InfrastructureList.get_infrastructure(infid)
+            state_event = {"id": res["last_id"], "type": "state",
+                           "data": {"state": res["state"], "vm_states": res["vm_states"]}}
+            return flask.Response(flask.stream_with_context(stream_events(sel_inf, auth, [state_event] + res["events"],
+                                                                          res["last_id"], timeout)),
+                                  mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+        else:
+            # Only wait in case of specifying the last event received
+            res = InfrastructureManager.GetInfrastructureEvents(infid, auth, last_id,
+                                                                timeout if last_id is not None else 0)
+            return format_output(res, default_type="application/json")
+    except DeletedInfrastructureException as ex:
+        return return_error(404, "Error Getting Inf. events: %s" % get_ex_error(ex))
+    except IncorrectInfrastructureException as ex:
+        return return_error(404, "Error Getting Inf. events: %s" % get_ex_error(ex))
+    except UnauthorizedUserException as ex:
+        return return_error(403, "Error Getting Inf. events: %s" % get_ex_error(ex))
+    except Exception as ex:
+        logger.exception("Error Getting Inf. events")
+        return return_error(400, "Error Getting Inf. events: %s" % get_ex_error(ex))
+
+
 @app.route('/infrastructures/<infid>/<prop>')
 def RESTGetInfrastructureProperty(infid=None, prop=None):
     try:
@@ -334,6 +705,15 @@ def RESTGetInfrastructureProperty(infid=None, prop=None):
         return return_error(401, "No authentication data provided")
 
     try:
+        if prop in ["contmsg", "radl"]:
+            # Check if the client already has the current version of the data
+            checked_auth = InfrastructureManager.check_auth_data(auth)
+            not_modified, headers = check_not_modified(InfrastructureManager.get_infrastructure(infid, checked_auth))
+            if not_modified:
+                return flask.make_response("", 304, headers)
+        else:
+            headers = {}
+
         if prop == "contmsg":
             headeronly = False
             if "headeronly" in flask.request.args.keys():
@@ -345,9 +725,9 @@ def RESTGetInfrastructureProperty(infid=None, prop=None):
                 else:
                     return return_error(400, "Incorrect value in headeronly parameter")
 
-            res = InfrastructureManager.GetInfrastructureContMsg(infid, auth, headeronly)
+            res = InfrastructureManager.GetInfrastructureContMsg(infid, checked_auth, headeronly)
         elif prop == "radl":
-            res = InfrastructureManager.GetInfrastructureRADL(infid, auth)
+            res = InfrastructureManager.GetInfrastructureRADL(infid, checked_auth)
         elif prop == "tosca":
             accept = get_media_type('Accept')
             if accept and "application/json" not in accept and "*/*" not in accept and "application/*" not in accept:
@@ -362,8 +742,21 @@ def RESTGetInfrastructureProperty(infid=None, prop=None):
             accept = get_media_type('Accept')
             if accept and "application/json" not in accept and "*/*" not in accept and "application/*" not in accept:
                 return return_error(415, "Unsupported Accept Media Types: %s" % accept)
-            res = InfrastructureManager.GetInfrastructureState(infid, auth)
-            return format_output(res, default_type="application/json", field_name="state")
+
+            force = get_force_param()
+            if force is None:
+                return return_error(400, "Incorrect value in force parameter")
+
+            # Check if the client already has the current version before refreshing the state
+            checked_auth = InfrastructureManager.check_auth_data(auth)
+            sel_inf = InfrastructureManager.get_infrastructure(infid, checked_auth)
+            if not force:
+                not_modified, headers = check_not_modified(sel_inf)
+                if not_modified:
+                    return flask.make_response("", 304, headers)
+            res = InfrastructureManager.GetInfrastructureState(infid, checked_auth, force)
+            _, headers = check_not_modified(sel_inf)
+            return format_output(res, default_type="application/json", field_name="state", extra_headers=headers)
         elif prop == "outputs":
             accept = get_media_type('Accept')
             if accept and "application/json" not in accept and "*/*" not in accept and "application/*" not in accept:
@@ -397,7 +790,7 @@ def RESTGetInfrastructureProperty(infid=None, prop=None):
         else:
             return return_error(404, "Incorrect infrastructure property")
 
-        return format_output(res, field_name=prop)
+        return format_output(res, field_name=prop, extra_headers=headers)
     except DeletedInfrastructureException as ex:
         return return_error(404, "Error Getting Inf. prop: %s" % get_ex_error(ex))
     except IncorrectInfrastructureException as ex:
@@ -409,6 +802,73 @@ def RESTGetInfrastructureProperty(infid=None, prop=None):
         return return_error(400, "Error Getting Inf. prop: %s" % get_ex_error(ex))
 
 
+def _get_inf_ids_from_body():
+    """
+    Get the list of infrastructure IDs (or URIs) from the body of the request.
+    It accepts a JSON list or a JSON object with an "infrastructures" list.
+    """
+    content_type = get_media_type('Content-Type') or ["application/json"]
+    if "application/json" not in content_type:
+        raise Exception("Unsupported Media Type %s" % content_type)
+
+    inf_ids = json.loads(flask.request.data.decode("utf-8"))
+    if isinstance(inf_ids, dict):
+        inf_ids = inf_ids.get("infrastructures")
+    if not isinstance(inf_ids, list):
+        raise Exception("Incorrect list of infrastructure IDs.")
+
+    # Enable to get also the infrastructure URIs
+    return [str(inf_id).rstrip("/").split("/")[-1] for inf_id in inf_ids]
+
+
+@app.route('/infrastructures/states', methods=['POST'])
+def RESTGetInfrastructuresState():
+    try:
+        auth = get_auth_header()
+    except Exception:
+        return return_error(401, "No authentication data provided")
+
+    try:
+        inf_ids = _get_inf_ids_from_body()
+    except Exception as ex:
+        return return_error(400, "Error Getting Inf. states: %s" % get_ex_error(ex))
+
+    force = get_force_param()
+    if force is None:
+        return return_error(400, "Incorrect value in force parameter")
+
+    try:
+        res = InfrastructureManager.GetInfrastructuresState(inf_ids, auth, force)
+        return format_output(res, default_type="application/json", field_name="states")
+    except Exception as ex:
+        logger.exception("Error Getting Inf. states")
+        return return_error(400, "Error Getting Inf. states: %s" % get_ex_error(ex))
+
+
+@app.route('/infrastructures/info', methods=['POST'])
+def RESTGetInfrastructuresInfo():
+    try:
+        auth = get_auth_header()
+    except Exception:
+        return return_error(401, "No authentication data provided")
+
+    try:
+        inf_ids = _get_inf_ids_from_body()
+    except Exception as ex:
+        return return_error(400, "Error Getting Inf. info: %s" % get_ex_error(ex))
+
+    try:
+        res = InfrastructureManager.GetInfrastructuresInfo(inf_ids, auth)
+        for infid, inf_info in res.items():
+            if "vm_list" in inf_info:
+                inf_info["vm_list"] = ["%sinfrastructures/%s/vms/%s" % (flask.request.url_root, infid, vm_id)
+                                       for vm_id in inf_info["vm_list"]]
+        return format_output(res, default_type="application/json", field_name="infrastructures")
+    except Exception as ex:
+        logger.exception("Error Getting Inf. info")
+        return return_error(400, "Error Getting Inf. info: %s" % get_ex_error(ex))
+
+
 @app.route('/infrastructures', methods=['GET'])
 def RESTGetInfrastructureList():
     try:
@@ -421,13 +881,11 @@ def RESTGetInfrastructureList():
         if "filter" in flask.request.args.keys():
             flt = flask.request.args.get("filter")
 
-        inf_ids = InfrastructureManager.GetInfrastructureList(auth, flt)
-        res = []
-
-        for inf_id in inf_ids:
-            res.append("%sinfrastructures/%s" % (flask.request.url_root, inf_id))
+        inf_ids = InfrastructureManager.GetInfrastructureList(auth, flt, stream=True)
+        url_root = flask.request.url_root
+        res = ("%sinfrastructures/%s" % (url_root, inf_id) for inf_id in inf_ids)
 
-        return format_output(res, "text/uri-list", "uri-list", "uri")
+        return stream_output(res, "text/uri-list", "uri-list", "uri")
     except InvaliddUserException as ex:
         return return_error(401, "Error Getting Inf. List: %s" % get_ex_error(ex))
     except Exception as ex:
@@ -536,9 +994,21 @@ def RESTGetVMInfo(infid=None, vmid=None):
     except Exception:
         return return_error(401, "No authentication data provided")
 
+    force = get_force_param()
+    if force is None:
+        return return_error(400, "Incorrect value in force parameter")
+
     try:
-        radl = InfrastructureManager.GetVMInfo(infid, vmid, auth)
-        return format_output(radl, field_name="radl")
+        # Check if the client already has the current version before refreshing the VM info
+        checked_auth = InfrastructureManager.check_auth_data(auth)
+        vm = InfrastructureManager.get_vm_from_inf(infid, vmid, checked_auth)
+        if not force:
+            not_modified, headers = check_not_modified(vm)
+            if not_modified:
+                return flask.make_response("", 304, headers)
+        radl = InfrastructureManager.GetVMInfo(infid, vmid, checked_auth, force=force)
+        _, headers = check_not_modified(vm)
+        return format_output(radl, field_name="radl", extra_headers=headers)
     except DeletedInfrastructureException as ex:
         return return_error(404, "Error Getting VM. info: %s" % get_ex_error(ex))
     except IncorrectInfrastructureException as ex:
@@ -562,8 +1032,15 @@ def RESTGetVMProperty(infid=None, vmid=None, prop=None):
         return return_error(401, "No authentication data provided")
 
     try:
+        headers = {}
         if prop == 'contmsg':
-            info = InfrastructureManager.GetVMContMsg(infid, vmid, auth)
+            # Check if the client already has the current version of the data
+            checked_auth = InfrastructureManager.check_auth_data(auth)
+            not_modified, headers = check_not_modified(InfrastructureManager.get_vm_from_inf(infid, vmid,
+                                                                                             checked_auth))
+            if not_modified:
+                return flask.make_response("", 304, headers)
+            info = InfrastructureManager.GetVMContMsg(infid, vmid, checked_auth)
         elif prop == 'command':
             auth = InfrastructureManager.check_auth_data(auth)
             sel_inf = InfrastructureManager.get_infrastructure(infid, auth)
@@ -642,7 +1119,7 @@ def RESTGetVMProperty(infid=None, vmid=None, prop=None):
         if info is None:
             return return_error(404, "Incorrect property %s for VM ID %s" % (prop, vmid))
         else:
-            return format_output(info, field_name=prop)
+            return format_output(info, field_name=prop, extra_headers=headers)
     except DeletedInfrastructureException as ex:
         return return_error(404, "Error Getting VM. property: %s" % get_ex_error(ex))
     except IncorrectInfrastructureException as ex:
@@ -658,6 +1135,31 @@ def RESTGetVMProperty(infid=None, vmid=None, prop=None):
         return return_error(400, "Error Getting VM property: %s" % get_ex_error(ex))
 
 
+def _add_resources(infid, radl_data, remove_list, tosca_data, auth, context):
+    """
+    Remove and add the resources requested in a RESTAddResource call
+    Returns a tuple with the list of new VM IDs and the number of removed VMs
+    """
+    removed_vms = 0
+    if remove_list:
+        removed_vms = InfrastructureManager.RemoveResource(infid, remove_list, auth, context)
+        if len(remove_list) != removed_vms:
+            logger.error("Error deleting resources %s (removed %s)" % (remove_list, removed_vms))
+
+    vm_ids = InfrastructureManager.AddResource(infid, radl_data, auth, context)
+
+    # If there are no changes in the infra, launch a reconfigure
+    if not remove_list and not vm_ids and context:
+        InfrastructureManager.Reconfigure(infid, "", auth)
+
+    # Replace the TOSCA document
+    if tosca_data:
+        sel_inf = InfrastructureManager.get_infrastructure(infid, auth)
+        sel_inf.extra_info['TOSCA'] = tosca_data
+
+    return vm_ids, removed_vms
+
+
 @app.route('/infrastructures/<infid>', methods=['POST'])
 def RESTAddResource(infid=None):
     try:
@@ -676,6 +1178,10 @@ def RESTAddResource(infid=None):
             else:
                 return return_error(400, "Incorrect value in context parameter")
 
+        async_call = get_async_param()
+        if async_call is None:
+            return return_error(400, "Incorrect value in async parameter")
+
         content_type = get_media_type('Content-Type')
         radl_data = flask.request.data.decode("utf-8")
         tosca_data = None
@@ -697,21 +1203,13 @@ def RESTAddResource(infid=None):
             else:
                 return return_error(415, "Unsupported Media Type %s" % content_type)
 
-        if remove_list:
-            removed_vms = InfrastructureManager.RemoveResource(infid, remove_list, auth, context)
-            if len(remove_list) != removed_vms:
-                logger.error("Error deleting resources %s (removed %s)" % (remove_list, removed_vms))
-
-        vm_ids = InfrastructureManager.AddResource(infid, radl_data, auth, context)
+        if async_call:
+            job_id = InfrastructureManager.CreateJob("AddResource", infid,
+                                                     (infid, radl_data, remove_list, tosca_data, auth, context),
+                                                     auth, _add_resources)
+            return format_job_output(job_id)
 
-        # If there are no changes in the infra, launch a reconfigure
-        if not remove_list and not vm_ids and context:
-            InfrastructureManager.Reconfigure(infid, "", auth)
-
-        # Replace the TOSCA document
-        if tosca_data:
-            sel_inf = InfrastructureManager.get_infrastructure(infid, auth)
-            sel_inf.extra_info['TOSCA'] = tosca_data
+        vm_ids, removed_vms = _add_resources(infid, radl_data, remove_list, tosca_data, auth, context)
 
         res = []
         for vm_id in vm_ids:
@@ -756,6 +1254,14 @@ def RESTRemoveResource(infid=None, vmid=None):
             else:
                 return return_error(400, "Incorrect value in context parameter")
 
+        async_call = get_async_param()
+        if async_call is None:
+            return return_error(400, "Incorrect value in async parameter")
+
+        if async_call:
+            job_id = InfrastructureManager.CreateJob("RemoveResource", infid, (infid, vmid, auth, context), auth)
+            return format_job_output(job_id)
+
         InfrastructureManager.RemoveResource(infid, vmid, auth, context)
         return flask.make_response("", 200, {'Content-Type': 'text/plain'})
     except DeletedInfrastructureException as ex:
@@ -783,6 +1289,10 @@ def RESTAlterVM(infid=None, vmid=None):
         return return_error(401, "No authentication data provided")
 
     try:
+        async_call = get_async_param()
+        if async_call is None:
+            return return_error(400, "Incorrect value in async parameter")
+
         content_type = get_media_type('Content-Type')
         radl_data = flask.request.data.decode("utf-8")
 
@@ -797,6 +1307,10 @@ def RESTAlterVM(infid=None, vmid=None):
             else:
                 return return_error(415, "Unsupported Media Type %s" % content_type)
 
+        if async_call:
+            job_id = InfrastructureManager.CreateJob("AlterVM", infid, (infid, vmid, radl_data, auth), auth)
+            return format_job_output(job_id)
+
         vm_info = InfrastructureManager.AlterVM(infid, vmid, radl_data, auth)
 
         return format_output(vm_info, field_name="radl")
@@ -833,6 +1347,10 @@ def RESTReconfigureInfrastructure(infid=None):
             except Exception:
                 return return_error(400, "Incorrect vm_list format.")
 
+        async_call = get_async_param()
+        if async_call is None:
+            return return_error(400, "Incorrect value in async parameter")
+
         content_type = get_media_type('Content-Type')
         radl_data = flask.request.data.decode("utf-8")
 
@@ -850,6 +1368,10 @@ def RESTReconfigureInfrastructure(infid=None):
         else:
             radl_data = ""
 
+        if async_call:
+            job_id = InfrastructureManager.CreateJob("Reconfigure", infid, (infid, radl_data, auth, vm_list), auth)
+            return format_job_output(job_id)
+
         res = InfrastructureManager.Reconfigure(infid, radl_data, auth, vm_list)
         # As we have to reconfigure the infra, return the ID for the HAProxy stickiness
         return flask.make_response(res, 200, {'Content-Type': 'text/plain', 'InfID': infid})
@@ -874,12 +1396,22 @@ def RESTOperateInfrastructure(infid=None, op=None):
         return return_error(401, "No authentication data provided")
 
     try:
+        async_call = get_async_param()
+        if async_call is None:
+            return return_error(400, "Incorrect value in async parameter")
+
         if op == "start":
-            res = InfrastructureManager.StartInfrastructure(infid, auth)
+            func_name = "StartInfrastructure"
         elif op == "stop":
-            res = InfrastructureManager.StopInfrastructure(infid, auth)
+            func_name = "StopInfrastructure"
         else:
             flask.abort(404)
+
+        if async_call:
+            job_id = InfrastructureManager.CreateJob(func_name, infid, (infid, auth), auth)
+            return format_job_output(job_id)
+
+        res = getattr(InfrastructureManager, func_name)(infid, auth)
         return flask.make_response(res, 200, {'Content-Type': 'text/plain'})
     except DeletedInfrastructureException as ex:
         return return_error(404, "Error in %s operation: %s" % (op, get_ex_error(ex)))
@@ -942,6 +1474,16 @@ def RESTGetVersion():
         return return_error(400, "Error getting IM version: %s" % get_ex_error(ex))
 
 
+@app.route('/ready')
+def RESTGetReadiness():
+    ready = InfrastructureList.is_ready()
+    res = {"ready": ready}
+    if "infrastructures" in InfrastructureList.startup_info:
+        res["infrastructures"] = InfrastructureList.startup_info["infrastructures"]
+        res["interrupted"] = len(InfrastructureList.startup_info["interrupted"])
+    return flask.make_response(json.dumps(res), 200 if ready else 503, {'Content-Type': 'application/json'})
+
+
 @app.route('/')
 def RESTIndex():
     rest_path = os.path.dirname(os.path.abspath(__file__))
@@ -1114,13 +1656,67 @@ def RESTGetStats():
             except Exception:
                 return return_error(400, "Incorrect format in end_date parameter: YYYY/MM/dd")
 
-        stats = InfrastructureManager.GetStats(init_date, end_date, auth)
-        return format_output(stats, default_type="application/json", field_name="stats")
+        if not get_stream_media_type():
+            return return_error(415, "Unsupported Accept Media Types: %s" % ",".join(get_media_type('Accept')))
+
+        stats = InfrastructureManager.GetStats(init_date, end_date, auth, stream=True)
+        return stream_output(stats, field_name="stats")
     except Exception as ex:
         logger.exception("Error getting stats")
         return return_error(400, "Error getting stats: %s" % get_ex_error(ex))
 
 
+@app.route('/debug/memory', methods=['GET'])
+def RESTGetMemoryReport():
+    try:
+        auth = get_auth_header()
+    except Exception:
+        return return_error(401, "No authentication data provided")
+
+    try:
+        res = InfrastructureManager.GetMemoryReport(auth)
+        return format_output(res, default_type="application/json")
+    except Exception as ex:
+        logger.exception("Error getting memory report")
+        return return_error(400, "Error getting memory report: %s" % get_ex_error(ex))
+
+
+@app.route('/debug/stats', methods=['GET'])
+def RESTGetServiceStats():
+    try:
+        auth = get_auth_header()
+    except Exception:
+        return return_error(401, "No authentication data provided")
+
+    try:
+        res = InfrastructureManager.GetServiceStats(auth)
+        return format_output(res, default_type="application/json")
+    except UnauthorizedUserException as ex:
+        return return_error(403, "Error getting service stats: %s" % get_ex_error(ex))
+    except Exception as ex:
+        logger.exception("Error getting service stats")
+        return return_error(400, "Error getting service stats: %s" % get_ex_error(ex))
+
+
+@app.route('/jobs/<jobid>', methods=['GET'])
+def RESTGetJobInfo(jobid=None):
+    try:
+        auth = get_auth_header()
+    except Exception:
+        return return_error(401, "No authentication data provided")
+
+    try:
+        res = InfrastructureManager.GetJobInfo(jobid, auth)
+        return format_output(res, "application/json")
+    except InvaliddUserException as ex:
+        return return_error(401, "Error Getting Job info: %s" % get_ex_error(ex))
+    except IncorrectJobException as ex:
+        return return_error(404, "Error Getting Job info: %s" % get_ex_error(ex))
+    except Exception as ex:
+        logger.exception("Error Getting Job info")
+        return return_error(400, "Error Getting Job info: %s" % get_ex_error(ex))
+
+
 @app.errorhandler(403)
 def error_mesage_403(error):
     return return_error(403, error.description)
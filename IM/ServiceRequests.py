@@ -20,6 +20,7 @@ import logging
 
 from IM.request import Request, AsyncRequest
 import IM.InfrastructureManager
+import IM.InfrastructureList
 from IM.config import Config
 from IM.auth import Authentication
 from IM import __version__ as version
@@ -61,6 +62,7 @@ class IMBaseRequest(AsyncRequest):
     GET_INFRASTRUCTURE_OWNERS = "GetInfrastructureOwners"
     ESTIMATE_RESOURCES = "EstimateResouces"
     GET_STATS = "GetStats"
+    GET_JOB_INFO = "GetJobInfo"
 
     @staticmethod
     def create_request(function, arguments=()):
@@ -122,6 +124,8 @@ class IMBaseRequest(AsyncRequest):
             return Request_EstimateResouces(arguments)
         elif function == IMBaseRequest.GET_STATS:
             return Request_GetStats(arguments)
+        elif function == IMBaseRequest.GET_JOB_INFO:
+            return Request_GetJobInfo(arguments)
         else:
             raise NotImplementedError("Function not Implemented")
 
@@ -135,6 +139,22 @@ class IMBaseRequest(AsyncRequest):
         """
         raise NotImplementedError("Should have implemented this")
 
+    def _get_async_call(self, num_args):
+        """
+        Get the value of the optional async_call argument, set after the num_args mandatory ones
+        """
+        return len(self.arguments) > num_args and bool(self.arguments[num_args])
+
+    @staticmethod
+    def _call_im_function(op, inf_id, args, auth, async_call=False):
+        """
+        Call the IM function or launch it as an asynchronous job returning the job ID
+        """
+        if async_call:
+            return IM.InfrastructureManager.InfrastructureManager.CreateJob(op, inf_id, args, auth)
+        else:
+            return getattr(IM.InfrastructureManager.InfrastructureManager, op)(*args)
+
     def _execute(self):
         try:
             res = self._call_function()
@@ -144,6 +164,8 @@ class IMBaseRequest(AsyncRequest):
             logger.exception(self._error_mesage)
             self.set(get_ex_error(ex))
             return False
+        finally:
+            IM.InfrastructureList.InfrastructureList.release()
 
 
 class Request_AddResource(IMBaseRequest):
@@ -153,10 +175,10 @@ class Request_AddResource(IMBaseRequest):
 
     def _call_function(self):
         self._error_mesage = "Error Adding resources."
-        (inf_id, radl_data, auth_data, context) = self.arguments
-        return IM.InfrastructureManager.InfrastructureManager.AddResource(inf_id, radl_data,
-                                                                          Authentication(auth_data),
-                                                                          context)
+        (inf_id, radl_data, auth_data, context) = self.arguments[:4]
+        auth = Authentication(auth_data)
+        return self._call_im_function(IMBaseRequest.ADD_RESOURCE, inf_id, (inf_id, radl_data, auth, context),
+                                      auth, self._get_async_call(4))
 
 
 class Request_RemoveResource(IMBaseRequest):
@@ -166,10 +188,10 @@ class Request_RemoveResource(IMBaseRequest):
 
     def _call_function(self):
         self._error_mesage = "Error Removing resources."
-        (inf_id, vm_list, auth_data, context) = self.arguments
-        return IM.InfrastructureManager.InfrastructureManager.RemoveResource(inf_id, vm_list,
-                                                                             Authentication(auth_data),
-                                                                             context)
+        (inf_id, vm_list, auth_data, context) = self.arguments[:4]
+        auth = Authentication(auth_data)
+        return self._call_im_function(IMBaseRequest.REMOVE_RESOURCE, inf_id, (inf_id, vm_list, auth, context),
+                                      auth, self._get_async_call(4))
 
 
 class Request_GetInfrastructureInfo(IMBaseRequest):
@@ -215,9 +237,10 @@ class Request_AlterVM(IMBaseRequest):
 
     def _call_function(self):
         self._error_mesage = "Error Changing VM Info."
-        (inf_id, vm_id, radl, auth_data) = self.arguments
-        return str(IM.InfrastructureManager.InfrastructureManager.AlterVM(inf_id, vm_id, radl,
-                                                                          Authentication(auth_data)))
+        (inf_id, vm_id, radl, auth_data) = self.arguments[:4]
+        auth = Authentication(auth_data)
+        return str(self._call_im_function(IMBaseRequest.ALTER_VM, inf_id, (inf_id, vm_id, radl, auth),
+                                          auth, self._get_async_call(4)))
 
 
 class Request_DestroyInfrastructure(IMBaseRequest):
@@ -239,8 +262,10 @@ class Request_StopInfrastructure(IMBaseRequest):
 
     def _call_function(self):
         self._error_mesage = "Error Stopping Inf."
-        (inf_id, auth_data) = self.arguments
-        return IM.InfrastructureManager.InfrastructureManager.StopInfrastructure(inf_id, Authentication(auth_data))
+        (inf_id, auth_data) = self.arguments[:2]
+        auth = Authentication(auth_data)
+        return self._call_im_function(IMBaseRequest.STOP_INFRASTRUCTURE, inf_id, (inf_id, auth),
+                                      auth, self._get_async_call(2))
 
 
 class Request_StartInfrastructure(IMBaseRequest):
@@ -250,8 +275,10 @@ class Request_StartInfrastructure(IMBaseRequest):
 
     def _call_function(self):
         self._error_mesage = "Error Starting Inf."
-        (inf_id, auth_data) = self.arguments
-        return IM.InfrastructureManager.InfrastructureManager.StartInfrastructure(inf_id, Authentication(auth_data))
+        (inf_id, auth_data) = self.arguments[:2]
+        auth = Authentication(auth_data)
+        return self._call_im_function(IMBaseRequest.START_INFRASTRUCTURE, inf_id, (inf_id, auth),
+                                      auth, self._get_async_call(2))
 
 
 class Request_CreateInfrastructure(IMBaseRequest):
@@ -284,9 +311,10 @@ class Request_Reconfigure(IMBaseRequest):
 
     def _call_function(self):
         self._error_mesage = "Error Reconfiguring Inf."
-        (inf_id, radl_data, auth_data, vm_list) = self.arguments
-        return IM.InfrastructureManager.InfrastructureManager.Reconfigure(inf_id, radl_data,
-                                                                          Authentication(auth_data), vm_list)
+        (inf_id, radl_data, auth_data, vm_list) = self.arguments[:4]
+        auth = Authentication(auth_data)
+        return self._call_im_function(IMBaseRequest.RECONFIGURE, inf_id, (inf_id, radl_data, auth, vm_list),
+                                      auth, self._get_async_call(4))
 
 
 class Request_ImportInfrastructure(IMBaseRequest):
@@ -487,3 +515,14 @@ class Request_GetStats(IMBaseRequest):
         self._error_mesage = "Error getting stats"
         (init_date, end_date, auth_data) = self.arguments
         return IM.InfrastructureManager.InfrastructureManager.GetStats(init_date, end_date, Authentication(auth_data))
+
+
+class Request_GetJobInfo(IMBaseRequest):
+    """
+    Request class for the GetJobInfo function
+    """
+
+    def _call_function(self):
+        self._error_mesage = "Error getting job info"
+        (job_id, auth_data) = self.arguments
+        return IM.InfrastructureManager.InfrastructureManager.GetJobInfo(job_id, Authentication(auth_data))
@@ -17,39 +17,129 @@
 import os.path
 import datetime
 import json
+import time
 import yaml
 import logging
+import threading
+from collections import OrderedDict
 
 from IM.db import DataBase
 from IM.auth import Authentication
 from IM.config import Config
-from IM.InfrastructureList import InfrastructureList
-from radl.radl_parse import parse_radl
+import IM.InfrastructureList
+from IM.RADLCache import RADLCache
 
 
 class Stats():
+    """
+    Class to manage the statistics of the infrastructures.
+    The stats of each infrastructure are stored in the ``inf_stats`` table, that is
+    updated each time the infrastructure data is saved, to avoid processing the data
+    of all the infrastructures each time the stats are requested.
+    """
 
     logger = logging.getLogger('InfrastructureManager')
     """Logger object."""
 
+    STATS_FIELDS = ['creation_date', 'tosca_name', 'vm_count', 'cpu_count', 'memory_size', 'cloud_type',
+                    'cloud_host', 'hybrid', 'deleted', 'im_user']
+    """Fields of the stats of an infrastructure."""
+
+    LAST_STATS_SIZE = 10000
+    """Max number of infrastructures whose last saved stats are kept in memory."""
+
+    _last_stats = OrderedDict()
+    """LRU map from the DB URL and the infrastructure ID to the last stats saved, to avoid unneeded updates."""
+
+    _table_created = set()
+    """Set of DB URLs where the stats table has been already checked, to avoid checking it in each save."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    _init_lock = threading.Lock()
+    """Threading Lock to avoid creating the stats table twice."""
+
     @staticmethod
-    def _get_data(str_data, init_date=None, end_date=None):
+    def _get_tosca_name(tosca):
+        """
+        Get the name of the TOSCA template from the icon of its metadata.
+        """
+        icon = tosca.get("metadata", {}).get("icon", "")
+        return os.path.basename(icon)[:-4]
+
+    @staticmethod
+    def _get_users(auth):
+        """
+        Get the list of IM users of an infrastructure with the same format used in the ``inf_list``
+        table, to enable filtering by user in the same way.
+        """
+        return [{"username": elem.get("username")} for elem in auth.getAuthInfo('InfrastructureManager')]
+
+    @staticmethod
+    def get_inf_stats(inf):
+        """
+        Get the stats of an infrastructure.
+
+        Args:
+
+        - inf(InfrastructureInfo): infrastructure.
+
+        Return: a dict with the stats.
+        """
+        resp = {'creation_date': inf.creation_date,
+                'tosca_name': '',
+                'vm_count': 0,
+                'cpu_count': 0,
+                'memory_size': 0,
+                'cloud_type': '',
+                'cloud_host': '',
+                'hybrid': False,
+                'deleted': bool(inf.deleted),
+                'im_user': None}
+
+        if inf.extra_info and "TOSCA" in inf.extra_info:
+            try:
+                resp['tosca_name'] = Stats._get_tosca_name(inf.extra_info["TOSCA"].yaml)
+            except Exception:
+                Stats.logger.exception("Error getting TOSCA name.")
+
+        for vm in inf.get_vm_list():
+            # only get the cloud of the first VM
+            if not resp['cloud_type']:
+                resp['cloud_type'] = vm.cloud.type
+            if not resp['cloud_host']:
+                resp['cloud_host'] = vm.cloud.server
+            elif resp['cloud_host'] != vm.cloud.server:
+                resp['hybrid'] = True
+
+            vm_sys = vm.info.systems[0]
+            if vm_sys.getValue('cpu.count'):
+                resp['cpu_count'] += vm_sys.getValue('cpu.count')
+            if vm_sys.getValue('memory.size'):
+                resp['memory_size'] += vm_sys.getFeature('memory.size').getValue('M')
+            resp['vm_count'] += 1
+
+        if inf.auth:
+            users = Stats._get_users(inf.auth)
+            if users:
+                resp['im_user'] = users[0]['username']
+        return resp
+
+    @staticmethod
+    def _get_data(str_data):
+        """
+        Get the stats of an infrastructure from its serialized data.
+        """
         dic = str_data if isinstance(str_data, dict) else json.loads(str_data)
-        resp = {'creation_date': ''}
+        resp = {'creation_date': None}
         if 'creation_date' in dic and dic['creation_date']:
-            creation_date = datetime.datetime.fromtimestamp(float(dic['creation_date']))
-            resp['creation_date'] = creation_date.strftime("%Y-%m-%d %H:%M:%S")
-            if init_date and creation_date < init_date:
-                return None
-            if end_date and creation_date > end_date:
-                return None
+            resp['creation_date'] = float(dic['creation_date'])
 
         resp['tosca_name'] = ''
         if 'extra_info' in dic and dic['extra_info'] and "TOSCA" in dic['extra_info']:
             try:
-                tosca = yaml.safe_load(dic['extra_info']['TOSCA'])
-                icon = tosca.get("metadata", {}).get("icon", "")
-                resp['tosca_name'] = os.path.basename(icon)[:-4]
+                resp['tosca_name'] = Stats._get_tosca_name(yaml.safe_load(dic['extra_info']['TOSCA']))
             except Exception:
                 Stats.logger.exception("Error loading TOSCA.")
 
@@ -61,8 +151,8 @@ class Stats():
         resp['hybrid'] = False
         resp['deleted'] = True if 'deleted' in dic and dic['deleted'] else False
         for str_vm_data in dic['vm_list']:
-            vm_data = json.loads(str_vm_data)
-            cloud_data = json.loads(vm_data["cloud"])
+            vm_data = str_vm_data if isinstance(str_vm_data, dict) else json.loads(str_vm_data)
+            cloud_data = vm_data["cloud"] if isinstance(vm_data["cloud"], dict) else json.loads(vm_data["cloud"])
 
             # only get the cloud of the first VM
             if not resp['cloud_type']:
@@ -72,7 +162,7 @@ class Stats():
             elif resp['cloud_host'] != cloud_data["server"]:
                 resp['hybrid'] = True
 
-            vm_sys = parse_radl(vm_data['info']).systems[0]
+            vm_sys = RADLCache.parse(vm_data['info'], clone=False).systems[0]
             if vm_sys.getValue('cpu.count'):
                 resp['cpu_count'] += vm_sys.getValue('cpu.count')
             if vm_sys.getValue('memory.size'):
@@ -83,6 +173,236 @@ class Stats():
         resp['im_user'] = inf_auth.get('username')
         return resp
 
+    @staticmethod
+    def init_table(db):
+        """
+        Creates the stats table and fills it with the stats of the infrastructures
+        already stored in the DB.
+        """
+        if db.db_url in Stats._table_created:
+            return True
+        with Stats._init_lock:
+            if db.db_url in Stats._table_created:
+                return True
+            created = Stats._create_table(db)
+            Stats._table_created.add(db.db_url)
+        if created:
+            Stats.logger.info("Filling the stats table with the existing infrastructures.")
+            Stats.logger.info("Stats of %s infrastructures stored." % Stats.backfill(db.db_url))
+        return True
+
+    @staticmethod
+    def _create_table(db):
+        """
+        Creates the stats table if it does not exist.
+        Return True if the table has been created.
+        """
+        if not db.table_exists("inf_stats"):
+            Stats.logger.debug("Creating the stats table!.")
+            if db.db_type == DataBase.MYSQL:
+                db.execute("CREATE TABLE inf_stats(id VARCHAR(255) PRIMARY KEY, creation_date DOUBLE,"
+                           " last_date DOUBLE, deleted INTEGER, vm_count INTEGER, cpu_count INTEGER,"
+                           " memory_size DOUBLE, cloud_type VARCHAR(255), cloud_host VARCHAR(255),"
+                           " hybrid INTEGER, tosca_name VARCHAR(255), im_user VARCHAR(255), auth TEXT,"
+                           " INDEX(creation_date))")
+            elif db.db_type == DataBase.SQLITE:
+                db.execute("CREATE TABLE inf_stats(id VARCHAR(255) PRIMARY KEY, creation_date DOUBLE,"
+                           " last_date DOUBLE, deleted INTEGER, vm_count INTEGER, cpu_count INTEGER,"
+                           " memory_size DOUBLE, cloud_type VARCHAR(255), cloud_host VARCHAR(255),"
+                           " hybrid INTEGER, tosca_name VARCHAR(255), im_user VARCHAR(255), auth TEXT)")
+                db.execute("CREATE INDEX inf_stats_creation_date ON inf_stats(creation_date)")
+            elif db.db_type == DataBase.MONGO:
+                db.connection.create_collection("inf_stats")
+                db.connection["inf_stats"].create_index([("id", 1)], unique=True)
+                db.connection["inf_stats"].create_index([("creation_date", 1)])
+                db.connection["inf_stats"].create_index([("auth", 1)])
+            return True
+        return False
+
+    @staticmethod
+    def _save_stats(db, inf_id, stats, auth, last_date=None):
+        """
+        Store the stats of an infrastructure in the DB.
+        """
+        if last_date is None:
+            last_date = time.time()
+        if db.db_type == DataBase.MONGO:
+            data = {"id": inf_id, "last_date": last_date, "auth": auth}
+            data.update(stats)
+            return db.replace("inf_stats", {"id": inf_id}, data)
+        else:
+            return db.execute("replace into inf_stats (id, creation_date, last_date, deleted, vm_count, cpu_count,"
+                              " memory_size, cloud_type, cloud_host, hybrid, tosca_name, im_user, auth)"
+                              " values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                              (inf_id, stats['creation_date'], last_date, int(stats['deleted']),
+                               stats['vm_count'], stats['cpu_count'], stats['memory_size'],
+                               stats['cloud_type'], stats['cloud_host'], int(stats['hybrid']),
+                               stats['tosca_name'], stats['im_user'], json.dumps(auth)))
+
+    @staticmethod
+    def save_inf_stats(db, inf):
+        """
+        Update the stats of an infrastructure in the DB (only if they have changed).
+
+        Args:
+
+        - db(DataBase): connected DataBase object.
+        - inf(InfrastructureInfo): infrastructure.
+        """
+        try:
+            stats = Stats.get_inf_stats(inf)
+            key = (db.db_url, inf.id)
+            with Stats._lock:
+                if Stats._last_stats.get(key) == stats:
+                    Stats._last_stats.move_to_end(key)
+                    return True
+            Stats.init_table(db)
+            res = Stats._save_stats(db, inf.id, stats, Stats._get_users(inf.auth) if inf.auth else [])
+            if res:
+                with Stats._lock:
+                    if inf.deleted:
+                        Stats._last_stats.pop(key, None)
+                    else:
+                        Stats._last_stats[key] = stats
+                        Stats._last_stats.move_to_end(key)
+                        while len(Stats._last_stats) > Stats.LAST_STATS_SIZE:
+                            Stats._last_stats.popitem(last=False)
+            return res
+        except Exception:
+            Stats.logger.exception("ERROR saving stats of Inf ID: %s." % inf.id)
+            return False
+
+    @staticmethod
+    def backfill(db_url=None):
+        """
+        Fill the stats table with the data of all the infrastructures stored in the DB.
+        It is called when the stats table is created to get the stats of the infrastructures
+        created before the stats table was added.
+
+        Args:
+
+        - db_url(str): URL of the DB. If not set Config.DATA_DB is used.
+
+        Return: the number of infrastructures processed or None in case of error connecting with the DB.
+        """
+        db = DataBase(db_url or Config.DATA_DB)
+        # The rows are read with a server side cursor so they are written using other connection
+        read_db = DataBase(db_url or Config.DATA_DB)
+        if not db.connect() or not read_db.connect():
+            Stats.logger.error("ERROR connecting with the database!.")
+            return None
+
+        Stats.init_table(db)
+        if not read_db.table_exists("inf_list"):
+            read_db.close()
+            db.close()
+            return 0
+        if db.db_type == DataBase.MONGO:
+            res = read_db.find_iter("inf_list", {}, {"id": True, "data": True, "date": True, "auth": True})
+        else:
+            res = read_db.select_iter("select id, data, date, auth from inf_list")
+
+        count = 0
+        for elem in res:
+            if db.db_type == DataBase.MONGO:
+                inf_id, data, date, auth = elem["id"], elem["data"], elem.get("date"), elem.get("auth")
+            else:
+                inf_id, data, date, auth = elem
+                auth = json.loads(auth) if auth else None
+            try:
+                if isinstance(date, datetime.datetime):
+                    date = time.mktime(date.timetuple())
+                elif isinstance(date, str):
+                    date = time.mktime(datetime.datetime.strptime(date[:10], "%Y-%m-%d").timetuple())
+                stats = Stats._get_data(data)
+                users = Stats._get_users(Authentication.deserialize(auth)) if auth else []
+                Stats._save_stats(db, inf_id, stats, users, date)
+                count += 1
+            except Exception:
+                Stats.logger.exception("ERROR reading infrastructure info from Inf ID: %s" % inf_id)
+        read_db.close()
+        db.close()
+        return count
+
+    @staticmethod
+    def _format_stats(elem, db_type):
+        """
+        Get the stats dict from a row of the stats table.
+        """
+        if db_type == DataBase.MONGO:
+            res = dict((field, elem.get(field)) for field in Stats.STATS_FIELDS)
+            res['inf_id'] = elem["id"]
+            res['last_date'] = elem.get("last_date")
+        else:
+            res = dict(zip(Stats.STATS_FIELDS + ['inf_id', 'last_date'], elem))
+        res['hybrid'] = bool(res['hybrid'])
+        res['deleted'] = bool(res['deleted'])
+        for field in ['creation_date', 'last_date']:
+            if res[field]:
+                res[field] = datetime.datetime.fromtimestamp(float(res[field])).strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                res[field] = ''
+        return res
+
+    @staticmethod
+    def iter_stats(init_date="1970-01-01", end_date=None, auth=None):
+        """
+        Get the statistics from the IM DB as a generator that formats them on demand.
+        The rows are read in batches before returning, so no DB cursor is kept open
+        while the caller consumes the stats (e.g. streaming them to a slow client).
+
+        Args:
+
+        - init_date(str): Only will be returned infrastructure created afther this date.
+        - end_date(str): Only will be returned infrastructure created before this date.
+        - auth(Authentication): parsed authentication tokens.
+
+        Return: a generator of dicts with the stats (see :py:meth:`get_stats`) or None
+                in case of error connecting with the DB.
+        """
+        db = DataBase(Config.DATA_DB)
+        if not db.connect():
+            Stats.logger.error("ERROR connecting with the database!.")
+            return None
+
+        Stats.init_table(db)
+        init = time.mktime(datetime.datetime.strptime(init_date, "%Y-%m-%d").timetuple())
+        end = None
+        if end_date:
+            end = time.mktime(datetime.datetime.strptime(end_date, "%Y-%m-%d").timetuple())
+        if db.db_type == DataBase.MONGO:
+            filt = IM.InfrastructureList.InfrastructureList._gen_filter_from_auth(auth)
+            date_filt = {"$gte": init}
+            if end is not None:
+                date_filt["$lte"] = end
+            filt["$or"] = [{"creation_date": date_filt}, {"creation_date": None}]
+            res = db.find_iter("inf_stats", filt, None, [('creation_date', -1)])
+        else:
+            where = "where (creation_date is null or (creation_date >= %s"
+            args = [init]
+            if end is not None:
+                where += " and creation_date <= %s"
+                args.append(end)
+            where += "))"
+            like = IM.InfrastructureList.InfrastructureList._gen_where_from_auth(auth)
+            if like:
+                where += " and (%s)" % like
+            sql = "select " + ", ".join(Stats.STATS_FIELDS) + ", id, last_date from inf_stats " + where  # nosec
+            res = db.select_iter(sql + " order by creation_date desc", tuple(args))
+        try:
+            rows = list(res)
+        finally:
+            db.close()
+
+        def gen_stats():
+            for elem in rows:
+                try:
+                    yield Stats._format_stats(elem, db.db_type)
+                except Exception:
+                    # Do not break the stream already started
+                    Stats.logger.exception("ERROR formatting the stats: %s." % str(elem))
+        return gen_stats()
+
     @staticmethod
     def get_stats(init_date="1970-01-01", end_date=None, auth=None):
         """
@@ -91,7 +411,7 @@ class Stats():
         Args:
 
         - init_date(str): Only will be returned infrastructure created afther this date.
-        - end_date(str): Only will be returned infrastructure created afther this date.
+        - end_date(str): Only will be returned infrastructure created before this date.
         - auth(Authentication): parsed authentication tokens.
 
         Return: a list of dict with the stats with the following format:
@@ -107,49 +427,23 @@ class Stats():
              'inf_id': '1',
              'deleted': False,
              'last_date': '2022-03-23 10:00:00'}
+            where last_date is the last time that the stats of the infrastructure changed.
         """
-        stats = []
+        res = Stats.iter_stats(init_date, end_date, auth)
+        if res is None:
+            return None
+        return list(res)
+
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        Stats._last_stats = OrderedDict()
+        Stats._table_created = set()
         db = DataBase(Config.DATA_DB)
         if db.connect():
-            if db.db_type == DataBase.MONGO:
-                filt = InfrastructureList._gen_filter_from_auth(auth)
-                filt["data.creation_date"] = {"$gte": datetime.datetime.strptime(init_date, "%Y-%m-%d").timestamp()}
-                if end_date:
-                    filt["data.creation_date"]["$lte"] = datetime.datetime.strptime(end_date, "%Y-%m-%d").timestamp()
-                res = db.find("inf_list", filt, {"id": True, "data": True, "date": True}, [('id', -1)])
-            else:
-                like = InfrastructureList._gen_where_from_auth(auth)
-                where = "where"
-                if like:
-                    where += " (%s)" % like
-                res = db.select("select data, date, id from inf_list %s order by rowid desc" % where)  # nosec
-
-            for elem in res:
+            if db.table_exists("inf_stats"):
                 if db.db_type == DataBase.MONGO:
-                    data = elem["data"]
-                    date = elem["date"]
-                    if date and not isinstance(date, datetime.datetime):
-                        date = datetime.datetime.fromtimestamp(elem["date"])
-                    inf_id = elem["id"]
+                    db.delete("inf_stats", {})
                 else:
-                    data = elem[0]
-                    date = elem[1]
-                    # SQLite date is stored as string
-                    if date and isinstance(date, str) and len(date) == 10:
-                        date = datetime.datetime.strptime(date, "%Y-%m-%d")
-                    inf_id = elem[2]
-                try:
-                    init = datetime.datetime.strptime(init_date, "%Y-%m-%d")
-                    end = datetime.datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
-                    res = Stats._get_data(data, init, end)
-                    if res:
-                        res['inf_id'] = inf_id
-                        res['last_date'] = date.strftime("%Y-%m-%d %H:%M:%S")
-                        stats.append(res)
-                except Exception:
-                    Stats.logger.exception("ERROR reading infrastructure info from Inf ID: %s" % inf_id)
+                    db.execute("delete from inf_stats")
             db.close()
-            return stats
-        else:
-            Stats.logger.error("ERROR connecting with the database!.")
-            return None
@@ -0,0 +1,212 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from IM.config import Config
+import IM.InfrastructureList
+from IM.VirtualMachine import VirtualMachine
+
+
+class ReconcilerEntry():
+    """
+    Stores the data needed to refresh the VMs of an infrastructure in background.
+    """
+
+    def __init__(self, inf, auth):
+        self.inf = inf
+        """Infrastructure to refresh."""
+        self.auth = auth
+        """Authentication data used to refresh the VMs of the infrastructure."""
+        self.auth_time = time.time()
+        """Last time that the authentication data was provided by a user."""
+        self.next_update = 0
+        """Time of the next refresh of the infrastructure."""
+        self.last_reconcile = None
+        """Time of the last refresh of the infrastructure."""
+
+
+class VMReconciler():
+    """
+    Background service that periodically refreshes the state of the VMs of the active
+    infrastructures, so that the API reads are served from the last state obtained.
+    Infrastructures with VMs in transitional states (pending, running but not configured or
+    unknown) are refreshed every VM_RECONCILER_FAST_INTERVAL secs and the rest every
+    VM_RECONCILER_SLOW_INTERVAL secs. The VMs of each infrastructure are refreshed in
+    batches per cloud provider.
+    """
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    TRANSITIONAL_STATES = ["pending", "running", "unknown"]
+    """VM states that require the fast refresh interval."""
+
+    _entries = {}
+    """Map from the infrastructure ID to the :py:class:`ReconcilerEntry` of the active infrastructures."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    _thread = None
+    """Thread that performs the refresh loop."""
+
+    _stop = threading.Event()
+    """Event to stop the refresh loop."""
+
+    @staticmethod
+    def register(inf, auth):
+        """
+        Register the access of a user to an infrastructure, storing (only in memory) the
+        authentication data to refresh its VMs, and launch the refresh loop if needed.
+
+        Args:
+
+        - inf(InfrastructureInfo): infrastructure accessed.
+        - auth(Authentication): parsed authentication tokens.
+        """
+        if not Config.VM_RECONCILER:
+            return
+        with VMReconciler._lock:
+            entry = VMReconciler._entries.get(inf.id)
+            if entry and entry.inf is inf:
+                entry.auth = auth
+                entry.auth_time = time.time()
+            else:
+                VMReconciler._entries[inf.id] = ReconcilerEntry(inf, auth)
+            if not VMReconciler._thread or not VMReconciler._thread.is_alive():
+                VMReconciler._stop = threading.Event()
+                VMReconciler._thread = threading.Thread(name="VMReconciler", target=VMReconciler._run,
+                                                        args=(VMReconciler._stop,))
+                VMReconciler._thread.daemon = True
+                VMReconciler._thread.start()
+
+    @staticmethod
+    def is_reconciled(inf):
+        """
+        Return True if the VMs of the infrastructure are being refreshed in background
+        and it has been refreshed at least once.
+        """
+        entry = VMReconciler._entries.get(inf.id)
+        return bool(entry and entry.inf is inf and entry.last_reconcile and
+                    VMReconciler._thread and VMReconciler._thread.is_alive())
+
+    @staticmethod
+    def get_interval(inf):
+        """
+        Get the time to wait until the next refresh of an infrastructure.
+        """
+        if inf.configured is None or inf.is_ctxt_process_running():
+            return Config.VM_RECONCILER_FAST_INTERVAL
+        for vm in inf.get_vm_list():
+            if vm.state in VMReconciler.TRANSITIONAL_STATES:
+                return Config.VM_RECONCILER_FAST_INTERVAL
+        return Config.VM_RECONCILER_SLOW_INTERVAL
+
+    @staticmethod
+    def _get_due_entries(now):
+        """
+        Get the list of entries to refresh, removing the deleted infrastructures
+        and the ones not accessed in the last VM_RECONCILER_AUTH_TIME secs.
+        """
+        res = []
+        with VMReconciler._lock:
+            for inf_id, entry in list(VMReconciler._entries.items()):
+                # Also remove the infrastructures evicted from memory
+                resident = IM.InfrastructureList.InfrastructureList.infrastructure_list.get(inf_id) is entry.inf
+                if entry.inf.deleted or not resident or now - entry.auth_time > Config.VM_RECONCILER_AUTH_TIME:
+                    VMReconciler.logger.debug("Inf ID: %s: Stop refreshing VMs in background." % inf_id)
+                    del VMReconciler._entries[inf_id]
+                elif entry.next_update <= now:
+                    res.append(entry)
+        return res
+
+    @staticmethod
+    def _update_vms(batch):
+        """
+        Refresh the state of a batch of VMs of the same infrastructure and cloud provider.
+        """
+        updated = False
+        if batch:
+            VirtualMachine.prefetch_status([vm for vm, _ in batch], batch[0][1], force=True)
+        for vm, auth in batch:
+            try:
+                updated = vm.update_status(auth, force=True) or updated
+            except Exception:
+                VMReconciler.logger.exception("Inf ID: %s: Error updating VM status." % vm.inf.id)
+        return updated
+
+    @staticmethod
+    def reconcile(entries):
+        """
+        Refresh the state of the VMs of a list of infrastructures.
+
+        Args:
+
+        - entries(list of ReconcilerEntry): infrastructures to refresh.
+        """
+        batches = []
+        for entry in entries:
+            by_cloud = {}
+            for vm in entry.inf.get_vm_list():
+                by_cloud.setdefault(vm.cloud.id, []).append((vm, entry.auth))
+            batches.extend(by_cloud.values())
+
+        if batches:
+            pool = ThreadPool(processes=min(len(batches), Config.MAX_SIMULTANEOUS_UPDATES))
+            pool.map(IM.InfrastructureList.InfrastructureList.released(VMReconciler._update_vms), batches)
+            pool.close()
+
+        now = time.time()
+        for entry in entries:
+            entry.last_reconcile = now
+            entry.next_update = now + VMReconciler.get_interval(entry.inf)
+
+        infs = [entry.inf for entry in entries if not entry.inf.deleted]
+        if infs:
+            IM.InfrastructureList.InfrastructureList.save_data(infs)
+
+    @staticmethod
+    def _run(stop):
+        """Refresh loop."""
+        VMReconciler.logger.info("VM reconciler started.")
+        while not stop.is_set():
+            try:
+                entries = VMReconciler._get_due_entries(time.time())
+                if entries:
+                    VMReconciler.reconcile(entries)
+            except Exception:
+                VMReconciler.logger.exception("Error refreshing the VMs in background.")
+            finally:
+                IM.InfrastructureList.InfrastructureList.release()
+            stop.wait(1)
+        VMReconciler.logger.info("VM reconciler stopped.")
+
+    @staticmethod
+    def stop():
+        """ Stop the refresh loop """
+        VMReconciler._stop.set()
+
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        VMReconciler.stop()
+        with VMReconciler._lock:
+            VMReconciler._entries = {}
+            VMReconciler._thread = None
@@ -0,0 +1,70 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import time
+
+
+class VersionMixin(object):
+    """
+    Class to add a version counter that is increased every time
+    one of the attributes in VERSIONED_ATTRS changes.
+    It is used to generate the ETag and Last-Modified headers of the REST API.
+    """
+
+    VERSIONED_ATTRS = frozenset()
+    """Attributes whose modification increases the version."""
+
+    # Start the counter with the current time to get increasing versions across restarts.
+    # As it is shared by all the objects, the max version of a set of objects is increased
+    # every time one of them is modified.
+    _counter = itertools.count(int(time.time() * 1000))
+
+    version = 0
+    """Version of the object data."""
+    last_modified = 0
+    """Time of the last modification of the object data."""
+
+    def __setattr__(self, name, value):
+        if name in self.VERSIONED_ATTRS:
+            # Use getattr as some of them may be properties (e.g. cont_out)
+            old = getattr(self, name, None)
+            # Only compare values of simple types to avoid costly comparisons
+            if old is not value and (not isinstance(value, (str, int, float)) or old != value):
+                object.__setattr__(self, name, value)
+                self.attr_changed(name, old, value)
+                return
+        object.__setattr__(self, name, value)
+
+    def attr_changed(self, name, old, value):
+        """
+        Called when one of the attributes in VERSIONED_ATTRS changes.
+        """
+        self.update_version()
+
+    def get_version(self):
+        """
+        Return a tuple with the version and the last modification time of the object.
+        """
+        return self.version, self.last_modified
+
+    def update_version(self):
+        """
+        Increase the version of the object.
+        Must be called explicitly for "in place" modifications of the versioned attributes.
+        """
+        self.version = next(VersionMixin._counter)
+        self.last_modified = time.time()
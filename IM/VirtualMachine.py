@@ -25,9 +25,12 @@ import sys
 import os.path
 from netaddr import IPNetwork, IPAddress
 
-from radl.radl import network, RADL
-from radl.radl_parse import parse_radl
+from radl.radl import network, RADL, Feature
 from IM.LoggerMixin import LoggerMixin
+from IM.VersionMixin import VersionMixin
+from IM.ContOutMixin import ContOutMixin, CompressedText
+from IM.EventBus import EventBus
+from IM.RADLCache import RADLCache
 from IM.SSH import SSH
 from IM.SSHRetry import SSHRetry
 from IM.config import Config
@@ -35,7 +38,7 @@ from IM import get_user_pass_host_port
 import IM.CloudInfo
 
 
-class VirtualMachine(LoggerMixin):
+class VirtualMachine(LoggerMixin, VersionMixin, ContOutMixin):
 
     # VM states
     UNKNOWN = "unknown"
@@ -56,6 +59,8 @@ class VirtualMachine(LoggerMixin):
 
     NO_DNS_NAME_SET = ["Kubernetes", "OSCAR", "Lambda"]
 
+    VERSIONED_ATTRS = frozenset(["id", "state", "info", "cont_out", "destroy", "deleting", "configured", "error_msg"])
+
     logger = logging.getLogger('InfrastructureManager')
 
     def __init__(self, inf, cloud_id, cloud, info, requested_radl, cloud_connector=None, im_id=None):
@@ -103,9 +108,25 @@ class VirtualMachine(LoggerMixin):
         self.creation_date = int(time.time())
         """ Creation time of this Inf. """
 
+    def attr_changed(self, name, old, value):
+        """
+        Increase the version and publish the VM state transitions and new contextualization messages.
+        """
+        VersionMixin.attr_changed(self, name, old, value)
+        inf = self.__dict__.get("inf")
+        im_id = self.__dict__.get("im_id")
+        if inf and im_id is not None and EventBus.is_watched(inf.id):
+            if name == "state":
+                EventBus.publish(inf.id, "vm_state", {"vm_id": str(im_id), "state": value})
+            elif name == "cont_out":
+                data = EventBus.get_msg_data(old, value)
+                data["vm_id"] = str(im_id)
+                EventBus.publish(inf.id, "vm_cont_msg", data)
+
     def serialize(self):
         with self._lock:
             odict = self.__dict__.copy()
+        odict['cont_out'] = CompressedText.get_text(odict.get('cont_out'))
         # Quit the lock to the data to be store by pickle
         del odict['_lock']
         del odict['cloud_connector']
@@ -125,19 +146,38 @@ class VirtualMachine(LoggerMixin):
         return odict
 
     @staticmethod
-    def deserialize(str_data):
+    def deserialize(str_data, requested_radls=None):
+        """
+        Create a VirtualMachine from its serialized data.
+
+        Args:
+
+        - str_data(str or dict): serialized data of the VM.
+        - requested_radls(dict): map from the RADL text to the RADL object of the requested
+          RADLs already loaded. The VMs with the same requested RADL will share the object
+          as they do when they are launched.
+
+        Return(VirtualMachine): the VM object.
+        """
         dic = str_data if isinstance(str_data, dict) else json.loads(str_data)
         if dic['cloud']:
             dic['cloud'] = IM.CloudInfo.CloudInfo.deserialize(dic['cloud'])
         if dic['info']:
-            dic['info'] = parse_radl(dic['info'])
+            dic['info'] = RADLCache.parse(dic['info'])
         if dic['requested_radl']:
-            dic['requested_radl'] = parse_radl(dic['requested_radl'])
+            if requested_radls is None:
+                dic['requested_radl'] = RADLCache.parse(dic['requested_radl'])
+            else:
+                if dic['requested_radl'] not in requested_radls:
+                    requested_radls[dic['requested_radl']] = RADLCache.parse(dic['requested_radl'])
+                dic['requested_radl'] = requested_radls[dic['requested_radl']]
 
         newvm = VirtualMachine(None, None, None, None, None, None, dic['im_id'])
         # Set creating to False as default to VMs stored with 1.5.5 or old versions
         newvm.creating = False
         newvm.creation_date = None
+        if 'cont_out' in dic:
+            dic['cont_out'] = CompressedText.compress(dic['cont_out'])
         newvm.__dict__.update(dic)
         # If we load a VM that is not configured, set it to False
         # because the configuration process will be lost
@@ -153,7 +193,7 @@ class VirtualMachine(LoggerMixin):
             self.cloud_connector = self.cloud.getCloudConnector(self.inf)
         return self.cloud_connector
 
-    def delete(self, delete_list, auth, exceptions):
+    def delete(self, delete_list, auth, exceptions, last=None):
         """
         Delete the VM
         """
@@ -161,9 +201,10 @@ class VirtualMachine(LoggerMixin):
         if self.destroy:
             return (True, "")
 
-        # Select the last in the list to delete
-        remain_vms = [v for v in self.inf.get_vm_list() if v not in delete_list]
-        last = self.is_last_in_cloud(delete_list, remain_vms)
+        if last is None:
+            # Select the last in the list to delete
+            remain_vms = [v for v in self.inf.get_vm_list() if v not in delete_list]
+            last = self.is_last_in_cloud(delete_list, remain_vms)
         success = False
         try:
             self.deleting = True
@@ -196,6 +237,8 @@ class VirtualMachine(LoggerMixin):
             raise Exception("Incorrect RADL no system with name %s provided." % self.info.systems[0].name)
         new_radl.systems = [s]
         (success, alter_res) = self.getCloudConnector().alterVM(self, new_radl, auth)
+        # The VM info is modified in place
+        self.update_version()
         # force the update of the information
         self.last_update = 0
         return (success, alter_res)
@@ -513,6 +556,7 @@ class VirtualMachine(LoggerMixin):
 
             self.info.systems[0].setValue(
                 'net_interface.' + str(num_net) + '.connection', public_net.id)
+            self.update_version()
 
     def contextualize(self):
         """
@@ -555,12 +599,16 @@ class VirtualMachine(LoggerMixin):
             # To avoid to refresh the information too quickly
             if force or now - self.last_update > Config.VM_INFO_UPDATE_FREQUENCY:
                 success = False
+                old_info = self._get_info_values()
                 try:
                     (success, new_vm) = self.getCloudConnector().updateVMInfo(self, auth)
                     if success:
                         state = new_vm.state
                         updated = True
                         self.last_update = now
+                        # The connectors modify the VM info in place
+                        if self._get_info_values() != old_info:
+                            self.update_version()
                     else:
                         self.log_error("Error updating VM status: %s" % new_vm)
                 except Exception:
@@ -594,6 +642,43 @@ class VirtualMachine(LoggerMixin):
 
         return updated
 
+    @staticmethod
+    def prefetch_status(vms, auth, force=False, finalize=False):
+        """
+        Get the information of the VMs that will be updated (or finalized) in batches per
+        cloud provider, for the connectors that support it (see CloudConnector.prefetch_vms_info).
+
+        Args:
+
+        - vms(list of VirtualMachine): VMs to update.
+        - auth(Authentication): parsed authentication tokens.
+        - force(boolean): force the VM update.
+        - finalize(boolean): the VMs will be finalized instead of updated.
+        """
+        now = int(time.time())
+        vms_by_cloud = {}
+        for vm in vms:
+            if (vm.id and not vm.destroy and not vm.deleting and
+                    (force or now - vm.last_update > Config.VM_INFO_UPDATE_FREQUENCY)):
+                vms_by_cloud.setdefault(vm.cloud.id, []).append(vm)
+
+        for cloud_vms in vms_by_cloud.values():
+            if len(cloud_vms) > 1:
+                try:
+                    cloud_vms[0].getCloudConnector().prefetch_vms_info(cloud_vms, auth, finalize)
+                except Exception:
+                    cloud_vms[0].log_exception("Error getting the info of the VMs in batch.")
+
+    def _get_info_values(self):
+        """
+        Get the values of the VM info fields set by the connectors (system features
+        and networks) to detect changes without rendering the RADL
+        """
+        # setValue appends the features again, so do not take the order into account
+        values = sorted(str((f.prop, f.operator, f.value)) for f in self.info.systems[0].features
+                        if isinstance(f, Feature))
+        return values, sorted(net.id for net in self.info.networks)
+
     def replace_dns_name(self, vm_system):
         """Replace the #N# in dns_names."""
         cont = 0
@@ -807,7 +892,9 @@ class VirtualMachine(LoggerMixin):
         """
         Launch the check_ctxt_process as a thread
         """
-        t = threading.Thread(target=self.check_ctxt_process)
+        # Imported here to avoid a circular import
+        from IM.InfrastructureList import InfrastructureList
+        t = threading.Thread(target=InfrastructureList.released(self.check_ctxt_process))
         t.daemon = True
         t.start()
 
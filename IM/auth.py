@@ -40,6 +40,8 @@ class Authentication:
             self.auth_list = auth_data.auth_list
         else:
             self.auth_list = auth_data
+        self.checked = False
+        """Flag set when the IM credentials have been already validated."""
 
         for auth in self.auth_list:
             if 'id' in auth and auth['id']:
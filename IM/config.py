@@ -71,8 +71,18 @@ class Config:
     RECIPES_DIR = CONTEXTUALIZATION_DIR + '/AnsibleRecipes'
     RECIPES_DB_FILE = CONTEXTUALIZATION_DIR + '/recipes_ansible.db'
     MAX_CONTEXTUALIZATION_TIME = 7200
-    MAX_SIMULTANEOUS_LAUNCHES = 1
+    MAX_SIMULTANEOUS_LAUNCHES = 10
+    MAX_SIMULTANEOUS_LAUNCHES_BY_TYPE = {}
+    MAX_SIMULTANEOUS_JOBS = 10
+    JOB_HISTORY_TIME = 604800
+    MAX_SIMULTANEOUS_UPDATES = 10
+    CLOUD_OPERATIONS_POOL_SIZE = 50
+    HTTP_POOL_SIZE = 10
+    HTTP_TIMEOUT = 120
+    HTTP_MAX_RETRIES = 3
+    HTTP_RETRY_BACKOFF = 0.5
     DATA_DB = '/etc/im/inf.dat'
+    DB_BATCH_SIZE = 1000
     XMLRCP_SSL = False
     XMLRCP_SSL_KEYFILE = "/etc/im/pki/server-key.pem"
     XMLRCP_SSL_CERTFILE = "/etc/im/pki/server-cert.pem"
@@ -81,10 +91,38 @@ class Config:
     REST_SSL_KEYFILE = "/etc/im/pki/server-key.pem"
     REST_SSL_CERTFILE = "/etc/im/pki/server-cert.pem"
     REST_SSL_CA_CERTS = "/etc/im/pki/ca-chain.pem"
+    REST_THREADS = 10
+    REST_MAX_THREADS = -1
+    REST_REQUEST_QUEUE_SIZE = 5
+    REST_KEEPALIVE_TIMEOUT = 10
+    REST_MAX_BODY_SIZE = 0
+    REST_WORKERS = 1
+    REST_BENCHMARK_REQUESTS = 0
+    XMLRCP_MAX_THREADS = 0
+    XMLRCP_REQUEST_QUEUE_SIZE = 5
     PLAYBOOK_RETRIES = 1
     VM_INFO_UPDATE_FREQUENCY = 10
     # This value must be always higher than VM_INFO_UPDATE_FREQUENCY
     VM_INFO_UPDATE_ERROR_GRACE_PERIOD = 120
+    EVENTS_HISTORY_SIZE = 1000
+    EVENTS_MAX_WAIT = 60
+    VM_RECONCILER = False
+    VM_RECONCILER_FAST_INTERVAL = 10
+    VM_RECONCILER_SLOW_INTERVAL = 120
+    VM_RECONCILER_AUTH_TIME = 3600
+    RADL_CACHE_SIZE = 1000
+    IMAGE_CACHE_TIME = 300
+    MAX_SIMULTANEOUS_IMAGE_QUERIES = 10
+    CONCRETE_SYSTEM_TIMEOUT = 60
+    CONCRETE_SYSTEM_POOL_SIZE = 20
+    KUBERNETES_WATCH_TIME = 600
+    KUBERNETES_WATCH_RESYNC = 300
+    TOSCA_CACHE_BACKEND = "sqlite"
+    TOSCA_CACHE_NAME = "/var/tmp/im/tosca_cache"  # nosec
+    TOSCA_CACHE_TIME = 3600
+    TOSCA_ARTIFACTS_MIRROR = None
+    TOSCA_PARSE_CACHE_SIZE = 100
+    CONT_OUT_COMPRESS_SIZE = 65536
     REMOTE_CONF_DIR = "/var/tmp/.im"  # nosec
     MAX_SSH_ERRORS = 5
     PRIVATE_NET_MASKS = ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16",
@@ -100,6 +138,8 @@ class Config:
     OIDC_ISSUERS = []
     OIDC_AUDIENCE = None
     INF_CACHE_TIME = 0
+    INF_CACHE_MAX_ENTRIES = 0
+    INF_CACHE_MAX_SIZE = 0
     VMINFO_JSON = False
     OIDC_CLIENT_ID = None
     OIDC_CLIENT_SECRET = None
@@ -115,6 +155,7 @@ class Config:
     ACTIVATE_XMLRPC = True
     FORCE_OIDC_AUTH = False
     BOOT_MODE = 0  # It can be 0-Normal, 1-ReadOnly, 2-ReadDelete
+    RESUME_CTXT = False
     ENABLE_CORS = False
     CORS_ORIGIN = '*'
     VAULT_URL = None
@@ -152,6 +193,7 @@ class ConfigOpenNebula:
     TEMPLATE_OTHER = 'GRAPHICS = [type="vnc",listen="0.0.0.0"]'
     IMAGE_UNAME = ''
     TTS_URL = 'https://localhost:8443'
+    CACHE_TIME = 60
 
 
 if config.has_section("OpenNebula"):
@@ -19,6 +19,7 @@ import random
 import string
 import base64
 import re
+import time
 try:
     from urlparse import urlparse
 except ImportError:
@@ -146,6 +147,50 @@ class AzureInstanceTypeInfo:
         return instance_type
 
 
+class AzurePollers:
+    """
+    Set of Azure long running operations (the pollers returned by the begin_* functions)
+    started concurrently and waited together with a shared deadline.
+
+    Args:
+            - timeout(int, optional): max time to wait all the operations added to the set
+    """
+
+    def __init__(self, timeout=None):
+        self.pollers = {}
+        self.deadline = time.time() + timeout if timeout else None
+
+    def add(self, name, poller):
+        """Add the poller of an operation with the specified name"""
+        self.pollers[name] = poller
+
+    def wait(self, raise_error=False):
+        """
+        Wait all the operations added since the last call until the deadline.
+        Return a dict with the result of each operation or the exception raised.
+        If raise_error is True raise the first exception instead.
+        """
+        res = {}
+        pollers, self.pollers = self.pollers, {}
+        for name, poller in pollers.items():
+            try:
+                timeout = None
+                if self.deadline:
+                    timeout = max(0, self.deadline - time.time())
+                poller.wait(timeout)
+                if not poller.done():
+                    raise Exception("Timeout waiting operation %s." % name)
+                res[name] = poller.result()
+            except Exception as ex:
+                res[name] = ex
+
+        if raise_error:
+            for value in res.values():
+                if isinstance(value, Exception):
+                    raise value
+        return res
+
+
 class AzureCloudConnector(CloudConnector):
     """
     Cloud Launcher to the Azure platform
@@ -162,6 +207,10 @@ class AzureCloudConnector(CloudConnector):
     """Default location to use"""
     DEFAULT_USER = 'azureuser'
     """ default user to SSH access the VM """
+    OPERATIONS_TIMEOUT = 1800
+    """ Max time to wait a set of long running operations """
+    SHARED_RESOURCES_CLEANUP = True
+    """ Delete the RG once all the VMs are terminated """
 
     PROVISION_STATE_MAP = {
         'Accepted': VirtualMachine.PENDING,
@@ -375,6 +424,7 @@ class AzureCloudConnector(CloudConnector):
         """
         i = 0
         res = {}
+        pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
         network_client = NetworkManagementClient(credentials, subscription_id)
         while radl.systems[0].getValue("net_interface." + str(i) + ".connection"):
             network_name = radl.systems[0].getValue("net_interface." + str(i) + ".connection")
@@ -385,13 +435,20 @@ class AzureCloudConnector(CloudConnector):
                 nsg_name = network.getValue("sg_name")
                 if not nsg_name:
                     nsg_name = "nsg-%s" % network_name
-                nsg = self.create_nsg(location, group_name, nsg_name, outports, network_client, inf)
-                res[network_name] = nsg
+                res[network_name] = None
+                self.create_nsg(location, group_name, nsg_name, outports, network_client, inf, pollers, network_name)
+
+        # Wait all the NSGs together
+        for network_name, nsg in pollers.wait().items():
+            if isinstance(nsg, Exception):
+                self.log_error("Error creating NGS: %s" % nsg)
+                nsg = None
+            res[network_name] = nsg
         return res
 
-    def create_nsg(self, location, group_name, nsg_name, outports, network_client, inf):
+    def create_nsg(self, location, group_name, nsg_name, outports, network_client, inf, pollers, name):
         """
-        Create a Network Security Group
+        Start the creation of a Network Security Group adding it to the pollers with the specified name
         """
         security_rules = []
         cont = 200
@@ -426,18 +483,18 @@ class AzureCloudConnector(CloudConnector):
             'security_rules': security_rules
         }
 
-        ngs = None
         try:
-            ngs = network_client.network_security_groups.begin_create_or_update(group_name, nsg_name, params).result()
+            poller = network_client.network_security_groups.begin_create_or_update(group_name, nsg_name, params)
+            pollers.add(name, poller)
         except Exception:
             self.log_exception("Error creating NGS")
 
-        return ngs
-
-    def create_nics(self, radl, credentials, subscription_id, group_name, subnets, ngss, vm_id, inf):
-        """Create a Network Interface for a VM."""
+    def _get_nics_params(self, radl, network_client, group_name, subnets, ngss, vm_id, inf, pollers):
+        """
+        Get the parameters of the Network Interfaces of a VM, adding to the pollers the creation of
+        its public IP. Return a list of tuples (nic name, nic params, primary, public ip name).
+        """
         system = radl.systems[0]
-        network_client = NetworkManagementClient(credentials, subscription_id)
 
         location = self.DEFAULT_LOCATION
         if radl.systems[0].getValue('availability_zone'):
@@ -498,7 +555,6 @@ class AzureCloudConnector(CloudConnector):
                 publicAdded = True
                 primary = True
                 public_ip_info = None
-                created = False
                 # if fixed ip is set, try to find it
                 if fixed_ip:
                     for publicip in list(network_client.public_ip_addresses.list(group_name)):
@@ -512,8 +568,11 @@ class AzureCloudConnector(CloudConnector):
                         self.log_warn("IP %s not found. Creating new one!!" % fixed_ip)
                         self.error_messages += "IP %s not found. Creating new one!!" % fixed_ip
 
-                # If not create a PublicIP
-                if not public_ip_info:
+                if public_ip_info:
+                    nic_params['ip_configurations'][0]['public_ip_address'] = {'id': public_ip_info.id,
+                                                                               'tags': {'InfID': inf.id}}
+                else:
+                    # If not create a PublicIP (the ID is set once it is created)
                     public_ip_name = "public-ip-%d-%d" % (vm_id, i)
                     public_ip_parameters = {
                         'location': location,
@@ -524,31 +583,92 @@ class AzureCloudConnector(CloudConnector):
                         'delete_option': DeleteOptions.DELETE
                     }
 
-                    async_publicip_creation = network_client.public_ip_addresses.begin_create_or_update(
+                    pollers.add(public_ip_name, network_client.public_ip_addresses.begin_create_or_update(
                         group_name,
                         public_ip_name,
                         public_ip_parameters
-                    )
-                    public_ip_info = async_publicip_creation.result()
-                    created = True
-
-                nic_params['ip_configurations'][0]['public_ip_address'] = {'id': public_ip_info.id,
-                                                                           'tags': {'InfID': inf.id}}
-                if created:
-                    nic_params['ip_configurations'][0]['public_ip_address']['delete_option'] = DeleteOptions.DELETE
+                    ))
+                    nic_params['ip_configurations'][0]['public_ip_address'] = {'tags': {'InfID': inf.id},
+                                                                               'delete_option': DeleteOptions.DELETE}
 
                 if pub_network_name:
                     nic_params['network_security_group'] = {'id': ngss[pub_network_name].id}
 
-            async_nic_creation = network_client.network_interfaces.begin_create_or_update(
-                group_name, nic_name, nic_params)
-            nic = async_nic_creation.result()
-            res.append((nic, primary, public_ip_name))
+            res.append((nic_name, nic_params, primary, public_ip_name))
 
             i += 1
 
         return res
 
+    def create_nics(self, radl, credentials, subscription_id, group_name, subnets, ngss, vm_ids, inf):
+        """
+        Create the Network Interfaces of a set of VMs. First the public IPs and then the NICs
+        of all the VMs are created concurrently.
+        Return a list with a list of tuples (nic, primary, public ip name) or an error message per VM.
+        """
+        network_client = NetworkManagementClient(credentials, subscription_id)
+        pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
+
+        vms_nics = [self._get_nics_params(radl, network_client, group_name, subnets, ngss, vm_id, inf, pollers)
+                    for vm_id in vm_ids]
+        public_ips = pollers.wait()
+
+        for nics in vms_nics:
+            # Do not create the NICs of a VM if its public IP has failed
+            if any(isinstance(public_ips.get(public_ip_name), Exception) for _, _, _, public_ip_name in nics):
+                continue
+            for nic_name, nic_params, _, public_ip_name in nics:
+                if public_ip_name:
+                    nic_params['ip_configurations'][0]['public_ip_address']['id'] = public_ips[public_ip_name].id
+                pollers.add(nic_name, network_client.network_interfaces.begin_create_or_update(
+                    group_name, nic_name, nic_params))
+        created_nics = pollers.wait()
+
+        res = []
+        for nics in vms_nics:
+            vm_nics = []
+            errors = []
+            for nic_name, _, primary, public_ip_name in nics:
+                for value in [public_ips.get(public_ip_name), created_nics.get(nic_name)]:
+                    if isinstance(value, Exception):
+                        errors.append(str(value))
+                if nic_name in created_nics and not isinstance(created_nics[nic_name], Exception):
+                    vm_nics.append((created_nics[nic_name], primary, public_ip_name))
+                elif public_ip_name in public_ips and not isinstance(public_ips[public_ip_name], Exception):
+                    # Delete also the public IPs of the NICs not created
+                    vm_nics.append((None, primary, public_ip_name))
+
+            if errors:
+                self.log_error("Error creating the NICs: %s" % errors)
+                self.delete_nics(network_client, group_name, vm_nics)
+                res.append("Error creating the NICs: %s" % "; ".join(errors))
+            else:
+                res.append(vm_nics)
+
+        return res
+
+    def delete_nics(self, network_client, group_name, nics):
+        """
+        Delete a list of NICs concurrently and then its public IPs
+        """
+        pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
+        try:
+            for nic, _, _ in nics:
+                if nic:
+                    pollers.add(nic.name, network_client.network_interfaces.begin_delete(group_name, nic.name))
+            deleted = pollers.wait()
+            for _, _, public_ip_name in nics:
+                if public_ip_name:
+                    pollers.add(public_ip_name,
+                                network_client.public_ip_addresses.begin_delete(group_name, public_ip_name))
+            deleted.update(pollers.wait())
+
+            for name, value in deleted.items():
+                if isinstance(value, Exception):
+                    self.log_error("Error deleting %s: %s" % (name, value))
+        except Exception as delex:
+            self.log_exception("Error deleting NICS %s" % str(delex))
+
     def get_azure_vm_create_json(self, group_name, vm_name, nics, radl,
                                  instance_type, custom_data, compute_client, tags):
         """ Create the VM parameters structure. """
@@ -611,18 +731,19 @@ class AzureCloudConnector(CloudConnector):
             if boot_disk_size:
                 os_disk_properties['disk_size_gb'] = boot_disk_size
 
-            async_creation = compute_client.disks.begin_create_or_update(
+            pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
+            pollers.add(os_disk_name, compute_client.disks.begin_create_or_update(
                 group_name,
                 os_disk_name,
                 os_disk_properties
-            )
+            ))
 
             self.log_info("Creating OS disk %s of type %s from disk: %s/%s/%s." % (os_disk_name,
                                                                                    os_type,
                                                                                    image_values[0],
                                                                                    image_values[1],
                                                                                    image_values[2]))
-            disk_resource = async_creation.result()
+            disk_resource = pollers.wait(raise_error=True)[os_disk_name]
 
             vm['storage_profile'] = {
                 'os_disk': {
@@ -711,6 +832,7 @@ class AzureCloudConnector(CloudConnector):
 
         subnets = {}
         used_cidrs = []
+        pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
         for net in radl.networks:
             if net.isPublic() and has_private:
                 continue
@@ -739,7 +861,7 @@ class AzureCloudConnector(CloudConnector):
                 self.log_debug("Creating virtual network %s." % vnet_name)
                 vnet_cird = self.get_nets_common_cird(radl)
                 # Create VNet in the RG of the Inf
-                async_vnet_creation = network_client.virtual_networks.begin_create_or_update(
+                pollers.add(vnet_name, network_client.virtual_networks.begin_create_or_update(
                     group_name,
                     vnet_name,
                     {
@@ -749,8 +871,8 @@ class AzureCloudConnector(CloudConnector):
                             'address_prefixes': [vnet_cird]
                         }
                     }
-                )
-                async_vnet_creation.wait()
+                ))
+                pollers.wait(raise_error=True)
 
             # check if the subnet exists
             subnet = None
@@ -765,14 +887,15 @@ class AzureCloudConnector(CloudConnector):
             if not subnet:
                 self.log_debug("Creating subnet %s." % subnet_name)
                 # Create Subnet in the RG of the Inf
-                async_subnet_creation = network_client.subnets.begin_create_or_update(
+                # The subnets of the same vnet cannot be created concurrently
+                pollers.add(subnet_name, network_client.subnets.begin_create_or_update(
                     group_name,
                     vnet_name,
                     subnet_name,
                     {'address_prefix': net_cidr,
                      'tags': {'InfID': inf.id}}
-                )
-                subnets[net.id] = async_subnet_creation.result()
+                ))
+                subnets[net.id] = pollers.wait(raise_error=True)[subnet_name]
                 net.setValue('cidr', net_cidr)
                 # Set also the cidr in the inf RADL
                 inf.radl.get_network_by_id(net.id).setValue('cidr', net_cidr)
@@ -782,30 +905,38 @@ class AzureCloudConnector(CloudConnector):
     def create_vms(self, rg_name, inf, radl, requested_radl, num_vm, location,
                    ngss, subnets, credentials, subscription_id, tags):
         """
-        Creates a set of VMs
+        Creates a set of VMs. The NICs of all the VMs are created concurrently
+        and then the creation of the VMs is started.
         """
-        vms = []
-        i = 0
-        while i < num_vm:
-            vm_name = self.gen_instance_name(radl.systems[0])
-
-            try:
-                args = {'location': location}
-                if tags:
-                    args['tags'] = tags
+        compute_client = ComputeManagementClient(credentials, subscription_id)
 
-                # Create resource group for the VM
-                compute_client = ComputeManagementClient(credentials, subscription_id)
+        new_vms = []
+        for _ in range(num_vm):
+            vm_name = self.gen_instance_name(radl.systems[0])
+            vm = VirtualMachine(inf, rg_name + '/' + vm_name, self.cloud, radl, requested_radl, self)
+            vm.destroy = True
+            inf.add_vm(vm)
+            vm.info.systems[0].setValue('instance_id', rg_name + '/' + vm_name)
+            new_vms.append((vm, vm_name))
 
-                vm = VirtualMachine(inf, rg_name + '/' + vm_name, self.cloud, radl, requested_radl, self)
-                vm.destroy = True
-                inf.add_vm(vm)
-                vm.info.systems[0].setValue('instance_id', rg_name + '/' + vm_name)
+        try:
+            vms_nics = self.create_nics(radl, credentials, subscription_id, rg_name, subnets, ngss,
+                                        [vm.im_id for vm, _ in new_vms], inf)
+        except Exception as ex:
+            self.log_exception("Error creating the NICs")
+            vms_nics = ["Error creating the NICs: %s" % ex] * num_vm
 
-                nics = self.create_nics(radl, credentials, subscription_id, rg_name, subnets, ngss, vm.im_id, inf)
+        vms = []
+        instance_type = None
+        for (vm, vm_name), nics in zip(new_vms, vms_nics):
+            if not isinstance(nics, list):
+                vms.append((False, "Error creating the VM: %s" % nics))
+                continue
 
+            try:
                 custom_data = self.get_cloud_init_data(radl, vm)
-                instance_type = self.get_instance_type(radl.systems[0], credentials, subscription_id)
+                if not instance_type:
+                    instance_type = self.get_instance_type(radl.systems[0], credentials, subscription_id)
                 vm_parameters = self.get_azure_vm_create_json(rg_name, vm_name,
                                                               nics, radl, instance_type, custom_data,
                                                               compute_client, tags)
@@ -822,17 +953,8 @@ class AzureCloudConnector(CloudConnector):
                 self.log_exception("Error creating the VM")
 
                 # Delete nics & pub ips
-                try:
-                    network_client = NetworkManagementClient(credentials, subscription_id)
-                    for nic, _, public_ip in nics:
-                        network_client.network_interfaces.begin_delete(rg_name, nic.name).wait()
-                        if public_ip:
-                            network_client.public_ip_addresses.begin_delete(rg_name, public_ip).wait()
-
-                except Exception as delex:
-                    self.log_exception("Error deleting NICS %s" % str(delex))
-
-            i += 1
+                network_client = NetworkManagementClient(credentials, subscription_id)
+                self.delete_nics(network_client, rg_name, nics)
 
         return vms
 
@@ -894,32 +1016,45 @@ class AzureCloudConnector(CloudConnector):
         vms = self.create_vms(rg_name, inf, radl, requested_radl, num_vm, location,
                               ngss, subnets, credentials, subscription_id, tags)
 
+        # Wait all the VMs together
+        pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
+        for success, data in vms:
+            if success:
+                vm, async_vm_creation = data
+                pollers.add(vm.id, async_vm_creation)
+        self.log_debug("Waiting %d VMs to be created." % len(pollers.pollers))
+        created = pollers.wait()
+
         all_failed = True
         remaining_vms = num_vm
+        deletes = AzurePollers(self.OPERATIONS_TIMEOUT)
         for success, data in vms:
             if success:
-                vm, async_vm_creation = data
-                try:
-                    self.log_debug("Waiting VM ID %s to be created." % vm.id)
-                    async_vm_creation.wait()
-                    all_failed = False
-                    res.append((True, vm))
-                    remaining_vms -= 1
-                except Exception as ex:
-                    self.log_exception("Error waiting the VM %s." % vm.id)
+                vm, _ = data
+                if isinstance(created[vm.id], Exception):
+                    self.log_error("Error waiting the VM %s: %s" % (vm.id, created[vm.id]))
 
                     # Delete created resources for this VM
                     try:
                         group_name = vm.id.split('/')[0]
                         vm_name = vm.id.split('/')[1]
-                        compute_client.virtual_machines.begin_delete(group_name, vm_name).wait()
+                        deletes.add(vm.id, compute_client.virtual_machines.begin_delete(group_name, vm_name))
                     except Exception:
                         self.log_exception("Error removing errored VM: %s" % vm.id)
 
-                    res.append((False, "Error waiting the VM %s: %s" % (vm.id, str(ex))))
+                    res.append((False, "Error waiting the VM %s: %s" % (vm.id, created[vm.id])))
+                else:
+                    all_failed = False
+                    res.append((True, vm))
+                    remaining_vms -= 1
             else:
                 res.append((False, data))
 
+        # Wait the errored VMs to be deleted
+        for vm_id, deleted in deletes.wait().items():
+            if isinstance(deleted, Exception):
+                self.log_error("Error removing errored VM %s: %s" % (vm_id, deleted))
+
         if all_failed:
             try:
                 deleted, msg = self.delete_resource_group(inf, rg_name, resource_client, max_retries=1)
@@ -1055,7 +1190,9 @@ class AzureCloudConnector(CloudConnector):
 
                 # Delete VM
                 try:
-                    compute_client.virtual_machines.begin_delete(group_name, vm_name).wait()
+                    pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
+                    pollers.add(vm.id, compute_client.virtual_machines.begin_delete(group_name, vm_name))
+                    pollers.wait(raise_error=True)
                 except ResourceNotFoundError:
                     self.log_warn("VM ID %s does not exist. Ignoring." % vm.id)
             else:
@@ -1063,13 +1200,7 @@ class AzureCloudConnector(CloudConnector):
 
             # if it is the last VM delete also the RG of the Inf
             if last:
-                if vm.id:
-                    group_name = vm.id.split('/')[0]
-                else:
-                    group_name = "rg-%s" % vm.inf.id
-                deleted, msg = self.delete_resource_group(vm.inf, group_name, resource_client)
-                if not deleted:
-                    return False, "Error terminating the RG: %s" % msg
+                return self.delete_shared_resources([vm], auth_data, resource_client)
 
         except Exception as ex:
             self.log_exception("Error terminating the VM")
@@ -1077,6 +1208,28 @@ class AzureCloudConnector(CloudConnector):
 
         return True, ""
 
+    def delete_shared_resources(self, vms, auth_data, resource_client=None):
+        try:
+            if not resource_client:
+                credentials, subscription_id = self.get_credentials(auth_data)
+                resource_client = ResourceManagementClient(credentials, subscription_id)
+
+            group_names = []
+            for vm in vms:
+                group_name = vm.id.split('/')[0] if vm.id else "rg-%s" % vm.inf.id
+                if group_name not in group_names:
+                    group_names.append(group_name)
+
+            for group_name in group_names:
+                deleted, msg = self.delete_resource_group(vms[0].inf, group_name, resource_client)
+                if not deleted:
+                    return False, "Error terminating the RG: %s" % msg
+        except Exception as ex:
+            self.log_exception("Error terminating the RG")
+            return False, "Error terminating the RG: " + str(ex)
+
+        return True, ""
+
     def stop(self, vm, auth_data):
         return self.vm_action(vm, 'stop', auth_data)
 
@@ -1114,9 +1267,12 @@ class AzureCloudConnector(CloudConnector):
             credentials, subscription_id = self.get_credentials(auth_data)
             compute_client = ComputeManagementClient(credentials, subscription_id)
 
+            # All the steps share the same deadline
+            pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
+
             # Deallocating the VM (resize prepare)
-            async_vm_deallocate = compute_client.virtual_machines.deallocate(group_name, vm_name)
-            async_vm_deallocate.wait()
+            pollers.add("deallocate", compute_client.virtual_machines.deallocate(group_name, vm_name))
+            pollers.wait(raise_error=True)
 
             new_system = self.resize_vm_radl(vm, radl)
             if not new_system:
@@ -1128,11 +1284,12 @@ class AzureCloudConnector(CloudConnector):
             async_vm_update = compute_client.virtual_machines.begin_create_or_update(group_name,
                                                                                      vm_name,
                                                                                      vm_parameters)
-            async_vm_update.wait()
+            pollers.add("update", async_vm_update)
+            pollers.wait(raise_error=True)
 
             # Start the VM
-            async_vm_start = compute_client.virtual_machines.start(group_name, vm_name)
-            async_vm_start.wait()
+            pollers.add("start", compute_client.virtual_machines.start(group_name, vm_name))
+            pollers.wait(raise_error=True)
 
             return self.updateVMInfo(vm, auth_data)
         except ResourceNotFoundError:
@@ -1167,21 +1324,21 @@ class AzureCloudConnector(CloudConnector):
                 cont += 1
 
                 try:
-                    async_deletes = []
+                    # Delete all the resources concurrently
+                    pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
                     for resource in list(resource_client.resources.list_by_resource_group(group_name)):
                         if resource.tags and 'InfID' in resource.tags and resource.tags['InfID'] == inf.id:
                             rnamespace = resource.type.split('/')[0]
                             rtype = resource.type.split('/')[1]
-                            async_deletes.append(resource_client.resources.begin_delete(group_name,
-                                                                                        rnamespace,
-                                                                                        "",
-                                                                                        rtype,
-                                                                                        resource.name,
-                                                                                        "2018-05-01"))
+                            pollers.add(resource.id, resource_client.resources.begin_delete(group_name,
+                                                                                            rnamespace,
+                                                                                            "",
+                                                                                            rtype,
+                                                                                            resource.name,
+                                                                                            "2018-05-01"))
                         else:
                             self.log_warn("Resource %s was not created by the IM. Ignore." % resource.name)
-                    for async_delete in async_deletes:
-                        async_delete.wait()
+                    pollers.wait(raise_error=True)
                     deleted = True
                 except Exception as ex:
                     msg = str(ex)
@@ -1195,7 +1352,9 @@ class AzureCloudConnector(CloudConnector):
             while cont < max_retries and not deleted:
                 cont += 1
                 try:
-                    resource_client.resource_groups.begin_delete(group_name).wait()
+                    pollers = AzurePollers(self.OPERATIONS_TIMEOUT)
+                    pollers.add(group_name, resource_client.resource_groups.begin_delete(group_name))
+                    pollers.wait(raise_error=True)
                     deleted = True
                 except Exception as ex:
                     msg = str(ex)
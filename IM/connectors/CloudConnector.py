@@ -40,6 +40,11 @@ class CloudConnector(LoggerMixin):
     type = "BaseClass"
     """str with the name of the provider."""
     DEFAULT_NET_CIDR = "10.0.*.0/24"
+    MAX_LAUNCH_BATCH = 1
+    """Max number of equal VMs that the connector creates with a single launch request."""
+    SHARED_RESOURCES_CLEANUP = False
+    """The connector deletes the resources shared by the VMs (networks, SGs, ...) with
+    delete_shared_resources once all the VMs are terminated, instead of in the finalize of the last one."""
 
     def __init__(self, cloud_info, inf):
         self.cloud = cloud_info
@@ -136,6 +141,20 @@ class CloudConnector(LoggerMixin):
 
         raise NotImplementedError("Should have implemented this")
 
+    def prefetch_vms_info(self, vms, auth_data, finalize=False):
+        """
+        Gets the information of a set of VMs in a batch before calling updateVMInfo
+        (or finalize) for each one. The connectors supporting it must keep the results
+        to be used in the next updateVMInfo (or finalize) calls.
+
+        Arguments:
+           - vms(list of :py:class:`IM.VirtualMachine`): VMs to update.
+           - auth_data(:py:class:`dict` of str objects): Authentication data to access cloud provider.
+           - finalize(bool): The VMs will be finalized instead of updated.
+        """
+        # By default each VM is requested in the updateVMInfo function
+        pass
+
     def alterVM(self, vm, radl, auth_data):
         """
         Modifies the features of a VM
@@ -243,6 +262,35 @@ class CloudConnector(LoggerMixin):
 
         raise NotImplementedError("Should have implemented this")
 
+    def wait_vms_terminated(self, vms, auth_data, timeout=180, delay=5):
+        """ Waits a set of finalized VMs to be terminated in the cloud provider
+
+                Arguments:
+                - vms(list of :py:class:`IM.VirtualMachine`): VMs finalized.
+                - auth_data(:py:class:`dict` of str objects): Authentication data to access cloud provider.
+                - timeout(int): Max time to wait.
+                - delay(int): Time between the checks.
+
+                Returns: True if all the VMs are terminated or False otherwise.
+        """
+        # By default the finalize function returns once the VM is terminated
+        return True
+
+    def delete_shared_resources(self, vms, auth_data):
+        """ Deletes the resources shared by the VMs of the infrastructure (networks, SGs, ...)
+            once all of them are terminated. Only used if SHARED_RESOURCES_CLEANUP is True.
+
+                Arguments:
+                - vms(list of :py:class:`IM.VirtualMachine`): VMs of the infrastructure finalized.
+                - auth_data(:py:class:`dict` of str objects): Authentication data to access cloud provider.
+
+                Returns: a tuple (success, msg).
+           - The first value is True if the operation finished successfully or false otherwise.
+           - The second value is an error message.
+        """
+
+        raise NotImplementedError("Should have implemented this")
+
     def start(self, vm, auth_data):
         """ Starts a (previously stopped) VM
 
@@ -395,6 +443,26 @@ class CloudConnector(LoggerMixin):
             self.log_exception("Error deleting snapshots.")
             return success, str(ex)
 
+    def get_launch_batches(self, num_vm):
+        """
+        Split a number of equal VMs to launch in batches of at most MAX_LAUNCH_BATCH VMs
+        that the connector creates with a single request. The batches are launched in parallel.
+        """
+        if self.MAX_LAUNCH_BATCH <= 1 or num_vm <= self.MAX_LAUNCH_BATCH:
+            return [num_vm]
+        batches = [self.MAX_LAUNCH_BATCH] * (num_vm // self.MAX_LAUNCH_BATCH)
+        if num_vm % self.MAX_LAUNCH_BATCH:
+            batches.append(num_vm % self.MAX_LAUNCH_BATCH)
+        return batches
+
+    @staticmethod
+    def cloud_init_depends_on_vm(vm):
+        """
+        Check if the data returned by get_cloud_init_data is specific of the VM, so
+        it cannot be shared with other VMs launched with the same request.
+        """
+        return Config.SSH_REVERSE_TUNNELS and not vm.hasPublicNet()
+
     def get_cloud_init_data(self, radl=None, vm=None, public_key=None, user=None):
         """
         Get the cloud init data specified by the user in the RADL
@@ -419,7 +487,7 @@ class CloudConnector(LoggerMixin):
                     return cloud_config
 
         # Only for those VMs with private IP
-        if Config.SSH_REVERSE_TUNNELS and vm and not vm.hasPublicNet():
+        if vm and self.cloud_init_depends_on_vm(vm):
             if 'packages' not in cloud_config:
                 cloud_config['packages'] = []
             cloud_config['packages'].extend(["curl", "sshpass"])
@@ -32,6 +32,7 @@ from .CloudConnector import CloudConnector
 from IM.connectors.exceptions import NoAuthData
 from radl.radl import Feature
 from IM import UnixHTTPAdapter
+from IM.HTTPClient import HTTPClient
 
 
 class DockerCloudConnector(CloudConnector):
@@ -77,7 +78,7 @@ class DockerCloudConnector(CloudConnector):
                 cert = None
 
             try:
-                resp = requests.request(method, url, verify=self.verify_ssl, cert=cert, headers=headers, data=body)
+                resp = HTTPClient.request(method, url, verify=self.verify_ssl, cert=cert, headers=headers, data=body)
             finally:
                 if cert:
                     try:
@@ -14,8 +14,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
+import threading
 import time
 import requests
+from collections import OrderedDict
 import re
 from netaddr import IPNetwork, IPAddress, spanning_cidr
 
@@ -97,15 +100,42 @@ class EC2CloudConnector(CloudConnector):
     """Dictionary with a map with the EC3 VM states to the IM states."""
     DEFAULT_USER = 'cloudadm'
     """ default user to SSH access the VM """
+    MAX_LAUNCH_BATCH = 50
+    """Max number of ondemand instances created with a single run_instances request."""
+    SHARED_RESOURCES_CLEANUP = True
+    """Delete the SGs and nets once all the VMs are terminated."""
+
+    DESCRIBE_BATCH_SIZE = 200
+    """Max number of IDs filtered in a single describe request."""
+    VM_INFO_PREFETCH_TIME = 10
+    """Max time (in secs) to use the data got in a batch of describe requests."""
+    SESSION_CACHE_TIME = 3600
+    """Max time (in secs) to keep the boto3 sessions and clients of a set of credentials."""
 
     instance_type_list = []
     """ Information about the instance types """
 
+    _regions = None
+    """List of the available EC2 regions."""
+    _sessions = {}
+    """Map from the credentials and region to a tuple (time, boto3 session, dict of clients)."""
+    _prefetched = OrderedDict()
+    """Map from the credentials, region and element to a tuple (time, data) got in a batch, sorted by time."""
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
     def __init__(self, cloud_info, inf):
-        self.connection = None
         self.auth = None
         CloudConnector.__init__(self, cloud_info, inf)
 
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        with EC2CloudConnector._lock:
+            EC2CloudConnector._regions = None
+            EC2CloudConnector._sessions = {}
+            EC2CloudConnector._prefetched = OrderedDict()
+
     def concrete_system(self, radl_system, str_url, auth_data):
         url = urlparse(str_url)
         protocol = url[0]
@@ -160,10 +190,28 @@ class EC2CloudConnector(CloudConnector):
         if instance_type.gpu_model:
             system.addFeature(Feature("gpu.model", "=", instance_type.gpu_model), conflict="other", missing="other")
 
+    @staticmethod
+    def _get_auth_key(auth):
+        """
+        Get a key to identify a set of EC2 credentials without storing them.
+        """
+        data = "%s:%s:%s" % (auth.get('username'), auth.get('password'), auth.get('token'))
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    @staticmethod
+    def get_regions():
+        """
+        Get the list of available EC2 regions (only loaded once).
+        """
+        if EC2CloudConnector._regions is None:
+            EC2CloudConnector._regions = boto3.session.Session().get_available_regions('ec2')
+        return EC2CloudConnector._regions
+
     # Get the EC2 connection object
     def get_connection(self, region_name, auth_data, service_name, object_type='client'):
         """
         Get a :py:class:`boto.ec2.connection` to interact with.
+        The boto3 sessions and clients are shared per credentials and region.
 
         Arguments:
            - region_name(str): EC2 region to connect.
@@ -176,37 +224,110 @@ class EC2CloudConnector(CloudConnector):
         else:
             auth = auths[0]
 
-        if self.connection and self.auth.compare(auth_data, self.type):
-            if object_type == 'resource':
-                return self.connection.resource(service_name)
-            else:
-                return self.connection.client(service_name)
-        else:
+        if 'username' in auth and 'password' in auth:
             self.auth = auth_data
-
-            if 'username' in auth and 'password' in auth:
-                try:
-                    if region_name != 'universal':
-                        region_names = boto3.session.Session().get_available_regions('ec2')
-                        if region_name not in region_names:
+            key = (self._get_auth_key(auth), region_name)
+            now = time.time()
+            try:
+                with EC2CloudConnector._lock:
+                    # boto3 sessions are not thread safe, so create the clients with the lock
+                    if key in EC2CloudConnector._sessions:
+                        _, session, clients = EC2CloudConnector._sessions[key]
+                    else:
+                        if region_name != 'universal' and region_name not in self.get_regions():
                             raise CloudConnectorException("Incorrect region name: " + region_name)
+                        # Remove the old sessions
+                        for old_key, (session_time, _, _) in list(EC2CloudConnector._sessions.items()):
+                            if now - session_time > self.SESSION_CACHE_TIME:
+                                del EC2CloudConnector._sessions[old_key]
+                        session = boto3.session.Session(region_name=region_name,
+                                                        aws_access_key_id=auth['username'],
+                                                        aws_secret_access_key=auth['password'],
+                                                        aws_session_token=auth.get('token'))
+                        clients = {}
+                        EC2CloudConnector._sessions[key] = (now, session, clients)
 
-                    session = boto3.session.Session(region_name=region_name,
-                                                    aws_access_key_id=auth['username'],
-                                                    aws_secret_access_key=auth['password'],
-                                                    aws_session_token=auth.get('token'))
-                    self.connection = session
                     if object_type == 'resource':
+                        # Resources are not thread safe, do not share them
                         return session.resource(service_name)
-                    else:
-                        return session.client(service_name)
-                except Exception as ex:
-                    self.log_exception("Error getting the region " + region_name)
-                    raise CloudConnectorException("Error getting the region " + region_name + ": " + str(ex))
-            else:
-                self.log_error("No correct auth data has been specified to EC2: "
-                               "username (Access Key) and password (Secret Key)")
-                raise NoCorrectAuthData(self.type, "username (Access Key) and password (Secret Key)")
+                    if service_name not in clients:
+                        clients[service_name] = session.client(service_name)
+                    return clients[service_name]
+            except Exception as ex:
+                self.log_exception("Error getting the region " + region_name)
+                raise CloudConnectorException("Error getting the region " + region_name + ": " + str(ex))
+        else:
+            self.log_error("No correct auth data has been specified to EC2: "
+                           "username (Access Key) and password (Secret Key)")
+            raise NoCorrectAuthData(self.type, "username (Access Key) and password (Secret Key)")
+
+    def _get_prefetch_key(self, region_name, name):
+        auth = self.auth.getAuthInfo(self.type)[0] if self.auth else {}
+        return (self._get_auth_key(auth), region_name, name)
+
+    def _set_prefetched(self, region_name, name, data):
+        key = self._get_prefetch_key(region_name, name)
+        now = time.time()
+        with EC2CloudConnector._lock:
+            # Add it at the end to keep the entries sorted by time
+            EC2CloudConnector._prefetched.pop(key, None)
+            EC2CloudConnector._prefetched[key] = (now, data)
+            # Purge the expired entries, so that the data of the VMs not read again is not kept forever
+            while EC2CloudConnector._prefetched:
+                old_key, (data_time, _) = next(iter(EC2CloudConnector._prefetched.items()))
+                if now - data_time <= self.VM_INFO_PREFETCH_TIME:
+                    break
+                del EC2CloudConnector._prefetched[old_key]
+
+    def _get_prefetched(self, region_name, name, pop=False):
+        """
+        Get the data got in the last batch of describe requests or None if not available.
+        """
+        key = self._get_prefetch_key(region_name, name)
+        with EC2CloudConnector._lock:
+            if key in EC2CloudConnector._prefetched:
+                data_time, data = EC2CloudConnector._prefetched[key]
+                if pop or time.time() - data_time > self.VM_INFO_PREFETCH_TIME:
+                    del EC2CloudConnector._prefetched[key]
+                if time.time() - data_time <= self.VM_INFO_PREFETCH_TIME:
+                    return data
+        return None
+
+    def prefetch_vms_info(self, vms, auth_data, finalize=False):
+        for region_name, instance_ids in self._get_vm_ids_by_region(vms).items():
+            conn = self.get_connection(region_name, auth_data, 'ec2')
+            sir_ids = [instance_id for instance_id in instance_ids if instance_id[0] == "s"]
+            instance_ids = [instance_id for instance_id in instance_ids if instance_id[0] != "s"]
+            try:
+                for i in range(0, len(sir_ids), self.DESCRIBE_BATCH_SIZE):
+                    filters = [{'Name': 'spot-instance-request-id', 'Values': sir_ids[i:i + self.DESCRIBE_BATCH_SIZE]}]
+                    for sir in conn.describe_spot_instance_requests(Filters=filters)['SpotInstanceRequests']:
+                        self._set_prefetched(region_name, sir['SpotInstanceRequestId'], sir)
+                        if sir.get('InstanceId'):
+                            instance_ids.append(sir['InstanceId'])
+
+                for i in range(0, len(instance_ids), self.DESCRIBE_BATCH_SIZE):
+                    filters = [{'Name': 'instance-id', 'Values': instance_ids[i:i + self.DESCRIBE_BATCH_SIZE]}]
+                    for reservation in conn.describe_instances(Filters=filters)['Reservations']:
+                        for instance in reservation['Instances']:
+                            self._set_prefetched(region_name, instance['InstanceId'], instance)
+
+                self._set_prefetched(region_name, "addresses", conn.describe_addresses()['Addresses'])
+            except Exception as ex:
+                self.log_warn("Error describing the instances of region %s: %s" % (region_name, ex))
+
+    def _describe_addresses(self, conn, region_name, public_ip=None):
+        """
+        Get the elastic IPs of a region, using the ones got in the last batch if available.
+        """
+        addresses = self._get_prefetched(region_name, "addresses")
+        if addresses is None:
+            if public_ip:
+                return conn.describe_addresses(Filters=[{"Name": "public-ip", "Values": [public_ip]}])['Addresses']
+            return conn.describe_addresses()['Addresses']
+        if public_ip:
+            return [address for address in addresses if address['PublicIp'] == public_ip]
+        return addresses
 
     # path format: aws://eu-west-1/ami-00685b74
     @staticmethod
@@ -717,6 +838,7 @@ class EC2CloudConnector(CloudConnector):
 
         i = 0
         while i < num_vm:
+            vms = []
             try:
                 err_msg = "Launching in region %s with image: %s" % (region_name, ami)
                 err_msg += " in VPC: %s-%s " % (vpc, subnet)
@@ -724,8 +846,15 @@ class EC2CloudConnector(CloudConnector):
                 vm = VirtualMachine(inf, None, self.cloud, radl, requested_radl, self)
                 vm.destroy = True
                 inf.add_vm(vm)
+                vms.append(vm)
                 user_data = self.get_cloud_init_data(radl, vm, public_key, user)
 
+                # Launch a batch of ondemand instances with the same request
+                # if the cloud init data is the same for all the VMs
+                batch = 1
+                if not spot and not self.cloud_init_depends_on_vm(vm):
+                    batch = min(self.MAX_LAUNCH_BATCH, num_vm - i)
+
                 # Get data for the root disk
                 size = None
                 disk_type = "standard"
@@ -746,6 +875,12 @@ class EC2CloudConnector(CloudConnector):
                     bdm[0]['Ebs']['VolumeSize'] = size
 
                 volumes = self.get_volumes(conn, vm)
+                for _ in range(1, batch):
+                    new_vm = VirtualMachine(inf, None, self.cloud, radl, requested_radl, self)
+                    new_vm.destroy = True
+                    inf.add_vm(new_vm)
+                    self.get_volumes(conn, new_vm)
+                    vms.append(new_vm)
                 for device, (size, snapshot_id, _, disk_type) in volumes.items():
                     bd = {
                         'DeviceName': device,
@@ -840,7 +975,7 @@ class EC2CloudConnector(CloudConnector):
 
                     params = {'ImageId': image['ImageId'],
                               'MinCount': 1,
-                              'MaxCount': 1,
+                              'MaxCount': batch,
                               'InstanceType': instance_type.name,
                               'NetworkInterfaces': interfaces,
                               'BlockDeviceMappings': bdm,
@@ -862,29 +997,39 @@ class EC2CloudConnector(CloudConnector):
 
                     instances = conn.run_instances(**params)['Instances']
 
-                    if instances:
-                        ec2_vm_id = region_name + ";" + instances[0]['InstanceId']
-
-                        self.log_debug("RADL:")
-                        self.log_debug(system)
-
-                        vm.id = ec2_vm_id
+                    self.log_debug("RADL:")
+                    self.log_debug(system)
+                    # The VMs not launched (MinCount < MaxCount) will be retried
+                    for num, (vm, instance) in enumerate(zip(vms, instances)):
+                        if num > 0:
+                            # All the instances of the request get the same Name, set a unique one
+                            try:
+                                conn.create_tags(Resources=[instance['InstanceId']],
+                                                 Tags=[{'Key': 'Name', 'Value': self.gen_instance_name(system)}])
+                            except Exception:
+                                self.log_exception("Error setting the Name tag of instance %s." %
+                                                   instance['InstanceId'])
+                        vm.id = region_name + ";" + instance['InstanceId']
                         vm.info.systems[0].setValue('instance_id', str(vm.id))
                         self.log_info("Instance successfully launched.")
                         vm.destroy = False
                         res.append((True, vm))
                         all_failed = False
-                    else:
+                    for _ in vms[len(instances):]:
                         res.append((False, "Error %s." % err_msg))
 
             except Exception as ex:
                 self.log_exception("Error %s." % err_msg)
-                res.append((False, "Error %s. %s" % (err_msg, str(ex))))
+                for _ in (vms or [None]):
+                    res.append((False, "Error %s. %s" % (err_msg, str(ex))))
 
-            i += 1
+            i += len(vms) or 1
 
         # if all the VMs have failed, remove the sgs and nets
-        if all_failed:
+        # (if they are not used by other VMs of the same cloud, e.g. launched concurrently)
+        cloud_vms = [v for v in inf.get_vm_list() if v.cloud.type == self.cloud.type and
+                     v.cloud.server == self.cloud.server]
+        if all_failed and not cloud_vms:
             try:
                 self.delete_networks(conn, inf.id)
             except Exception:
@@ -1002,7 +1147,12 @@ class EC2CloudConnector(CloudConnector):
         try:
             resource = self.get_connection(region_name, auth_data, 'ec2', 'resource')
             instance = resource.Instance(instance_id)
-            instance.load()
+            data = self._get_prefetched(region_name, instance_id, pop=True)
+            if data:
+                # Use the data got in the last batch instead of loading it
+                instance.meta.data = data
+            else:
+                instance.load()
         except Exception:
             self.log_exception("Error getting instance id: %s" % instance_id)
 
@@ -1040,6 +1190,7 @@ class EC2CloudConnector(CloudConnector):
                     pub_address = conn.allocate_address(Domain='vpc')
 
                 conn.associate_address(InstanceId=instance.id, AllocationId=pub_address['AllocationId'])
+                self._get_prefetched(vm.id.split(";")[0], "addresses", pop=True)
 
                 self.log_debug(pub_address)
                 return pub_address
@@ -1085,11 +1236,10 @@ class EC2CloudConnector(CloudConnector):
             if pub_ip in fixed_ips:
                 self.log_info("%s is a fixed IP, it is not released" % pub_ip)
             else:
-                for address in conn.describe_addresses(Filters=[{"Name": "public-ip",
-                                                                 "Values": [pub_ip]}])['Addresses']:
+                for address in self._describe_addresses(conn, vm.id.split(";")[0], pub_ip):
                     self.log_info("This VM has a Elastic IP %s." % address['PublicIp'])
                     cont = 0
-                    while address['InstanceId'] and cont < timeout:
+                    while address.get('InstanceId') and cont < timeout:
                         cont += 3
                         try:
                             self.log_debug("Disassociate it.")
@@ -1140,8 +1290,8 @@ class EC2CloudConnector(CloudConnector):
 
         elastic_ips = []
         # Get the elastic IPs assigned (there must be only 1)
-        for address in conn.describe_addresses()['Addresses']:
-            if address['InstanceId'] == instance.id:
+        for address in self._describe_addresses(conn, vm.id.split(";")[0]):
+            if address.get('InstanceId') == instance.id:
                 elastic_ips.append(str(address['PublicIp']))
                 # It will be used if it is different to the public IP of the
                 # instance
@@ -1264,11 +1414,13 @@ class EC2CloudConnector(CloudConnector):
             job_instance_id = None
 
             self.log_info("Check if the request has been fulfilled and the instance has been deployed")
-            request_list = conn.describe_spot_instance_requests(Filters=[{'Name': 'spot-instance-request-id',
-                                                                          'Values': [instance_id]}])
-            sir = []
-            if request_list['SpotInstanceRequests']:
-                sir = request_list['SpotInstanceRequests'][0]
+            sir = self._get_prefetched(region, instance_id, pop=True)
+            if not sir:
+                request_list = conn.describe_spot_instance_requests(Filters=[{'Name': 'spot-instance-request-id',
+                                                                              'Values': [instance_id]}])
+                sir = []
+                if request_list['SpotInstanceRequests']:
+                    sir = request_list['SpotInstanceRequests'][0]
             # TODO: Check if the request had failed and launch it in
             # another availability zone
             if sir['State'] == 'failed':
@@ -1422,14 +1574,17 @@ class EC2CloudConnector(CloudConnector):
            - conn(:py:class:`boto.ec2.connection`): object to connect to EC2 API.
            - vm(:py:class:`IM.VirtualMachine`): VM information.
         """
-        instance_id = vm.id.split(";")[1]
+        region_name, instance_id = vm.id.split(";")
         # Check if the instance_id starts with "sir" -> spot request
         if (instance_id[0] == "s"):
-            request_list = conn.describe_spot_instance_requests(Filters=[{'Name': 'spot-instance-request-id',
-                                                                          'Values': ['job_sir_id']}])
-            if request_list['SpotInstanceRequests']:
-                sir = request_list['SpotInstanceRequests'][0]
-                conn.cancel_spot_instance_requests(sir['SpotInstanceRequestId'])
+            sir = self._get_prefetched(region_name, instance_id, pop=True)
+            if not sir:
+                request_list = conn.describe_spot_instance_requests(Filters=[{'Name': 'spot-instance-request-id',
+                                                                              'Values': [instance_id]}])
+                if request_list['SpotInstanceRequests']:
+                    sir = request_list['SpotInstanceRequests'][0]
+            if sir:
+                conn.cancel_spot_instance_requests(SpotInstanceRequestIds=[sir['SpotInstanceRequestId']])
                 self.log_info("Spot instance request " + sir['SpotInstanceRequestId'] + " deleted")
 
     def delete_networks(self, conn, inf_id, timeout=240):
@@ -1515,20 +1670,72 @@ class EC2CloudConnector(CloudConnector):
 
         # if this is the last VM
         if last:
-            # Delete the SG
-            try:
-                self.delete_security_groups(conn, vm)
-            except Exception as ex:
-                self.log_exception("Error deleting security group.")
-                error_msg += "Error deleting security group: %s. " % ex
+            error_msg += self._delete_shared_resources(conn, vm)
 
-            # And nets
-            try:
-                self.delete_networks(conn, vm.inf.id)
-            except Exception as ex:
-                self.log_exception("Error deleting networks.")
-                error_msg += "Error deleting networks: %s. " % ex
+        return (error_msg == "", error_msg)
 
+    def _delete_shared_resources(self, conn, vm):
+        """
+        Delete the SGs and nets of the infrastructure of the VM and return the error messages
+        """
+        error_msg = ""
+        # Delete the SG
+        try:
+            self.delete_security_groups(conn, vm)
+        except Exception as ex:
+            self.log_exception("Error deleting security group.")
+            error_msg += "Error deleting security group: %s. " % ex
+
+        # And nets
+        try:
+            self.delete_networks(conn, vm.inf.id)
+        except Exception as ex:
+            self.log_exception("Error deleting networks.")
+            error_msg += "Error deleting networks: %s. " % ex
+
+        return error_msg
+
+    def _get_vm_ids_by_region(self, vms):
+        """
+        Get a dict with the list of instance IDs of the VMs in each region
+        """
+        regions = {}
+        for vm in vms:
+            if vm.id:
+                region_name, instance_id = vm.id.split(";")
+                regions.setdefault(region_name, []).append(instance_id)
+        return regions
+
+    def wait_vms_terminated(self, vms, auth_data, timeout=180, delay=5):
+        all_terminated = True
+        for region_name, instance_ids in self._get_vm_ids_by_region(vms).items():
+            conn = self.get_connection(region_name, auth_data, 'ec2')
+            cont = 0
+            while instance_ids and cont < timeout:
+                # Check all the instances of the region with a single request
+                try:
+                    reservations = conn.describe_instances(Filters=[{'Name': 'instance-id',
+                                                                     'Values': instance_ids}])['Reservations']
+                    instance_ids = [instance['InstanceId'] for reservation in reservations
+                                    for instance in reservation['Instances']
+                                    if instance['State']['Name'] != 'terminated']
+                except Exception as ex:
+                    self.log_warn("Error describing the instances: %s" % ex)
+                if instance_ids:
+                    time.sleep(delay)
+                    cont += delay
+
+            if instance_ids:
+                self.log_warn("Timeout waiting instances %s to be terminated." % instance_ids)
+                all_terminated = False
+        return all_terminated
+
+    def delete_shared_resources(self, vms, auth_data):
+        # The snapshots created with the auto_delete option are deleted before terminating the VMs
+        error_msg = ""
+        for region_name in self._get_vm_ids_by_region(vms):
+            conn = self.get_connection(region_name, auth_data, 'ec2')
+            error_msg += self._delete_shared_resources(conn, vms[-1])
         return (error_msg == "", error_msg)
 
     def _get_security_groups(self, conn, vm):
@@ -16,7 +16,7 @@
 
 import json
 import os
-import requests
+from IM.HTTPClient import HTTPClient
 import time
 from uuid import uuid1
 from netaddr import IPNetwork, IPAddress
@@ -90,7 +90,7 @@ class FogBowCloudConnector(CloudConnector):
                 headers = {}
             headers.update(auth_header)
 
-        resp = requests.request(method, self.get_full_url(url), verify=self.verify_ssl, headers=headers, data=body)
+        resp = HTTPClient.request(method, self.get_full_url(url), verify=self.verify_ssl, headers=headers, data=body)
 
         return resp
 
@@ -154,8 +154,8 @@ class FogBowCloudConnector(CloudConnector):
 
         if self.token:
             self.log_debug("We have a token. Check if it is valid.")
-            resp = requests.request('HEAD', self.get_full_url('/clouds/'), verify=self.verify_ssl,
-                                    headers={'Fogbow-User-Token': self.token})
+            resp = HTTPClient.request('HEAD', self.get_full_url('/clouds/'), verify=self.verify_ssl,
+                                      headers={'Fogbow-User-Token': self.token})
             if resp.status_code in [200, 201]:
                 return self.token
             else:
@@ -168,7 +168,7 @@ class FogBowCloudConnector(CloudConnector):
         else:
             as_host = self.get_full_url('/as', True)
 
-        resp = requests.request('GET', self.get_full_url('/publicKey/'), verify=self.verify_ssl)
+        resp = HTTPClient.request('GET', self.get_full_url('/publicKey/'), verify=self.verify_ssl)
         if resp.status_code == 200:
             public_key = resp.json()['publicKey']
 
@@ -177,8 +177,8 @@ class FogBowCloudConnector(CloudConnector):
             if key not in ['id', 'type', 'host', 'as_host']:
                 body['credentials'][key] = value
 
-        resp = requests.request('POST', '%s/tokens/' % as_host, verify=self.verify_ssl,
-                                headers=headers, data=json.dumps(body))
+        resp = HTTPClient.request('POST', '%s/tokens/' % as_host, verify=self.verify_ssl,
+                                  headers=headers, data=json.dumps(body))
         if resp.status_code in [200, 201]:
             self.token = resp.json()['token']
             return self.token
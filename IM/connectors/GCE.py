@@ -28,7 +28,7 @@ try:
     from libcloud.dns.types import Provider as DNSProvider
     from libcloud.dns.types import RecordType
     from libcloud.dns.providers import get_driver as get_dns_driver
-    from libcloud.compute.drivers.gce import GCENodeSize
+    from libcloud.compute.drivers.gce import GCENodeSize, GCEFailedNode
 except Exception as ex:
     print("WARN: libcloud library not correctly installed. GCECloudConnector will not work!.")
     print(ex)
@@ -55,6 +55,8 @@ class GCECloudConnector(LibCloudCloudConnector):
     DEFAULT_ZONE = "us-central1-a"
     DEFAULT_USER = 'gceuser'
     """ default user to SSH access the VM """
+    MAX_LAUNCH_BATCH = 50
+    """Max number of nodes created with a single ex_create_multiple_nodes request."""
 
     def __init__(self, cloud_info, inf):
         self.auth = None
@@ -650,6 +652,11 @@ class GCECloudConnector(LibCloudCloudConnector):
                 error_msg = str(ex)
 
         for node in nodes:
+            if isinstance(node, GCEFailedNode):
+                # ex_create_multiple_nodes returns the nodes that could not be created
+                self.log_warn("Error creating node %s: %s" % (node.name, node.error))
+                error_msg = "Error launching VM: %s" % node.error
+                continue
             vm = VirtualMachine(inf, node.extra['name'], self.cloud, radl,
                                 requested_radl, self.cloud.getCloudConnector(inf))
             vm.info.systems[0].setValue('instance_id', str(vm.id))
@@ -660,7 +667,7 @@ class GCECloudConnector(LibCloudCloudConnector):
             res.append((True, vm))
 
         all_ok = True
-        for _ in range(len(nodes), num_vm):
+        for _ in range(len(res), num_vm):
             all_ok = False
             res.append((False, "ERROR: %s" % error_msg))
 
@@ -16,7 +16,9 @@
 
 import base64
 import json
-import requests
+import logging
+import threading
+from IM.HTTPClient import HTTPClient
 import time
 import os
 import re
@@ -35,6 +37,200 @@ from radl.radl import Feature
 from IM.config import Config
 
 
+class KubernetesWatch():
+    """
+    Informer-style local cache of the objects of a kind (pods, services, ...) in a namespace
+    of a Kubernetes cluster. The objects are listed once and then updated by the events of
+    a watch request that runs in a background thread. The objects are listed again every
+    KUBERNETES_WATCH_RESYNC seconds or if the watch fails, and the watch ends (and it is
+    removed) when it has not been used for KUBERNETES_WATCH_TIME seconds.
+    """
+
+    logger = logging.getLogger('CloudConnector')
+    """Logger object."""
+
+    _watches = {}
+    """Map from the list URL (cluster, namespace and kind) to its KubernetesWatch."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    def __init__(self, url, headers, verify, key=None):
+        self.url = url
+        """URL of the list of objects."""
+        self.key = key
+        """Key of the watch in the _watches map."""
+        self.headers = headers
+        """Auth headers used to contact the API server."""
+        self.verify = verify
+        """Verify the SSL certificate of the API server."""
+        self.objects = {}
+        """Map from the object name to its data."""
+        self.resource_version = None
+        """Resource version of the last event processed."""
+        self.last_sync = 0
+        """Time of the last list of the objects."""
+        self.list_error = False
+        """Flag to set if the last list of the objects failed."""
+        self.listing = False
+        """Flag to set while the objects are being listed."""
+        self.last_access = time.time()
+        """Time of the last object read."""
+        self.thread = None
+        """Thread processing the watch events."""
+        self.stopped = False
+        """Flag to set to end the watch."""
+        self.lock = threading.Lock()
+        """Threading Lock to avoid concurrency problems."""
+
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        with KubernetesWatch._lock:
+            watches = list(KubernetesWatch._watches.values())
+            KubernetesWatch._watches = {}
+        for watch in watches:
+            watch.stopped = True
+
+    @staticmethod
+    def get_watch(url, headers, verify):
+        """
+        Get the KubernetesWatch of a list URL creating it if needed.
+        The credentials are not part of the key, so a refreshed token reuses the same watch
+        (see get).
+        """
+        key = url
+        now = time.time()
+        with KubernetesWatch._lock:
+            # Purge the watches not used whose thread has already finished
+            for k, w in list(KubernetesWatch._watches.items()):
+                if k != key and now - w.last_access > Config.KUBERNETES_WATCH_TIME and not w._is_running():
+                    del KubernetesWatch._watches[k]
+            watch = KubernetesWatch._watches.get(key)
+            if watch is None:
+                watch = KubernetesWatch(url, headers, verify, key)
+                KubernetesWatch._watches[key] = watch
+        return watch
+
+    def _is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _is_synced(self):
+        return (self.resource_version is not None and self._is_running() and
+                time.time() - self.last_sync < Config.KUBERNETES_WATCH_RESYNC)
+
+    def _list(self):
+        """
+        List the objects and start the watch thread. The caller must set the listing flag.
+        The request is done without holding the lock to not block the other readers.
+        """
+        try:
+            with self.lock:
+                self.last_sync = time.time()
+                self.resource_version = None
+                self.list_error = True
+                headers = self.headers
+            resp = HTTPClient.request("GET", self.url, verify=self.verify, headers=headers)
+            if resp.status_code != 200:
+                # The user may not be allowed to list the objects, do not retry until the next resync
+                self.logger.debug("Error listing %s: %s" % (self.url, resp.text))
+                return False
+            data = resp.json()
+            objects = dict((item["metadata"]["name"], item) for item in data.get("items", []))
+            with self.lock:
+                self.list_error = False
+                self.objects = objects
+                self.resource_version = data["metadata"]["resourceVersion"]
+                if not self._is_running():
+                    self.thread = threading.Thread(target=self._watch)
+                    self.thread.daemon = True
+                    self.thread.start()
+            return True
+        finally:
+            with self.lock:
+                self.listing = False
+
+    def _watch(self):
+        self.logger.debug("Starting watch of %s." % self.url)
+        while not self.stopped and time.time() - self.last_access < Config.KUBERNETES_WATCH_TIME:
+            with self.lock:
+                resource_version = self.resource_version
+            if resource_version is None or self.stopped:
+                break
+            watch_timeout = 60
+            params = {"watch": "1", "resourceVersion": resource_version, "timeoutSeconds": watch_timeout}
+            try:
+                resp = HTTPClient.request("GET", self.url, verify=self.verify, headers=self.headers,
+                                          params=params, stream=True, timeout=(10, watch_timeout + 10))
+                try:
+                    if resp.status_code != 200:
+                        self.logger.debug("Error watching %s: %s" % (self.url, resp.text))
+                        break
+                    for line in resp.iter_lines():
+                        if line and not self._process_event(json.loads(line)):
+                            break
+                finally:
+                    resp.close()
+            except Exception:
+                self.logger.exception("Error watching %s." % self.url)
+                break
+        # Force a new list in the next read
+        with self.lock:
+            self.resource_version = None
+        # Remove the watch if it is not used anymore
+        if self.stopped or time.time() - self.last_access >= Config.KUBERNETES_WATCH_TIME:
+            with KubernetesWatch._lock:
+                if KubernetesWatch._watches.get(self.key) is self:
+                    del KubernetesWatch._watches[self.key]
+        self.logger.debug("Watch of %s finished." % self.url)
+
+    def _process_event(self, event):
+        with self.lock:
+            if event.get("type") == "ERROR":
+                # Usually a 410 Gone error as the resource version is too old
+                self.resource_version = None
+                return False
+            obj = event.get("object", {})
+            name = obj.get("metadata", {}).get("name")
+            if name:
+                if event.get("type") == "DELETED":
+                    self.objects.pop(name, None)
+                else:
+                    self.objects[name] = obj
+                self.resource_version = obj["metadata"].get("resourceVersion", self.resource_version)
+        return True
+
+    def get(self, name, headers=None):
+        """
+        Get the data of an object from the local cache. If the auth headers are not the
+        ones used in the last list of the objects, they replace them and the objects are
+        listed again, so the objects are only returned to the users allowed to list them.
+
+        Args:
+
+        - name(str): name of the object.
+        - headers(dict): current auth headers to use in the list requests.
+
+        Return: the object data (dict) or None if it is not found or the objects cannot be listed.
+        """
+        self.last_access = time.time()
+        with self.lock:
+            if headers and headers != self.headers:
+                self.headers = headers
+                self.last_sync = 0
+                self.list_error = False
+            if self._is_synced():
+                return self.objects.get(name)
+            # Do not wait while other thread lists the objects, the object will be requested directly
+            if self.listing or (self.list_error and time.time() - self.last_sync < Config.KUBERNETES_WATCH_RESYNC):
+                return None
+            self.listing = True
+        if not self._list():
+            return None
+        with self.lock:
+            return self.objects.get(name)
+
+
 class KubernetesCloudConnector(CloudConnector):
     """
     Cloud Launcher to Kubernetes platform
@@ -62,7 +258,7 @@ class KubernetesCloudConnector(CloudConnector):
         else:
             data = body
         url = "%s://%s:%d%s%s" % (self.cloud.protocol, self.cloud.server, self.cloud.get_port(), self.cloud.path, url)
-        resp = requests.request(method, url, verify=self.verify_ssl, headers=headers, data=data)
+        resp = HTTPClient.request(method, url, verify=self.verify_ssl, headers=headers, data=data)
 
         return resp
 
@@ -293,16 +489,11 @@ class KubernetesCloudConnector(CloudConnector):
                 self.error_messages += "Error creating service for pod %s: %s" % (name, svc_resp.text)
                 self.log_warn("Error creating service: %s" % svc_resp.text)
             else:
-                # Wait a bit to assure the service has been created
-                time.sleep(0.5)
-                # Get Service data to get assigned nodePort
-                uri = "/api/v1/namespaces/%s/%s/%s" % (namespace, "services", name)
-                svc_resp = self.create_request('GET', uri, auth_data)
-                if svc_resp.status_code == 200:
-                    for port in svc_resp.json()['spec']['ports']:
-                        # Set Out port in the RADL info of the VM
-                        if 'nodePort' in port and port['nodePort']:
-                            vm.setOutPort(int(port['port']), int(port['nodePort']))
+                # The created Service returned already has the assigned nodePorts
+                for port in svc_resp.json()['spec']['ports']:
+                    # Set Out port in the RADL info of the VM
+                    if 'nodePort' in port and port['nodePort']:
+                        vm.setOutPort(int(port['port']), int(port['nodePort']))
 
         except Exception:
             self.error_messages += "Error creating service to access pod %s" % name
@@ -647,7 +838,23 @@ class KubernetesCloudConnector(CloudConnector):
 
         return res
 
-    def _get_pod(self, vm, auth_data):
+    def _get_cached_pod(self, namespace, pod_name, auth_data):
+        """
+        Get the data of a POD from the shared watch of the namespace.
+        Return None if it is not found in the cache.
+        """
+        if Config.KUBERNETES_WATCH_TIME <= 0:
+            return None
+        try:
+            auth_header, _, _ = self.get_auth_header(auth_data)
+            url = "%s://%s:%d%s/api/v1/namespaces/%s/pods" % (self.cloud.protocol, self.cloud.server,
+                                                              self.cloud.get_port(), self.cloud.path, namespace)
+            return KubernetesWatch.get_watch(url, auth_header, self.verify_ssl).get(pod_name, auth_header)
+        except Exception:
+            self.log_exception("Error getting POD %s/%s from the watch cache" % (namespace, pod_name))
+            return None
+
+    def _get_pod(self, vm, auth_data, cached=False):
         try:
             namespace = vm.id.split("/")[0]
             pod_name = vm.id.split("/")[1]
@@ -655,6 +862,11 @@ class KubernetesCloudConnector(CloudConnector):
             self.log_exception("Error invalid VM id")
             return (False, None, "Error invalid VM id: " + str(ex))
 
+        if cached:
+            pod_data = self._get_cached_pod(namespace, pod_name, auth_data)
+            if pod_data:
+                return (True, 200, json.dumps(pod_data))
+
         try:
             uri = "/api/v1/namespaces/%s/%s/%s" % (namespace, "pods", pod_name)
             resp = self.create_request('GET', uri, auth_data)
@@ -675,7 +887,7 @@ class KubernetesCloudConnector(CloudConnector):
             return float(cpu)
 
     def updateVMInfo(self, vm, auth_data):
-        success, status, output = self._get_pod(vm, auth_data)
+        success, status, output = self._get_pod(vm, auth_data, cached=True)
         if success:
             output = json.loads(output)
             vm.state = self.VM_STATE_MAP.get(output["status"]["phase"], VirtualMachine.UNKNOWN)
@@ -16,7 +16,7 @@
 
 import base64
 import json
-import requests
+from IM.HTTPClient import HTTPClient
 from IM.VirtualMachine import VirtualMachine
 from .CloudConnector import CloudConnector
 from IM.connectors.exceptions import NoAuthData, NoCorrectAuthData, CloudConnectorException
@@ -219,8 +219,8 @@ class OSCARCloudConnector(CloudConnector):
                 url = "%s/system/services" % self.cloud.get_url()
                 service = self._get_service_json(radl.systems[0])
                 headers = {"Authorization": self._get_auth_header(auth_data)}
-                response = requests.request("POST", url, data=json.dumps(service),
-                                            headers=headers, verify=self.verify_ssl)
+                response = HTTPClient.request("POST", url, data=json.dumps(service),
+                                              headers=headers, verify=self.verify_ssl)
                 if response.status_code == 201:
                     vm.destroy = False
                     vm.state = VirtualMachine.RUNNING
@@ -242,7 +242,7 @@ class OSCARCloudConnector(CloudConnector):
         try:
             url = "%s/system/services/%s" % (self.cloud.get_url(), vm.id)
             headers = {"Authorization": self._get_auth_header(auth_data)}
-            response = requests.request("DELETE", url, headers=headers, verify=self.verify_ssl)
+            response = HTTPClient.request("DELETE", url, headers=headers, verify=self.verify_ssl)
             if response.status_code == 404:
                 self.log_warn("OSCAR function '%s' does not exist. Ignore." % vm.id)
                 return True, ""
@@ -286,8 +286,8 @@ class OSCARCloudConnector(CloudConnector):
                     url = "%s/system/services" % self.cloud.get_url()
                     service = self._get_service_json(vm.info.systems[0])
                     headers = {"Authorization": self._get_auth_header(auth_data)}
-                    response = requests.request("POST", url, data=json.dumps(service),
-                                                headers=headers, verify=self.verify_ssl)
+                    response = HTTPClient.request("POST", url, data=json.dumps(service),
+                                                  headers=headers, verify=self.verify_ssl)
                     if response.status_code == 201:
                         vm.state = VirtualMachine.RUNNING
                     else:
@@ -304,7 +304,7 @@ class OSCARCloudConnector(CloudConnector):
             try:
                 url = "%s/system/services/%s" % (self.cloud.get_url(), vm.id)
                 headers = {"Authorization": self._get_auth_header(auth_data)}
-                response = requests.request("GET", url, headers=headers, verify=self.verify_ssl)
+                response = HTTPClient.request("GET", url, headers=headers, verify=self.verify_ssl)
                 if response.status_code == 404:
                     if vm.state == VirtualMachine.PENDING:
                         self.log_warn("OSCAR function '%s' does not exist. Maintain it as PENDING." % vm.id)
@@ -328,7 +328,7 @@ class OSCARCloudConnector(CloudConnector):
             service = self._get_service_json(radl.systems[0])
             url = "%s/system/services/%s" % (self.cloud.get_url(), vm.id)
             headers = {"Authorization": self._get_auth_header(auth_data)}
-            response = requests.request("PUT", url, data=json.dumps(service), headers=headers, verify=self.verify_ssl)
+            response = HTTPClient.request("PUT", url, data=json.dumps(service), headers=headers, verify=self.verify_ssl)
             if response.status_code == 404:
                 vm.state = VirtualMachine.OFF
                 return True, vm
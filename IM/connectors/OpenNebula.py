@@ -22,8 +22,11 @@ try:
 except ImportError:
     from xmlrpc.client import ServerProxy  # nosec
 
+import hashlib
 import os.path
+import threading
 import time
+from collections import OrderedDict
 from packaging.version import Version
 from IM.xmlobject import XMLObject
 try:
@@ -223,6 +226,17 @@ class OpenNebulaCloudConnector(CloudConnector):
     """str with the name of the provider."""
     DEFAULT_USER = 'root'
     """ default user to SSH access the VM """
+    MULTICALL_SIZE = 50
+    """Max number of VMs requested in a system.multicall call."""
+    VM_INFO_PREFETCH_TIME = 10
+    """Max time (in secs) to use the VM info got in a batch."""
+
+    _local = threading.local()
+    """Thread local storage of the XML-RPC clients (ServerProxy) per endpoint."""
+    _cache = OrderedDict()
+    """Map from the endpoint and session key to a tuple (time, value) of the cached data, sorted by time."""
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
 
     def __init__(self, cloud_info, inf):
         CloudConnector.__init__(self, cloud_info, inf)
@@ -240,6 +254,55 @@ class OpenNebulaCloudConnector(CloudConnector):
         else:
             self.server_url = "http://%s:%d/RPC2" % (self.cloud.server, self.cloud.port)
 
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        with OpenNebulaCloudConnector._lock:
+            OpenNebulaCloudConnector._local = threading.local()
+            OpenNebulaCloudConnector._cache = OrderedDict()
+
+    def _get_server(self):
+        """
+        Get the XML-RPC client of the ONE endpoint. The clients are kept per thread
+        (ServerProxy is not thread safe) to reuse the HTTP connections.
+        """
+        servers = getattr(self._local, "servers", None)
+        if servers is None:
+            servers = {}
+            self._local.servers = servers
+        if self.server_url not in servers:
+            servers[self.server_url] = ServerProxy(self.server_url, allow_none=True)
+        return servers[self.server_url]
+
+    def _get_cache_key(self, name, session_id=None):
+        key = [self.server_url, name]
+        if session_id:
+            key.append(hashlib.sha256(session_id.encode()).hexdigest())
+        return tuple(key)
+
+    def _get_cached(self, key, cache_time):
+        with self._lock:
+            if key in self._cache:
+                cached_time, value = self._cache[key]
+                if time.time() - cached_time <= cache_time:
+                    return value
+                del self._cache[key]
+        return None
+
+    def _set_cached(self, key, value):
+        now = time.time()
+        max_time = max(self.VM_INFO_PREFETCH_TIME, ConfigOpenNebula.CACHE_TIME)
+        with self._lock:
+            # Add it at the end to keep the entries sorted by time
+            self._cache.pop(key, None)
+            self._cache[key] = (now, value)
+            # Purge the expired entries, so that the data of deleted VMs is not kept forever
+            while self._cache:
+                old_key, (cached_time, _) = next(iter(self._cache.items()))
+                if now - cached_time <= max_time:
+                    break
+                del self._cache[old_key]
+
     def concrete_system(self, radl_system, str_url, auth_data):
         url = urlparse(str_url)
         protocol = url[0]
@@ -343,12 +406,45 @@ class OpenNebulaCloudConnector(CloudConnector):
                     break
                 i += 1
 
+    def prefetch_vms_info(self, vms, auth_data, finalize=False):
+        if finalize:
+            # The VM info is not used to finalize the VMs
+            return
+        server = self._get_server()
+        session_id = self.getSessionID(auth_data)
+
+        for i in range(0, len(vms), self.MULTICALL_SIZE):
+            batch = vms[i:i + self.MULTICALL_SIZE]
+            calls = [{'methodName': 'one.vm.info', 'params': [session_id, int(vm.id)]} for vm in batch]
+            try:
+                results = server.system.multicall(calls)
+            except Exception as ex:
+                self.log_warn("Error getting the VMs info with system.multicall: %s" % ex)
+                return
+            for vm, result in zip(batch, results):
+                # The faults are returned as a dict and the results as a list with one item
+                if isinstance(result, list) and result:
+                    self._set_cached(self._get_cache_key("vm.info.%s" % vm.id, session_id), result[0][0:2])
+
+    def _get_vm_info(self, server, session_id, vm_id):
+        """
+        Get the info of a VM, using the one got in the last batch if available.
+        """
+        key = self._get_cache_key("vm.info.%s" % vm_id, session_id)
+        res = self._get_cached(key, self.VM_INFO_PREFETCH_TIME)
+        if res is not None:
+            # Use it only once
+            with self._lock:
+                self._cache.pop(key, None)
+            return res
+        return server.one.vm.info(session_id, int(vm_id))[0:2]
+
     def updateVMInfo(self, vm, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
 
         session_id = self.getSessionID(auth_data)
 
-        success, res_info = server.one.vm.info(session_id, int(vm.id))[0:2]
+        success, res_info = self._get_vm_info(server, session_id, vm.id)
         if success:
             res_vm = VM(res_info)
 
@@ -411,7 +507,7 @@ class OpenNebulaCloudConnector(CloudConnector):
             return (success, res_info)
 
     def _get_security_group(self, sg_name, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
         session_id = self.getSessionID(auth_data)
 
         success, res_info = server.one.secgrouppool.info(session_id, -1, -1, -1)[0:2]
@@ -426,7 +522,7 @@ class OpenNebulaCloudConnector(CloudConnector):
         return None
 
     def create_security_groups(self, inf, radl, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
         session_id = self.getSessionID(auth_data)
 
         sgs = {}
@@ -487,7 +583,7 @@ class OpenNebulaCloudConnector(CloudConnector):
         return sgs
 
     def launch(self, inf, radl, requested_radl, num_vm, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
         session_id = self.getSessionID(auth_data)
 
         sgs = self.create_security_groups(inf, radl, auth_data)
@@ -525,7 +621,7 @@ class OpenNebulaCloudConnector(CloudConnector):
         """
         Delete the SG of this node
         """
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
         session_id = self.getSessionID(auth_data)
 
         for net in inf.radl.networks:
@@ -560,7 +656,7 @@ class OpenNebulaCloudConnector(CloudConnector):
                 self.log_error("Error deleting the SG: Timeout.")
 
     def finalize(self, vm, last, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
         session_id = self.getSessionID(auth_data)
 
         # first delete the snapshots to avoid problems in EC3 deleting the IM front-end
@@ -601,7 +697,7 @@ class OpenNebulaCloudConnector(CloudConnector):
         return self.vm_action(vm, 'reboot-hard', auth_data)
 
     def vm_action(self, vm, action, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
         session_id = self.getSessionID(auth_data)
         success, err = server.one.vm.action(session_id, action, int(vm.id))[0:2]
         return (success, err)
@@ -744,7 +840,12 @@ class OpenNebulaCloudConnector(CloudConnector):
 
          Returns: str with the ONE version (format: X.X.X)
         """
-        server = ServerProxy(self.server_url, allow_none=True)
+        key = self._get_cache_key("version")
+        version = self._get_cached(key, ConfigOpenNebula.CACHE_TIME)
+        if version:
+            return version
+
+        server = self._get_server()
 
         version = "2.0.0"
         methods = server.system.listMethods()
@@ -753,6 +854,7 @@ class OpenNebulaCloudConnector(CloudConnector):
             success, res_info = server.one.system.version(session_id)[0:2]
             if success:
                 version = res_info
+                self._set_cached(key, version)
             else:
                 version = "3.8.0 or Higher"
         else:
@@ -827,8 +929,13 @@ class OpenNebulaCloudConnector(CloudConnector):
          Returns: a list of tuples (net_name, net_id, is_public) with the name, ID, and boolean specifying
          if it is a public network of the found network None if not found
         """
-        server = ServerProxy(self.server_url, allow_none=True)
         session_id = self.getSessionID(auth_data)
+        key = self._get_cache_key("networks", session_id)
+        res = self._get_cached(key, ConfigOpenNebula.CACHE_TIME)
+        if res is not None:
+            return list(res)
+
+        server = self._get_server()
         success, info = server.one.vnpool.info(session_id, -2, -1, -1)[0:2]
         if success:
             pool_info = VNET_POOL(info)
@@ -903,6 +1010,7 @@ class OpenNebulaCloudConnector(CloudConnector):
 
             res.append((net.NAME, net.ID, is_public))
 
+        self._set_cached(key, list(res))
         return res
 
     @staticmethod
@@ -1023,7 +1131,7 @@ class OpenNebulaCloudConnector(CloudConnector):
 
          Returns: bool, True if the one.vm.resize function appears in the ONE server or false otherwise
         """
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
 
         methods = server.system.listMethods()
         if "one.vm.resize" in methods:
@@ -1035,7 +1143,7 @@ class OpenNebulaCloudConnector(CloudConnector):
         """
         Poweroff the VM and waits for it to be in poweredoff state
         """
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
         session_id = self.getSessionID(auth_data)
         success, err = server.one.vm.action(session_id, 'poweroff', int(vm.id))[0:2]
         if not success:
@@ -1080,7 +1188,7 @@ class OpenNebulaCloudConnector(CloudConnector):
             return (True, "")
 
     def attach_volume(self, vm, disk_size, disk_device, disk_fstype, session_id):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
 
         disk_temp = '''
             DISK = [
@@ -1131,7 +1239,7 @@ class OpenNebulaCloudConnector(CloudConnector):
         return (True, "")
 
     def alter_mem_cpu(self, vm, system, session_id, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
 
         cpu = vm.info.systems[0].getValue('cpu.count')
         memory = vm.info.systems[0].getFeature('memory.size').getValue('M')
@@ -1173,7 +1281,7 @@ class OpenNebulaCloudConnector(CloudConnector):
             return (True, "")
 
     def create_snapshot(self, vm, disk_num, image_name, auto_delete, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
 
         session_id = self.getSessionID(auth_data)
 
@@ -1203,7 +1311,7 @@ class OpenNebulaCloudConnector(CloudConnector):
             return (False, res_info)
 
     def wait_image(self, image_id, auth_data, timeout=180):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
 
         session_id = self.getSessionID(auth_data)
 
@@ -1229,7 +1337,7 @@ class OpenNebulaCloudConnector(CloudConnector):
             return False, "Timeout waiting image to be ready"
 
     def delete_image(self, image_url, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
 
         session_id = self.getSessionID(auth_data)
 
@@ -1255,7 +1363,7 @@ class OpenNebulaCloudConnector(CloudConnector):
             return int(image_id)
         else:
             # We have to find the ID of the image name
-            server = ServerProxy(self.server_url, allow_none=True)
+            server = self._get_server()
             success, res_info = server.one.imagepool.info(session_id, -2, -1, -1)[0:2]
             if success:
                 pool_info = IMAGE_POOL(res_info)
@@ -1270,7 +1378,7 @@ class OpenNebulaCloudConnector(CloudConnector):
             return None
 
     def list_images(self, auth_data, filters=None):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
         session_id = self.getSessionID(auth_data)
 
         success, res_info = server.one.imagepool.info(session_id, -2, -1, -1)[0:2]
@@ -1309,7 +1417,7 @@ class OpenNebulaCloudConnector(CloudConnector):
         return res
 
     def get_quotas(self, auth_data):
-        server = ServerProxy(self.server_url, allow_none=True)
+        server = self._get_server()
         session_id = self.getSessionID(auth_data)
 
         success, res_info = server.one.user.info(session_id, -1)[0:2]
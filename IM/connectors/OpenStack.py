@@ -27,7 +27,7 @@ from IM.SSH import SSH
 
 try:
     from libcloud.common.exceptions import BaseHTTPError
-    from libcloud.compute.types import Provider
+    from libcloud.compute.types import Provider, NodeState
     from libcloud.compute.providers import get_driver
     from libcloud.compute.base import NodeAuthSSHKey
     from libcloud.compute.drivers.openstack import (OpenStack_2_NodeDriver,
@@ -70,6 +70,8 @@ class OpenStackCloudConnector(LibCloudCloudConnector):
     """ Default authentication method """
     MINMUM_DISK_SIZE = 5
     """ Default minimum root disk size in GB """
+    SHARED_RESOURCES_CLEANUP = True
+    """ Delete the SGs and nets once all the VMs are terminated """
 
     def __init__(self, cloud_info, inf):
         self.auth = None
@@ -1827,24 +1829,8 @@ class OpenStackCloudConnector(LibCloudCloudConnector):
         success.append(res)
         msgs.append(msg)
 
-        driver = self.get_driver(auth_data)
-
         if last:
-            # Delete the SG if this is the last VM
-            try:
-                res, msg = self.delete_security_groups(driver, vm.inf)
-            except Exception as ex:
-                res = False
-                msg = get_ex_error(ex)
-            success.append(res)
-            msgs.append(msg)
-
-            # Delete the created networks
-            try:
-                res, msg = self.delete_networks(driver, vm.inf)
-            except Exception as ex:
-                res = False
-                msg = get_ex_error(ex)
+            res, msg = self.delete_shared_resources([vm], auth_data)
             success.append(res)
             msgs.append(msg)
         else:
@@ -1853,6 +1839,54 @@ class OpenStackCloudConnector(LibCloudCloudConnector):
 
         return (all(success), "\n ".join(msgs))
 
+    def wait_vms_terminated(self, vms, auth_data, timeout=180, delay=5):
+        vm_ids = [vm.id for vm in vms if vm.id]
+        driver = self.get_driver(auth_data)
+        cont = 0
+        while vm_ids and cont < timeout:
+            # Only get the details of the VMs being terminated, not all the nodes of the project
+            for vm_id in list(vm_ids):
+                try:
+                    node = driver.ex_get_node_details(vm_id)
+                    if node is None or node.state == NodeState.TERMINATED:
+                        vm_ids.remove(vm_id)
+                except Exception as ex:
+                    self.log_warn("Error getting the details of node %s: %s" % (vm_id, get_ex_error(ex)))
+            if vm_ids:
+                time.sleep(delay)
+                cont += delay
+
+        if vm_ids:
+            self.log_warn("Timeout waiting VMs %s to be terminated." % vm_ids)
+            return False
+        return True
+
+    def delete_shared_resources(self, vms, auth_data):
+        driver = self.get_driver(auth_data)
+        inf = vms[0].inf
+        success = []
+        msgs = []
+
+        # Delete the SGs
+        try:
+            res, msg = self.delete_security_groups(driver, inf)
+        except Exception as ex:
+            res = False
+            msg = get_ex_error(ex)
+        success.append(res)
+        msgs.append(msg)
+
+        # Delete the created networks
+        try:
+            res, msg = self.delete_networks(driver, inf)
+        except Exception as ex:
+            res = False
+            msg = get_ex_error(ex)
+        success.append(res)
+        msgs.append(msg)
+
+        return (all(success), "\n ".join(msgs))
+
     def _get_security_names(self, inf):
         """
         Get the list of SGs for this infra
@@ -17,6 +17,8 @@
 """Class to manage DB operations"""
 import time
 
+from IM.config import Config
+
 try:
     from urlparse import urlparse
 except ImportError:
@@ -142,7 +144,15 @@ class DataBase:
         else:
             return False
 
-    def _execute_retry(self, sql, args, fetch=False):
+    def _get_cursor(self, server_side=False):
+        """ Get a new cursor, a server side one (unbuffered) in case of MySQL
+            if server_side is True. SQLite cursors already fetch the rows on demand.
+        """
+        if server_side and self.db_type == DataBase.MYSQL:
+            return self.connection.cursor(mdb.cursors.SSCursor)
+        return self.connection.cursor()
+
+    def _execute_retry(self, sql, args, fetch=False, server_side=False):
         """ Function to execute a SQL function, retrying in case of locked DB
 
             Arguments:
@@ -150,9 +160,12 @@ class DataBase:
             - args: A List of arguments to substitute in the SQL sentence
             - fetch: If the function must fetch the results.
                     (Optional, default False)
+            - server_side: If the function must return the cursor, to
+                    fetch the results on demand. (Optional, default False)
 
             Returns: True if fetch is False and the operation is performed
-                     correctly or a list with the "Fetch" of the results
+                     correctly, a list with the "Fetch" of the results
+                     or the cursor if server_side is True
         """
 
         if self.connection is None:
@@ -161,7 +174,7 @@ class DataBase:
             retries_cont = 0
             while retries_cont < self.MAX_RETRIES:
                 try:
-                    cursor = self.connection.cursor()
+                    cursor = self._get_cursor(server_side)
                     if args is not None:
                         if self.db_type == DataBase.SQLITE:
                             new_sql = sql.replace("%s", "?").replace("now()", "date('now')")
@@ -171,7 +184,9 @@ class DataBase:
                     else:
                         cursor.execute(sql)
 
-                    if fetch:
+                    if server_side:
+                        res = cursor
+                    elif fetch:
                         res = list(cursor.fetchall())
                     else:
                         self.connection.commit()
@@ -219,6 +234,57 @@ class DataBase:
             raise Exception("Operation not supported in MongoDB")
         return self._execute_retry(sql, args, fetch=True)
 
+    def select_iter(self, sql, args=None, batch_size=None):
+        """ Executes a SQL sentence that returns results, fetching them
+            in batches to avoid loading all of them in memory
+
+            In MySQL the rows are read from a server side cursor that keeps
+            the connection busy until the generator is consumed or closed, so
+            the consumer must not block (e.g. waiting for a client) between rows.
+            In SQLite an active cursor locks the DB for the writers, so all the
+            rows are fetched in batches before returning the first one.
+
+            Arguments:
+            - sql: The SQL sentence
+            - args: A List of arguments to substitute in the SQL sentence
+                    (Optional, default None)
+            - batch_size: Number of rows fetched in each batch
+                    (Optional, default Config.DB_BATCH_SIZE)
+
+            Returns: A generator of the result rows
+        """
+        if self.db_type == DataBase.MONGO:
+            raise Exception("Operation not supported in MongoDB")
+        cursor = self._execute_retry(sql, args, server_side=True)
+        if self.db_type == DataBase.SQLITE:
+            return iter(self._fetch_cursor(cursor, batch_size or Config.DB_BATCH_SIZE))
+        return self._iter_cursor(cursor, batch_size or Config.DB_BATCH_SIZE)
+
+    @staticmethod
+    def _fetch_cursor(cursor, batch_size):
+        res = []
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                res.extend(rows)
+        finally:
+            cursor.close()
+        return res
+
+    @staticmethod
+    def _iter_cursor(cursor, batch_size):
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
     def close(self):
         """ Closes the DB connection """
         if self.connection is None:
@@ -270,6 +336,33 @@ class DataBase:
                 projection.update({'_id': False})
             return list(self.connection[table_name].find(filt, projection, sort=sort))
 
+    def find_iter(self, table_name, filt=None, projection=None, sort=None, batch_size=None):
+        """ find elements, returning a generator that gets them from the server
+            in batches of batch_size documents (default Config.DB_BATCH_SIZE)
+
+            The server side cursor is kept open until the generator is consumed
+            or closed, so the consumer must not block between elements.
+        """
+        if self.db_type != DataBase.MONGO:
+            raise Exception("Operation only supported in MongoDB")
+
+        if self.connection is None:
+            raise Exception("DataBase object not connected")
+        else:
+            if projection:
+                projection.update({'_id': False})
+            cursor = self.connection[table_name].find(filt, projection, sort=sort,
+                                                      batch_size=batch_size or Config.DB_BATCH_SIZE)
+            return self._iter_mongo_cursor(cursor)
+
+    @staticmethod
+    def _iter_mongo_cursor(cursor):
+        try:
+            for elem in cursor:
+                yield elem
+        finally:
+            cursor.close()
+
     def replace(self, table_name, filt, replacement):
         """ insert/replace elements """
         if self.db_type != DataBase.MONGO:
@@ -24,17 +24,21 @@ import os
 import signal
 import time
 import argparse
+import threading
 import psutil
 
 from IM.request import Request, AsyncXMLRPCServer, get_system_queue
 from IM.config import Config
 from IM.InfrastructureManager import InfrastructureManager
 from IM.InfrastructureList import InfrastructureList
+from IM.JobManager import JobManager
 from IM.ServiceRequests import IMBaseRequest
 from IM import __version__ as version
 
 
 logger = logging.getLogger('InfrastructureManager')
+# PIDs of the REST API worker processes
+rest_workers = []
 
 
 class ExtraInfoFilter(logging.Filter):
@@ -60,15 +64,15 @@ def WaitRequest(request):
 # They create the specified request and wait for it.
 
 
-def AddResource(inf_id, radl_data, auth_data, context=True):
+def AddResource(inf_id, radl_data, auth_data, context=True, async_call=False):
     request = IMBaseRequest.create_request(
-        IMBaseRequest.ADD_RESOURCE, (inf_id, radl_data, auth_data, context))
+        IMBaseRequest.ADD_RESOURCE, (inf_id, radl_data, auth_data, context, async_call))
     return WaitRequest(request)
 
 
-def RemoveResource(inf_id, vm_list, auth_data, context=True):
+def RemoveResource(inf_id, vm_list, auth_data, context=True, async_call=False):
     request = IMBaseRequest.create_request(
-        IMBaseRequest.REMOVE_RESOURCE, (inf_id, vm_list, auth_data, context))
+        IMBaseRequest.REMOVE_RESOURCE, (inf_id, vm_list, auth_data, context, async_call))
     return WaitRequest(request)
 
 
@@ -84,9 +88,9 @@ def GetVMProperty(inf_id, vm_id, property_name, auth_data):
     return WaitRequest(request)
 
 
-def AlterVM(inf_id, vm_id, radl, auth_data):
+def AlterVM(inf_id, vm_id, radl, auth_data, async_call=False):
     request = IMBaseRequest.create_request(
-        IMBaseRequest.ALTER_VM, (inf_id, vm_id, radl, auth_data))
+        IMBaseRequest.ALTER_VM, (inf_id, vm_id, radl, auth_data, async_call))
     return WaitRequest(request)
 
 
@@ -96,15 +100,15 @@ def GetInfrastructureInfo(inf_id, auth_data):
     return WaitRequest(request)
 
 
-def StopInfrastructure(inf_id, auth_data):
+def StopInfrastructure(inf_id, auth_data, async_call=False):
     request = IMBaseRequest.create_request(
-        IMBaseRequest.STOP_INFRASTRUCTURE, (inf_id, auth_data))
+        IMBaseRequest.STOP_INFRASTRUCTURE, (inf_id, auth_data, async_call))
     return WaitRequest(request)
 
 
-def StartInfrastructure(inf_id, auth_data):
+def StartInfrastructure(inf_id, auth_data, async_call=False):
     request = IMBaseRequest.create_request(
-        IMBaseRequest.START_INFRASTRUCTURE, (inf_id, auth_data))
+        IMBaseRequest.START_INFRASTRUCTURE, (inf_id, auth_data, async_call))
     return WaitRequest(request)
 
 
@@ -128,9 +132,9 @@ def GetInfrastructureList(auth_data, flt=None):
     return WaitRequest(request)
 
 
-def Reconfigure(inf_id, radl_data, auth_data, vm_list=None):
+def Reconfigure(inf_id, radl_data, auth_data, vm_list=None, async_call=False):
     request = IMBaseRequest.create_request(
-        IMBaseRequest.RECONFIGURE, (inf_id, radl_data, auth_data, vm_list))
+        IMBaseRequest.RECONFIGURE, (inf_id, radl_data, auth_data, vm_list, async_call))
     return WaitRequest(request)
 
 
@@ -235,19 +239,45 @@ def GetStats(init_date, end_date, auth_data):
     return WaitRequest(request)
 
 
+def GetJobInfo(job_id, auth_data):
+    request = IMBaseRequest.create_request(
+        IMBaseRequest.GET_JOB_INFO, (job_id, auth_data))
+    return WaitRequest(request)
+
+
 def launch_daemon():
     """
     Launch the IM daemon
     """
+    if Config.ACTIVATE_REST and Config.REST_WORKERS > 1 and not Config.INF_CACHE_TIME:
+        print("REST_WORKERS set without INF_CACHE_TIME. The workers would not refresh the data from the DB.")
+        sys.exit(2)
+
     if not InfrastructureList.init_table():
         print("Error connecting with the DB!!.")
         sys.exit(2)
 
+    # Set as failed the jobs of this instance interrupted by the previous stop and purge the old ones
+    JobManager.check_jobs(interrupted=True)
+
     InfrastructureManager.logger.info('************ Start Infrastructure Manager daemon (v.%s) ************' % version)
 
     if Config.ACTIVATE_REST:
         # If specified launch the REST server
         import IM.REST
+        if Config.REST_WORKERS > 1:
+            # The worker processes must be launched before starting any thread
+            rest_workers.extend(IM.REST.run_workers(host=Config.REST_ADDRESS, port=Config.REST_PORT))
+
+    # The infrastructures are loaded on first access, only the interrupted ones are loaded at startup
+    InfrastructureList.launch_startup()
+
+    if Config.ACTIVATE_REST:
+        if Config.REST_BENCHMARK_REQUESTS > 0:
+            t = threading.Thread(target=IM.REST.benchmark,
+                                 args=(Config.REST_ADDRESS, Config.REST_PORT, Config.REST_BENCHMARK_REQUESTS))
+            t.daemon = True
+            t.start()
         if Config.ACTIVATE_XMLRPC:
             IM.REST.run_in_thread(host=Config.REST_ADDRESS, port=Config.REST_PORT)
         else:
@@ -297,6 +327,7 @@ def launch_daemon():
         server.register_function(GetInfrastructureOwners)
         server.register_function(EstimateResources)
         server.register_function(GetStats)
+        server.register_function(GetJobInfo)
 
         # Launch the API XMLRPC thread
         server.serve_forever_in_thread()
@@ -375,6 +406,8 @@ def im_stop():
             # we have to stop the REST server
             import IM.REST
             IM.REST.stop()
+            if rest_workers:
+                IM.REST.stop_workers(rest_workers)
 
         # Assure that the IM data are correctly saved
         InfrastructureManager.logger.info('Stopping Infrastructure Manager daemon...')
@@ -17,6 +17,7 @@
 Class to contact with an OpenID server
 '''
 import requests
+from IM.HTTPClient import HTTPClient
 import json
 import time
 from .JWT import JWT
@@ -32,7 +33,7 @@ class OpenIDClient(object):
             if iss in OpenIDClient.ISSUER_CONFIG_CACHE:
                 return OpenIDClient.ISSUER_CONFIG_CACHE[iss]
             url = "%s/.well-known/openid-configuration" % iss
-            resp = requests.request("GET", url, verify=verify_ssl)
+            resp = HTTPClient.request("GET", url, verify=verify_ssl)
             if resp.status_code != 200:
                 return {"error": "Code: %d. Message: %s." % (resp.status_code, resp.text)}
             # Only store currently needed data
@@ -51,7 +52,7 @@ class OpenIDClient(object):
             decoded_token = JWT().get_info(token)
             headers = {'Authorization': 'Bearer %s' % token}
             conf = OpenIDClient.get_openid_configuration(decoded_token['iss'], verify_ssl=False)
-            resp = requests.request("GET", conf["userinfo_endpoint"], verify=verify_ssl, headers=headers)
+            resp = HTTPClient.request("GET", conf["userinfo_endpoint"], verify=verify_ssl, headers=headers)
             if resp.status_code != 200:
                 return False, "Code: %d. Message: %s." % (resp.status_code, resp.text)
             return True, json.loads(resp.text)
@@ -67,8 +68,8 @@ class OpenIDClient(object):
             decoded_token = JWT().get_info(token)
             conf = OpenIDClient.get_openid_configuration(decoded_token['iss'], verify_ssl=False)
             url = "%s?token=%s&token_type_hint=access_token" % (conf["introspection_endpoint"], token)
-            resp = requests.request("GET", url, verify=verify_ssl,
-                                    auth=requests.auth.HTTPBasicAuth(client_id, client_secret))
+            resp = HTTPClient.request("GET", url, verify=verify_ssl,
+                                      auth=requests.auth.HTTPBasicAuth(client_id, client_secret))
             if resp.status_code != 200:
                 return False, "Code: %d. Message: %s." % (resp.status_code, resp.text)
             return True, json.loads(resp.text)
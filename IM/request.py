@@ -265,7 +265,36 @@ class AsyncRequest(Request):
         self.__thread.start()
 
 
-class AsyncXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+class BoundedThreadingMixIn(ThreadingMixIn):
+    """
+    ThreadingMixIn that limits the number of requests processed simultaneously
+    to XMLRCP_MAX_THREADS. The rest of connections will wait in the socket queue.
+    """
+
+    request_queue_size = Config.XMLRCP_REQUEST_QUEUE_SIZE
+    _threads_semaphore = None
+
+    def process_request(self, request, client_address):
+        if Config.XMLRCP_MAX_THREADS > 0:
+            if self._threads_semaphore is None:
+                self._threads_semaphore = threading.BoundedSemaphore(Config.XMLRCP_MAX_THREADS)
+            self._threads_semaphore.acquire()
+        try:
+            ThreadingMixIn.process_request(self, request, client_address)
+        except Exception:
+            if self._threads_semaphore:
+                self._threads_semaphore.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            if self._threads_semaphore:
+                self._threads_semaphore.release()
+
+
+class AsyncXMLRPCServer(BoundedThreadingMixIn, SimpleXMLRPCServer):
 
     def serve_forever_in_thread(self):
         """
@@ -282,7 +311,7 @@ class AsyncXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
 
 
 if Config.XMLRCP_SSL:
-    class AsyncSSLXMLRPCServer(ThreadingMixIn, SSLSimpleXMLRPCServer):
+    class AsyncSSLXMLRPCServer(BoundedThreadingMixIn, SSLSimpleXMLRPCServer):
 
         def __init__(self, *args, **kwargs):
             super(AsyncSSLXMLRPCServer, self).__init__(*args, **kwargs)
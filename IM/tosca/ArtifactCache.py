@@ -0,0 +1,115 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+import requests_cache
+from requests.adapters import HTTPAdapter
+
+from IM.config import Config
+
+
+class ArtifactCache():
+    """
+    Process-wide cache of the artifacts (implementation scripts, files) downloaded
+    to translate the TOSCA templates. All the Tosca objects share the same cached
+    Session, stored in the configured backend, instead of creating one per object.
+    """
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    GET_TIMEOUT = 20
+    """Timeout (in secs) of the artifact downloads."""
+
+    _session = None
+    """Cached Session shared by all the downloads."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    @staticmethod
+    def _reinit():
+        """Restart the class attributes to initial values."""
+        with ArtifactCache._lock:
+            session = ArtifactCache._session
+            ArtifactCache._session = None
+        if session:
+            session.close()
+
+    @staticmethod
+    def get_session():
+        """
+        Get the cached Session creating it if needed.
+        """
+        with ArtifactCache._lock:
+            if ArtifactCache._session is None:
+                session = requests_cache.CachedSession(Config.TOSCA_CACHE_NAME,
+                                                       backend=Config.TOSCA_CACHE_BACKEND,
+                                                       cache_control=True,
+                                                       expire_after=Config.TOSCA_CACHE_TIME)
+                adapter = HTTPAdapter(pool_maxsize=Config.HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                ArtifactCache._session = session
+            return ArtifactCache._session
+
+    @staticmethod
+    def get(url):
+        """
+        Get the content of an artifact.
+
+        Args:
+
+        - url(str): URL of the artifact.
+
+        Return: the content (str) of the artifact. It raises an Exception if it cannot be downloaded.
+        """
+        resp = ArtifactCache.get_session().get(url, timeout=ArtifactCache.GET_TIMEOUT)
+        if resp.status_code != 200:
+            raise Exception(resp.reason + "\n" + resp.text)
+        return resp.text
+
+    @staticmethod
+    def _get_no_raise(url):
+        try:
+            return ArtifactCache.get(url)
+        except Exception as ex:
+            ArtifactCache.logger.debug("Error downloading artifact %s: %s" % (url, ex))
+            return ex
+
+    @staticmethod
+    def prefetch(urls):
+        """
+        Download a set of artifacts in parallel (up to HTTP_POOL_SIZE at the same time).
+
+        Args:
+
+        - urls(list): list of URLs of the artifacts.
+
+        Return: a dict with the content (str) of each URL or the Exception raised downloading it.
+        """
+        urls = sorted(set(urls))
+        if len(urls) <= 1:
+            return dict((url, ArtifactCache._get_no_raise(url)) for url in urls)
+
+        pool = ThreadPool(processes=min(len(urls), Config.HTTP_POOL_SIZE))
+        try:
+            return dict(zip(urls, pool.map(ArtifactCache._get_no_raise, urls)))
+        finally:
+            pool.close()
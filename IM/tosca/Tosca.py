@@ -1,8 +1,6 @@
 import os
 import logging
 import yaml
-import copy
-import requests_cache
 import json
 import re
 from toscaparser.nodetemplate import NodeTemplate
@@ -16,11 +14,13 @@ try:
     from urlparse import urlparse
 except ImportError:
     from urllib.parse import urlparse
-from toscaparser.tosca_template import ToscaTemplate
 from toscaparser.elements.interfaces import InterfacesDef
 from toscaparser.functions import Function, is_function, get_function, GetAttribute, Concat, Token
 from toscaparser.elements.scalarunit import ScalarUnit_Size
 from IM.ansible_utils import merge_recipes
+from IM.config import Config
+from IM.tosca.ArtifactCache import ArtifactCache
+from IM.tosca.ToscaCache import ToscaCache
 from radl.radl import (system, deploy, network, Feature, Features, configure,
                        contextualize_item, RADL, contextualize, ansible, description)
 
@@ -35,23 +35,34 @@ class Tosca:
 
     ARTIFACTS_PATH = os.path.dirname(os.path.realpath(__file__)) + "/tosca-types/artifacts"
     ARTIFACTS_REMOTE_REPO = "https://raw.githubusercontent.com/grycap/tosca/main/artifacts/"
-    GET_TIMEOUT = 20
 
     logger = logging.getLogger('InfrastructureManager')
 
     def __init__(self, yaml_str, verify=True):
-        self.cache_session = requests_cache.CachedSession('tosca_cache', cache_control=True, expire_after=3600)
+        self.artifacts = None
+        """Map from the URL of the remote artifacts of the template to its content."""
+        self.verify = verify
+        """Flag to raise the errors found parsing the template."""
+        self._tosca = None
         Tosca.logger.debug("TOSCA: %s" % yaml_str)
         try:
             self.yaml = yaml.safe_load(yaml_str)
-            if not verify:
-                def verify_fake(tpl):
-                    return True
-                ToscaTemplate.verify_template = verify_fake
-            self.tosca = ToscaTemplate(yaml_dict_tpl=copy.deepcopy(self.yaml))
+            # The template is validated when it is submitted, otherwise it is parsed when needed
+            if verify:
+                self._tosca = ToscaCache.parse(self.yaml, verify)
         except Exception as ex:
             raise Exception("Error parsing TOSCA template: %s" % str(ex))
 
+    @property
+    def tosca(self):
+        """ToscaTemplate object of the template."""
+        if self._tosca is None:
+            try:
+                self._tosca = ToscaCache.parse(self.yaml, self.verify)
+            except Exception as ex:
+                raise Exception("Error parsing TOSCA template: %s" % str(ex))
+        return self._tosca
+
     def serialize(self):
         return yaml.safe_dump(self.yaml)
 
@@ -101,6 +112,9 @@ class Tosca:
                 src = node
                 relationships.append((src, trgt, relationship))
 
+        if self.artifacts is None:
+            self._prefetch_artifacts(relationships)
+
         radl = RADL()
         interfaces = {}
         cont_items = []
@@ -793,6 +807,83 @@ class Tosca:
 
         return res
 
+    @staticmethod
+    def _get_implementation_location(implementation):
+        """
+        Get the path of an implementation script and the URL to download it
+        (None if it is a local file).
+        """
+        implementation_url = urlparse(implementation)
+        if implementation_url[0] in ['http', 'https', 'ftp']:
+            return implementation_url[2], implementation
+
+        if implementation_url[0] == 'file':
+            script_path = implementation_url[2]
+        else:
+            script_path = os.path.join(Tosca.ARTIFACTS_PATH, implementation)
+        if os.path.isfile(script_path):
+            return script_path, None
+        return script_path, Tosca.ARTIFACTS_REMOTE_REPO + implementation
+
+    @staticmethod
+    def _get_mirror_path(url):
+        """
+        Get the path of an artifact of the remote repo in the local mirror (if configured).
+        """
+        if Config.TOSCA_ARTIFACTS_MIRROR and url.startswith(Tosca.ARTIFACTS_REMOTE_REPO):
+            return os.path.join(Config.TOSCA_ARTIFACTS_MIRROR, url[len(Tosca.ARTIFACTS_REMOTE_REPO):])
+        return None
+
+    def _prefetch_artifacts(self, relationships):
+        """
+        Download in parallel the remote artifacts (implementation scripts and files)
+        used by the nodes of the template.
+        """
+        urls = set()
+        for node in self.tosca.nodetemplates:
+            try:
+                root_type = Tosca._get_root_parent_type(node).type
+                if root_type == "tosca.nodes.Container.Application":
+                    for artifact in self._get_node_artifacts(node).values():
+                        if (artifact.get("type") == "tosca.artifacts.File" and artifact.get("deploy_path") and
+                                artifact.get("file") and not artifact.get("properties", {}).get("content")):
+                            urls.add(artifact.get("file"))
+                elif root_type not in ["tosca.nodes.BlockStorage", "tosca.nodes.network.Port",
+                                       "tosca.nodes.network.Network", "tosca.nodes.im.AnsibleHost",
+                                       "tosca.nodes.aisprint.FaaS.Function"]:
+                    interfaces = Tosca._get_interfaces(node)
+                    interfaces.update(Tosca._get_relationships_interfaces(relationships, node))
+                    for interface in interfaces.values():
+                        implementation = self._get_implementation_url(interface.node_template or node,
+                                                                      interface.implementation)
+                        if implementation:
+                            urls.add(self._get_implementation_location(implementation)[1])
+            except Exception as ex:
+                # The error will be raised processing the node
+                Tosca.logger.debug("Error getting the artifacts of node %s: %s" % (node.name, ex))
+
+        urls = [url for url in urls if url and not self._get_mirror_path(url)]
+        self.artifacts = ArtifactCache.prefetch(urls)
+
+    def _get_artifact(self, url):
+        """
+        Get the content of a remote artifact from the local mirror, the prefetched
+        artifacts or the shared artifact cache.
+        """
+        mirror_path = self._get_mirror_path(url)
+        if mirror_path:
+            if not os.path.isfile(mirror_path):
+                raise Exception("File %s not found in the artifacts mirror." % mirror_path)
+            with open(mirror_path) as f:
+                return f.read()
+
+        if self.artifacts and url in self.artifacts:
+            res = self.artifacts[url]
+            if isinstance(res, Exception):
+                raise res
+            return res
+        return ArtifactCache.get(url)
+
     def _gen_configure_from_interfaces(self, node, compute, interfaces):
         if not interfaces:
             return None
@@ -844,39 +935,26 @@ class Tosca:
                             os.path.basename(artifact) + " url='" + artifact + "'\n"
 
                 implementation = self._get_implementation_url(node, interface.implementation)
-                implementation_url = urlparse(implementation)
+                script_path, url = self._get_implementation_location(implementation)
 
-                if implementation_url[0] in ['http', 'https', 'ftp']:
-                    script_path = implementation_url[2]
+                if url is None:
+                    f = open(script_path)
+                    script_content = f.read()
+                    f.close()
+                elif url == implementation:
                     try:
-                        resp = self.cache_session.get(implementation, timeout=self.GET_TIMEOUT)
-                        script_content = resp.text
-                        if resp.status_code != 200:
-                            raise Exception(resp.reason + "\n" + resp.text)
+                        script_content = self._get_artifact(url)
                     except Exception as ex:
                         raise Exception("Error downloading the implementation script '%s': %s" % (
                             implementation, str(ex)))
                 else:
-                    if implementation_url[0] == 'file':
-                        script_path = implementation_url[2]
-                    else:
-                        script_path = os.path.join(Tosca.ARTIFACTS_PATH, implementation)
-                    if os.path.isfile(script_path):
-                        f = open(script_path)
-                        script_content = f.read()
-                        f.close()
-                    else:
-                        try:
-                            resp = self.cache_session.get(Tosca.ARTIFACTS_REMOTE_REPO + implementation,
-                                                          timeout=self.GET_TIMEOUT)
-                            script_content = resp.text
-                            if resp.status_code != 200:
-                                raise Exception(resp.reason + "\n" + resp.text)
-                        except Exception:
-                            raise Exception("Implementation file: '%s' is not located in the artifacts folder '%s' "
-                                            "or in the artifacts remote url '%s'." % (implementation,
-                                                                                      Tosca.ARTIFACTS_PATH,
-                                                                                      Tosca.ARTIFACTS_REMOTE_REPO))
+                    try:
+                        script_content = self._get_artifact(url)
+                    except Exception:
+                        raise Exception("Implementation file: '%s' is not located in the artifacts folder '%s' "
+                                        "or in the artifacts remote url '%s'." % (implementation,
+                                                                                  Tosca.ARTIFACTS_PATH,
+                                                                                  Tosca.ARTIFACTS_REMOTE_REPO))
 
                 if script_path.endswith(".yaml") or script_path.endswith(".yml"):
                     if env:
@@ -1995,7 +2073,8 @@ class Tosca:
 
     def merge(self, other_tosca):
         Tosca._merge_yaml(self.yaml, other_tosca.yaml)
-        self.tosca = ToscaTemplate(yaml_dict_tpl=copy.deepcopy(self.yaml))
+        self._tosca = None
+        self.artifacts = None
         return self
 
     @staticmethod
@@ -2168,10 +2247,10 @@ class Tosca:
                 res.setValue('disk.%d.content' % cont, content)
             # if content is not empty file is ignored
             if cm_file and not content:
-                resp = self.cache_session.get(cm_file, timeout=self.GET_TIMEOUT)
-                if resp.status_code != 200:
-                    raise Exception("Error downloading file %s: %s\n%s" % (cm_file, resp.reason, resp.text))
-                res.setValue('disk.%d.content' % cont, resp.text)
+                try:
+                    res.setValue('disk.%d.content' % cont, self._get_artifact(cm_file))
+                except Exception as ex:
+                    raise Exception("Error downloading file %s: %s" % (cm_file, ex))
             if content or cm_file:
                 res.setValue('disk.%d.mount_path' % cont, mount_path)
                 cont += 1
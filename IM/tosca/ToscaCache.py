@@ -0,0 +1,118 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from toscaparser.tosca_template import ToscaTemplate
+from IM.config import Config
+
+
+class NotVerifiedToscaTemplate(ToscaTemplate):
+    """
+    ToscaTemplate that does not raise the errors found parsing the template.
+    Used to load the templates already validated when they were submitted.
+    """
+
+    def verify_template(self):
+        pass
+
+
+class ToscaCache():
+    """
+    LRU cache of parsed TOSCA templates indexed by the hash of their content.
+    Building a ToscaTemplate requires to load the imported and normative types and
+    to resolve all the node types, and the same templates are parsed many times
+    (every time an infrastructure is loaded, merged or translated).
+    The cached objects are never returned: each call gets its own copy, as the
+    translation process modifies the values of the template.
+    """
+
+    _cache = OrderedDict()
+    """Map from the hash of the template to the creation time, the verify flag and the ToscaTemplate."""
+
+    _lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems."""
+
+    hits = 0
+    """Number of parse requests served from the cache."""
+
+    misses = 0
+    """Number of parse requests that required to parse the template."""
+
+    @staticmethod
+    def _get_key(yaml_dict):
+        return hashlib.sha256(json.dumps(yaml_dict, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _parse(yaml_dict, verify):
+        if verify:
+            return ToscaTemplate(yaml_dict_tpl=copy.deepcopy(yaml_dict))
+        else:
+            return NotVerifiedToscaTemplate(yaml_dict_tpl=copy.deepcopy(yaml_dict))
+
+    @staticmethod
+    def parse(yaml_dict, verify=True):
+        """
+        Parse a TOSCA template using the cache.
+
+        Args:
+
+        - yaml_dict(dict): TOSCA template to parse.
+        - verify(bool): raise the errors found in the template.
+
+        Return(ToscaTemplate): a new ToscaTemplate object.
+        """
+        if not Config.TOSCA_PARSE_CACHE_SIZE:
+            return ToscaCache._parse(yaml_dict, verify)
+
+        key = ToscaCache._get_key(yaml_dict)
+        now = time.time()
+        tosca = None
+        with ToscaCache._lock:
+            entry = ToscaCache._cache.get(key)
+            # Expire the entries like the artifacts to get the updates of the imported types
+            # and do not use a not verified template if the verification is requested
+            if entry and now - entry[0] < Config.TOSCA_CACHE_TIME and (entry[1] or not verify):
+                ToscaCache._cache.move_to_end(key)
+                ToscaCache.hits += 1
+                tosca = entry[2]
+
+        if tosca is None:
+            tosca = ToscaCache._parse(yaml_dict, verify)
+            with ToscaCache._lock:
+                ToscaCache.misses += 1
+                # Do not replace a valid verified template (stored by other thread) with a not verified one
+                entry = ToscaCache._cache.get(key)
+                if verify or not entry or not entry[1] or now - entry[0] >= Config.TOSCA_CACHE_TIME:
+                    ToscaCache._cache[key] = (now, verify, tosca)
+                ToscaCache._cache.move_to_end(key)
+                while len(ToscaCache._cache) > Config.TOSCA_PARSE_CACHE_SIZE:
+                    ToscaCache._cache.popitem(last=False)
+
+        return copy.deepcopy(tosca)
+
+    @staticmethod
+    def clear():
+        """Remove all the elements of the cache."""
+        with ToscaCache._lock:
+            ToscaCache._cache = OrderedDict()
+            ToscaCache.hits = 0
+            ToscaCache.misses = 0
@@ -5,7 +5,7 @@ Created on 16 de jun. de 2016
 '''
 
 import json
-import requests
+from IM.HTTPClient import HTTPClient
 
 
 class TTSClient:
@@ -30,7 +30,7 @@ class TTSClient:
         Perform the GET operation on the TTS with the specified URL
         """
         url = "%s://%s:%s%s" % (self.uri_scheme, self.host, self.port, url)
-        resp = requests.request("GET", url, verify=self.ssl_verify, headers=headers)
+        resp = HTTPClient.request("GET", url, verify=self.ssl_verify, headers=headers)
 
         if resp.status_code >= 200 and resp.status_code <= 299:
             return True, resp.text
@@ -43,7 +43,7 @@ class TTSClient:
         and using the body specified
         """
         url = "%s://%s:%s%s" % (self.uri_scheme, self.host, self.port, url)
-        resp = requests.request("POST", url, verify=self.ssl_verify, headers=headers, data=body)
+        resp = HTTPClient.request("POST", url, verify=self.ssl_verify, headers=headers, data=body)
         if resp.status_code >= 200 and resp.status_code <= 299:
             return True, resp.text
         else:
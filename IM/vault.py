@@ -20,8 +20,8 @@
 # under the License.
 """Class to manage user credentials using a Vault backend."""
 import hvac
-import requests
 import json
+from IM.HTTPClient import HTTPClient
 
 
 class VaultCredentials():
@@ -44,7 +44,7 @@ class VaultCredentials():
         else:
             data = '{ "jwt": "' + token + '" }'
 
-        response = requests.post(login_url, data=data, verify=self.ssl_verify, timeout=5)
+        response = HTTPClient.request("POST", login_url, data=data, verify=self.ssl_verify, timeout=5)
 
         if not response.ok:
             raise Exception("Error getting Vault token: {} - {}".format(response.status_code, response.text))
@@ -54,7 +54,8 @@ class VaultCredentials():
         vault_auth_token = deserialized_response["auth"]["client_token"]
         vault_entity_id = deserialized_response["auth"]["entity_id"]
 
-        self.client = hvac.Client(url=self.url, token=vault_auth_token, verify=self.ssl_verify)
+        self.client = hvac.Client(url=self.url, token=vault_auth_token, verify=self.ssl_verify,
+                                  session=HTTPClient.get_session(self.url))
         if not self.client.is_authenticated():
             raise Exception("Error authenticating against Vault with token: {}".format(vault_auth_token))
 
@@ -44,7 +44,7 @@ if __name__ == "__main__":
                 sys.stderr.write("Error connecting with DB: %s\n" % sys.argv[2])
                 sys.exit(-1)
 
-            res = mydb.select("select id, deleted, data, date, auth from inf_list order by rowid desc")
+            res = mydb.select_iter("select id, deleted, data, date, auth from inf_list order by rowid desc")
             for elem in res:
                 ok = mongodb.replace("inf_list", {"id": elem[0]}, {"id": elem[0], "deleted": int(elem[1]),
                                                                    "data": elem[2], "date": elem[3],
@@ -0,0 +1,40 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+
+sys.path.append("..")
+sys.path.append(".")
+
+from IM.config import Config
+from IM.Stats import Stats
+
+
+if __name__ == "__main__":
+    db_url = Config.DATA_DB
+    if len(sys.argv) > 1:
+        db_url = sys.argv[1]
+
+    if not db_url:
+        sys.stderr.write("No DATA_DB defined in the im.cfg file!!\n")
+        sys.exit(-1)
+
+    sys.stdout.write("Filling the stats table of DB: %s.\n" % db_url)
+    res = Stats.backfill(db_url)
+    if res is None:
+        sys.stderr.write("ERROR connecting with the database!.\n")
+        sys.exit(-1)
+    sys.stdout.write("Stats of %d infrastructures stored.\n" % res)
@@ -15,7 +15,7 @@ from mock import patch, MagicMock
 
 class TestAppDB(unittest.TestCase):
 
-    def get_response(self, method, url, verify, cert=None, headers=None, data=None):
+    def get_response(self, method, url, verify, cert=None, headers=None, data=None, timeout=None):
         resp = MagicMock()
         parts = urlparse(url)
         url = parts[2]
@@ -86,7 +86,7 @@ class TestAppDB(unittest.TestCase):
 
         return resp
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_site_id(self, requests):
         requests.side_effect = self.get_response
         res = AppDB.get_site_id("RECAS-BARI", "openstack")
@@ -94,25 +94,25 @@ class TestAppDB(unittest.TestCase):
         res = AppDB.get_site_id("RECAS-BARI", "occi")
         self.assertEqual(res, "8015G0")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_site_url(self, requests):
         requests.side_effect = self.get_response
         res = AppDB.get_site_url("8016G0", "openstack")
         self.assertEqual(res, "https://cloud.recas.ba.infn.it:5000")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_image_id(self, requests):
         requests.side_effect = self.get_response
         res = AppDB.get_image_id("8016G0", "egi.ubuntu.16.04", "fedcloud.egi.eu")
         self.assertEqual(res, "image_id2")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_image_id_from_uri(self, requests):
         requests.side_effect = self.get_response
         res = AppDB.get_image_id_from_uri("8016G0", "83d5e854-a128-5b1f-9457-d32e10a720a6:8135")
         self.assertEqual(res, "image_id3")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_image_data(self, requests):
         requests.side_effect = self.get_response
         str_url = "appdb://RECAS-BARI/egi.ubuntu.16.04?fedcloud.egi.eu"
@@ -136,7 +136,7 @@ class TestAppDB(unittest.TestCase):
         self.assertEqual(site_url, "https://cloud.recas.ba.infn.it:5000")
         self.assertEqual(image_id, "image_id2")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_project_ids(self, requests):
         requests.side_effect = self.get_response
         projects = AppDB.get_project_ids('8015G0')
@@ -19,7 +19,7 @@ def read_file_as_string(file_name):
 
 class TestAppDBIS(unittest.TestCase):
 
-    def get_response(self, method, url, verify, cert=None, headers=None, data=None):
+    def get_response(self, method, url, verify, cert=None, headers=None, data=None, timeout=None):
         resp = MagicMock()
         parts = urlparse(url)
         url = parts[2]
@@ -167,7 +167,7 @@ class TestAppDBIS(unittest.TestCase):
 
         return resp
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_image_list(self, requests):
         requests.side_effect = self.get_response
         app = AppDBIS()
@@ -177,7 +177,7 @@ class TestAppDBIS(unittest.TestCase):
         self.assertEqual(res[0]["entityName"],
                          "Image for EGI Ubuntu 18.04 [Ubuntu/18.04/VirtualBox]")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_image(self, requests):
         requests.side_effect = self.get_response
         app = AppDBIS()
@@ -186,7 +186,7 @@ class TestAppDBIS(unittest.TestCase):
         self.assertEqual(res["imageBaseMpUri"],
                          "https://appdb.egi.eu/store/vm/image/9117c171-8ca5-41ad-bd36-4b71e4e5dc85:7949")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_endpoints_and_images(self, requests):
         requests.side_effect = self.get_response
         app = AppDBIS()
@@ -213,7 +213,7 @@ class TestAppDBIS(unittest.TestCase):
         self.assertEqual(res[0].getValue('disk.0.image.url'), ("ost://thor.univ-lille.fr:5000/"
                                                                "d57482d1-9253-4ee7-b3d0-a64d92682591"))
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_get_sites_supporting_vo(self, requests):
         requests.side_effect = self.get_response
         app = AppDBIS()
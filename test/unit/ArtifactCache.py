@@ -0,0 +1,76 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from IM.tosca.ArtifactCache import ArtifactCache
+from IM.config import Config
+from mock import patch, MagicMock
+
+
+class TestArtifactCache(unittest.TestCase):
+    """
+    Class to test the ArtifactCache class
+    """
+
+    def setUp(self):
+        ArtifactCache._reinit()
+        self.backend = Config.TOSCA_CACHE_BACKEND
+        Config.TOSCA_CACHE_BACKEND = "memory"
+
+    def tearDown(self):
+        ArtifactCache._reinit()
+        Config.TOSCA_CACHE_BACKEND = self.backend
+
+    @staticmethod
+    def get_response(url, timeout=None):
+        resp = MagicMock()
+        if url.endswith("/error.yml"):
+            resp.status_code = 404
+            resp.reason = "Not Found"
+            resp.text = "Not found"
+        else:
+            resp.status_code = 200
+            resp.text = "content of %s" % url
+        return resp
+
+    def test_get_session(self):
+        session = ArtifactCache.get_session()
+        self.assertIs(session, ArtifactCache.get_session())
+        self.assertEqual(session.get_adapter("https://server.com")._pool_maxsize, Config.HTTP_POOL_SIZE)
+
+    @patch('requests_cache.CachedSession.get')
+    def test_prefetch(self, get):
+        get.side_effect = self.get_response
+
+        urls = ["https://server.com/%d.yml" % i for i in range(5)]
+        res = ArtifactCache.prefetch(urls + ["https://server.com/1.yml", "https://server.com/error.yml"])
+        self.assertEqual(get.call_count, 6)
+        for url in urls:
+            self.assertEqual(res[url], "content of %s" % url)
+        self.assertIsInstance(res["https://server.com/error.yml"], Exception)
+        self.assertIn("Not Found", str(res["https://server.com/error.yml"]))
+        self.assertEqual(get.call_args_list[0][1], {"timeout": ArtifactCache.GET_TIMEOUT})
+
+        self.assertEqual(ArtifactCache.get("https://server.com/1.yml"), "content of https://server.com/1.yml")
+        with self.assertRaises(Exception):
+            ArtifactCache.get("https://server.com/error.yml")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from IM.HTTPClient import HTTPClient
+from IM.config import Config
+from mock import patch, MagicMock
+
+
+class TestHTTPClient(unittest.TestCase):
+    """
+    Class to test the HTTPClient class
+    """
+
+    def setUp(self):
+        HTTPClient._reinit()
+
+    def tearDown(self):
+        HTTPClient._reinit()
+
+    def test_get_session(self):
+        session1 = HTTPClient.get_session("https://server.com:8443/path?q=1")
+        session2 = HTTPClient.get_session("https://server.com:8443/other")
+        session3 = HTTPClient.get_session("https://other.com/path")
+        self.assertIs(session1, session2)
+        self.assertIsNot(session1, session3)
+        adapter = session1.get_adapter("https://server.com:8443/path")
+        self.assertEqual(adapter._pool_maxsize, Config.HTTP_POOL_SIZE)
+        self.assertEqual(adapter.max_retries.total, Config.HTTP_MAX_RETRIES)
+        self.assertNotIn("POST", adapter.max_retries.allowed_methods)
+
+        # Cookies must not be shared among different users
+        self.assertEqual(len(session1.cookies._policy.allowed_domains()), 0)
+
+    @patch('requests.Session.request')
+    def test_request(self, request):
+        resp = MagicMock()
+        resp.status_code = 200
+        request.side_effect = [resp, Exception("Connection error"), resp]
+
+        self.assertIs(HTTPClient.request("GET", "https://server.com/path", verify=False), resp)
+        self.assertEqual(request.call_args_list[0][0], ("GET", "https://server.com/path"))
+        self.assertEqual(request.call_args_list[0][1], {"verify": False, "timeout": Config.HTTP_TIMEOUT})
+
+        with self.assertRaises(Exception):
+            HTTPClient.request("POST", "https://server.com/path", data="data", timeout=5)
+        self.assertEqual(request.call_args_list[1][1]["timeout"], 5)
+
+        # Requests with a client certificate do not use the shared session
+        HTTPClient.request("GET", "https://other.com/path", cert=("cert", "key"))
+        self.assertNotIn("https://other.com", HTTPClient._sessions)
+
+        stats = HTTPClient.get_stats()
+        self.assertEqual(stats["https://server.com"]["requests"], 2)
+        self.assertEqual(stats["https://server.com"]["errors"], 1)
+        self.assertEqual(stats["https://other.com"]["requests"], 1)
+        self.assertEqual(stats["https://other.com"]["errors"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,6 +17,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import json
 import unittest
 import sys
 from io import BytesIO
@@ -65,7 +66,26 @@ class TestREST(unittest.TestCase):
         self.assertEqual(200, res.status_code)
         self.assertEqual(res.json, ({"uri-list": [{"uri": "http://localhost/infrastructures/1"},
                                                   {"uri": "http://localhost/infrastructures/2"}]}))
+        self.assertEqual(GetInfrastructureList.call_args_list[0][1], {"stream": True})
 
+        GetInfrastructureList.return_value = iter(["1", "2"])
+        headers["Accept"] = "text/uri-list"
+        res = self.client.get('/infrastructures', headers=headers)
+        self.assertEqual(res.headers["Content-Type"], "text/uri-list")
+        self.assertEqual(res.text, "http://localhost/infrastructures/1\nhttp://localhost/infrastructures/2")
+
+        GetInfrastructureList.return_value = iter(["1", "2"])
+        headers["Accept"] = "application/x-ndjson"
+        res = self.client.get('/infrastructures', headers=headers)
+        self.assertEqual(res.headers["Content-Type"], "application/x-ndjson")
+        self.assertEqual(res.text, ('{"uri": "http://localhost/infrastructures/1"}\n'
+                                    '{"uri": "http://localhost/infrastructures/2"}\n'))
+
+        headers["Accept"] = "application/yaml"
+        res = self.client.get('/infrastructures', headers=headers)
+        self.assertEqual(415, res.status_code)
+
+        headers["Accept"] = "application/json"
         GetInfrastructureList.side_effect = InvaliddUserException()
         res = self.client.get('/infrastructures', headers=headers)
         self.assertEqual(401, res.status_code)
@@ -105,6 +125,70 @@ class TestREST(unittest.TestCase):
         self.assertEqual(403, res.status_code)
         self.assertEqual(res.text, "Error Getting Inf. info: Access to this infrastructure not granted.")
 
+    @patch("IM.InfrastructureList.InfrastructureList.get_infrastructure")
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureEvents")
+    def test_GetInfrastructureEvents(self, GetInfrastructureEvents, get_infrastructure):
+        headers = {"AUTHORIZATION": ("type = InfrastructureManager; username = user; password = pass\\n"
+                                     "id = one; type = OpenNebula; host = onedock.i3m.upv.es:2633; "
+                                     "username = user; password = pass")}
+
+        events = [{"id": 2, "type": "vm_state", "date": 1646658974, "data": {"vm_id": "0", "state": "running"}}]
+        GetInfrastructureEvents.return_value = {"state": "running", "vm_states": {"0": "running"},
+                                                "events": events, "last_id": 2}
+        res = self.client.get('/infrastructures/1/events?wait=1&timeout=5', headers=headers)
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(res.json["events"], events)
+        self.assertEqual(GetInfrastructureEvents.call_args_list[0][0][2:], (1, 5))
+
+        res = self.client.get('/infrastructures/1/events', headers=headers)
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(GetInfrastructureEvents.call_args_list[1][0][2:], (None, 0))
+
+        res = self.client.get('/infrastructures/1/events?wait=a', headers=headers)
+        self.assertEqual(400, res.status_code)
+
+        inf = MagicMock()
+        inf.id = "1"
+        get_infrastructure.return_value = inf
+        headers["Accept"] = "text/event-stream"
+        res = self.client.get('/infrastructures/1/events?timeout=0', headers=headers)
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(res.text, ('id: 2\nevent: state\ndata: {"state": "running", "vm_states": {"0": "running"}}\n\n'
+                                    'id: 2\nevent: vm_state\ndata: {"vm_id": "0", "state": "running"}\n\n'))
+
+        GetInfrastructureEvents.side_effect = DeletedInfrastructureException()
+        res = self.client.get('/infrastructures/1/events', headers=headers)
+        self.assertEqual(404, res.status_code)
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructuresInfo")
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructuresState")
+    def test_GetInfrastructuresStateInfo(self, GetInfrastructuresState, GetInfrastructuresInfo):
+        headers = {"AUTHORIZATION": ("type = InfrastructureManager; username = user; password = pass\\n"
+                                     "id = one; type = OpenNebula; host = onedock.i3m.upv.es:2633; "
+                                     "username = user; password = pass"),
+                   "Content-Type": "application/json"}
+
+        GetInfrastructuresState.return_value = {"1": {"state": "running", "vm_states": {"0": "running"}},
+                                                "2": {"error": "Deleted infrastructure."}}
+        res = self.client.post('/infrastructures/states', headers=headers,
+                               data=json.dumps(["1", "http://localhost/infrastructures/2"]))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(res.json, {"states": {"1": {"state": "running", "vm_states": {"0": "running"}},
+                                               "2": {"error": "Deleted infrastructure."}}})
+        self.assertEqual(GetInfrastructuresState.call_args_list[0][0][0], ["1", "2"])
+
+        GetInfrastructuresInfo.return_value = {"1": {"vm_list": ["0", "1"]}, "2": {"error": "Deleted infrastructure."}}
+        res = self.client.post('/infrastructures/info', headers=headers,
+                               data=json.dumps({"infrastructures": ["1", "2"]}))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(res.json, {"infrastructures": {"1": {"vm_list": ["http://localhost/infrastructures/1/vms/0",
+                                                                          "http://localhost/infrastructures/1/vms/1"]},
+                                                        "2": {"error": "Deleted infrastructure."}}})
+
+        res = self.client.post('/infrastructures/states', headers=headers, data=json.dumps({"infs": []}))
+        self.assertEqual(400, res.status_code)
+        self.assertEqual(res.text, "Error Getting Inf. states: Incorrect list of infrastructure IDs.")
+
     @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureContMsg")
     @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureRADL")
     @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureState")
@@ -121,6 +205,7 @@ class TestREST(unittest.TestCase):
 
         inf = MagicMock()
         get_infrastructure.return_value = inf
+        inf.get_version.return_value = (1, 1646658974)
         tosca = MagicMock()
         inf.extra_info = {"TOSCA": tosca}
         tosca.get_outputs.return_value = "outputs"
@@ -129,8 +214,16 @@ class TestREST(unittest.TestCase):
         res = self.client.get('/infrastructures/1/state', headers=headers)
         self.assertEqual(res.json["state"]["state"], "running")
 
+        # The state is not refreshed if the client has the current version
+        etag_headers = dict(headers, **{"If-None-Match": res.headers["ETag"]})
+        res = self.client.get('/infrastructures/1/state', headers=etag_headers)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(GetInfrastructureState.call_count, 1)
+
         res = self.client.get('/infrastructures/1/contmsg', headers=headers)
         self.assertEqual(res.text, "contmsg")
+        # The credentials are not validated again
+        self.assertTrue(GetInfrastructureContMsg.call_args_list[0][0][1].checked)
 
         res = self.client.get('/infrastructures/1/contmsg?headeronly=yes', headers=headers)
         self.assertEqual(res.text, "contmsg")
@@ -255,8 +348,9 @@ class TestREST(unittest.TestCase):
         res = self.client.post('/infrastructures', headers=headers, data=BytesIO(b"radl"))
         self.assertEqual(res.json['code'], 415)
 
+    @patch("IM.InfrastructureManager.InfrastructureManager.get_vm_from_inf")
     @patch("IM.InfrastructureManager.InfrastructureManager.GetVMInfo")
-    def test_GetVMInfo(self, GetVMInfo):
+    def test_GetVMInfo(self, GetVMInfo, get_vm_from_inf):
         """Test REST GetVMInfo."""
         headers = {"AUTHORIZATION": ("type = InfrastructureManager; username = user; password = pass\\n"
                                      "id = one; type = OpenNebula; host = onedock.i3m.upv.es:2633; "
@@ -264,13 +358,32 @@ class TestREST(unittest.TestCase):
                    "Accept": "application/json"}
 
         GetVMInfo.return_value = parse_radl("system test (cpu.count = 1)")
+        vm = MagicMock()
+        vm.get_version.return_value = (1, 1646658974)
+        get_vm_from_inf.return_value = vm
 
         res = self.client.get('/infrastructures/1/vms/1', headers=headers)
         self.assertEqual(res.json, {"radl": [{"cpu.count": 1, "class": "system", "id": "test"}]})
 
+        # The VM info is not refreshed if the client has the current version
+        headers["If-None-Match"] = res.headers["ETag"]
+        res = self.client.get('/infrastructures/1/vms/1', headers=headers)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(GetVMInfo.call_count, 1)
+        del headers["If-None-Match"]
+
         headers["Accept"] = "text/*"
         res = self.client.get('/infrastructures/1/vms/1', headers=headers)
         self.assertEqual(res.text, 'system test (\ncpu.count = 1\n)\n\n')
+        self.assertEqual(GetVMInfo.call_args_list[-1][1], {"force": False})
+
+        res = self.client.get('/infrastructures/1/vms/1?force=yes', headers=headers)
+        self.assertEqual(res.text, 'system test (\ncpu.count = 1\n)\n\n')
+        self.assertEqual(GetVMInfo.call_args_list[-1][1], {"force": True})
+
+        res = self.client.get('/infrastructures/1/vms/1?force=maybe', headers=headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.text, "Incorrect value in force parameter")
 
         GetVMInfo.side_effect = DeletedInfrastructureException()
         res = self.client.get('/infrastructures/1/vms/1', headers=headers)
@@ -292,9 +405,10 @@ class TestREST(unittest.TestCase):
         res = self.client.get('/infrastructures/1/vms/1', headers=headers)
         self.assertEqual(res.text, "Error Getting VM. info: Invalid VM ID")
 
+    @patch("IM.InfrastructureManager.InfrastructureManager.get_vm_from_inf")
     @patch("IM.InfrastructureManager.InfrastructureManager.GetVMProperty")
     @patch("IM.InfrastructureManager.InfrastructureManager.GetVMContMsg")
-    def test_GetVMProperty(self, GetVMContMsg, GetVMProperty):
+    def test_GetVMProperty(self, GetVMContMsg, GetVMProperty, get_vm_from_inf):
         """Test REST GetVMProperty."""
         headers = {"AUTHORIZATION": ("type = InfrastructureManager; username = user; password = pass\\n"
                                      "id = one; type = OpenNebula; host = onedock.i3m.upv.es:2633; "
@@ -302,12 +416,36 @@ class TestREST(unittest.TestCase):
 
         GetVMProperty.return_value = "prop"
         GetVMContMsg.return_value = "contmsg"
+        vm = MagicMock()
+        vm.get_version.return_value = (1, 1646658974)
+        get_vm_from_inf.return_value = vm
 
         res = self.client.get('/infrastructures/1/vms/1/prop', headers=headers)
         self.assertEqual(res.text, "prop")
 
         res = self.client.get('/infrastructures/1/vms/1/contmsg', headers=headers)
         self.assertEqual(res.text, "contmsg")
+        self.assertEqual(res.headers["Last-Modified"], "Mon, 07 Mar 2022 13:16:14 GMT")
+
+        # Conditional GET
+        headers["If-None-Match"] = res.headers["ETag"]
+        res = self.client.get('/infrastructures/1/vms/1/contmsg', headers=headers)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(GetVMContMsg.call_count, 1)
+
+        vm.get_version.return_value = (2, 1646658974)
+        res = self.client.get('/infrastructures/1/vms/1/contmsg', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.text, "contmsg")
+        del headers["If-None-Match"]
+
+        headers["If-Modified-Since"] = "Mon, 07 Mar 2022 13:16:14 GMT"
+        res = self.client.get('/infrastructures/1/vms/1/contmsg', headers=headers)
+        self.assertEqual(res.status_code, 304)
+        vm.get_version.return_value = (2, 1646658975)
+        res = self.client.get('/infrastructures/1/vms/1/contmsg', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        del headers["If-Modified-Since"]
 
         GetVMProperty.side_effect = DeletedInfrastructureException()
         res = self.client.get('/infrastructures/1/vms/1/prop', headers=headers)
@@ -573,6 +711,51 @@ class TestREST(unittest.TestCase):
         self.assertEqual(res.json['openapi'], '3.0.0')
         self.assertEqual(res.json['servers'][0]['url'], 'http://localhost/')
 
+    @patch("IM.InfrastructureList.InfrastructureList.is_ready")
+    def test_GetReadiness(self, is_ready):
+        is_ready.return_value = False
+        res = self.client.get('/ready')
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json, {"ready": False})
+
+        is_ready.return_value = True
+        with patch("IM.InfrastructureList.InfrastructureList.startup_info", {"infrastructures": 3,
+                                                                             "interrupted": ["2"]}):
+            res = self.client.get('/ready')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json, {"ready": True, "infrastructures": 3, "interrupted": 1})
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetServiceStats")
+    def test_GetServiceStats(self, GetServiceStats):
+        """Test REST GetServiceStats."""
+        headers = {"AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass"}
+        GetServiceStats.return_value = {"cache": {"entries": 1}, "scheduling": {}}
+        res = self.client.get('/debug/stats', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json, GetServiceStats.return_value)
+
+        res = self.client.get('/debug/stats')
+        self.assertEqual(res.status_code, 401)
+
+        GetServiceStats.side_effect = UnauthorizedUserException("Access to the service stats not granted.")
+        res = self.client.get('/debug/stats', headers=headers)
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(res.text, "Error getting service stats: Access to the service stats not granted.")
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetMemoryReport")
+    def test_GetMemoryReport(self, GetMemoryReport):
+        """Test REST GetMemoryReport."""
+        headers = {"AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass"}
+        GetMemoryReport.return_value = {"cache": {"entries": 1},
+                                        "infrastructures": [{"id": "1", "vms": 1, "data_size": 10,
+                                                             "cont_out_size": 100, "cont_out_memory": 20}]}
+        res = self.client.get('/debug/memory', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json, GetMemoryReport.return_value)
+
+        res = self.client.get('/debug/memory')
+        self.assertEqual(res.status_code, 401)
+
     @patch("IM.InfrastructureManager.InfrastructureManager.CreateDiskSnapshot")
     def test_CreateDiskSnapshot(self, CreateDiskSnapshot):
         """Test REST StopVM."""
@@ -852,6 +1035,108 @@ class TestREST(unittest.TestCase):
         self.assertEqual(GetStats.call_args_list[0][0][2].auth_list, [{"type": "InfrastructureManager",
                                                                        "username": "user",
                                                                        "password": "pass"}])
+        self.assertEqual(GetStats.call_args_list[0][1], {"stream": True})
+
+        GetStats.return_value = iter([{"key": 1}, {"key": 2}])
+        res = self.client.get('/stats', headers=headers)
+        self.assertEqual(res.text, '{"stats": [{"key": 1}, {"key": 2}]}')
+        self.assertEqual(res.headers["Content-Type"], "application/json")
+
+        GetStats.return_value = iter([{"key": 1, "other": "a,b"}, {"key": 2, "other": ""}])
+        headers["Accept"] = "text/csv"
+        res = self.client.get('/stats', headers=headers)
+        self.assertEqual(res.headers["Content-Type"], "text/csv")
+        self.assertEqual(res.text, 'key,other\r\n1,"a,b"\r\n2,\r\n')
+
+        GetStats.return_value = iter([{"key": 1}, {"key": 2}])
+        headers["Accept"] = "application/x-ndjson"
+        res = self.client.get('/stats', headers=headers)
+        self.assertEqual(res.text, '{"key": 1}\n{"key": 2}\n')
+
+        headers["Accept"] = "application/yaml"
+        res = self.client.get('/stats', headers=headers)
+        self.assertEqual(res.status_code, 415)
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.CreateJob")
+    def test_AsyncOperations(self, CreateJob):
+        """Test REST operations launched as jobs."""
+        headers = {"AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass"}
+        CreateJob.return_value = "jobid"
+
+        res = self.client.put('/infrastructures/1/stop?async=yes', headers=headers)
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(res.text, "http://localhost/jobs/jobid")
+        self.assertEqual(res.headers['Location'], "http://localhost/jobs/jobid")
+        self.assertEqual(CreateJob.call_args_list[0][0][0], "StopInfrastructure")
+        self.assertEqual(CreateJob.call_args_list[0][0][1], "1")
+
+        res = self.client.delete('/infrastructures/1/vms/1,2?async=1', headers=headers)
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(CreateJob.call_args_list[1][0][0], "RemoveResource")
+        self.assertEqual(CreateJob.call_args_list[1][0][2][1], "1,2")
+
+        res = self.client.put('/infrastructures/1/reconfigure?async=true', headers=headers)
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(CreateJob.call_args_list[2][0][0], "Reconfigure")
+
+        res = self.client.post('/infrastructures/1?async=yes', headers=headers, data=BytesIO(b"radl"))
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(CreateJob.call_args_list[3][0][0], "AddResource")
+
+        res = self.client.put('/infrastructures/1/start?async=maybe', headers=headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.text, "Incorrect value in async parameter")
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetJobInfo")
+    def test_GetJobInfo(self, GetJobInfo):
+        """Test REST GetJobInfo."""
+        from IM.JobManager import IncorrectJobException
+        headers = {"AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass"}
+        job_info = {"id": "jobid", "op": "AddResource", "inf_id": "1", "state": "finished",
+                    "progress": 100, "result": [0, 1], "error_msg": None}
+        GetJobInfo.return_value = job_info
+
+        res = self.client.get('/jobs/jobid', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json, job_info)
+
+        GetJobInfo.side_effect = IncorrectJobException()
+        res = self.client.get('/jobs/jobid', headers=headers)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.text, "Error Getting Job info: Invalid job ID or access not granted.")
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.AddResource")
+    def test_MaxBodySize(self, AddResource):
+        """Test REST max body size."""
+        from IM.config import Config
+        headers = {"AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass"}
+        AddResource.return_value = []
+        Config.REST_MAX_BODY_SIZE = 4
+        try:
+            res = self.client.post('/infrastructures/1?context=no', headers=headers, data=BytesIO(b"radl data"))
+            self.assertEqual(res.status_code, 413)
+            self.assertEqual(res.text, "Request body too large. Max size: 4 bytes.")
+            res = self.client.post('/infrastructures/1?context=no', headers=headers, data=BytesIO(b"radl"))
+            self.assertEqual(res.status_code, 200)
+        finally:
+            Config.REST_MAX_BODY_SIZE = 0
+
+    @patch("IM.REST.os")
+    @patch("IM.REST.stop")
+    @patch("IM.InfrastructureManager.InfrastructureManager.stop")
+    def test_StopWorker(self, im_stop, rest_stop, os_mock):
+        """Test the stop of the REST worker processes."""
+        from IM.REST import _stop_worker, stop_workers
+        os_mock.WNOHANG = 1
+        os_mock.waitpid.side_effect = lambda pid, _: (pid, 0)
+        stop_workers([10, 11])
+        self.assertEqual(os_mock.kill.call_count, 2)
+        self.assertEqual(os_mock.waitpid.call_count, 2)
+
+        _stop_worker(15, None)
+        self.assertEqual(rest_stop.call_count, 1)
+        self.assertEqual(im_stop.call_count, 1)
+        self.assertEqual(os_mock._exit.call_args[0][0], 0)
 
 
 if __name__ == "__main__":
@@ -22,7 +22,7 @@ import sys
 import yaml
 import json
 
-from mock import MagicMock
+from mock import patch, MagicMock
 
 sys.path.append("..")
 sys.path.append(".")
@@ -32,6 +32,9 @@ from radl.radl_parse import parse_radl
 from radl.radl import system, Feature
 from IM.InfrastructureInfo import InfrastructureInfo
 from IM.tosca.Tosca import Tosca
+from IM.tosca.ToscaCache import ToscaCache
+from IM.tosca.ArtifactCache import ArtifactCache
+from IM.config import Config
 
 
 def read_file_as_string(file_name):
@@ -46,6 +49,15 @@ class TestTosca(unittest.TestCase):
     def __init__(self, *args):
         unittest.TestCase.__init__(self, *args)
 
+    def setUp(self):
+        ArtifactCache._reinit()
+        self.backend = Config.TOSCA_CACHE_BACKEND
+        Config.TOSCA_CACHE_BACKEND = "memory"
+
+    def tearDown(self):
+        ArtifactCache._reinit()
+        Config.TOSCA_CACHE_BACKEND = self.backend
+
     def test_tosca_to_radl(self):
         """Test TOSCA RADL translation"""
         tosca_data = read_file_as_string('../files/tosca_long.yml')
@@ -172,6 +184,75 @@ class TestTosca(unittest.TestCase):
         c = Tosca._merge_yaml(a, b)
         self.assertEqual(c, b)
 
+    @patch('IM.tosca.Tosca.Config')
+    def test_tosca_artifacts_location(self, config):
+        """Test the location of the TOSCA artifacts"""
+        self.assertEqual(Tosca._get_implementation_location("https://server.com/path/script.yml"),
+                         ("/path/script.yml", "https://server.com/path/script.yml"))
+        self.assertEqual(Tosca._get_implementation_location("file:///tmp/notfound.yml"),
+                         ("/tmp/notfound.yml", Tosca.ARTIFACTS_REMOTE_REPO + "file:///tmp/notfound.yml"))
+        self.assertEqual(Tosca._get_implementation_location("notfound/script.yml"),
+                         (os.path.join(Tosca.ARTIFACTS_PATH, "notfound/script.yml"),
+                          Tosca.ARTIFACTS_REMOTE_REPO + "notfound/script.yml"))
+
+        config.TOSCA_ARTIFACTS_MIRROR = None
+        self.assertIsNone(Tosca._get_mirror_path(Tosca.ARTIFACTS_REMOTE_REPO + "docker/script.yml"))
+        config.TOSCA_ARTIFACTS_MIRROR = "/opt/artifacts"
+        self.assertEqual(Tosca._get_mirror_path(Tosca.ARTIFACTS_REMOTE_REPO + "docker/script.yml"),
+                         "/opt/artifacts/docker/script.yml")
+        self.assertIsNone(Tosca._get_mirror_path("https://server.com/path/script.yml"))
+
+    def test_tosca_parse_cache(self):
+        """Test the lazy parsing and the cache of the TOSCA templates"""
+        tosca_data = """
+tosca_definitions_version: tosca_simple_yaml_1_0
+topology_template:
+  node_templates:
+    server:
+      type: tosca.nodes.Compute
+      capabilities:
+        host:
+          properties:
+            num_cpus: 1
+  outputs:
+    server_ip:
+      value: { get_attribute: [ server, public_address ] }
+"""
+        ToscaCache.clear()
+        tosca = Tosca.deserialize(tosca_data)
+        self.assertIsNone(tosca._tosca)
+        self.assertEqual(ToscaCache.misses, 0)
+        self.assertEqual(yaml.safe_load(tosca.serialize()), yaml.safe_load(tosca_data))
+
+        tosca2 = Tosca(tosca_data)
+        self.assertEqual(ToscaCache.misses, 1)
+        self.assertEqual(tosca.tosca.nodetemplates[0].name, "server")
+        self.assertEqual(ToscaCache.hits, 1)
+        # Each object gets its own copy of the template
+        self.assertIsNot(tosca.tosca, tosca2.tosca)
+        self.assertIsNot(tosca.tosca.nodetemplates[0], tosca2.tosca.nodetemplates[0])
+
+        # A not verified template is not returned if the verification is requested
+        invalid_data = tosca_data.replace("num_cpus: 1", "num_cpus: 1\n            unknown: 1")
+        Tosca.deserialize(invalid_data).tosca
+        with self.assertRaises(Exception):
+            Tosca(invalid_data)
+        ToscaCache.clear()
+
+        # A not verified template does not replace a verified one
+        parse = ToscaCache._parse
+
+        def parse_and_verify(yaml_dict, verify):
+            if not verify:
+                # Other thread stores the verified template meanwhile
+                ToscaCache.parse(yaml_dict, True)
+            return parse(yaml_dict, verify)
+        with patch("IM.tosca.ToscaCache.ToscaCache._parse", side_effect=parse_and_verify):
+            Tosca.deserialize(tosca_data).tosca
+        self.assertEqual([entry[1] for entry in ToscaCache._cache.values()], [True])
+        self.assertEqual(ToscaCache.misses, 2)
+        ToscaCache.clear()
+
     def test_tosca_add_hybrid1(self):
         tosca_data = read_file_as_string('../files/tosca_add_hybrid_l2.yml')
         tosca = Tosca(tosca_data)
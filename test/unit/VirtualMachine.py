@@ -19,8 +19,12 @@
 import unittest
 import os
 import tempfile
+import zlib
 
 from IM.VirtualMachine import VirtualMachine
+from IM.RADLCache import RADLCache
+from IM.ContOutMixin import CompressedText
+from IM.config import Config
 from radl import radl_parse
 from mock import patch, MagicMock
 
@@ -168,6 +172,103 @@ class TestVirtualMachine(unittest.TestCase):
         vm.update_status(None)
         self.assertEqual(vm.info.systems[0].getValue('net_interface.0.dns_name'), "vnode-1")
 
+    def test_version(self):
+        radl_data = """
+            system test (
+            net_interface.0.connection = 'public'
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        vm = VirtualMachine(None, "1", None, radl, radl, MagicMock(), 1)
+        version = vm.version
+
+        vm.cont_out = ""
+        vm.state = VirtualMachine.PENDING
+        self.assertEqual(vm.version, version)
+
+        vm.cont_out = "log"
+        self.assertGreater(vm.version, version)
+        version = vm.version
+
+        # in place modification of the VM info
+        def updateVMInfo(vm, auth):
+            vm.setIps(["8.8.8.8"], [])
+            return True, vm
+        vm.getCloudConnector().updateVMInfo.side_effect = updateVMInfo
+        vm.update_status(None, force=True)
+        self.assertGreater(vm.version, version)
+        version = vm.version
+
+        vm.update_status(None, force=True)
+        self.assertEqual(vm.version, version)
+
+    def test_deserialize_radl_cache(self):
+        radl_data = """
+            system test (
+            cpu.count >= 1 and
+            memory.size >= 1g
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        vm1 = VirtualMachine(None, "1", None, radl, radl, None, 1)
+        vm2 = VirtualMachine(None, "2", None, radl, radl, None, 2)
+        data1 = vm1.serialize()
+        data2 = vm2.serialize()
+
+        RADLCache.clear()
+        requested_radls = {}
+        new_vm1 = VirtualMachine.deserialize(data1, requested_radls)
+        new_vm2 = VirtualMachine.deserialize(data2, requested_radls)
+        self.assertEqual(str(new_vm1.info), str(vm1.info))
+        self.assertEqual(str(new_vm2.requested_radl), str(radl))
+        # The info RADL is parsed only once but each VM has its own copy
+        self.assertIsNot(new_vm1.info, new_vm2.info)
+        new_vm1.info.systems[0].setValue("cpu.count", 2)
+        self.assertEqual(new_vm2.info.systems[0].getValue("cpu.count"), 1)
+        # The requested RADL is shared by the VMs as in the launch process
+        self.assertIs(new_vm1.requested_radl, new_vm2.requested_radl)
+        self.assertEqual(RADLCache.misses, 2)
+        self.assertEqual(RADLCache.hits, 1)
+
+    @patch("IM.config.Config.CONT_OUT_COMPRESS_SIZE", 100)
+    def test_cont_out_compression(self):
+        self.assertEqual(Config.CONT_OUT_COMPRESS_SIZE, 100)
+        radl = radl_parse.parse_radl("system test ()")
+        vm = VirtualMachine(None, "1", None, radl, radl, None, 1)
+        vm.cont_out = "short"
+        self.assertEqual(vm.__dict__["cont_out"], "short")
+        self.assertEqual(vm.get_cont_out_sizes(), (5, 5))
+
+        version = vm.version
+        log = "Launch task: install\n" * 50
+        vm.cont_out += log
+        self.assertIsInstance(vm.__dict__["cont_out"], CompressedText)
+        self.assertEqual(vm.cont_out, "short" + log)
+        self.assertGreater(vm.version, version)
+        size, memory = vm.get_cont_out_sizes()
+        self.assertEqual(size, 5 + len(log))
+        self.assertLess(memory, size)
+
+        # Setting the same value does not change the version
+        version = vm.version
+        vm.cont_out = "short" + log
+        self.assertEqual(vm.version, version)
+
+        new_vm = VirtualMachine.deserialize(vm.serialize())
+        self.assertIsInstance(new_vm.__dict__["cont_out"], CompressedText)
+        self.assertEqual(new_vm.cont_out, "short" + log)
+
+        # Appending text does not decompress the message and only compresses each chunk once
+        line = "Launch task: install\n"
+        with patch("IM.ContOutMixin.zlib") as zlib_mock:
+            zlib_mock.compress.side_effect = zlib.compress
+            for _ in range(1000):
+                version = vm.version
+                vm.append_cont_out(line)
+                self.assertGreater(vm.version, version)
+        self.assertEqual(zlib_mock.decompress.call_count, 0)
+        self.assertLessEqual(zlib_mock.compress.call_count, len(line) * 1000 // 100)
+        self.assertEqual(vm.cont_out, "short" + log + line * 1000)
+        self.assertEqual(vm.get_cont_out_sizes()[0], len("short" + log + line * 1000))
+
 
 if __name__ == '__main__':
     unittest.main()
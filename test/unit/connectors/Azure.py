@@ -27,7 +27,7 @@ from IM.auth import Authentication
 from radl import radl_parse
 from IM.VirtualMachine import VirtualMachine
 from IM.InfrastructureInfo import InfrastructureInfo
-from IM.connectors.Azure import AzureCloudConnector
+from IM.connectors.Azure import AzureCloudConnector, AzurePollers
 from azure.core.exceptions import ResourceNotFoundError
 from mock import patch, MagicMock, call
 from IM.config import Config
@@ -118,7 +118,7 @@ class TestAzureConnector(TestCloudConnectorBase):
         self.assertEqual(len(concrete), 1)
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    def wait(self):
+    def wait(self, timeout=None):
         """
         Wait VMs returning error only first time
         """
@@ -699,6 +699,33 @@ class TestAzureConnector(TestCloudConnectorBase):
         res = azure_cloud.launch_with_retry(inf, radl, radl, 1, auth, 1, 0)
         self.assertEqual(res, [(False, 'Attempt 1: Error: Invalid rg_name. It must be unique per infrastructure.\n')])
 
+    def test_pollers(self):
+        ok = MagicMock()
+        ok.result.return_value = "ok"
+        error = MagicMock()
+        error.wait.side_effect = Exception("error")
+        pending = MagicMock()
+        pending.done.return_value = False
+
+        pollers = AzurePollers(10)
+        pollers.add("ok", ok)
+        pollers.add("error", error)
+        pollers.add("pending", pending)
+        res = pollers.wait()
+        self.assertEqual(res["ok"], "ok")
+        self.assertEqual(str(res["error"]), "error")
+        self.assertEqual(str(res["pending"]), "Timeout waiting operation pending.")
+        # All the pollers share the same deadline
+        self.assertLessEqual(ok.wait.call_args_list[0][0][0], 10)
+        self.assertLessEqual(pending.wait.call_args_list[0][0][0], ok.wait.call_args_list[0][0][0])
+
+        # The pollers already waited are not waited again
+        pollers.add("error", error)
+        with self.assertRaises(Exception) as ex:
+            pollers.wait(raise_error=True)
+        self.assertEqual(str(ex.exception), "error")
+        self.assertEqual(ok.wait.call_count, 1)
+
 
 if __name__ == '__main__':
     unittest.main()
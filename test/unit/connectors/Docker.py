@@ -84,7 +84,7 @@ class TestDockerConnector(TestCloudConnectorBase):
         self.assertEqual(len(concrete), 1)
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    def get_response(self, method, url, verify, cert, headers, data):
+    def get_response(self, method, url, verify, cert, headers, data, timeout=None):
         resp = MagicMock()
         parts = urlparse(url)
         url = parts[2]
@@ -149,7 +149,7 @@ class TestDockerConnector(TestCloudConnectorBase):
 
         return resp
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     @patch('IM.InfrastructureList.InfrastructureList.save_data')
     def test_20_launch(self, save_data, requests):
         radl_data = """
@@ -193,7 +193,7 @@ class TestDockerConnector(TestCloudConnectorBase):
         self.assertTrue(success, msg="ERROR: launching a VM.")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_30_updateVMInfo(self, requests):
         radl_data = """
             network net (outbound = 'yes')
@@ -235,7 +235,7 @@ class TestDockerConnector(TestCloudConnectorBase):
         self.assertEqual(vm.info.systems[0].getValue("net_interface.1.ip"), "10.0.0.1")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_40_stop(self, requests):
         auth = Authentication([{'id': 'docker', 'type': 'Docker', 'host': 'http://server.com:2375'}])
         docker_cloud = self.get_docker_cloud()
@@ -250,7 +250,7 @@ class TestDockerConnector(TestCloudConnectorBase):
         self.assertTrue(success, msg="ERROR: stopping VM info.")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_50_start(self, requests):
         auth = Authentication([{'id': 'docker', 'type': 'Docker', 'host': 'http://server.com:2375'}])
         docker_cloud = self.get_docker_cloud()
@@ -265,7 +265,7 @@ class TestDockerConnector(TestCloudConnectorBase):
         self.assertTrue(success, msg="ERROR: stopping VM info.")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_52_reboot(self, requests):
         auth = Authentication([{'id': 'docker', 'type': 'Docker', 'host': 'http://server.com:2375'}])
         docker_cloud = self.get_docker_cloud()
@@ -280,7 +280,7 @@ class TestDockerConnector(TestCloudConnectorBase):
         self.assertTrue(success, msg="ERROR: rebooting VM info.")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_60_finalize(self, requests):
         radl_data = """
             network net (outbound = 'yes')
@@ -28,12 +28,16 @@ from IM.config import Config
 from IM.VirtualMachine import VirtualMachine
 from radl import radl_parse
 from IM.InfrastructureInfo import InfrastructureInfo
-from IM.connectors.EC2 import EC2CloudConnector
+from IM.connectors.EC2 import EC2CloudConnector, InstanceTypeInfo
 from mock import patch, MagicMock, call
 
 
 class TestEC2Connector(TestCloudConnectorBase):
 
+    def setUp(self):
+        TestCloudConnectorBase.setUp(self)
+        EC2CloudConnector._reinit()
+
     @staticmethod
     def get_ec2_cloud():
         cloud_info = CloudInfo()
@@ -175,6 +179,65 @@ class TestEC2Connector(TestCloudConnectorBase):
         self.assertEqual(mock_conn.create_security_group.call_args_list[2][1]['GroupName'], "im-%s-net2" % inf.id)
         mock_conn.run_instances.assert_called_once()
 
+    @patch('IM.connectors.EC2.EC2CloudConnector.get_instance_type')
+    @patch('IM.connectors.EC2.boto3.session.Session')
+    @patch('IM.InfrastructureList.InfrastructureList.save_data')
+    def test_22_launch_bulk(self, save_data, mock_boto_session, get_instance_type):
+        radl_data = """
+            network net1 (outbound = 'yes')
+            system test (
+            cpu.count>=1 and
+            memory.size>=512m and
+            net_interface.0.connection = 'net1' and
+            disk.0.os.name = 'linux' and
+            disk.0.image.url = 'aws://us-east-1/ami-id' and
+            disk.0.os.credentials.username = 'user'
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        radl.check()
+
+        auth = Authentication([{'id': 'ec2', 'type': 'EC2', 'username': 'user', 'password': 'pass'},
+                               {'type': 'InfrastructureManager', 'username': 'user', 'password': 'pass'}])
+        ec2_cloud = self.get_ec2_cloud()
+        ec2_cloud.MAX_LAUNCH_BATCH = 3
+        self.assertEqual(ec2_cloud.get_launch_batches(7), [3, 3, 1])
+
+        inf = InfrastructureInfo()
+        inf.auth = auth
+        inf.radl = radl
+
+        get_instance_type.return_value = InstanceTypeInfo("t2.micro")
+        mock_conn = MagicMock()
+        mock_boto_session.return_value.client.return_value = mock_conn
+        mock_boto_session.return_value.get_available_regions.return_value = ['us-east-1']
+        mock_conn.describe_security_groups.return_value = {'SecurityGroups': []}
+        mock_conn.create_security_group.return_value = {'GroupId': 'sg-id'}
+        mock_conn.describe_vpcs.return_value = {'Vpcs': [{'VpcId': 'vpc-id'}]}
+        mock_conn.describe_subnets.return_value = {'Subnets': [{'SubnetId': 'subnet-id'}]}
+        mock_conn.describe_images.return_value = {'Images': [{'ImageId': 'ami-id',
+                                                              'BlockDeviceMappings': [{'DeviceName': '/dev/sda1',
+                                                                                       'Ebs': {
+                                                                                           'SnapshotId': 'snap-12345678'
+                                                                                       }}]}
+                                                             ]}
+        # Only 2 of the 3 instances of the first request are launched
+        mock_conn.run_instances.side_effect = [{'Instances': [{'InstanceId': 'i-1'}, {'InstanceId': 'i-2'}]},
+                                               {'Instances': [{'InstanceId': 'i-3'}]}]
+
+        res = ec2_cloud.launch(inf, radl, radl, 4, auth)
+        self.assertEqual([success for success, _ in res], [True, True, False, True])
+        self.assertEqual([vm.id for success, vm in res if success],
+                         ["us-east-1;i-1", "us-east-1;i-2", "us-east-1;i-3"])
+        self.assertEqual(mock_conn.run_instances.call_count, 2)
+        self.assertEqual(mock_conn.run_instances.call_args_list[0][1]['MaxCount'], 3)
+        self.assertEqual(mock_conn.run_instances.call_args_list[1][1]['MaxCount'], 1)
+        # Each instance gets a unique Name
+        self.assertEqual(mock_conn.create_tags.call_count, 1)
+        self.assertEqual(mock_conn.create_tags.call_args_list[0][1]['Resources'], ['i-2'])
+        names = [mock_conn.run_instances.call_args_list[0][1]['TagSpecifications'][0]['Tags'][0]['Value'],
+                 mock_conn.create_tags.call_args_list[0][1]['Tags'][0]['Value']]
+        self.assertEqual(len(set(names)), 2)
+
     @patch('IM.connectors.EC2.boto3.session.Session')
     @patch('IM.InfrastructureList.InfrastructureList.save_data')
     def test_25_launch_spot(self, save_data, mock_boto_session):
@@ -386,6 +449,71 @@ class TestEC2Connector(TestCloudConnectorBase):
         self.assertTrue(success, msg="ERROR: updating VM info.")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
+    @patch('IM.connectors.EC2.EC2CloudConnector.get_instance_type_by_name')
+    @patch('IM.connectors.EC2.boto3.session.Session')
+    def test_45_prefetch_vms_info(self, mock_boto_session, get_instance_type_by_name):
+        radl_data = """
+            network net (outbound = 'yes')
+            system test (
+            cpu.count=1 and
+            memory.size=512m and
+            net_interface.0.connection = 'net' and
+            disk.0.os.name = 'linux' and
+            disk.0.image.url = 'aws://us-east-1/ami-id'
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        radl.check()
+
+        auth = Authentication([{'id': 'ec2', 'type': 'EC2', 'username': 'user', 'password': 'pass'}])
+        ec2_cloud = self.get_ec2_cloud()
+        get_instance_type_by_name.return_value = InstanceTypeInfo("t1.micro", ["x86_64"], 1, 1, 512)
+
+        mock_conn = MagicMock()
+        mock_res = MagicMock()
+        mock_boto_session.return_value.client.return_value = mock_conn
+        mock_boto_session.return_value.resource.return_value = mock_res
+        mock_boto_session.return_value.get_available_regions.return_value = ['us-east-1']
+        mock_conn.describe_instances.return_value = {'Reservations': [{'Instances': [{'InstanceId': 'id-1'},
+                                                                                     {'InstanceId': 'id-2'}]}]}
+        mock_conn.describe_spot_instance_requests.return_value = {
+            'SpotInstanceRequests': [{'SpotInstanceRequestId': 'sir-1', 'InstanceId': 'id-2', 'State': 'active'}]}
+        mock_conn.describe_addresses.return_value = {'Addresses': []}
+        instance = MagicMock()
+        instance.id = "id-1"
+        instance.placement = {'AvailabilityZone': 'us-east-1'}
+        instance.state = {'Name': 'running'}
+        instance.public_ip_address = "158.42.1.1"
+        instance.private_ip_address = "10.0.0.1"
+        mock_res.Instance.return_value = instance
+
+        inf = MagicMock()
+        vm1 = VirtualMachine(inf, "us-east-1;id-1", ec2_cloud.cloud, radl, radl, ec2_cloud, 1)
+        vm2 = VirtualMachine(inf, "us-east-1;sir-1", ec2_cloud.cloud, radl, radl, ec2_cloud, 1)
+
+        VirtualMachine.prefetch_status([vm1, vm2], auth, force=True)
+        self.assertEqual(mock_conn.describe_instances.call_args_list,
+                         [call(Filters=[{'Name': 'instance-id', 'Values': ['id-1', 'id-2']}])])
+        self.assertEqual(mock_conn.describe_spot_instance_requests.call_count, 1)
+
+        for vm in [vm1, vm2]:
+            success, _ = ec2_cloud.updateVMInfo(vm, auth)
+            self.assertTrue(success, msg="ERROR: updating VM info.")
+        self.assertEqual(vm2.id, "us-east-1;id-2")
+        # All the data has been got in the batch
+        self.assertEqual(instance.load.call_count, 0)
+        self.assertEqual(mock_conn.describe_spot_instance_requests.call_count, 1)
+        self.assertEqual(mock_conn.describe_addresses.call_count, 1)
+        # The sessions are shared
+        self.assertEqual(mock_boto_session.call_count, 2)
+
+        # The expired data is purged when new data is added
+        EC2CloudConnector._prefetched["old"] = (0, {})
+        EC2CloudConnector._prefetched.move_to_end("old", last=False)
+        ec2_cloud._set_prefetched("us-east-1", "id-3", {})
+        self.assertNotIn("old", EC2CloudConnector._prefetched)
+        self.assertEqual(ec2_cloud._get_prefetched("us-east-1", "id-3"), {})
+        self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
+
     @patch('IM.connectors.EC2.boto3.session.Session')
     def test_50_vmop(self, mock_boto_session):
         auth = Authentication([{'id': 'ec2', 'type': 'EC2', 'username': 'user', 'password': 'pass'}])
@@ -553,6 +681,33 @@ class TestEC2Connector(TestCloudConnectorBase):
         self.assertEqual(mock_conn.detach_internet_gateway.call_args_list, [call(InternetGatewayId='ig-id',
                                                                                  VpcId='vpc-id')])
 
+    @patch('IM.connectors.EC2.boto3.session.Session')
+    @patch('time.sleep')
+    def test_65_wait_vms_terminated(self, sleep, mock_boto_session):
+        auth = Authentication([{'id': 'ec2', 'type': 'EC2', 'username': 'user', 'password': 'pass'}])
+        ec2_cloud = self.get_ec2_cloud()
+
+        inf = MagicMock()
+        inf.id = "1"
+        vm1 = VirtualMachine(inf, "us-east-1;id-1", ec2_cloud.cloud, None, None, ec2_cloud, 1)
+        vm2 = VirtualMachine(inf, "us-east-1;id-2", ec2_cloud.cloud, None, None, ec2_cloud, 2)
+
+        mock_conn = MagicMock()
+        mock_boto_session.return_value.client.return_value = mock_conn
+        mock_boto_session.return_value.get_available_regions.return_value = ['us-east-1']
+        mock_conn.describe_instances.side_effect = [
+            {'Reservations': [{'Instances': [{'InstanceId': 'id-1', 'State': {'Name': 'terminated'}},
+                                             {'InstanceId': 'id-2', 'State': {'Name': 'shutting-down'}}]}]},
+            {'Reservations': [{'Instances': [{'InstanceId': 'id-2', 'State': {'Name': 'terminated'}}]}]}
+        ]
+
+        self.assertTrue(ec2_cloud.wait_vms_terminated([vm1, vm2], auth))
+        self.assertEqual(mock_conn.describe_instances.call_count, 2)
+        self.assertEqual(mock_conn.describe_instances.call_args_list[0][1]['Filters'][0]['Values'],
+                         ['id-1', 'id-2'])
+        self.assertEqual(mock_conn.describe_instances.call_args_list[1][1]['Filters'][0]['Values'], ['id-2'])
+        self.assertEqual(sleep.call_count, 1)
+
     @patch('IM.connectors.EC2.boto3.session.Session')
     @patch('time.sleep')
     def test_70_create_snapshot(self, sleep, mock_boto_session):
@@ -75,7 +75,7 @@ class TestFogBowConnector(TestCloudConnectorBase):
         self.assertEqual(len(concrete), 1)
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    def get_response(self, method, url, verify, headers={}, data=None):
+    def get_response(self, method, url, verify, headers={}, data=None, timeout=None):
         resp = MagicMock()
         parts = urlparse(url)
         url = parts[2]
@@ -202,7 +202,7 @@ class TestFogBowConnector(TestCloudConnectorBase):
     def request(self, method, url, body=None, headers=None):
         self.__class__.last_op = method, url
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     @patch('IM.InfrastructureList.InfrastructureList.save_data')
     def test_20_launch(self, save_data, requests):
         radl_data = """
@@ -264,7 +264,7 @@ class TestFogBowConnector(TestCloudConnectorBase):
         self.assertEqual(data["compute"]["requirements"], {'sgx:epc_size': '8', 'gpu': 'true'})
         self.assertEqual(data["federatedNetworkId"], "1")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     @patch('time.sleep')
     def test_30_updateVMInfo(self, sleep, requests):
         radl_data = """
@@ -319,7 +319,7 @@ class TestFogBowConnector(TestCloudConnectorBase):
         data = json.loads(requests.call_args_list[9][1]["data"])
         self.assertEqual(data, {"computeId": "1", "device": "/dev/hdb", "volumeId": "1"})
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_60_finalize(self, requests):
         auth = Authentication([{'id': 'fogbow', 'type': 'FogBow', 'host': 'server.com',
                                 'username': 'user', 'password': 'pass', 'as_host': 'server1.com'}])
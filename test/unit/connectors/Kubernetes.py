@@ -27,7 +27,8 @@ from IM.CloudInfo import CloudInfo
 from IM.auth import Authentication
 from radl import radl_parse
 from IM.VirtualMachine import VirtualMachine
-from IM.connectors.Kubernetes import KubernetesCloudConnector
+from IM.config import Config
+from IM.connectors.Kubernetes import KubernetesCloudConnector, KubernetesWatch
 try:
     from urlparse import urlparse
 except ImportError:
@@ -40,6 +41,15 @@ class TestKubernetesConnector(TestCloudConnectorBase):
     Class to test the IM connectors
     """
 
+    def tearDown(self):
+        # Stop the watches started by the tests before the requests patch ends
+        watches = list(KubernetesWatch._watches.values())
+        KubernetesWatch._reinit()
+        for watch in watches:
+            if watch.thread:
+                watch.thread.join(5)
+        TestCloudConnectorBase.tearDown(self)
+
     @staticmethod
     def get_kube_cloud():
         cloud_info = CloudInfo()
@@ -71,13 +81,29 @@ class TestKubernetesConnector(TestCloudConnectorBase):
         self.assertEqual(len(concrete), 1)
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    def get_response(self, method, url, verify, headers, data):
+    def get_response(self, method, url, verify, headers, data=None, timeout=None, params=None, stream=False):
         resp = MagicMock()
         parts = urlparse(url)
         url = parts[2]
 
         if method == "GET":
-            if url == "/api/":
+            if url.endswith("/pods") and params and params.get("watch"):
+                resp.status_code = 200
+                pod = {"metadata": {"namespace": "namespace", "name": "1", "resourceVersion": "2"},
+                       "status": {"phase": "Failed", "hostIP": "158.42.1.1", "podIP": "10.0.0.1"},
+                       "spec": {"containers": [{"image": "image:1.0"}]}}
+                resp.iter_lines.return_value = [json.dumps({"type": "MODIFIED", "object": pod}).encode(),
+                                                json.dumps({"type": "ERROR", "object": {"code": 410}}).encode()]
+            elif url == "/api/v1/namespaces/namespace/pods":
+                resp.status_code = 200
+                resp.json.return_value = {"metadata": {"resourceVersion": "1"},
+                                          "items": [{"metadata": {"namespace": "namespace", "name": "1"},
+                                                     "status": {"phase": "Running", "hostIP": "158.42.1.1",
+                                                                "podIP": "10.0.0.1"},
+                                                     "spec": {"containers": [{"image": "image:1.0"}]}}]}
+            elif url.endswith("/pods"):
+                resp.status_code = 403
+            elif url == "/api/":
                 resp.status_code = 200
                 resp.text = '{"versions": "v1"}'
             elif url.endswith("/pods/1"):
@@ -131,7 +157,7 @@ class TestKubernetesConnector(TestCloudConnectorBase):
     def add_vm(self, vm):
         vm.im_id = 0
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     @patch('IM.InfrastructureList.InfrastructureList.save_data')
     @patch('IM.connectors.Kubernetes.KubernetesCloudConnector._random_string', return_value='aaaa')
     def test_20_launch(self, random_string, save_data, requests):
@@ -333,13 +359,13 @@ class TestKubernetesConnector(TestCloudConnectorBase):
             },
         }
 
-        self.assertEqual(requests.call_args_list[7][0][1],
+        self.assertEqual(requests.call_args_list[6][0][1],
                          'http://server.com:8080/apis/networking.k8s.io/v1/namespaces/somenamespace/ingresses')
-        self.assertEqual(json.loads(requests.call_args_list[7][1]['data']), exp_ing)
+        self.assertEqual(json.loads(requests.call_args_list[6][1]['data']), exp_ing)
 
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_30_updateVMInfo(self, requests):
         radl_data = """
             network net (outbound = 'yes')
@@ -368,7 +394,76 @@ class TestKubernetesConnector(TestCloudConnectorBase):
         self.assertEqual(vm.info.systems[0].getValue("net_interface.0.ip"), "158.42.1.1")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
+    def test_35_updateVMInfo_watch(self, requests):
+        radl_data = """
+            network net (outbound = 'yes')
+            system test (
+            cpu.count=1 and
+            memory.size=512m and
+            net_interface.0.connection = 'net' and
+            disk.0.image.url = 'docker://someimage'
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        radl.check()
+
+        auth = Authentication([{'id': 'kube', 'type': 'Kubernetes',
+                                'host': 'http://server.com:8080', 'token': 'token'}])
+        kube_cloud = self.get_kube_cloud()
+        KubernetesWatch._reinit()
+
+        inf = MagicMock()
+        vm = VirtualMachine(inf, "namespace/1", kube_cloud.cloud, radl, radl, kube_cloud, 1)
+        vm2 = VirtualMachine(inf, "namespace/2", kube_cloud.cloud, radl, radl, kube_cloud, 1)
+
+        requests.side_effect = self.get_response
+
+        success, vm = kube_cloud.updateVMInfo(vm, auth)
+        self.assertTrue(success, msg="ERROR: updating VM info.")
+        self.assertEqual(vm.state, VirtualMachine.RUNNING)
+        self.assertEqual(vm.info.systems[0].getValue("net_interface.0.ip"), "158.42.1.1")
+        self.assertEqual(requests.call_args_list[0][0],
+                         ('GET', 'http://server.com:8080/api/v1/namespaces/namespace/pods'))
+
+        # Wait the watch to process the events
+        watch = list(KubernetesWatch._watches.values())[0]
+        watch.thread.join(5)
+        self.assertEqual(requests.call_args_list[1][1]["params"]["resourceVersion"], "1")
+        self.assertEqual(watch.objects["1"]["status"]["phase"], "Failed")
+
+        # A POD not found in the cache is requested directly
+        kube_cloud.updateVMInfo(vm2, auth)
+        self.assertEqual(requests.call_args_list[-1][0],
+                         ('GET', 'http://server.com:8080/api/v1/namespaces/namespace/pods/2'))
+        self.assertEqual(len([c for c in requests.call_args_list if c[0][1].endswith("/pods/1")]), 0)
+
+        # The reads do not wait while other thread lists the objects
+        num_requests = requests.call_count
+        watch.listing = True
+        watch.resource_version = None
+        self.assertIsNone(watch.get("1"))
+        self.assertEqual(requests.call_count, num_requests)
+        watch.listing = False
+
+        # A refreshed token reuses the watch, but the objects are listed again with it
+        new_header = {"Authorization": "Bearer new_token"}
+        self.assertIs(KubernetesWatch.get_watch(watch.url, new_header, False), watch)
+        self.assertEqual(watch.get("1", new_header)["metadata"]["name"], "1")
+        list_calls = [c for c in requests.call_args_list
+                      if c[0][1].endswith("/namespaces/namespace/pods") and not c[1].get("params")]
+        self.assertEqual(list_calls[-1][1]["headers"], new_header)
+        self.assertEqual(len(KubernetesWatch._watches), 1)
+        watch.thread.join(5)
+
+        # The watches not used are purged
+        watch.last_access -= Config.KUBERNETES_WATCH_TIME + 1
+        watch.thread.join(5)
+        KubernetesWatch.get_watch("http://server.com:8080/api/v1/namespaces/other/pods", {}, False)
+        self.assertNotIn(watch, KubernetesWatch._watches.values())
+        self.assertEqual(len(KubernetesWatch._watches), 1)
+        KubernetesWatch._reinit()
+
+    @patch('requests.Session.request')
     def test_55_alter(self, requests):
         radl_data = """
             network net ()
@@ -401,7 +496,7 @@ class TestKubernetesConnector(TestCloudConnectorBase):
         self.assertTrue(success, msg="ERROR: modifying VM info.")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_60_finalize(self, requests):
         auth = Authentication([{'id': 'kube', 'type': 'Kubernetes',
                                 'host': 'http://server.com:8080', 'token': 'token'}])
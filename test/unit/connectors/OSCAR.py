@@ -82,7 +82,7 @@ class TestOSCARConnector(TestCloudConnectorBase):
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
     @staticmethod
-    def get_response(method, url, verify=False, headers=None, data=None):
+    def get_response(method, url, verify=False, headers=None, data=None, timeout=None):
         resp = MagicMock()
         parts = urlparse(url)
         url = parts[2]
@@ -118,7 +118,7 @@ class TestOSCARConnector(TestCloudConnectorBase):
 
         return resp
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     @patch('IM.InfrastructureList.InfrastructureList.save_data')
     def test_20_launch(self, save_data, requests):
         radl_data = """
@@ -194,7 +194,7 @@ class TestOSCARConnector(TestCloudConnectorBase):
         self.assertEqual(res[0][1].state, VirtualMachine.PENDING)
         self.assertEqual(requests.call_count, 1)
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_30_updateVMInfo(self, requests):
         radl_data = """
             system test (
@@ -262,7 +262,7 @@ class TestOSCARConnector(TestCloudConnectorBase):
         self.assertEqual(requests.call_args_list[1][0][0], "POST")
         self.assertEqual(requests.call_args_list[1][0][1], "http://oscar.com:80/system/services")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_55_alter(self, requests):
         radl_data = """
             system test (
@@ -311,7 +311,7 @@ class TestOSCARConnector(TestCloudConnectorBase):
         self.assertEqual(requests.call_args_list[0][0][1], "http://oscar.com:80/system/services/fname")
         self.assertEqual(json.loads(requests.call_args_list[0][1]['data']), {'memory': '4096Mi', 'cpu': '2'})
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_60_finalize(self, requests):
         auth = Authentication([{'id': 'osc', 'type': 'OSCAR', 'host': 'http://oscar.com', 'token': 'token'}])
         oscar_cloud = self.get_oscar_cloud()
@@ -36,6 +36,10 @@ class TestONEConnector(TestCloudConnectorBase):
     Class to test the IM connectors
     """
 
+    def setUp(self):
+        TestCloudConnectorBase.setUp(self)
+        OpenNebulaCloudConnector._reinit()
+
     @staticmethod
     def get_one_cloud():
         cloud_info = CloudInfo()
@@ -196,6 +200,62 @@ class TestONEConnector(TestCloudConnectorBase):
         self.assertTrue(success, msg="ERROR: updating VM info.")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
+    @patch('IM.connectors.OpenNebula.ServerProxy')
+    def test_35_prefetch_vms_info(self, server_proxy):
+        radl_data = """
+            network net (outbound = 'yes' and provider_id = 'publica')
+            network net1 (provider_id = 'privada')
+            system test (
+            cpu.count=1 and
+            memory.size=512m and
+            net_interface.0.connection = 'net' and
+            net_interface.1.connection = 'net1' and
+            disk.0.os.name = 'linux' and
+            disk.0.image.url = 'one://server.com/1'
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        radl.check()
+
+        auth = Authentication([{'id': 'one', 'type': 'OpenNebula', 'username': 'user',
+                                'password': 'pass', 'host': 'server.com:2633'}])
+        one_cloud = self.get_one_cloud()
+
+        inf = MagicMock()
+        vm1 = VirtualMachine(inf, "1", one_cloud.cloud, radl, radl, one_cloud, 1)
+        vm2 = VirtualMachine(inf, "2", one_cloud.cloud, radl, radl, one_cloud, 1)
+
+        vm_info = self.read_file_as_string("files/vm_info.xml")
+        one_server = MagicMock()
+        one_server.system.multicall.return_value = [[[True, vm_info, 0]],
+                                                    {"faultCode": 1, "faultString": "Error"}]
+        one_server.one.vm.info.return_value = (True, vm_info, 0)
+        server_proxy.return_value = one_server
+
+        VirtualMachine.prefetch_status([vm1, vm2], auth, force=True)
+        self.assertEqual(one_server.system.multicall.call_args_list[0][0][0],
+                         [{'methodName': 'one.vm.info', 'params': ['user:pass', 1]},
+                          {'methodName': 'one.vm.info', 'params': ['user:pass', 2]}])
+
+        success, _ = one_cloud.updateVMInfo(vm1, auth)
+        self.assertTrue(success, msg="ERROR: updating VM info.")
+        self.assertEqual(vm1.info.systems[0].getValue("net_interface.0.ip"), "158.42.1.1")
+        self.assertEqual(one_server.one.vm.info.call_count, 0)
+
+        # The VM with a fault is requested again
+        success, _ = one_cloud.updateVMInfo(vm2, auth)
+        self.assertTrue(success, msg="ERROR: updating VM info.")
+        self.assertEqual(one_server.one.vm.info.call_args_list, [call('user:pass', 2)])
+        # The same XML-RPC client is reused
+        self.assertEqual(server_proxy.call_count, 1)
+
+        # The expired data is purged when new data is added
+        OpenNebulaCloudConnector._cache["old"] = (0, None)
+        OpenNebulaCloudConnector._cache.move_to_end("old", last=False)
+        one_cloud._set_cached("new", 1)
+        self.assertNotIn("old", OpenNebulaCloudConnector._cache)
+        self.assertEqual(one_cloud._get_cached("new", 10), 1)
+        self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
+
     @patch('IM.connectors.OpenNebula.ServerProxy')
     def test_40_stop(self, server_proxy):
         auth = Authentication([{'id': 'one', 'type': 'OpenNebula', 'username': 'user',
@@ -875,6 +875,39 @@ class TestOSTConnector(TestCloudConnectorBase):
         self.assertEqual(fip.delete.call_args_list, [call()])
         self.assertEqual(node.destroy.call_args_list, [call(), call()])
 
+    @patch('libcloud.compute.drivers.openstack.OpenStackNodeDriver')
+    @patch('time.sleep')
+    def test_65_wait_vms_terminated(self, sleep, get_driver):
+        auth = Authentication([{'id': 'ost', 'type': 'OpenStack', 'username': 'user',
+                                'password': 'pass', 'tenant': 'tenant', 'host': 'https://server.com:5000'}])
+        ost_cloud = self.get_ost_cloud()
+
+        inf = MagicMock()
+        vm1 = VirtualMachine(inf, "1", ost_cloud.cloud, "", "", ost_cloud, 1)
+        vm2 = VirtualMachine(inf, "2", ost_cloud.cloud, "", "", ost_cloud, 2)
+
+        driver = MagicMock()
+        driver.name = "OpenStack"
+        get_driver.return_value = driver
+
+        node = MagicMock()
+        node.id = "2"
+        node.state = NodeState.RUNNING
+        terminated = MagicMock()
+        terminated.id = "2"
+        terminated.state = NodeState.TERMINATED
+        # The VM 1 is already deleted and the VM 2 is terminated in the second check
+        driver.ex_get_node_details.side_effect = [None, node, terminated]
+
+        self.assertTrue(ost_cloud.wait_vms_terminated([vm1, vm2], auth))
+        self.assertEqual(driver.ex_get_node_details.call_args_list, [call("1"), call("2"), call("2")])
+        self.assertEqual(driver.list_nodes.call_count, 0)
+
+        driver.ex_get_node_details.side_effect = None
+        driver.ex_get_node_details.return_value = node
+        self.assertFalse(ost_cloud.wait_vms_terminated([vm2], auth, timeout=10))
+        self.assertIn("Timeout waiting VMs ['2'] to be terminated.", self.log.getvalue())
+
     @patch('libcloud.compute.drivers.openstack.OpenStackNodeDriver')
     def test_70_create_snapshot(self, get_driver):
         auth = Authentication([{'id': 'ost', 'type': 'OpenStack', 'username': 'user',
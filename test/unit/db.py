@@ -41,6 +41,20 @@ class TestDataBase(unittest.TestCase):
         db.execute("insert into test (id, data, date) values (%s, %s, now())", (1, "Data"))
         res = db.select("select data from test where id = %s", (1,))
         self.assertEqual(res, [("Data",)])
+        db.execute("insert into test (id, data, date) values (%s, %s, now())", (2, "Data2"))
+        db.execute("insert into test (id, data, date) values (%s, %s, now())", (3, "Data3"))
+        res = db.select_iter("select data from test order by id", batch_size=2)
+        self.assertEqual(next(res), ("Data",))
+        self.assertEqual(list(res), [("Data2",), ("Data3",)])
+
+        # The DB can be written while the rows are iterated
+        res = db.select_iter("select data from test order by id", batch_size=1)
+        self.assertEqual(next(res), ("Data",))
+        db2 = DataBase(db_url)
+        self.assertTrue(db2.connect())
+        self.assertTrue(db2.execute("insert into test (id, data, date) values (%s, %s, now())", (4, "Data4")))
+        db2.close()
+        self.assertEqual(list(res), [("Data2",), ("Data3",)])
         db.close()
 
     @patch('IM.db.mdb.connect')
@@ -61,6 +75,12 @@ class TestDataBase(unittest.TestCase):
         res = db.select("select data from test where id = %s", (1,))
         self.assertEqual(res, [("Data",)])
 
+        cursor.fetchmany.side_effect = [[("Data",)], []]
+        res = db.select_iter("select data from test")
+        self.assertEqual(list(res), [("Data",)])
+        self.assertEqual(connection.cursor.call_args_list[-1][0][0].__name__, "SSCursor")
+        self.assertEqual(cursor.close.call_count, 1)
+
         db.close()
 
     @patch('IM.db.MongoClient')
@@ -97,6 +117,14 @@ class TestDataBase(unittest.TestCase):
         self.assertEqual(len(res), 1)
         self.assertEqual(table.find.call_args_list[0][0], ({'id': 2}, {'_id': False, 'data': True}))
 
+        cursor = MagicMock()
+        cursor.__iter__.return_value = iter([{'id': 2, 'data': 'test2'}])
+        table.find.return_value = cursor
+        res = db.find_iter('table', {'id': 2}, {'data': True}, batch_size=10)
+        self.assertEqual(list(res), [{'id': 2, 'data': 'test2'}])
+        self.assertEqual(table.find.call_args_list[1][1], {'sort': None, 'batch_size': 10})
+        self.assertEqual(cursor.close.call_count, 1)
+
         del_res = MagicMock()
         del_res.deleted_count = 1
         table.delete_many.return_value = del_res
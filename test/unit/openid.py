@@ -49,7 +49,7 @@ class TestOpenIDClient(unittest.TestCase):
         self.assertTrue(expired)
         self.assertEqual(msg, "Token expired")
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_10_get_user_info_request(self, requests):
         mock_response1 = MagicMock()
         mock_response1.status_code = 200
@@ -69,7 +69,7 @@ class TestOpenIDClient(unittest.TestCase):
                          {'https://iam-test.indigo-datacloud.eu/': {'introspection_endpoint': '/introspect',
                                                                     'userinfo_endpoint': '/userinfo'}})
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_20_get_token_introspection(self, requests):
         mock_response2 = MagicMock()
         mock_response2.status_code = 200
@@ -17,9 +17,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
+import threading
 import time
 
-from IM.request import Request, RequestQueue, AsyncRequest
+from mock import patch
+from IM.request import Request, RequestQueue, AsyncRequest, BoundedThreadingMixIn
 
 
 class DummyRequest(AsyncRequest):
@@ -72,6 +74,33 @@ class TestRequest(unittest.TestCase):
         time.sleep(2.5)
         self.assertEqual(sr.status(), Request.STATUS_PROCESSED)
 
+    @patch('IM.request.Config')
+    def test_bounded_threads(self, config):
+        config.XMLRCP_MAX_THREADS = 2
+        running = []
+        max_running = [0]
+        lock = threading.Lock()
+
+        class DummyServer(BoundedThreadingMixIn):
+            daemon_threads = True
+
+            def finish_request(self, request, client_address):
+                with lock:
+                    running.append(request)
+                    max_running[0] = max(max_running[0], len(running))
+                time.sleep(0.2)
+                with lock:
+                    running.remove(request)
+
+            def shutdown_request(self, request):
+                pass
+
+        server = DummyServer()
+        for i in range(6):
+            server.process_request(i, None)
+        time.sleep(0.5)
+        self.assertEqual(max_running[0], 2)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -18,6 +18,8 @@
 
 import os
 import time
+import datetime
+from threading import Thread, Event
 import logging
 import unittest
 import sys
@@ -36,16 +38,21 @@ Config.MAX_SIMULTANEOUS_LAUNCHES = 2
 
 from IM.VirtualMachine import VirtualMachine
 from IM.InfrastructureManager import InfrastructureManager as IM
-from IM.InfrastructureManager import DisabledFunctionException
+from IM.InfrastructureManager import DisabledFunctionException, UnauthorizedUserException
 from IM.InfrastructureList import InfrastructureList
 from IM.auth import Authentication
-from radl.radl import RADL, system, deploy, Feature, SoftFeatures
+from radl.radl import RADL, system, deploy, Feature, SoftFeatures, contextualize
 from radl.radl_parse import parse_radl
 from radl.radl_json import parse_radl as parse_radl_json
 from IM.CloudInfo import CloudInfo
 from IM.connectors.CloudConnector import CloudConnector
 from IM.SSH import SSH
 from IM.InfrastructureInfo import InfrastructureInfo
+from IM.VMReconciler import VMReconciler
+from IM.Stats import Stats
+from IM.ImageCache import ImageCache
+from IM.CloudLimiter import CloudLimiter, CloudLimit
+from IM.db import DataBase
 
 
 def read_file_as_string(file_name):
@@ -411,6 +418,24 @@ class TestIM(unittest.TestCase):
             self.assertEqual(call[3], 1)
         IM.DestroyInfrastructure(infId, auth0)
 
+    def test_inf_addresources_bulk(self):
+        """Deploy n equal virtual machines in bulk batches."""
+        n = 7  # Machines to deploy
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er"),
+                               Feature("disk.0.os.credentials.username", "=", "user"),
+                               Feature("disk.0.os.credentials.password", "=", "pass")]))
+        radl.add(deploy("s0", n))
+        cloud = self.get_cloud_connector_mock()
+        cloud.MAX_LAUNCH_BATCH = 3
+        self.register_cloudconnector("Mock", cloud)
+        auth0 = self.getAuth([0], [], [("Mock", 0)])
+        infId = IM.CreateInfrastructure("", auth0)
+        vms = IM.AddResource(infId, str(radl), auth0)
+        self.assertEqual(len(vms), n)
+        self.assertEqual(sorted(call[3] for call, _ in cloud.launch.call_args_list), [1, 3, 3])
+        IM.DestroyInfrastructure(infId, auth0)
+
     def test_inf_addresources2(self):
         """Deploy independent virtual machines in two cloud providers."""
         n0, n1 = 2, 5  # Machines to deploy
@@ -445,6 +470,144 @@ class TestIM(unittest.TestCase):
             self.assertEqual(call[3], 1)
         IM.DestroyInfrastructure(infId, auth0)
 
+    def test_deploy_groups_timeout(self):
+        """Test that a slow cloud provider does not stall the cloud selection."""
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er")]))
+        radl.add(deploy("s0", 1))
+        release = Event()
+
+        def slow_concrete_system(_0, s, _1):
+            release.wait(5)
+            return [s.clone()]
+        cloud0 = self.get_cloud_connector_mock("MyMock0")
+        cloud0.concreteSystem = slow_concrete_system
+        self.register_cloudconnector("Mock0", cloud0)
+        cloud1 = self.get_cloud_connector_mock("MyMock1")
+        self.register_cloudconnector("Mock1", cloud1)
+        auth0 = self.getAuth([0], [], [("Mock0", 0), ("Mock1", 1)])
+        inf = InfrastructureInfo()
+        inf.id = "1"
+        cloud_list = dict([(c.id, c.getCloudConnector(inf)) for c in CloudInfo.get_cloud_list(auth0)])
+        systems_with_iis = {"s0": [radl.get_system_by_name("s0")]}
+
+        Config.CONCRETE_SYSTEM_TIMEOUT = 0.5
+        try:
+            concrete_systems, deploy_groups, deploys_group_cloud = IM.get_deploy_groups(cloud_list, radl,
+                                                                                        systems_with_iis, inf, auth0)
+        finally:
+            Config.CONCRETE_SYSTEM_TIMEOUT = 60
+            release.set()
+        self.assertEqual(concrete_systems["cloud0"]["s0"], (None, -1e9))
+        self.assertEqual(deploys_group_cloud[id(deploy_groups[0])], "cloud1")
+        self.assertIn("Timeout concreting the systems with cloud cloud0.", inf.cont_out)
+        stats = IM.get_scheduling_stats()
+        self.assertEqual(stats["Mock0"]["timeouts"], 1)
+        self.assertEqual(stats["Mock1"]["count"], 1)
+        self.assertIs(IM._get_concrete_pool(), IM._get_concrete_pool())
+
+    def test_cloud_limiter(self):
+        """Test the per cloud concurrency limits."""
+        cloud = CloudInfo()
+        cloud.type = "Dummy"
+        cloud.server = "server.com"
+        active = []
+        max_active = []
+
+        def operation(item):
+            active.append(item)
+            max_active.append(len(active))
+            time.sleep(0.05)
+            active.remove(item)
+            if item == 0:
+                return "Error launching the VM: HTTP Error 429: Too Many Requests"
+            return None
+
+        Config.MAX_SIMULTANEOUS_LAUNCHES_BY_TYPE = {"Dummy": 3}
+        try:
+            res = CloudLimiter.run(operation, list(range(6)), lambda _: cloud)
+        finally:
+            Config.MAX_SIMULTANEOUS_LAUNCHES_BY_TYPE = {}
+        self.assertEqual(res[1:], [None] * 5)
+        self.assertLessEqual(max(max_active), 3)
+        stats = CloudLimiter.get_stats()["Dummy://server.com"]
+        self.assertEqual(stats["throttled"], 1)
+        self.assertEqual(stats["max_limit"], 3)
+        self.assertEqual(stats["active"], 0)
+
+        # AIMD adaptation of the limit
+        limit = CloudLimit(4)
+        limit.acquire()
+        limit.release(throttled=True)
+        self.assertEqual(limit.limit, 2.0)
+        limit.acquire()
+        limit.release()
+        self.assertEqual(limit.limit, 2.5)
+
+        self.assertTrue(CloudLimiter.is_throttle_error(Exception("An error occurred (RequestLimitExceeded)")))
+        self.assertTrue(CloudLimiter.is_throttle_error("Quota exceeded for instances"))
+        self.assertFalse(CloudLimiter.is_throttle_error("Error: Image not found"))
+        self.assertFalse(CloudLimiter.is_throttle_error(None))
+
+        # The limits are applied per region and credentials
+        cloud.id = "ec2"
+        cloud.type = "EC2"
+        cloud.server = ""
+        auth0 = Authentication([{'id': 'ec2', 'type': 'EC2', 'username': 'key0', 'password': 'secret'}])
+        auth1 = Authentication([{'id': 'ec2', 'type': 'EC2', 'username': 'key1', 'password': 'secret'}])
+        sys0 = system("s0", [Feature("disk.0.image.url", "=", "aws://us-east-1/ami-0123")])
+        sys1 = system("s1", [Feature("disk.0.image.url", "=", "aws://eu-west-1/ami-0123")])
+        key = CloudLimiter.get_key(cloud, auth0, sys0)
+        self.assertTrue(key.startswith("EC2:///us-east-1#"))
+        self.assertNotIn("secret", key)
+        self.assertEqual(key, CloudLimiter.get_key(cloud, auth0, sys0.clone()))
+        self.assertNotEqual(key, CloudLimiter.get_key(cloud, auth1, sys0))
+        self.assertNotEqual(key, CloudLimiter.get_key(cloud, auth0, sys1))
+
+    def test_cloud_limiter_groups(self):
+        """Test that a busy cloud does not delay the others and the nested calls."""
+        slow = CloudInfo()
+        slow.type = "Dummy"
+        slow.server = "slow.com"
+        fast = CloudInfo()
+        fast.type = "Dummy"
+        fast.server = "fast.com"
+        other = CloudInfo()
+        other.type = "Dummy"
+        other.server = "other.com"
+        release = Event()
+        done = []
+
+        def operation(item):
+            if item[0] is slow:
+                release.wait(5)
+            else:
+                # Nested call from a cloud operation
+                CloudLimiter.run(lambda i: None, [item], lambda i: other)
+                done.append(item[1])
+                if len(done) == 3:
+                    release.set()
+            return None
+
+        items = [(slow, 0), (slow, 1), (fast, 2), (fast, 3), (fast, 4)]
+        Config.MAX_SIMULTANEOUS_LAUNCHES_BY_TYPE = {"Dummy": 1}
+        old_pool = CloudLimiter._pool
+        CloudLimiter._pool = None
+        # One thread for the slow cloud and other for the fast one (and its nested calls)
+        Config.CLOUD_OPERATIONS_POOL_SIZE = 2
+        init = time.time()
+        try:
+            res = CloudLimiter.run(operation, items, lambda i: i[0])
+        finally:
+            Config.MAX_SIMULTANEOUS_LAUNCHES_BY_TYPE = {}
+            Config.CLOUD_OPERATIONS_POOL_SIZE = 50
+            CloudLimiter._pool.close()
+            CloudLimiter._pool = old_pool
+        self.assertEqual(res, [None] * 5)
+        self.assertEqual(done, [2, 3, 4])
+        # The fast cloud operations did not wait the slow ones
+        self.assertLess(time.time() - init, 4)
+
     @patch('IM.VMRC.Client')
     def test_inf_addresources3(self, suds_cli):
         """Test cloud selection."""
@@ -749,6 +912,8 @@ class TestIM(unittest.TestCase):
         vm3.im_id = 2
         vm3.state = VirtualMachine.RUNNING
         inf.get_vm_list.return_value = [vm1, vm2, vm3]
+        for vm in inf.get_vm_list.return_value:
+            vm.last_update = int(time.time())
 
         state = IM.GetInfrastructureState("1", auth0)
         self.assertEqual(state["state"], "running")
@@ -793,6 +958,260 @@ class TestIM(unittest.TestCase):
         state = IM.GetInfrastructureState("1", auth0)
         self.assertEqual(state["state"], "pending")
 
+    def test_get_infs_state_info(self):
+        """Test GetInfrastructuresState and GetInfrastructuresInfo."""
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er"),
+                               Feature("disk.0.os.credentials.username", "=", "user"),
+                               Feature("disk.0.os.credentials.password", "=", "pass")]))
+        radl.add(deploy("s0", 1))
+
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        auth1 = self.getAuth([1], [], [("Dummy", 0)])
+        infId0 = IM.CreateInfrastructure(str(radl), auth0)
+        infId1 = IM.CreateInfrastructure("", auth0)
+        infId2 = IM.CreateInfrastructure("", auth1)
+        infId3 = IM.CreateInfrastructure("", auth0)
+        IM.DestroyInfrastructure(infId3, auth0)
+        # Force loading it from the DB
+        del InfrastructureList.infrastructure_list[infId1]
+
+        inf_ids = [infId0, infId1, infId2, infId3, "noid"]
+        res = IM.GetInfrastructuresState(inf_ids, auth0)
+        self.assertEqual(res[infId0]["state"], "running")
+        self.assertEqual(res[infId0]["vm_states"], {"0": "running"})
+        self.assertIsNotNone(res[infId0]["last_update"])
+        self.assertEqual(res[infId1]["state"], "pending")
+        self.assertEqual(res[infId2], {"error": "Access to this infrastructure not granted."})
+        self.assertEqual(res[infId3], {"error": "Deleted infrastructure."})
+        self.assertEqual(res["noid"], {"error": "Invalid infrastructure ID or access not granted."})
+
+        res = IM.GetInfrastructuresInfo(inf_ids, auth0)
+        self.assertEqual(res[infId0], {"vm_list": ["0"]})
+        self.assertEqual(res[infId1], {"vm_list": []})
+        self.assertEqual(res[infId2], {"error": "Access to this infrastructure not granted."})
+        self.assertEqual(res[infId3], {"error": "Deleted infrastructure."})
+        self.assertEqual(res["noid"], {"error": "Invalid infrastructure ID or access not granted."})
+
+        IM.DestroyInfrastructure(infId0, auth0)
+        IM.DestroyInfrastructure(infId1, auth0)
+        IM.DestroyInfrastructure(infId2, auth1)
+
+    def test_inf_version(self):
+        """Test the version of the infrastructures."""
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er"),
+                               Feature("disk.0.os.credentials.username", "=", "user"),
+                               Feature("disk.0.os.credentials.password", "=", "pass")]))
+        radl.add(deploy("s0", 1))
+
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        infId = IM.CreateInfrastructure("", auth0)
+        inf = IM.get_infrastructure(infId, auth0)
+        version, _ = inf.get_version()
+
+        IM.AddResource(infId, str(radl), auth0)
+        new_version, _ = inf.get_version()
+        self.assertGreater(new_version, version)
+        version = new_version
+
+        inf.get_vm_list()[0].cont_out = "log"
+        new_version, _ = inf.get_version()
+        self.assertGreater(new_version, version)
+        version = new_version
+
+        IM.GetInfrastructureRADL(infId, auth0)
+        new_version, _ = inf.get_version()
+        self.assertEqual(new_version, version)
+
+        # The changes of the connectors in the VM info are detected
+        vm = inf.get_vm_list()[0]
+        old_info = vm._get_info_values()
+        self.assertEqual(vm._get_info_values(), old_info)
+        vm.info.systems[0].setValue("net_interface.0.ip", "8.8.8.8")
+        self.assertNotEqual(vm._get_info_values(), old_info)
+
+        # The credentials already checked are not validated again
+        checked_auth = IM.check_auth_data(auth0)
+        self.assertTrue(checked_auth.checked)
+        with patch('IM.InfrastructureManager.InfrastructureManager.check_im_user') as check_im_user:
+            self.assertIs(IM.check_auth_data(checked_auth), checked_auth)
+            self.assertEqual(check_im_user.call_count, 0)
+
+        IM.DestroyInfrastructure(infId, auth0)
+
+    def test_vm_reconciler(self):
+        """Test the background VM reconciler."""
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er"),
+                               Feature("disk.0.os.credentials.username", "=", "user"),
+                               Feature("disk.0.os.credentials.password", "=", "pass")]))
+        radl.add(deploy("s0", 2))
+        # Disable the contextualization
+        radl.add(contextualize([]))
+
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        infId = IM.CreateInfrastructure(str(radl), auth0)
+        inf = IM.get_infrastructure(infId, auth0)
+        self.assertFalse(VMReconciler.is_reconciled(inf))
+
+        Config.VM_RECONCILER = True
+        try:
+            IM.GetInfrastructureState(infId, auth0)
+            cont = 0
+            while not VMReconciler.is_reconciled(inf) and cont < 50:
+                time.sleep(0.1)
+                cont += 1
+            self.assertTrue(VMReconciler.is_reconciled(inf))
+
+            with patch.object(VirtualMachine, 'update_status', autospec=True) as update_status:
+                def inf_calls():
+                    # Only consider the calls to the VMs of this infrastructure
+                    return [c for c in update_status.call_args_list if c[0][0].inf is inf]
+
+                state = IM.GetInfrastructureState(infId, auth0)
+                self.assertEqual(state["state"], "configured")
+                self.assertEqual(len(inf_calls()), 0)
+                IM.GetVMInfo(infId, "0", auth0)
+                self.assertEqual(len(inf_calls()), 0)
+
+                IM.GetInfrastructureState(infId, auth0, force=True)
+                self.assertEqual(len(inf_calls()), 2)
+                self.assertEqual(inf_calls()[0][0][2], True)
+                IM.GetVMInfo(infId, "0", auth0, force=True)
+                self.assertEqual(len(inf_calls()), 3)
+
+            vm = MagicMock()
+            vm.state = VirtualMachine.CONFIGURED
+            sel_inf = MagicMock()
+            sel_inf.configured = True
+            sel_inf.is_ctxt_process_running.return_value = False
+            sel_inf.get_vm_list.return_value = [vm]
+            self.assertEqual(VMReconciler.get_interval(sel_inf), Config.VM_RECONCILER_SLOW_INTERVAL)
+            vm.state = VirtualMachine.PENDING
+            self.assertEqual(VMReconciler.get_interval(sel_inf), Config.VM_RECONCILER_FAST_INTERVAL)
+
+            IM.DestroyInfrastructure(infId, auth0)
+            VMReconciler._get_due_entries(time.time())
+            self.assertFalse(VMReconciler.is_reconciled(inf))
+        finally:
+            Config.VM_RECONCILER = False
+            VMReconciler.stop()
+
+    @patch('IM.InfrastructureInfo.InfrastructureInfo.Contextualize')
+    def test_vm_reconciler_release(self, contextualize):
+        """Test that the infrastructures got by the reconciler threads are released."""
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er")]))
+        radl.add(deploy("s0", 2))
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        infId = IM.CreateInfrastructure(str(radl), auth0)
+        inf = IM.get_infrastructure(infId, auth0)
+        InfrastructureList.release()
+
+        def update_status(vm, auth, force=False):
+            # Get the infrastructure from the reconciler pool threads
+            InfrastructureList.get_infrastructure(vm.inf.id)
+            return False
+
+        Config.VM_RECONCILER = True
+        try:
+            with patch.object(VirtualMachine, 'update_status', autospec=True, side_effect=update_status):
+                VMReconciler.register(inf, auth0)
+                cont = 0
+                while not VMReconciler.is_reconciled(inf) and cont < 50:
+                    time.sleep(0.1)
+                    cont += 1
+                self.assertTrue(VMReconciler.is_reconciled(inf))
+        finally:
+            Config.VM_RECONCILER = False
+            VMReconciler.stop()
+
+        self.assertIsNone(InfrastructureList._in_use.get(infId))
+        with patch.object(InfrastructureList, "MIN_RESIDENCE_TIME", -1):
+            self.assertTrue(InfrastructureList._is_evictable(inf, datetime.datetime.now()))
+
+        IM.DestroyInfrastructure(infId, auth0)
+
+    @patch('IM.VirtualMachine.VirtualMachine.update_status')
+    def test_inf_events(self, update_status):
+        """Test GetInfrastructureEvents."""
+        # Avoid the refresh loop to change the state of the VMs
+        update_status.return_value = False
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er"),
+                               Feature("disk.0.os.credentials.username", "=", "user"),
+                               Feature("disk.0.os.credentials.password", "=", "pass")]))
+        radl.add(deploy("s0", 1))
+        # Disable the contextualization
+        radl.add(contextualize([]))
+
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        infId = IM.CreateInfrastructure(str(radl), auth0)
+        inf = IM.get_infrastructure(infId, auth0)
+
+        res = IM.GetInfrastructureEvents(infId, auth0)
+        self.assertEqual(res["state"], "running")
+        self.assertEqual(res["events"], [])
+        self.assertEqual(res["last_id"], 0)
+
+        inf.get_vm_list()[0].state = VirtualMachine.STOPPED
+        inf.add_cont_msg("msg")
+        # The returned cursor can be used in the next call
+        res = IM.GetInfrastructureEvents(infId, auth0, res["last_id"])
+        self.assertEqual(res["state"], "stopped")
+        self.assertEqual(res["events"][0]["type"], "vm_state")
+        self.assertEqual(res["events"][0]["data"], {"vm_id": "0", "state": "stopped"})
+        self.assertEqual(res["events"][1]["type"], "cont_msg")
+        self.assertTrue(res["events"][1]["data"]["msg"].endswith(": msg\n"))
+        self.assertTrue(res["events"][1]["data"]["append"])
+        last_id = res["last_id"]
+        self.assertEqual(last_id, res["events"][1]["id"])
+
+        # Long-poll waiting for new events
+        def update_state():
+            time.sleep(0.5)
+            inf.get_vm_list()[0].state = VirtualMachine.RUNNING
+        Thread(target=update_state).start()
+        init = time.time()
+        res = IM.GetInfrastructureEvents(infId, auth0, last_id, 10)
+        self.assertLess(time.time() - init, 5)
+        self.assertEqual(len(res["events"]), 1)
+        self.assertEqual(res["events"][0]["data"], {"vm_id": "0", "state": "running"})
+
+        IM.DestroyInfrastructure(infId, auth0)
+
+    @patch('IM.InfrastructureList.InfrastructureList.save_data')
+    @patch('IM.VirtualMachine.VirtualMachine.update_status')
+    def test_inf_events_refresh(self, update_status, save_data):
+        """Test the refresh of the VMs of the watched infrastructures."""
+        from IM.EventBus import EventBus, EventChannel
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er")]))
+        radl.add(deploy("s0", 1))
+        radl.add(contextualize([]))
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        infId = IM.CreateInfrastructure(str(radl), auth0)
+
+        # An idle channel stops after one refresh
+        update_status.reset_mock()
+        channel = EventChannel()
+        channel.last_watch = 0
+        EventBus._refresh_inf(infId, channel)
+        self.assertEqual(update_status.call_count, 1)
+        self.assertEqual(save_data.call_args[0][0].id, infId)
+        self.assertEqual(InfrastructureList._in_use.get(infId, 0), 0)
+
+        # The VMs are not refreshed if the VMReconciler is enabled
+        Config.VM_RECONCILER = True
+        try:
+            EventBus._refresh_inf(infId, channel)
+        finally:
+            Config.VM_RECONCILER = False
+        self.assertEqual(update_status.call_count, 1)
+
+        IM.DestroyInfrastructure(infId, auth0)
+
     def test_altervm(self):
         """Test AlterVM."""
         radl = RADL()
@@ -864,6 +1283,77 @@ class TestIM(unittest.TestCase):
 
         IM.DestroyInfrastructure(infId, auth0)
 
+    def test_jobs(self):
+        """Test asynchronous operations."""
+        from IM.JobManager import IncorrectJobException
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er"),
+                               Feature("disk.0.os.credentials.username", "=", "user"),
+                               Feature("disk.0.os.credentials.password", "=", "pass")]))
+        radl.add(deploy("s0", 1))
+
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        infId = IM.CreateInfrastructure(str(radl), auth0)
+
+        job_id = IM.CreateJob("StopInfrastructure", infId, (infId, auth0), auth0)
+        for _ in range(10):
+            job = IM.GetJobInfo(job_id, auth0)
+            if job["state"] in ["finished", "failed"]:
+                break
+            time.sleep(0.5)
+        self.assertEqual(job["state"], "finished")
+        self.assertEqual(job["progress"], 100)
+        self.assertEqual(job["result"], "")
+        self.assertEqual(job["inf_id"], infId)
+
+        with self.assertRaises(IncorrectJobException):
+            IM.GetJobInfo(job_id, self.getAuth([1]))
+
+        with self.assertRaises(Exception) as ex:
+            IM.CreateJob("ExportInfrastructure", infId, (infId, False, auth0), auth0)
+        self.assertEqual(str(ex.exception), "Operation ExportInfrastructure cannot be launched asynchronously.")
+
+        IM.DestroyInfrastructure(infId, auth0)
+
+    def test_jobs_check(self):
+        """Test the authorization and the check of the stored jobs."""
+        from IM.JobManager import Job, JobManager
+        auth = Authentication([{'type': 'InfrastructureManager', 'username': 'user',
+                                'password': 'pass', 'token': 'token'}])
+        job = Job("StopInfrastructure", "infid", auth)
+        self.assertTrue(job.is_authorized(auth))
+        self.assertFalse(job.is_authorized(Authentication([{'type': 'InfrastructureManager',
+                                                            'username': 'user', 'password': 'pass'}])))
+
+        self.assertNotIn('"pass"', job.serialize())
+        self.assertNotIn(': "token"', job.serialize())
+
+        # A job interrupted by an IM stop, a running one of other IM instance and an old finished one
+        job.state = Job.RUNNING
+        job.instance = JobManager.INSTANCE
+        JobManager.save_job(job)
+        other_job = Job("StartInfrastructure", "infid", auth)
+        other_job.state = Job.RUNNING
+        other_job.instance = "other_host"
+        JobManager.save_job(other_job)
+        old_job = Job("StartInfrastructure", "infid", auth)
+        old_job.state = Job.FINISHED
+        old_job.update_date = int(time.time()) - Config.JOB_HISTORY_TIME - 1
+        JobManager.save_job(old_job)
+
+        self.assertTrue(JobManager.check_jobs(interrupted=True))
+        job = JobManager.get_job(job.id, auth)
+        self.assertEqual(job.state, Job.FAILED)
+        self.assertEqual(job.error_msg, "The IM service was stopped while the job was running.")
+        self.assertEqual(JobManager.get_job(other_job.id, auth).state, Job.RUNNING)
+        self.assertIsNone(JobManager._get_job_from_db(old_job.id))
+
+        # The periodic check only purges the old finished jobs
+        JobManager.save_job(old_job)
+        self.assertTrue(JobManager.check_jobs())
+        self.assertIsNone(JobManager._get_job_from_db(old_job.id))
+        self.assertIsNotNone(JobManager._get_job_from_db(job.id))
+
     def test_export_import(self):
         """Test ExportInfrastructure and ImportInfrastructure operations."""
         radl = RADL()
@@ -1054,7 +1544,7 @@ configure step2 (
 
         IM.DestroyInfrastructure(infId, auth0)
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_check_oidc_invalid_token(self, request):
         im_auth = {"token": self.gen_token()}
 
@@ -1236,6 +1726,137 @@ configure step2 (
         self.assertEqual(res['1'].vm_master.info.systems[0].getValue("disk.0.image.url"), "mock0://linux.for.ev.er")
         self.assertTrue(res['1'].auth.compare(inf.auth, "InfrastructureManager"))
 
+    def test_inf_cache_eviction(self):
+        """ Test the eviction of the infrastructures from memory."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        for inf_id in ["1", "2", "3"]:
+            inf = InfrastructureInfo()
+            inf.id = inf_id
+            inf.auth = auth0
+            InfrastructureList.add_infrastructure(inf)
+        InfrastructureList.save_data()
+        self.assertGreater(InfrastructureList.get_cache_stats()["size"], 0)
+
+        InfrastructureList.infrastructure_list["1"].last_access -= datetime.timedelta(seconds=120)
+        InfrastructureList.infrastructure_list["2"].last_access -= datetime.timedelta(seconds=90)
+        InfrastructureList.infrastructure_list["2"].adding = True
+        Config.INF_CACHE_MAX_ENTRIES = 1
+        try:
+            InfrastructureList._evict()
+            # 2 is not evicted as it has an operation in progress and 3 has been accessed recently
+            self.assertEqual(sorted(InfrastructureList.infrastructure_list.keys()), ["2", "3"])
+
+            inf = InfrastructureList.get_infrastructure("1")
+            self.assertEqual(inf.id, "1")
+            InfrastructureList.get_infrastructure("3")
+            stats = InfrastructureList.get_cache_stats()
+            self.assertEqual((stats["entries"], stats["hits"], stats["misses"], stats["evictions"]), (3, 1, 1, 1))
+
+            # The infrastructures got by the current operation are not evicted until released
+            inf.last_access -= datetime.timedelta(seconds=120)
+            InfrastructureList.infrastructure_list["2"].adding = False
+            InfrastructureList._evict()
+            self.assertIn("1", InfrastructureList.infrastructure_list)
+            InfrastructureList.release()
+            self.assertEqual(InfrastructureList._in_use, {})
+            InfrastructureList._evict()
+            self.assertNotIn("1", InfrastructureList.infrastructure_list)
+        finally:
+            Config.INF_CACHE_MAX_ENTRIES = 0
+
+        # An evicted infrastructure is saved from the caller object
+        inf.cont_out = "evicted"
+        InfrastructureList.save_data(inf)
+        res = InfrastructureList._get_data_from_db(Config.DATA_DB, "1")
+        self.assertEqual(res["1"].cont_out, "evicted")
+        # But not using its ID
+        res = InfrastructureList._save_data_to_db(Config.DATA_DB, InfrastructureList.infrastructure_list, "1")
+        self.assertTrue(res)
+
+    def test_memory_report(self):
+        """ Test GetMemoryReport."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        auth1 = self.getAuth([1], [], [("Dummy", 0)])
+        Config.CONT_OUT_COMPRESS_SIZE = 100
+        try:
+            inf_id = IM.CreateInfrastructure("", auth0)
+            inf = IM.get_infrastructure(inf_id, auth0)
+            inf.cont_out = "Contextualization log line\n" * 100
+            IM.CreateInfrastructure("", auth1)
+
+            res = IM.GetMemoryReport(auth0)
+            self.assertEqual(len(res["infrastructures"]), 1)
+            usage = res["infrastructures"][0]
+            self.assertEqual(usage["id"], inf_id)
+            self.assertEqual(usage["cont_out_size"], 2700)
+            self.assertLess(usage["cont_out_memory"], 2700)
+            self.assertEqual(res["cache"]["entries"], 2)
+        finally:
+            Config.CONT_OUT_COMPRESS_SIZE = 65536
+
+    def test_service_stats(self):
+        """ Test GetServiceStats."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        with self.assertRaises(UnauthorizedUserException):
+            IM.GetServiceStats(auth0)
+
+        Config.ADMIN_USER = {"username": "admin", "password": "adminpass"}
+        try:
+            autha = Authentication([{'id': 'im', 'type': 'InfrastructureManager',
+                                     'username': 'admin', 'password': 'adminpass'}])
+            res = IM.GetServiceStats(autha)
+        finally:
+            Config.ADMIN_USER = None
+        self.assertIn("entries", res["cache"])
+        self.assertIn("scheduling", res)
+        self.assertIn("clouds", res)
+        self.assertIn("http", res)
+
+    @patch('IM.InfrastructureInfo.InfrastructureInfo.Contextualize')
+    def test_startup(self, contextualize):
+        """ Test the startup process."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er")]))
+        radl.add(deploy("s0", 1))
+        infs = {}
+        for inf_id, configured in [("1", True), ("2", None), ("3", None)]:
+            inf = InfrastructureInfo()
+            inf.id = inf_id
+            inf.auth = auth0
+            inf.configured = configured
+            inf.vm_list = [VirtualMachine(inf, "1", CloudInfo(), radl, radl, None, 0)]
+            infs[inf_id] = inf
+        InfrastructureList._save_data_to_db(Config.DATA_DB, infs)
+        InfrastructureList.infrastructure_list = {}
+
+        self.assertTrue(InfrastructureList.inf_exists("1"))
+        self.assertFalse(InfrastructureList.inf_exists("4"))
+        self.assertEqual(InfrastructureList.infrastructure_list, {})
+
+        InfrastructureList.startup()
+        self.assertEqual(InfrastructureList.startup_info, {"infrastructures": 3, "interrupted": ["2", "3"]})
+        self.assertEqual(sorted(InfrastructureList.infrastructure_list.keys()), ["2", "3"])
+        inf = InfrastructureList.infrastructure_list["2"]
+        self.assertFalse(inf.configured)
+        self.assertIn("Contextualization process interrupted by an IM restart.", inf.cont_out)
+        self.assertEqual(contextualize.call_count, 0)
+
+        # Now they are not interrupted
+        InfrastructureList.infrastructure_list = {}
+        InfrastructureList.startup()
+        self.assertEqual(InfrastructureList.startup_info, {"infrastructures": 3, "interrupted": []})
+
+        infs["2"].configured = None
+        InfrastructureList._save_data_to_db(Config.DATA_DB, infs, "2")
+        Config.RESUME_CTXT = True
+        try:
+            InfrastructureList.startup()
+        finally:
+            Config.RESUME_CTXT = False
+        self.assertEqual(contextualize.call_count, 1)
+        self.assertEqual(contextualize.call_args_list[0][0][0].auth_list, auth0.auth_list)
+
     def test_inf_remove_two_clouds(self):
         """Test remove VMs from 2 cloud providers."""
         radl = """"
@@ -1292,6 +1913,51 @@ configure step2 (
         self.assertEqual(cloud1.finalize.call_args_list[0][0][1], False)
         self.assertEqual(cloud1.finalize.call_args_list[1][0][1], True)
 
+    def test_inf_remove_shared_resources(self):
+        """Test remove VMs deleting the shared resources once per cloud provider."""
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er"),
+                               Feature("disk.0.os.credentials.username", "=", "user"),
+                               Feature("disk.0.os.credentials.password", "=", "pass")]))
+        radl.add(deploy("s0", 3))
+
+        cloud = self.get_cloud_connector_mock()
+        cloud.SHARED_RESOURCES_CLEANUP = True
+        cloud.finalize = Mock(return_value=(True, ""))
+        cloud.wait_vms_terminated = Mock(return_value=True)
+        cloud.delete_shared_resources = Mock(return_value=(True, ""))
+        calls = []
+        cloud.delete_snapshots = Mock(side_effect=lambda vm, auth: calls.append("delete_snapshots"))
+        cloud.finalize.side_effect = lambda vm, last, auth: calls.append("finalize") or (True, "")
+        self.register_cloudconnector("Mock", cloud)
+        auth0 = self.getAuth([0], [], [("Mock", 0)])
+
+        infId = IM.CreateInfrastructure(str(radl), auth0)
+        inf = IM.get_infrastructure(infId, auth0)
+        for vm in inf.vm_list:
+            vm.cloud_connector = cloud
+
+        # Some VMs remain in the cloud provider
+        cont = IM.RemoveResource(infId, ['0', '1'], auth0)
+        self.assertEqual(cont, 2)
+        self.assertEqual(cloud.finalize.call_count, 2)
+        self.assertEqual(cloud.wait_vms_terminated.call_count, 0)
+        self.assertEqual(cloud.delete_shared_resources.call_count, 0)
+        self.assertEqual(cloud.delete_snapshots.call_count, 0)
+
+        inf = IM.get_infrastructure(infId, auth0)
+        inf.vm_list[2].cloud_connector = cloud
+        IM.DestroyInfrastructure(infId, auth0)
+        self.assertEqual(cloud.finalize.call_count, 3)
+        for call in cloud.finalize.call_args_list:
+            self.assertEqual(call[0][1], False)
+        self.assertEqual(cloud.wait_vms_terminated.call_count, 1)
+        self.assertEqual(cloud.delete_shared_resources.call_count, 1)
+        self.assertEqual(cloud.delete_shared_resources.call_args_list[0][0][0], [inf.vm_list[2]])
+        # The snapshots are deleted before terminating the VMs
+        self.assertEqual(calls[2:], ["delete_snapshots", "finalize"])
+        self.assertIn("1 VMs deleted", inf.cont_out)
+
     def test_create_async(self):
         """Create Inf. async."""
         radl = RADL()
@@ -1485,16 +2151,20 @@ configure step2 (
 
     @patch("IM.connectors.Dummy.DummyCloudConnector")
     def test_search_vm(self, dummycc):
-        auth = self.getAuth([0], [], [("Dummy", 0), ("Dummy", 0)])
+        auth = self.getAuth([0], [], [("Dummy", 0), ("Dummy", 1)])
         radl_sys = system("s0", [Feature("disk.0.os.flavour", "=", "Ubuntu"),
                                  Feature("disk.0.os.version", "=", "20.04")])
         inf = MagicMock()
-        dummy = MagicMock(["list_images"])
-        dummycc.return_value = dummy
-        dummy.list_images.side_effect = [[{"name": "ubuntu-20.04-raw", "uri": "imageuri"}],
-                                         [{"name": "ubuntu-22.04-raw", "uri": "imageuri2"},
-                                          {"name": "ubuntu-20.04-raw", "uri": "imageuri3"},
-                                          {"name": "ubuntu-20.04-raw", "uri": "imageuri4"}]]
+        images = {"cloud0": [{"name": "ubuntu-20.04-raw", "uri": "imageuri"}],
+                  "cloud1": [{"name": "ubuntu-22.04-raw", "uri": "imageuri2"},
+                             {"name": "ubuntu-20.04-raw", "uri": "imageuri3"},
+                             {"name": "ubuntu-20.04-raw", "uri": "imageuri4"}]}
+
+        def get_connector(cloud, inf):
+            dummy = MagicMock(["list_images"])
+            dummy.list_images.return_value = images[cloud.id]
+            return dummy
+        dummycc.side_effect = get_connector
         res = IM.search_vm(inf, radl_sys, auth)
         self.assertEqual(len(res), 2)
         self.assertEqual(res[0].name, "s0")
@@ -1502,6 +2172,49 @@ configure step2 (
         self.assertEqual(res[1].name, "s0")
         self.assertEqual(res[1].getValue("disk.0.image.url"), "imageuri2")
 
+        # The second search is served from the cache
+        res = IM.search_vm(inf, radl_sys, auth)
+        self.assertEqual([s.getValue("disk.0.image.url") for s in res], ["imageuri", "imageuri2"])
+        self.assertEqual(dummycc.call_count, 2)
+        self.assertEqual((ImageCache.hits, ImageCache.misses), (2, 2))
+
+    def test_image_cache(self):
+        """ Test the deduplication of concurrent image lookups and the TTL of ImageCache."""
+        calls = []
+        started = Event()
+
+        def list_images(release):
+            calls.append(1)
+            started.set()
+            release.wait()
+            return [{"uri": "imageuri"}]
+
+        release = Event()
+        key = ImageCache.get_key("list_images", "Dummy", {"distribution": "ubuntu"})
+        results = []
+        threads = [Thread(target=lambda: results.append(ImageCache.get(key, list_images, release)))
+                   for _ in range(3)]
+        threads[0].start()
+        started.wait()
+        for th in threads[1:]:
+            th.start()
+        time.sleep(0.1)
+        release.set()
+        for th in threads:
+            th.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [[{"uri": "imageuri"}]] * 3)
+
+        # Errors are not cached
+        with self.assertRaises(Exception):
+            ImageCache.get("error", MagicMock(side_effect=Exception("error")))
+        self.assertEqual(ImageCache.get("error", lambda: [1]), [1])
+
+        # Expired entries are queried again
+        with patch("time.time", return_value=time.time() + Config.IMAGE_CACHE_TIME + 1):
+            ImageCache.get(key, list_images, release)
+        self.assertEqual(len(calls), 2)
+
     @patch('IM.InfrastructureManager.AppDB')
     def test_translate_egi_to_ost(self, appdb):
         appdb.get_site_id.return_value = 'site_id'
@@ -1565,20 +2278,61 @@ configure step2 (
                             {'sizeInGigabytes': 20}]
             }})
 
-    @patch('IM.Stats.DataBase')
-    @patch('IM.InfrastructureManager.InfrastructureManager.check_auth_data')
-    def test_get_stats(self, check_auth_data, DataBase):
+    def test_get_stats(self):
+        """Test GetStats."""
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er"),
+                               Feature("disk.0.os.credentials.username", "=", "user"),
+                               Feature("disk.0.os.credentials.password", "=", "pass"),
+                               Feature("memory.size", "=", 512, "M"),
+                               Feature("cpu.count", "=", 2)]))
+        radl.add(deploy("s0", 2))
+        radl.add(contextualize([]))
+
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        auth1 = self.getAuth([1], [], [("Dummy", 0)])
+        infId = IM.CreateInfrastructure(str(radl), auth0)
+
+        stats = IM.GetStats('2001-01-01', None, auth0)
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['inf_id'], infId)
+        self.assertEqual(stats[0]['vm_count'], 2)
+        self.assertEqual(stats[0]['cpu_count'], 4)
+        self.assertEqual(stats[0]['memory_size'], 1024)
+        self.assertEqual(stats[0]['cloud_type'], 'Dummy')
+        self.assertEqual(stats[0]['im_user'], 'user0')
+        self.assertFalse(stats[0]['deleted'])
+        self.assertFalse(stats[0]['hybrid'])
+
+        self.assertEqual(IM.GetStats('2001-01-01', None, auth1), [])
+        self.assertEqual(IM.GetStats('2001-01-01', '2001-01-02', auth0), [])
+
+        # The last saved stats are indexed by DB
+        self.assertIn((Config.DATA_DB, infId), Stats._last_stats)
+
+        IM.DestroyInfrastructure(infId, auth0)
+        stats = list(IM.GetStats(None, None, auth0, stream=True))
+        self.assertTrue(stats[0]['deleted'])
+
+        # The DB can be written while the stats are streamed
+        stats = IM.GetStats(None, None, auth0, stream=True)
+        next(stats)
+        db = DataBase(Config.DATA_DB)
+        db.connect()
+        self.assertTrue(db.execute("update inf_stats set deleted = 1 where id = %s", (infId,)))
+        db.close()
+        # and the errors formatting a row do not break the stream
+        with patch.object(Stats, "_format_stats", side_effect=Exception("error")):
+            self.assertEqual(list(IM.GetStats(None, None, auth0, stream=True)), [])
+
+        # Add an infrastructure stored before the stats table was created
+        auth = Authentication([{'type': 'InfrastructureManager', 'token': 'atoken',
+                                'username': 'user0', 'password': 'pass'}])
         radl = """
             system node (
             memory.size = 512M and
             cpu.count = 2
             )"""
-
-        auth = Authentication([{'type': 'InfrastructureManager', 'token': 'atoken',
-                                'username': '__OPENID__mcaballer', 'password': 'pass'}])
-        check_auth_data.return_value = auth
-
-        db = MagicMock()
         inf_data = {
             "id": "1",
             "auth": auth.serialize(),
@@ -1589,10 +2343,20 @@ configure step2 (
                 json.dumps({"cloud": '{"type": "OSCAR", "server": "sharp-elbakyan5.im.grycap.net"}', "info": radl})
             ]
         }
-        db.select.return_value = [(json.dumps(inf_data), '2022-03-23', '1')]
-        DataBase.return_value = db
-
-        stats = IM.GetStats('2001-01-01', '2122-01-01', auth)
+        db = DataBase(Config.DATA_DB)
+        db.connect()
+        db.execute("replace into inf_list (id, deleted, data, date, auth) values (%s, %s, %s, now(), %s)",
+                   ("1", 0, json.dumps(inf_data), json.dumps(auth.serialize())))
+        db.close()
+        self.assertEqual(Stats.backfill(), 2)
+
+        # The stats table is filled when it is created
+        db.connect()
+        db.execute("drop table inf_stats")
+        db.close()
+        Stats._table_created = set()
+        stats = IM.GetStats('2022-03-01', '2022-03-08', auth0)
+        del stats[0]['last_date']
         expected_res = [{'creation_date': '2022-03-07 12:16:14',
                          'tosca_name': 'kubernetes',
                          'vm_count': 2,
@@ -1602,11 +2366,15 @@ configure step2 (
                          'cloud_host': 'sharp-elbakyan5.im.grycap.net',
                          'hybrid': False,
                          'deleted': False,
-                         'im_user': '__OPENID__mcaballer',
-                         'inf_id': '1',
-                         'last_date': '2022-03-23 00:00:00'}]
+                         'im_user': 'user0',
+                         'inf_id': '1'}]
         self.assertEqual(stats, expected_res)
 
+        # The last saved stats are bounded
+        with patch.object(Stats, "LAST_STATS_SIZE", 1):
+            infId = IM.CreateInfrastructure(str(radl), auth1)
+        self.assertEqual(list(Stats._last_stats.keys()), [(Config.DATA_DB, infId)])
+
 
 if __name__ == "__main__":
     unittest.main()
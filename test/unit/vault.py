@@ -28,7 +28,7 @@ class TestVaultCredentials(unittest.TestCase):
     Class to test the VaultCredentials class
     """
     @patch("hvac.Client")
-    @patch('requests.post')
+    @patch('requests.Session.request')
     def test_get_creds(self, post, hvac):
         client = MagicMock()
         cred1 = {"id": "credid", "type": "type", "username": "user", "password": "pass", "enabled": 1}